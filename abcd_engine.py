@@ -0,0 +1,309 @@
+"""
+Матричный (ABCD) расчёт геометрии фокусировки с деревом отрезков по линзам.
+
+Положение изображения после линзы описывается дробно-линейным отображением,
+т.е. 2x2 матрицей в однородных координатах (v = n / d — расстояние от текущей
+точки оси до изображения):
+
+    дрейф на t:   [[1, -t], [0, 1]]
+    линза F:      [[1, 0], [1/F, 1]]     (L2 = 1 / (1/F - 1/L1), L1 = -v)
+
+Матрицы унимодулярны; увеличение линзы M = |d_prev / d|, поэтому M_total = 1/|d|.
+Размер в фокусе sf_i^2 = (M_i sf_{i-1})^2 + (c_i L2_i)^2 (diff_lim линейна по |L2|),
+откуда d_i^2 sf_i^2 = sx^2 + сумма c_i^2 n_i^2 — квадратичная форма входного
+вектора, которая тоже складывается по отрезкам. Поглощение exp(-mu d) — сумма
+по отрезку.
+
+Каждый слот (линза, активная или нет) — лист дерева; включение/выключение или
+сдвиг линзы пересчитывает O(log n) узлов. Совпадает с Calculator.propagate по
+final_pos, L2, M_total, size_x, size_y. Пропускание с учётом апертур (erf,
+ограничение Al по A) зависит от всей предыстории пучка, поэтому не делится на
+отрезки: его даёт report(), который считает активные линзы эталонным движком.
+"""
+from typing import Dict, List
+
+import numpy as np
+
+from computations import Calculator, Formulas, FWHM_TO_SIGMA
+from lens_mask import LensMask
+
+# Узел: (a, b, c, d, s00, s01, s11, mu_d, last)
+#   [[a, b], [c, d]] — произведение матриц отрезка (правая линза слева),
+#   S — квадратичная форма вклада дифракции, mu_d — сумма mu*d активных линз,
+#   last — номер последнего активного слота отрезка или -1
+_IDENTITY = (1.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 0.0, -1)
+
+
+def _combine_matrices(left, right):
+    """
+    (a, b, c, d, s00, s01, s11) отрезка left, затем right.
+    Работает и с числами, и с numpy-массивами (поэлементно).
+    """
+    a1, b1, c1, d1, p00, p01, p11 = left
+    a2, b2, c2, d2, q00, q01, q11 = right
+    # S = S_left + P_leftᵀ S_right P_left
+    t00 = q00 * a1 + q01 * c1
+    t01 = q00 * b1 + q01 * d1
+    t10 = q01 * a1 + q11 * c1
+    t11 = q01 * b1 + q11 * d1
+    return (
+        a2 * a1 + b2 * c1, a2 * b1 + b2 * d1,
+        c2 * a1 + d2 * c1, c2 * b1 + d2 * d1,
+        p00 + a1 * t00 + c1 * t10,
+        p01 + a1 * t01 + c1 * t11,
+        p11 + b1 * t01 + d1 * t11,
+    )
+
+
+def _combine(left, right):
+    """Отрезок left, затем right."""
+    return _combine_matrices(left[:7], right[:7]) + (
+        left[7] + right[7],
+        right[8] if right[8] >= 0 else left[8],
+    )
+
+
+def _leaf(index, t, inv_F, c, mu_d, active):
+    """Дрейф t до слота, затем линза (если активна)."""
+    if not active:
+        return (1.0, -t, 0.0, 1.0, 0.0, 0.0, 0.0, 0.0, -1)
+    # Q = [[1, -t], [1/F, 1 - t/F]]; вклад дифракции c^2 * (строка 0 Q)ᵀ(строка 0 Q)
+    c2 = c * c
+    return (1.0, -t, inv_F, 1.0 - t * inv_F, c2, -c2 * t, c2 * t * t, mu_d, index)
+
+
+class ABCDEngine:
+    """
+    Геометрия схемы с быстрыми правками.
+
+    Слоты — все линзы схемы (включая выключенные) в порядке цепочки, с
+    абсолютными позициями. set_active()/move() — O(log n), focus() — O(1).
+    """
+
+    def __init__(self, slots: List[Dict], active, source_params: Dict):
+        """
+        Args:
+            slots: словари линз в формате build_chain (R, A, p, delta, mu, d, abs_pos, ...)
+            active: флаги активности слотов
+            source_params: словарь SourceManager (sx_fwhm, sy_fwhm, lamda — в единицах режима build_chain)
+        """
+        self.slots = slots
+        self.source_params = source_params
+        self.z = np.array([s['abs_pos'] for s in slots], dtype=float)
+        self.active = np.array(list(active), dtype=bool)
+        if len(self.active) != len(slots):
+            raise ValueError("active flags do not match the number of slots")
+
+        lamda = source_params['lamda']
+        F = np.empty(len(slots))
+        self.c = np.empty(len(slots))
+        for i, s in enumerate(slots):
+            F[i] = Formulas.F_single_lens(s['R'], s['delta'], s['p'])
+            Aeff = Formulas.Aeff_single_lens(F[i], s['delta'], s['mu'])
+            self.c[i] = Formulas.diff_lim(1.0, s['A'], Aeff, lamda)
+        self.inv_F = 1.0 / F
+        self.mu_d = np.array([s['mu'] * s['d'] for s in slots], dtype=float)
+
+        self.size = 1
+        while self.size < max(len(slots), 1):
+            self.size *= 2
+        self.tree = [_IDENTITY] * (2 * self.size)
+        for i in range(len(slots)):
+            self.tree[self.size + i] = self._make_leaf(i)
+        for node in range(self.size - 1, 0, -1):
+            self.tree[node] = _combine(self.tree[2 * node], self.tree[2 * node + 1])
+
+    @classmethod
+    def from_structure(cls, controller, energy, structure_config, source_params=None, mode=None):
+        """Слоты из structure_config: схема собирается со всеми включёнными линзами."""
+        source, chain = controller.build_chain(energy, structure_config, source_params, mode)
+        _, slots = controller.build_chain(energy, all_lenses_active(structure_config), source_params, mode)
+        active_keys = {slot_key(lens) for lens in chain}
+        return cls(slots, [slot_key(s) in active_keys for s in slots], source)
+
+    # --- Дерево ---
+
+    def _make_leaf(self, i):
+        t = self.z[i] - (self.z[i - 1] if i > 0 else 0.0)
+        return _leaf(i, float(t), float(self.inv_F[i]), float(self.c[i]), float(self.mu_d[i]), bool(self.active[i]))
+
+    def _update(self, i):
+        node = self.size + i
+        self.tree[node] = self._make_leaf(i)
+        node //= 2
+        while node:
+            self.tree[node] = _combine(self.tree[2 * node], self.tree[2 * node + 1])
+            node //= 2
+
+    def set_active(self, i, active=True):
+        if self.active[i] != active:
+            self.active[i] = active
+            self._update(i)
+
+    def toggle(self, i):
+        self.set_active(i, not self.active[i])
+
+    def move(self, i, abs_pos):
+        """Сдвигает слот i; меняются дрейфы до него и до следующего слота."""
+        self.z[i] = abs_pos
+        self._update(i)
+        if i + 1 < len(self.slots):
+            self._update(i + 1)
+
+    def set_mask(self, active):
+        """Переходит к другому набору активных слотов, обновляя только изменившиеся."""
+        active = np.asarray(active, dtype=bool)
+        for i in np.flatnonzero(active != self.active):
+            self.set_active(int(i), bool(active[i]))
+
+    # --- Результаты ---
+
+    def focus(self):
+        """
+        Итог схемы в формате отчёта контроллера (без T, G и full_history).
+        T_abs — только поглощение exp(-сумма mu*d) активных линз.
+        """
+        a, b, c, d, s00, s01, s11, mu_d, last = self.tree[1]
+        if last < 0:
+            return {'error': "No active lenses"}
+        # Вход (0, 1): изображение в источнике; после последнего слота v = b / d
+        with np.errstate(divide='ignore', invalid='ignore'):
+            L2 = float(np.divide(b, d) + (self.z[-1] - self.z[last]))
+            sx = self.source_params['sx_fwhm']
+            sy = self.source_params['sy_fwhm']
+            size_x = float(np.sqrt(sx * sx + s11) / abs(d)) if d else float('inf')
+            size_y = float(np.sqrt(sy * sy + s11) / abs(d)) if d else float('inf')
+        final_pos = float(self.z[last])
+        return {
+            'final_pos': final_pos,
+            'L2': L2,
+            'focus_pos': final_pos + L2,
+            'M_total': 1.0 / abs(d) if d else float('inf'),
+            'size_x': size_x,
+            'size_y': size_y,
+            'T_abs': float(np.exp(-mu_d)),
+        }
+
+    def evaluate_masks(self, masks):
+        """
+        focus() для последовательности наборов активных слотов.
+        Соседние наборы обычно отличаются на несколько линз, поэтому каждый
+        стоит O(k log n), где k — число переключений.
+        """
+        results = []
+        for active in masks:
+            self.set_mask(active)
+            results.append(self.focus())
+        return results
+
+    def report(self, calculator=Calculator):
+        """Полный отчёт (T, G, история по линзам) эталонным расчётом активных линз."""
+        chain = [dict(self.slots[i], abs_pos=float(self.z[i])) for i in np.flatnonzero(self.active)]
+        if not chain:
+            return {'error': "No active lenses"}
+        _mark_tf_boundaries(chain)
+        results, state = calculator.propagate(chain, self.source_params)
+        T = float(np.prod(state.T_blocks)) if state.T_blocks else 1.0
+        G = float(np.sqrt(np.sum(np.square(state.G_blocks)))) if state.G_blocks else 0.0
+        last = results[-1]
+        return {
+            'energy': self.source_params['energy'],
+            'final_pos': last.position,
+            'L2': last.L2,
+            'M_total': last.M_total,
+            'T': T,
+            'G': G,
+            'size_x': last.sfx,
+            'size_y': last.sfy,
+            'full_history': results,
+        }
+
+    def __len__(self):
+        return len(self.slots)
+
+
+# --- Векторный расчёт для многих вариантов одной цепочки ---
+
+def diffraction_coefficients(A, F, delta, mu, lamda):
+    """Formulas.diff_lim при L2 = 1 для массивов (вклад дифракции на единицу |L2|)."""
+    aeff_fwhm = FWHM_TO_SIGMA * np.sqrt(F * delta / mu)
+    w = 1 / (1 + (A / (6 * aeff_fwhm / FWHM_TO_SIGMA))**6)
+    a = aeff_fwhm / A
+    k = a + 1 / 6 * np.exp(-a) * w + 0.442 * (1 - w)
+    return np.abs(k * lamda / aeff_fwhm)
+
+
+def focus_batch(abs_pos, F, c, sx, sy):
+    """
+    Фокус для B вариантов цепочки активных линз.
+
+    Матрицы линз сворачиваются попарно: log2(n) векторных шагов по всем
+    вариантам сразу вместо цикла по линзам.
+
+    Args:
+        abs_pos: (B, n) позиции линз
+        F, c: фокусные расстояния и diffraction_coefficients, (n,) или (B, n)
+        sx, sy: размеры источника (в единицах режима)
+    Returns:
+        dict final_pos, L2, focus_pos, M_total, size_x, size_y — массивы (B,)
+    """
+    abs_pos = np.atleast_2d(np.asarray(abs_pos, dtype=float))
+    t = np.diff(abs_pos, axis=1, prepend=0.0)
+    inv_F = np.broadcast_to(1.0 / np.asarray(F, dtype=float), t.shape)
+    c2 = np.broadcast_to(np.asarray(c, dtype=float)**2, t.shape)
+    ones = np.ones_like(t)
+    nodes = (ones, -t, inv_F, 1.0 - t * inv_F, c2, -c2 * t, c2 * t * t)
+    while nodes[0].shape[1] > 1:
+        if nodes[0].shape[1] % 2:
+            pad = np.zeros((t.shape[0], 1))
+            nodes = tuple(np.concatenate([x, pad + v], axis=1)
+                          for x, v in zip(nodes, _IDENTITY[:7]))
+        nodes = _combine_matrices(tuple(x[:, 0::2] for x in nodes), tuple(x[:, 1::2] for x in nodes))
+    a, b, c, d, s00, s01, s11 = (x[:, 0] for x in nodes)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        L2 = b / d
+        final_pos = abs_pos[:, -1]
+        return {
+            'final_pos': final_pos,
+            'L2': L2,
+            'focus_pos': final_pos + L2,
+            'M_total': 1.0 / np.abs(d),
+            'size_x': np.sqrt(sx * sx + s11) / np.abs(d),
+            'size_y': np.sqrt(sy * sy + s11) / np.abs(d),
+        }
+
+
+def slot_key(lens):
+    """Слот линзы в схеме: (TF, блок, номер линзы в блоке)."""
+    return (lens.get('tf_name'), lens.get('block_index'), lens.get('lens_index_in_block'))
+
+
+def all_lenses_active(structure_config):
+    """Копия structure_config, в которой включены все линзы всех TF (для расстановки слотов)."""
+    full = []
+    for block in structure_config:
+        block = dict(block)
+        if block.get('type') == 'air':
+            n = len(block.get('lenses', []))
+            block['active_mask'] = LensMask((1 << n) - 1, n)
+        elif block.get('type') == 'vacuum':
+            groups = []
+            for group in block.get('groups', []):
+                group = dict(group, active=True)
+                if group.get('lenses') is not None:
+                    group['lenses'] = [dict(lens, active=True) for lens in group['lenses']]
+                groups.append(group)
+            block['groups'] = groups
+        full.append(block)
+    return full
+
+
+def _mark_tf_boundaries(chain):
+    """Флаги первой/последней линзы TF и номера линз в TF для активного подмножества."""
+    for k, lens in enumerate(chain):
+        name = lens.get('tf_name')
+        first = k == 0 or chain[k - 1].get('tf_name') != name
+        lens['is_first_in_tf'] = first
+        lens['lens_index_in_tf'] = 1 if first else chain[k - 1]['lens_index_in_tf'] + 1
+        lens['is_last_in_tf'] = k == len(chain) - 1 or chain[k + 1].get('tf_name') != name
@@ -0,0 +1,233 @@
+import math
+from dataclasses import dataclass
+from typing import Dict, List
+
+import numpy as np
+
+from computations import ERF_CONST, FWHM_TO_SIGMA, dependency_closure
+
+try:
+    from scipy.special import erf as _erf  # scipy приходит вместе с xraydb
+except ImportError:
+    _erf = np.vectorize(math.erf, otypes=[float])
+
+# Ключи результата BatchCalculator.propagate и зависимости между ними
+BATCH_FIELDS = ('final_pos', 'L2', 'focus_pos', 'M_total', 'T', 'G', 'size_x', 'size_y', 'alx', 'aly')
+BATCH_DEPENDENCIES = {'G': ('T',)}
+
+
+# --- Цепочка линз в виде плоских массивов ---
+
+@dataclass
+class ChainArrays:
+    """Цепочка линз (результат build_chain) в виде numpy-массивов по линзам."""
+
+    R: np.ndarray
+    A: np.ndarray
+    p: np.ndarray
+    delta: np.ndarray
+    mu: np.ndarray
+    d: np.ndarray
+    abs_pos: np.ndarray
+    is_first_in_tf: np.ndarray
+    is_last_in_tf: np.ndarray
+    tf_names: List[str]
+
+    @classmethod
+    def from_chain(cls, lens_chain: List[Dict]) -> "ChainArrays":
+        def col(key, default=0.0, dtype=float):
+            return np.array([lens.get(key, default) for lens in lens_chain], dtype=dtype)
+
+        return cls(
+            R = col('R'),
+            A = col('A'),
+            p = col('p'),
+            delta = col('delta'),
+            mu = col('mu'),
+            d = col('d'),
+            abs_pos = col('abs_pos'),
+            is_first_in_tf = col('is_first_in_tf', False, bool),
+            is_last_in_tf = col('is_last_in_tf', False, bool),
+            tf_names = [lens.get('tf_name', 'Unknown') for lens in lens_chain],
+        )
+
+    def __len__(self):
+        return len(self.R)
+
+    def tf_mask(self, tf_name):
+        """Булева маска линз, принадлежащих TF tf_name."""
+        return np.array([name == tf_name for name in self.tf_names], dtype=bool)
+
+    def positions_for(self, structure_config, tf_positions):
+        """
+        Абсолютные позиции линз (B, n) при других позициях TF.
+
+        Args:
+            structure_config: конфигурация, из которой собрана цепочка
+            tf_positions: {имя TF: массив (B,) позиций}; позиция понимается как
+                block['position'] (spin_pos в GUI), сдвиг переносит весь TF
+        """
+        batch = max((np.size(v) for v in tf_positions.values()), default=1)
+        abs_pos = np.broadcast_to(self.abs_pos, (batch, len(self))).copy()
+        for block in structure_config:
+            name = block.get('tf_name')
+            if name not in tf_positions:
+                continue
+            base = block.get('position', block['absolute_start'])
+            shift = np.asarray(tf_positions[name], dtype=float).reshape(-1) - base
+            abs_pos[:, self.tf_mask(name)] += shift[:, None]
+        return abs_pos
+
+    @staticmethod
+    def ordered(abs_pos):
+        """(B,) True, если линзы идут по оси по порядку (TF не перекрываются)."""
+        return np.all(np.diff(abs_pos, axis=1) >= 0, axis=1)
+
+
+# --- Векторизованный расчёт ---
+
+class BatchCalculator:
+    """
+    Тот же расчёт, что Calculator.propagate, но сразу для B вариантов цепочки.
+
+    Набор линз общий, а позиции (и при необходимости delta/mu/lamda) задаются
+    массивами с первой осью B. Цикл идёт только по линзам (каждая зависит от
+    предыдущей), по вариантам всё считается векторно. Возвращает итоговые
+    величины в тех же единицах, что _generate_report.
+    """
+
+    @staticmethod
+    def propagate(chain: ChainArrays, source_params: Dict, abs_pos=None, delta=None, mu=None, lamda=None,
+                  fields=None):
+        """
+        Args:
+            chain: цепочка линз (ChainArrays)
+            source_params: параметры источника (как для Calculator.propagate)
+            abs_pos: (B, n) абсолютные позиции линз; по умолчанию chain.abs_pos
+            delta, mu: (B, n) оптические константы, если они меняются (скан по энергии)
+            lamda: (B,) длина волны, если меняется
+            fields: нужные ключи результата (из BATCH_FIELDS, None — все); T и G
+                не считаются, если не нужны
+        """
+        if fields is None:
+            fields = BATCH_FIELDS
+        need = dependency_closure(fields, BATCH_DEPENDENCIES, BATCH_FIELDS)
+        want_T = 'T' in need
+        want_G = 'G' in need
+        n = len(chain)
+        abs_pos = np.atleast_2d(chain.abs_pos if abs_pos is None else np.asarray(abs_pos, dtype=float))
+        batch = abs_pos.shape[0]
+        delta = chain.delta if delta is None else np.asarray(delta, dtype=float)
+        mu = chain.mu if mu is None else np.asarray(mu, dtype=float)
+        lamda = np.full(batch, source_params['lamda']) if lamda is None else np.asarray(lamda, dtype=float)
+
+        inf = float('inf')
+
+        # Состояние пучка (BeamState) по всем вариантам сразу
+        z = np.zeros(batch)
+        wx = np.full(batch, source_params['wx_fwhm'], dtype=float)
+        wy = np.full(batch, source_params['wy_fwhm'], dtype=float)
+        sx = np.full(batch, source_params['sx_fwhm'], dtype=float)
+        sy = np.full(batch, source_params['sy_fwhm'], dtype=float)
+        L2_prev = np.zeros(batch)
+        alx_prev = np.zeros(batch)
+        aly_prev = np.zeros(batch)
+        M_total = np.ones(batch)
+        T_total = np.ones(batch)
+        T_block = np.ones(batch)
+        G_block = np.ones(batch)
+        G_blocks_sq = np.zeros(batch)
+
+        L2 = np.full(batch, np.nan)
+        sfx = sfy = alx = aly = L2
+
+        with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            for i in range(n):
+                if chain.is_first_in_tf[i]:
+                    T_block = np.ones(batch)
+                    G_block = np.ones(batch)
+
+                t = abs_pos[:, i] - abs_pos[:, i - 1] if i > 0 else abs_pos[:, 0]
+                A = chain.A[i]
+                d_i = delta[..., i]
+                mu_i = mu[..., i]
+
+                L1 = t if i == 0 else t - L2_prev
+
+                F = chain.R[i] / (2 * d_i) + chain.p[i] / 6
+                denom = 1 / F - 1 / L1
+                L2 = np.where((L1 == F) | (L1 == 0) | (denom == 0), inf, 1 / denom)
+                M = np.abs(L2 / L1)
+
+                aeff = FWHM_TO_SIGMA * np.sqrt(F * d_i / mu_i)
+
+                if i == 0:
+                    sfpx = np.where(wx != 0, np.sqrt((L1 * wx)**2 + sx**2), A)
+                    sfpy = np.where(wy != 0, np.sqrt((L1 * wy)**2 + sy**2), A)
+                else:
+                    sfpx = np.where(L2_prev == 0, inf, alx_prev * np.abs(t - L2_prev) / L2_prev)
+                    sfpy = np.where(L2_prev == 0, inf, aly_prev * np.abs(t - L2_prev) / L2_prev)
+
+                alx = np.where(A > sfpx, np.sqrt(1 / (1 / sfpx**2 + 1 / aeff**2)), A)
+                aly = np.where(A > sfpy, np.sqrt(1 / (1 / sfpy**2 + 1 / aeff**2)), A)
+
+                # diff_lim
+                sigma = aeff / FWHM_TO_SIGMA
+                w = 1 / (1 + (A / (6 * sigma))**6)
+                a = aeff / A
+                k = a + 1 / 6 * np.exp(-a) * w + 0.442 * (1 - w)
+                diff_lim = np.abs(k * lamda * L2 / aeff)
+
+                sfx = np.sqrt((M * sx)**2 + diff_lim**2)
+                sfy = np.sqrt((M * sy)**2 + diff_lim**2)
+
+                if want_T:
+                    c = A * ERF_CONST
+                    T = (np.exp(-mu_i * chain.d[i]) * (alx * aly) / (sfpx * sfpy)
+                         * (_erf(c / alx) * _erf(c / aly)) / (_erf(c / sfpx) * _erf(c / sfpy)))
+                    T_block = T_block * T
+                    if chain.is_last_in_tf[i]:
+                        T_total = T_total * T_block
+
+                if want_G:
+                    L_total = L1 + L2
+                    sb_x = np.sqrt((L_total * wx)**2 + sx**2)
+                    sb_y = np.sqrt((L_total * wy)**2 + sy**2)
+                    G = T * sb_x * sb_y / (sfx * sfy)
+                    G_block = G_block * G
+                    if chain.is_last_in_tf[i]:
+                        G_blocks_sq = G_blocks_sq + G_block**2
+
+                z = z + t
+                wx = wx - alx / F
+                wy = wy - aly / F
+                sx, sy = sfx, sfy
+                M_total = M_total * M
+                L2_prev = L2
+                alx_prev, aly_prev = alx, aly
+
+        result = {
+            'final_pos': z,
+            'L2': L2,
+            'focus_pos': z + L2,
+            'M_total': M_total,
+            'T': T_total if want_T else None,
+            'G': np.sqrt(G_blocks_sq) if want_G else None,
+            'size_x': sfx,
+            'size_y': sfy,
+            'alx': alx,
+            'aly': aly,
+        }
+        return {name: result[name] for name in fields}
+
+    @staticmethod
+    def beam_size_at(result: Dict, z_plane):
+        """
+        Размер пучка (x, y) в плоскости z_plane после последней линзы
+        (как Formulas.symm_beam_size, на расстоянии z_plane - focus_pos от фокуса).
+        """
+        dist = z_plane - result['focus_pos']
+        with np.errstate(divide='ignore', invalid='ignore'):
+            size_x = np.sqrt(result['size_x']**2 + (result['alx'] * dist / result['L2'])**2)
+            size_y = np.sqrt(result['size_y']**2 + (result['aly'] * dist / result['L2'])**2)
+        return size_x, size_y
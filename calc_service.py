@@ -0,0 +1,290 @@
+"""
+Локальный HTTP/JSON сервис расчёта фокуса поверх AdvancedController.
+
+Запуск:
+    python calc_service.py --port 8765 --workers 4
+
+Эндпоинты (JSON в теле запроса и ответа):
+    POST /calculate  {"energy": 10300, "structure": [...], "source": {...}, "use_fwhm": true,
+                      "history": false}
+    POST /scan       {"energies": [...], "structure": [...], "source": {...}}
+    POST /batch      {"requests": [<тело /calculate>, ...]}
+    GET  /stats      счётчики запросов и доля попаданий в кэш
+    GET  /health
+
+Блок structure — один TF:
+    {"tf_name": "TF2", "type": "air", "position": 64.0, "measure_to_center": true,
+     "preset": "R50", "total_lenses": 100, "active_ranges": [[0, 8]]}
+    {"tf_name": "TF1", "type": "vacuum", "position": 27.1,
+     "groups": [{"N": 1, "preset": "R500", "active": true}, ...]}
+Вместо position можно передать absolute_start; у Air можно передать lenses
+(список {"preset", "material", "active"}) вместо preset/total_lenses.
+"hardware" — id описания железа TF (tf_hardware); по умолчанию по типу.
+Размеры в source всегда FWHM; use_fwhm=false считает в режиме sigma.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from computations import LENS_RESULT_FIELDS, CalcMode
+from lens_mask import LensMask
+from main_controller import AdvancedController
+
+SUMMARY_KEYS = ('energy', 'final_pos', 'L2', 'M_total', 'T', 'G', 'size_x', 'size_y')
+
+_CONTROLLER = None  # свой контроллер в каждом рабочем процессе
+
+
+# --- Преобразование запросов и ответов ---
+
+def structure_from_json(blocks, controller):
+    """structure_config для AdvancedController из JSON-описания TF."""
+    structure = []
+    for index, block in enumerate(blocks):
+        block_type = block.get('type', 'air')
+        conf = {'type': block_type, 'tf_name': block.get('tf_name', f'TF{index + 1}')}
+
+        if block_type == 'air':
+            lenses = block.get('lenses')
+            if lenses is None:
+                preset = block.get('preset', 'R50')
+                lenses = [{'preset': preset} for _ in range(int(block.get('total_lenses', 100)))]
+            conf['lenses'] = lenses
+            if 'active_ranges' in block:
+                conf['active_mask'] = LensMask.from_ranges(
+                    [tuple(r) for r in block['active_ranges']], len(lenses))
+        elif block_type == 'vacuum':
+            conf['groups'] = block.get('groups', [])
+        else:
+            raise ValueError(f"Unknown TF type: {block_type}")
+        if 'hardware' in block:
+            conf['hardware'] = block['hardware']
+
+        if 'absolute_start' in block:
+            conf['absolute_start'] = float(block['absolute_start'])
+            conf['position'] = float(block.get('position', conf['absolute_start']))
+        elif 'position' in block:
+            position = float(block['position'])
+            length = controller._calculate_block_length(block_type, conf)
+            measure_to_center = block.get('measure_to_center', True)
+            conf['absolute_start'] = position - length / 2.0 if measure_to_center else position
+            conf['position'] = position
+        else:
+            raise ValueError(f"TF '{conf['tf_name']}': 'position' or 'absolute_start' is required")
+        structure.append(conf)
+    return structure
+
+
+def _json_number(value):
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return value
+
+
+def report_to_json(report, history=False):
+    """Отчёт _generate_report в JSON-совместимом виде (inf/nan -> null)."""
+    if 'error' in report:
+        return {'error': report['error']}
+    out = {key: _json_number(report[key]) for key in SUMMARY_KEYS}
+    L2 = report['L2']
+    out['focus_pos'] = _json_number(report['final_pos'] + L2)
+    if history:
+        out['history'] = [
+            {name: _json_number(getattr(item, name)) for name, _, _, _ in LENS_RESULT_FIELDS}
+            for item in report['full_history']
+        ]
+    return out
+
+
+def _init_worker(backend):
+    global _CONTROLLER
+    _CONTROLLER = AdvancedController(backend=backend)
+
+
+def _worker_calculate(request):
+    """Выполняется в рабочем процессе: один расчёт по нормализованному запросу."""
+    global _CONTROLLER
+    if _CONTROLLER is None:
+        _CONTROLLER = AdvancedController()
+    structure = structure_from_json(request['structure'], _CONTROLLER)
+    source = request.get('source')
+    energy = float(request['energy'])
+    if source is not None:
+        source = dict(source, energy=energy)
+    mode = CalcMode.of(bool(request.get('use_fwhm', (source or {}).get('use_fwhm', True))))
+    report = _CONTROLLER.run_calculations(energy, structure, source_params=source, mode=mode)
+    return report_to_json(report, history=request.get('history', False))
+
+
+# --- Сервис ---
+
+class CalcService:
+    """
+    Асинхронный фронтенд с пулом процессов.
+
+    Одинаковые запросы, пришедшие одновременно, считаются один раз
+    (ожидают одного и того же future), готовые ответы лежат в LRU-кэше.
+    """
+
+    def __init__(self, workers=None, cache_size=4096, backend='python'):
+        self.pool = ProcessPoolExecutor(max_workers=workers or os.cpu_count(),
+                                        initializer=_init_worker, initargs=(backend,))
+        self.cache = OrderedDict()
+        self.cache_size = cache_size
+        self.in_flight = {}
+        self.stats = {'requests': 0, 'calculations': 0, 'cache_hits': 0, 'cache_misses': 0,
+                      'coalesced': 0, 'errors': 0}
+
+    @staticmethod
+    def _key(request):
+        return json.dumps(request, sort_keys=True, separators=(',', ':'))
+
+    async def calculate(self, request):
+        """Один расчёт с кэшем и объединением одинаковых запросов."""
+        key = self._key(request)
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            self.stats['cache_hits'] += 1
+            return self.cache[key]
+        if key in self.in_flight:
+            self.stats['coalesced'] += 1
+            return await asyncio.shield(self.in_flight[key])
+
+        self.stats['cache_misses'] += 1
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self.pool, _worker_calculate, request)
+        self.in_flight[key] = future
+        try:
+            result = await future
+        finally:
+            del self.in_flight[key]
+        self.stats['calculations'] += 1
+
+        self.cache[key] = result
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return result
+
+    async def scan(self, body):
+        energies = body['energies']
+        base = {key: value for key, value in body.items() if key != 'energies'}
+        results = await asyncio.gather(*(self.calculate(dict(base, energy=e)) for e in energies))
+        return {'results': list(results)}
+
+    async def batch(self, body):
+        results = await asyncio.gather(*(self.calculate(request) for request in body['requests']),
+                                       return_exceptions=True)
+        return {'results': [{'error': str(r)} if isinstance(r, Exception) else r for r in results]}
+
+    def get_stats(self):
+        # Объединённые запросы кэш не обслужил: в долю попаданий они входят как промахи
+        lookups = self.stats['cache_hits'] + self.stats['cache_misses'] + self.stats['coalesced']
+        return dict(self.stats,
+                    cache_size=len(self.cache),
+                    in_flight=len(self.in_flight),
+                    hit_rate=self.stats['cache_hits'] / lookups if lookups else 0.0)
+
+    async def dispatch(self, method, path, body):
+        """Возвращает (HTTP-статус, JSON-ответ)."""
+        routes = {
+            ('POST', '/calculate'): self.calculate,
+            ('POST', '/scan'): self.scan,
+            ('POST', '/batch'): self.batch,
+        }
+        if method == 'GET' and path == '/stats':
+            return 200, self.get_stats()
+        if method == 'GET' and path == '/health':
+            return 200, {'status': 'ok'}
+        handler = routes.get((method, path))
+        if handler is None:
+            return 404, {'error': f"Unknown endpoint: {method} {path}"}
+
+        self.stats['requests'] += 1
+        try:
+            result = await handler(json.loads(body or b'{}'))
+        except (ValueError, KeyError, TypeError) as e:
+            self.stats['errors'] += 1
+            return 400, {'error': f"{type(e).__name__}: {e}"}
+        except Exception as e:
+            self.stats['errors'] += 1
+            return 500, {'error': f"{type(e).__name__}: {e}"}
+        if isinstance(result, dict) and 'error' in result:
+            return 422, result
+        return 200, result
+
+    # --- HTTP/1.1 поверх asyncio streams ---
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                length = int(headers.get('content-length', 0))
+                body = await reader.readexactly(length) if length else b''
+
+                status, payload = await self.dispatch(method.upper(), target.split('?')[0], body)
+                data = json.dumps(payload).encode()
+                keep_alive = (version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close')
+                writer.write(
+                    f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                    f"Content-Type: application/json\r\n"
+                    f"Content-Length: {len(data)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode('latin-1') + data
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host='127.0.0.1', port=8765):
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        async with server:
+            await server.serve_forever()
+
+    def close(self):
+        self.pool.shutdown(cancel_futures=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local focus calculation service")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--cache-size', type=int, default=4096)
+    parser.add_argument('--backend', choices=('python', 'numba'), default='python',
+                        help="propagation backend ('numba' needs Numba installed)")
+    args = parser.parse_args()
+
+    service = CalcService(workers=args.workers, cache_size=args.cache_size, backend=args.backend)
+    print(f"Serving on http://{args.host}:{args.port}")
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+
+
+if __name__ == '__main__':
+    main()
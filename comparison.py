@@ -0,0 +1,135 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+from computations import LENS_RESULT_FIELDS
+from main_controller import AdvancedController
+
+# Итоговые величины для сравнения: (ключ, заголовок, форматтер значения)
+SUMMARY_FIELDS = [
+    ('focus_pos', "Focus, m", lambda x: f"{x:.4f}"),
+    ('size_x', "Size X, um", lambda x: f"{x * 1e6:.2f}"),
+    ('size_y', "Size Y, um", lambda x: f"{x * 1e6:.2f}"),
+    ('T', "T, %", lambda x: f"{x * 100:.2f}"),
+    ('G', "G", lambda x: f"{x:.3e}"),
+]
+
+_CONTROLLER = None  # свой контроллер в каждом рабочем процессе
+
+
+@dataclass
+class Variant:
+    """Одна конфигурация для сравнения (копия structure_config и параметров источника)."""
+
+    name: str
+    structure_config: List[Dict]
+    source_params: Dict
+    report: Dict = field(default=None, repr=False)
+
+
+def _worker_calculate(args):
+    global _CONTROLLER
+    if _CONTROLLER is None:
+        _CONTROLLER = AdvancedController()
+    structure_config, source_params = args
+    return _CONTROLLER.run_calculations(source_params['energy'], structure_config, source_params=source_params)
+
+
+class ComparisonRun:
+    """
+    Параллельный расчёт вариантов в фоне (пул процессов).
+
+    poll() не блокирует и возвращает варианты, досчитанные с прошлого вызова,
+    поэтому окно сравнения заполняется по мере готовности результатов.
+    """
+
+    def __init__(self, variants, workers=None):
+        self.variants = variants
+        self.pool = ProcessPoolExecutor(max_workers=workers or min(os.cpu_count(), max(len(variants), 1)))
+        self.futures = {
+            self.pool.submit(_worker_calculate, (v.structure_config, v.source_params)): index
+            for index, v in enumerate(variants)
+        }
+
+    def poll(self):
+        """Список индексов вариантов, для которых только что появился отчёт."""
+        done = [future for future in self.futures if future.done()]
+        finished = []
+        for future in done:
+            index = self.futures.pop(future)
+            try:
+                self.variants[index].report = future.result()
+            except Exception as e:
+                self.variants[index].report = {'error': str(e)}
+            finished.append(index)
+        if not self.futures:
+            self.pool.shutdown(wait=False)
+        return finished
+
+    def finished(self):
+        return not self.futures
+
+    def cancel(self):
+        for future in self.futures:
+            future.cancel()
+        self.futures = {}
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+# --- Выравнивание и разности ---
+
+def lens_key(item):
+    """Линза в схеме: (TF, блок, номер линзы в блоке) — слот, а не номер среди активных."""
+    return (item.tf_name, item.block_index, item.lens_index_in_block)
+
+
+def align_histories(reports):
+    """
+    Выравнивает full_history нескольких отчётов по линзам.
+
+    Returns:
+        (keys, rows): keys — ключи lens_key в порядке TF и линз, rows[k][j] —
+        LensResult варианта j для ключа keys[k] или None, если линзы нет в пучке
+    """
+    tf_order = {}
+    by_variant = []
+    for report in reports:
+        items = {}
+        for item in (report or {}).get('full_history') or []:
+            tf_order.setdefault(item.tf_name, len(tf_order))
+            items[lens_key(item)] = item
+        by_variant.append(items)
+
+    keys = sorted({key for items in by_variant for key in items},
+                  key=lambda k: (tf_order[k[0]], k[1], k[2]))
+    rows = [[items.get(key) for items in by_variant] for key in keys]
+    return keys, rows
+
+
+def summary(report):
+    """Итоговые величины отчёта (SUMMARY_FIELDS) или None при ошибке."""
+    if not report or 'error' in report:
+        return None
+    values = {key: report[key] for key, _, _ in SUMMARY_FIELDS if key != 'focus_pos'}
+    values['focus_pos'] = report['final_pos'] + report['L2']
+    return values
+
+
+def summary_deltas(reports, reference=0):
+    """Разности итоговых величин относительно варианта reference (None, если нет данных)."""
+    ref = summary(reports[reference])
+    deltas = []
+    for report in reports:
+        values = summary(report)
+        if values is None or ref is None:
+            deltas.append(None)
+        else:
+            deltas.append({key: values[key] - ref[key] for key in values})
+    return deltas
+
+
+def numeric_fields():
+    """Числовые поля LensResult, которые показываются в GUI: (имя, заголовок, форматтер)."""
+    return [(name, header, fmt) for name, typ, header, fmt in LENS_RESULT_FIELDS
+            if typ is float and header is not None]
@@ -0,0 +1,226 @@
+from PyQt5.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QPushButton, QTableWidget,
+                             QTableWidgetItem, QHeaderView, QComboBox, QCheckBox, QLabel,
+                             QSplitter, QInputDialog, QAbstractItemView, QWidget)
+from PyQt5.QtGui import QColor
+from PyQt5.QtCore import Qt, QTimer
+
+from comparison import (SUMMARY_FIELDS, Variant, ComparisonRun, align_histories, summary,
+                        summary_deltas, numeric_fields)
+
+_DIFF_COLOR = QColor(255, 243, 179)
+
+
+class ComparisonDialog(QDialog):
+    """
+    Сравнение нескольких конфигураций: итоговые величины с разностями
+    относительно опорного варианта и выровненная по линзам история.
+    Окно немодальное: между добавлениями вариантов схему можно менять.
+    """
+
+    def __init__(self, parent, capture_current):
+        """capture_current() -> (structure_config, source_params) текущей схемы."""
+        super().__init__(parent)
+        self.setWindowTitle("Compare Configurations")
+        self.resize(1100, 700)
+        self.capture_current = capture_current
+        self.variants = []
+        self.run = None
+        self.fields = numeric_fields()
+
+        self.timer = QTimer(self)
+        self.timer.setInterval(50)
+        self.timer.timeout.connect(self.poll)
+
+        self.setup_ui()
+
+    def setup_ui(self):
+        layout = QVBoxLayout(self)
+
+        btns = QHBoxLayout()
+        self.btn_add = QPushButton("Add Current Configuration")
+        self.btn_remove = QPushButton("Remove Selected")
+        self.btn_compute = QPushButton("Compute")
+        self.btn_add.clicked.connect(self.add_current)
+        self.btn_remove.clicked.connect(self.remove_selected)
+        self.btn_compute.clicked.connect(self.compute)
+        btns.addWidget(self.btn_add)
+        btns.addWidget(self.btn_remove)
+        btns.addWidget(self.btn_compute)
+        btns.addStretch()
+        btns.addWidget(QLabel("Reference:"))
+        self.combo_reference = QComboBox()
+        self.combo_reference.currentIndexChanged.connect(self.refresh)
+        btns.addWidget(self.combo_reference)
+        layout.addLayout(btns)
+
+        splitter = QSplitter(Qt.Vertical)
+
+        self.table_summary = QTableWidget(0, 0)
+        self.table_summary.verticalHeader().setVisible(False)
+        self.table_summary.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table_summary.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        splitter.addWidget(self.table_summary)
+
+        lower = QWidget()
+        lower_layout = QVBoxLayout(lower)
+        lower_layout.setContentsMargins(0, 0, 0, 0)
+        field_row = QHBoxLayout()
+        field_row.addWidget(QLabel("Field:"))
+        self.combo_field = QComboBox()
+        self.combo_field.addItems([header for _, header, _ in self.fields])
+        self.combo_field.currentIndexChanged.connect(self.refresh_lenses)
+        field_row.addWidget(self.combo_field)
+        self.chk_delta = QCheckBox("Show difference from reference")
+        self.chk_delta.toggled.connect(self.refresh_lenses)
+        field_row.addWidget(self.chk_delta)
+        field_row.addStretch()
+        lower_layout.addLayout(field_row)
+        self.table_lenses = QTableWidget(0, 0)
+        self.table_lenses.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        lower_layout.addWidget(self.table_lenses)
+        splitter.addWidget(lower)
+        layout.addWidget(splitter)
+
+        self.lbl_status = QLabel("Add configurations to compare.")
+        layout.addWidget(self.lbl_status)
+
+    # --- Варианты ---
+
+    def add_variant(self, name, structure_config, source_params):
+        self.variants.append(Variant(name, structure_config, source_params))
+        self._update_reference_combo()
+        self.refresh()
+
+    def add_current(self):
+        default = f"Variant {len(self.variants) + 1}"
+        name, ok = QInputDialog.getText(self, "Add Configuration", "Name:", text=default)
+        if not ok:
+            return
+        structure_config, source_params = self.capture_current()
+        self.add_variant(name or default, structure_config, source_params)
+
+    def remove_selected(self):
+        if self.run is not None and not self.run.finished():
+            return
+        rows = sorted({index.row() for index in self.table_summary.selectedIndexes()}, reverse=True)
+        for row in rows:
+            del self.variants[row]
+        self._update_reference_combo()
+        self.refresh()
+
+    def _update_reference_combo(self):
+        current = self.combo_reference.currentIndex()
+        self.combo_reference.blockSignals(True)
+        self.combo_reference.clear()
+        self.combo_reference.addItems([v.name for v in self.variants])
+        self.combo_reference.setCurrentIndex(min(max(current, 0), len(self.variants) - 1))
+        self.combo_reference.blockSignals(False)
+
+    # --- Расчёт ---
+
+    def compute(self):
+        pending = [v for v in self.variants if v.report is None]
+        if not pending:
+            self.refresh()
+            return
+        if self.run is not None:
+            self.run.cancel()
+        self.run = ComparisonRun(pending)
+        self.btn_compute.setEnabled(False)
+        self.lbl_status.setText(f"Computing {len(pending)} configurations...")
+        self.timer.start()
+
+    def poll(self):
+        if self.run is None:
+            return
+        if self.run.poll():
+            self.refresh()
+        if self.run.finished():
+            self.timer.stop()
+            self.btn_compute.setEnabled(True)
+            self.lbl_status.setText(f"{len(self.variants)} configurations computed.")
+
+    def closeEvent(self, event):
+        self.timer.stop()
+        if self.run is not None:
+            self.run.cancel()
+        super().closeEvent(event)
+
+    # --- Отображение ---
+
+    def refresh(self):
+        self.refresh_summary()
+        self.refresh_lenses()
+
+    def _reference(self):
+        return max(self.combo_reference.currentIndex(), 0)
+
+    def refresh_summary(self):
+        reports = [v.report for v in self.variants]
+        deltas = summary_deltas(reports, self._reference()) if self.variants else []
+        headers = ["Configuration", "Status"]
+        for _, title, _ in SUMMARY_FIELDS:
+            headers += [title, "Δ " + title]
+        table = self.table_summary
+        table.setColumnCount(len(headers))
+        table.setHorizontalHeaderLabels(headers)
+        table.setRowCount(len(self.variants))
+
+        for row, (variant, delta) in enumerate(zip(self.variants, deltas)):
+            values = summary(variant.report)
+            if variant.report is None:
+                status = "pending"
+            elif values is None:
+                status = variant.report.get('error', 'error')
+            else:
+                status = "done"
+            cells = [variant.name, status]
+            for key, _, fmt in SUMMARY_FIELDS:
+                if values is None:
+                    cells += ["", ""]
+                else:
+                    d = delta[key] if delta else None
+                    cells += [fmt(values[key]), "" if d is None else ("+" if d >= 0 else "") + fmt(d)]
+            for col, text in enumerate(cells):
+                item = QTableWidgetItem(text)
+                # Колонки Δ: 3, 5, 7...; подсвечиваем ненулевые разности
+                if col >= 3 and col % 2 == 1 and text and delta[SUMMARY_FIELDS[(col - 2) // 2][0]] != 0:
+                    item.setBackground(_DIFF_COLOR)
+                table.setItem(row, col, item)
+        table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+
+    def refresh_lenses(self):
+        table = self.table_lenses
+        if not self.variants or self.combo_field.currentIndex() < 0:
+            table.setRowCount(0)
+            return
+        name, _, fmt = self.fields[self.combo_field.currentIndex()]
+        reference = self._reference()
+        show_delta = self.chk_delta.isChecked()
+
+        keys, rows = align_histories([v.report for v in self.variants])
+        table.setColumnCount(len(self.variants))
+        table.setHorizontalHeaderLabels([v.name for v in self.variants])
+        table.setRowCount(len(keys))
+        table.setVerticalHeaderLabels([f"{tf} b{block} #{lens}" for tf, block, lens in keys])
+
+        for r, items in enumerate(rows):
+            ref_item = items[reference] if reference < len(items) else None
+            ref_value = getattr(ref_item, name) if ref_item is not None else None
+            for c, item in enumerate(items):
+                if item is None:
+                    cell = QTableWidgetItem("—")
+                    cell.setForeground(QColor(150, 150, 150))
+                    table.setItem(r, c, cell)
+                    continue
+                value = getattr(item, name)
+                if show_delta and ref_value is not None and c != reference:
+                    diff = value - ref_value
+                    text = ("+" if diff >= 0 else "") + fmt(diff)
+                else:
+                    text = fmt(value)
+                cell = QTableWidgetItem(text)
+                if ref_value is None or (c != reference and value != ref_value):
+                    cell.setBackground(_DIFF_COLOR)
+                table.setItem(r, c, cell)
+        table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
@@ -1,531 +1,690 @@
-import math
-from dataclasses import dataclass, make_dataclass, field
-from typing import Dict, List, Optional, Tuple
-
-# --- 1. Классы данных (Data Structures) ---
-# Они заменят разрозненные переменные и словари
-
-LENS_RESULT_FIELDS = [
-    # Служебные поля (можно не показывать в GUI)
-    ("tf_name", str,"TF", str),           # None в заголовке = не отображать
-    ("block_index", int, None, None),
-    ("is_last_in_block", bool, None, None),
-    ("is_last_in_tf", bool, None, None),
-    # (имя, тип, заголовок для GUI, форматтер)
-    ("tf_id", str, None, None),
-    ("index", int,  None, None),
-    ("lens_index_in_tf", int, 'Lens in TF', str),
-    ("lens_index_in_block", int, 'Lens number', str), #вставить колонку с R
-    ("position", float, "Pos (m)", lambda x: f"{x:.4f}"),
-    ("L1", float, "L1, m", lambda x: f"{x:.4f}"),
-    ("L2", float, "L2, m", lambda x: "Inf" if x == float('inf') else f"{x:.4f}"),
-    ("F", float, "F, m", lambda x: f"{x:.4f}"),
-    ("sx_fwhm", float, "source (x), um", lambda x: f"{x * 1e6:.2f}"),
-    ("sy_fwhm", float, "source (y), um", lambda x: f"{x * 1e6:.2f}"),
-    ("sfpx", float, "Sfp (x), um", lambda x: f"{x * 1e6:.2f}"),
-    ("sfpy", float, "Sfp (y), um", lambda x: f"{x * 1e6:.2f}"),
-    ("alx", float, "Al (x), um", lambda x: f"{x * 1e6:.2f}"),
-    ("aly", float, "Al (y), um", lambda x: f"{x * 1e6:.2f}"),
-    ("slx", float, None, lambda x: f"{x * 1e6:.2f}"),
-    ("sly", float, None, lambda x: f"{x * 1e6:.2f}"),
-    ("sfx", float, "Focus Size (x), um", lambda x: f"{x * 1e6:.2f}"),
-    ("sfy", float, "Focus Size (y), um", lambda x: f"{x * 1e6:.2f}"),
-    ("T", float, "Trans., %", lambda x: f"{x * 100:.1f}"),
-    ("T_block", float, "T block, %", lambda x: f"{x * 100:.1f}"),
-    #("T_total", float, "T total (%)", lambda x: f"{x * 100:.1f}"),
-    ("M", float, "M", lambda x: f"{x:.3e}"),
-    ("M_total", float, "M total", lambda x: f"{x:.3e}"),
-    ("G", float, "G", lambda x: f"{x:.3e}"),
-    ("G_total", float, "G total", lambda x: f"{x:.3e}"),
-    ("NA", float, "NA", lambda x: f"{x:.3e}"),
-    ("NA_block", float, "NA block", lambda x: f"{x:.3e}"),
-    ("Aeff", float, "Effective Aperture, um", lambda x: f"{x * 1e6:.2f}"),  # в мкм
-    ("Aeff_total", float, "Aeff total", lambda x: f"{x * 1e6:.2f}"),  # в мкм
-    ("Aeff_block", float, "Aeff block", lambda x: f"{x * 1e6:.2f}"),  # в мкм
-    ("dof_x", float, None, lambda x: f'{x:.3e}'),
-    ("dof_y", float, None, lambda x: f'{x:.3e}'),
-    ("symmetry_dist", float, None, lambda x: f"{x:.4f}"),
-    ("symm_beam_size_x", float, None, lambda x: f"{x * 1e6:.2f}"),
-    ("symm_beam_size_y", float, None, lambda x: f"{x * 1e6:.2f}"),
-    #("G_block", float, "G block", lambda x: f"{x:.3e}"),
-    #("num_aper_block", float, "N.A. TF, umrad", lambda x: f"{x * 1e6:.2f}"),
-    # Можно добавить G, dof и т.д. — всё автоматически появится в GUI!
-]
-
-LensResult = make_dataclass("LensResult", [(name, typ) for name, typ, _, _ in LENS_RESULT_FIELDS])
-
-
-@dataclass
-class BeamState:
-    """Хранит состояние пучка в конкретной точке оптической оси"""
-
-    #focus_pos: float
-    z: float                  # Текущая координата на оси
-    wx: float                 # Размер источника/пучка X (расходимость или размер)
-    wy: float                 # Размер источника/пучка Y
-    sx: float                 # Размер пятна X
-    sy: float                 # Размер пятна Y
-    M_total: float = 1.0      # Общее увеличение
-    T_current_block: float = 1.0
-    G_current_block: float = 1.0
-    T_total: float = 1.0      # Общее пропускание
-    G_total: float = 1.0      # Общий gain
-
-    NA_current_block: float = 0.0
-    Aeff_current_block: float = float('inf')
-    Aeff_current_tf: float = float('inf')
-
-    T_blocks: List[float] = field(default_factory=list)
-    G_blocks: List[float] = field(default_factory=list)
-    NA_blocks: List[float] = field(default_factory=list)
-    Aeff_blocks: List[float] = field(default_factory=list)
-
-    # Параметры предыдущей линзы (для расчета следующей)
-    L2_prev: float = 0.0
-    Alx_prev: float = 0.0
-    Aly_prev: float = 0.0
-    Aeff_prev_total: float = float('inf')
-
-
-
-# --- 2. Физическое ядро (Physics Engine) ---
-
-class Formulas:
-    use_fwhm = True
-    """Сборник формул. Чистые функции, не хранят состояния"""
-
-    @staticmethod
-    def F_single_lens(R: float, delta: float, p: float) -> float: #убрать float
-        #print(R)
-        #print(delta)
-        #print('p calc',p)
-        return R / (2 * delta) + p / 6
-
-
-    @staticmethod
-    def L2(F, L1):
-        if L1 == F:
-            return float('inf')
-        try:
-            return 1/(1/F - 1/L1)
-        except ZeroDivisionError:
-            return float('inf')
-        
-    @staticmethod
-    def magnification(L1, L2):
-        return abs(L2 / L1)
-    
-    @staticmethod
-    def magnification_total(M1, M2):
-        return M1 * M2
-    
-    @staticmethod
-    def Aeff_single_lens(F, delta, mu): #сделать свитч на sigma
-        sigma_aeff = math.sqrt(F * delta / mu)
-        fwhm_aeff = 2.35482 * sigma_aeff
-        return fwhm_aeff if Formulas.use_fwhm else sigma_aeff
-
-    @staticmethod
-    def Aeff_system(Aeff_prev, Aeff_curr):
-        if Aeff_prev == float('inf'):
-            return Aeff_curr
-        return math.sqrt(1/(1/Aeff_prev**2 + 1/Aeff_curr**2))
-
-    @staticmethod
-    def diff_lim(L2, A, Aeff, lamda): #diff_lim_total
-        sigma = Aeff / 2.35482 #сделать свитч на sigma
-        n_pow = 6
-        A0 = 6 * sigma
-
-        w = 1 / (1 + (A / A0)**n_pow)
-        a = Aeff / A
-
-        k = (a + 1/6 * math.exp(-a) * w + 0.442 * (1 - w))
-        res = abs(k * lamda * L2 / Aeff)
-        return res
-    
-    @staticmethod
-    def sigma(Aeff):
-        return Aeff / 2.35482
-
-    @staticmethod
-    def get_k_param(A, Aeff):
-        sigma = Aeff / 2.35482 #FWHM / 2.35482
-        n_pow = 6
-        A0 = 6 * sigma
-
-        w = 1 / (1 + (A / A0)**n_pow)
-        a = Aeff / A
-
-        k = (a + 1/6 * math.exp(-a) * w + 0.442 * (1 - w))
-        return k
-    
-    @staticmethod
-    def sf(M, s, diff_lim):
-        """Размер пучка в фокусе"""
-        sl = M * s
-        return math.sqrt(sl**2 + diff_lim**2)
-    
-    @staticmethod
-    def sl(M, s):
-        """Размер пучка в фокусе"""
-        sl = M * s
-        return sl
-
-    @staticmethod
-    def sfp(L2_prev, L1, Al_prev, s_divergence, s, l, first_on_way: bool):
-        """Размер пучка на входе в линзу"""
-        if first_on_way: #if n == 1 and self.first_on_way == True:
-            sfpn = math.sqrt((L1 * s_divergence)**2 + s**2)
-        else:
-            sfpn = Al_prev * abs(L2_prev - l) / L2_prev
-        return sfpn
-    
-    @staticmethod
-    def sfp_first_lens(L1: float, divergence: float, source_size: float) -> float:
-        """Размер пучка на входе в первую линзу."""
-        return math.sqrt((L1 * divergence)**2 + source_size**2)
-    
-    @staticmethod
-    def sfp_next_lens(L2_prev: float, Al_prev: float, dist_from_prev: float) -> float:
-        """Размер пучка на входе в последующую линзу (после фокуса)."""
-        if L2_prev == 0:
-            return float('inf')  # или 0, или бросить исключение
-        return Al_prev * abs(dist_from_prev - L2_prev) / L2_prev #не lens_position
-    
-    @staticmethod
-    def Al(A, sfp_val, Aeff):
-        if A > sfp_val:
-           return math.sqrt(1/(1/sfp_val**2 + 1/Aeff**2))
-        else:
-            return A
-        #return math.sqrt(1/(1/sfp_val**2 + 1/self.Aeff_single_lens(F)**2))
-
-    @staticmethod
-    def transmission(A, Alx, Aly, sfpx, sfpy, mu, d):
-
-        if Formulas.use_fwhm:
-            const = math.sqrt(math.log(2))
-        else:
-            const = 1/ (2 * math.sqrt(2))
-
-
-        erf_alx = math.erf(A * const / Alx)
-        erf_aly = math.erf(A * const / Aly)
-        erf_sfpx = math.erf(A * const / sfpx)
-        erf_sfpy = math.erf(A * const / sfpy)
-        T_fwhm = math.exp(-mu * d) * (Alx * Aly) / (sfpx * sfpy) * (erf_alx * erf_aly) / (erf_sfpx * erf_sfpy)
-        T_sigma = math.exp(-mu * d) * (Alx * Aly) / (sfpx * sfpy) * (erf_alx * erf_aly) / (erf_sfpx * erf_sfpy) #исправить
-        #return fwhm_aeff if Formulas.use_fwhm else sigma_aeff 
-        return T_fwhm if Formulas.use_fwhm else T_sigma
-    
-    @staticmethod
-    def transmission_total(T1, T2):
-        return T1 * T2
-
-    @staticmethod
-    def straight_beam(L, s, s_divergence):
-        return math.sqrt((L * s_divergence)**2 + s**2)
-    
-    @staticmethod
-    def gain(T, straight_beam_x, straight_beam_y, sfx, sfy,):
-        G = T * straight_beam_x * straight_beam_y / (sfx * sfy)
-        return G
-    
-    @staticmethod
-    def gain_total(G1, G2):
-        return G1*G2#math.sqrt(G1**2 + G2**2)
-    
-    @staticmethod
-    def numerical_aperture(Aeff, F):
-        return Aeff / (2 * F)
-    
-    @staticmethod
-    def num_aper_total():
-        return
-    
-    @staticmethod
-    def symmetry_dist(l2, sfy, sfx, alx, aly, k):
-        """Calculate distance from last lens for symmetry beam"""
-        try:
-            return l2*math.sqrt((math.pow((1 + k) * sfy, 2) - math.pow(sfx, 2)) / (math.pow(alx, 2) - math.pow((1 + k) * aly, 2)))
-        except ZeroDivisionError:
-            return 0 #min(dofx, dofy)
-        except ValueError:
-            return 0#'Корень из отрицательного числа' #min(dofx, dofy)
-    
-    @staticmethod
-    def symm_beam_size(Al, L2, L, sf):
-        """Calculate size of symmetry beam"""
-        sg = Al * L / L2
-        return math.sqrt(sf**2 + sg**2)
-
-    @staticmethod
-    def dof(L2, sl, Al, lamda, num_ap):
-        """depth of field"""
-        dof_diff = lamda / (num_ap**2)
-        dof_g = 2 * L2 * sl / Al
-        dof_total = math.sqrt(math.pow(dof_g, 2))        
-        #return 0.88*lamda*l2**2/Aeff**2; либо как в диссере зверева
-        #из диссера поликарпова дополнительно рассмотреть хроматические абберации
-        #N.A. = arctg(Aeff/(2*L1)) = Aeff/(2*L1); либо Aeff/(2*f)
-        #взять картинку для пучка в фокусе как у зверева в диссертации
-        return dof_total
-
-
-# --- 3. Логика расчета (Logic) ---
-
-class Calculator:
-    """Класс, управляющий процессом расчета по цепочке линз."""
-
-    @staticmethod
-    def propagate(lens_config: List[Dict], source_params: Dict, initial_state: BeamState = None):
-        """
-        Основной цикл расчета.
-        
-        Args:
-            lens_configs: Список словарей параметров линз (R, A, p, u, N...)
-            source_params: Параметры источника (E, lamda, sx, sy...)
-            initial_state: Состояние пучка ПЕРЕД первой линзой в списке.
-        """
-
-        #Если начальное состояние не передано, создаем его из источника
-        if initial_state is None:
-            #Это случай самой первой линзы
-            state = BeamState(
-                z = 0,
-                wx = source_params['wx_fwhm'],
-                wy = source_params['wy_fwhm'],
-                sx = source_params['sx_fwhm'],
-                sy = source_params['sy_fwhm'],
-                L2_prev = 0,
-                Alx_prev = 0, 
-                Aly_prev = 0,
-                M_total = 1,
-                T_total = 1,
-                G_total = 1,
-                Aeff_prev_total = float('inf')
-            )
-        else:
-            state = initial_state
-
-        results = []
-        lamda = source_params['lamda']
-
-        for i, lens_conf in enumerate(lens_config):
-            if lens_conf.get('is_first_in_tf', False):
-                state.T_current_block = 1.0
-                state.G_current_block = 1.0
-                state.NA_current_block = 0.0
-                state.Aeff_current_block = float('inf')
-
-            abs_pos = lens_conf.get('abs_pos', None)
-            if abs_pos is not None:
-                if i == 0:
-                    distance_from_prev = abs_pos  # ← от источника
-                else:
-                    prev_abs_pos = lens_config[i - 1].get('abs_pos', state.z)
-                    distance_from_prev = abs_pos - prev_abs_pos
-            else:
-                # fallback: использовать distance_from_prev, если abs_pos не задан
-                distance_from_prev = lens_conf.get('distance_from_prev', 0)
-
-            # 1. Извлекаем параметры линзы
-            # Если передана группа (N > 1), нужно решить, как считать. 
-            # Твой код считал линзы по одной внутри группы? Или группу как одну линзу?
-            # В твоем parameters N=1..5, но в computations цикл шел по lens_set.
-            # Будем считать, что lens_configs - это уже развернутый список одиночных элементов, 
-            # либо мы обрабатываем "группу" как одну эффективную линзу (что обычно делается для CRL).
-            # НО, твой старый код итерировал `for n in lens_set`.
-            
-            # Для простоты считаем, что lens_conf - это ОДНА физическая единица расчета.
-            R = lens_conf['R']
-            A_phys = lens_conf['A']
-            p = lens_conf['p']
-            delta = lens_conf['delta']
-            mu = lens_conf['mu']
-            d = lens_conf['d']
-
-            # Расстояние от предыдущего элемента
-            t = distance_from_prev
-
-            #Определяем L1 (расстояние от источника / предыдущего фокуса до линзы)
-            if state.L2_prev == 0 and state.Alx_prev == 0:
-                L1 = t
-                is_first = True
-            else:
-                L1 = t - state.L2_prev #lens['position'] - prev_pos - L2_prev
-                is_first = False
-
-            #2. РАсчёт оптики
-            F = Formulas.F_single_lens(R, delta, p)
-            L2 = Formulas.L2(F, L1)
-            M = Formulas.magnification(L1, L2)
-            #M_total = Formulas.magnification_total(M_total, M)
-
-            Aeff = Formulas.Aeff_single_lens(F, delta, mu)
-            Aeff_sys = Formulas.Aeff_system(state.Aeff_prev_total, Aeff)
-
-            l_position = state.z + t
-
-            if is_first:
-                sfpx = Formulas.sfp_first_lens(L1=L1, divergence=state.wx, source_size=state.sx) if state.wx else A_phys
-                sfpy = Formulas.sfp_first_lens(L1=L1, divergence=state.wy, source_size=state.sy) if state.wy else A_phys
-            else:
-                sfpx = Formulas.sfp_next_lens(L2_prev = state.L2_prev, Al_prev = state.Alx_prev, dist_from_prev = t)
-                sfpy = Formulas.sfp_next_lens(L2_prev = state.L2_prev, Al_prev = state.Aly_prev, dist_from_prev = t)
-
-            alx = Formulas.Al(A_phys, sfpx, Aeff)
-            aly = Formulas.Al(A_phys, sfpy, Aeff)
-
-            diff_lim = Formulas.diff_lim(L2, A_phys, Aeff, lamda)
-            sfx = Formulas.sf(M, state.sx, diff_lim)
-            sfy = Formulas.sf(M, state.sy, diff_lim)
-            slx = Formulas.sl(M, state.sx)
-            sly = Formulas.sl(M, state.sy)
-
-            ''' Поменять расчёт для сценария sigma'''
-            T = Formulas.transmission(A_phys, alx, aly, sfpx, sfpy, mu, d) 
-
-            L_total_dist = L1 + L2
-            sb_x = math.sqrt((L_total_dist * state.wx)**2 + state.sx**2)
-            sb_y = math.sqrt((L_total_dist * state.wy)**2 + state.sy**2)
-            G = Formulas.gain(T, sb_x, sb_y, sfx, sfy)
-
-            NA = Formulas.numerical_aperture(Aeff, F)
-            state.NA_current_block = NA  # можно сделать накопление, если нужно
-            state.Aeff_current_block = Aeff_sys
-
-            #Обновление состояния для следующей итерации
-            new_wx = state.wx - alx/F #под вопросом правильность
-            new_wy = state.wy - aly/F
-
-            state.T_current_block *= T
-            state.G_current_block *= G #= math.sqrt(state.G_current_block**2 + G**2)
-
-            new_M_total = state.M_total * M
-            new_T_total = state.T_total * T
-            new_G_total = math.sqrt(state.G_total**2 + G**2)
-
-            #Сохранение результатов
-            result_data = {
-                'tf_name': lens_conf.get('tf_name', 'Unknown'),
-                'block_index': lens_conf.get('block_index', 1),
-                'is_last_in_block': lens_conf.get('is_last_in_block', False),
-                'is_last_in_tf': lens_conf.get('is_last_in_tf', False),
-                'tf_id': lens_conf.get('tf_id', 'Unknown'),
-                'lens_index_in_tf': lens_conf.get('lens_index_in_tf', i + 1),
-                'lens_index_in_block': lens_conf.get('lens_index_in_block', 1),
-                'index': i + 1,
-                'position': state.z + t,
-                'L1': L1,
-                'L2': L2,
-                'F': F,
-                'sx_fwhm': state.sx,
-                'sy_fwhm': state.sy,
-                'sfpx': sfpx,
-                'sfpy': sfpy,
-                'alx': alx,
-                'aly': aly,
-                'slx': slx,
-                'sly': sly,
-                'sfx': sfx,
-                'sfy': sfy,
-                'T': T,
-                'T_block': state.T_current_block,
-                'M': M,
-                'M_total': new_M_total,
-                'G': G,
-                'G_total': state.G_current_block,
-                # ... остальные поля
-
-                'NA': NA,
-                'NA_block': state.NA_current_block,
-                'Aeff': Aeff,
-                'Aeff_total': Aeff_sys,
-                'Aeff_block': state.Aeff_current_block,
-                # calculated only for last lens
-                'dof_x': 0.0,
-                'dof_y': 0.0, 
-                'symmetry_dist': 0.0,
-                'symm_beam_size_x': 0.0,
-                'symm_beam_size_y': 0.0,
-            }
-
-            if lens_conf.get('is_last_in_tf', False):
-                state.T_blocks.append(state.T_current_block)
-                state.G_blocks.append(state.G_current_block)
-                state.NA_blocks.append(state.NA_current_block)
-                state.Aeff_blocks.append(state.Aeff_current_block)
-                dof_x = Formulas.dof(L2, sfx, alx, lamda, NA)
-                dof_y = Formulas.dof(L2, sfy, aly, lamda, NA)
-                result_data['dof_x'] = dof_x
-                result_data['dof_y'] = dof_y
-            #result_data.setdefault('dof_x', 0.0)
-            #result_data.setdefault('dof_y', 0.0)
-            #result_data.setdefault('symmetry_dist', 0.0)
-            #result_data.setdefault('symm_beam_size_x', 0.0)
-            #result_data.setdefault('symm_beam_size_y', 0.0)
-
-            # Создаём объект
-            res = LensResult(**result_data)
-            results.append(res)
-
-            #Обновление state
-            state.z += t
-            state.wx = new_wx
-            state.wy = new_wy
-            state.sx = sfx
-            state.sy = sfy
-            state.M_total *= M
-            state.T_total *= T
-            state.G_total *= G#new_G_total #подумать над правильностью Formulas.gain_total(current_G_total, G)
-            
-            state.L2_prev = L2
-            state.Alx_prev = alx
-            state.Aly_prev = aly
-            state.Aeff_prev_total = Aeff_sys
-
-            # Внутри цикла по lens_conf:
-            R = lens_conf['R']
-            delta = lens_conf['delta']
-            p = lens_conf['p']
-            mu = lens_conf['mu']
-
-        if results:
-            last = results[-1]
-
-            # === NA для последней линзы ===
-            Aeff_last = Formulas.Aeff_single_lens(last.F, delta, mu)  # нужно передать актуальные delta, mu
-            NA_last = Formulas.numerical_aperture(Aeff_last, last.F)
-
-            # === k-коэффициент ===
-            k = 0.01 #cltkfnm 
-
-            # === DoF ===
-            num_ap = NA_last
-            if num_ap != 0:
-                dof_x = Formulas.dof(last.L2, last.slx, last.alx, lamda, num_ap)
-                dof_y = Formulas.dof(last.L2, last.sly, last.aly, lamda, num_ap)
-            else:
-                dof_x = 0.0
-                dof_y = 0.0
-
-            # === Symmetry ===
-            try:
-                sym_dist = Formulas.symmetry_dist(last.L2, last.sfy, last.sfx, last.alx, last.aly, k)
-            except:
-                sym_dist = 0.0
-
-            try:
-                sym_size_x = Formulas.symm_beam_size(last.alx, last.L2, sym_dist, last.sfx)
-                sym_size_y = Formulas.symm_beam_size(last.aly, last.L2, sym_dist, last.sfy)
-            except:
-                sym_size_x, sym_size_y = 0.0, 0.0
-
-            # === Обновляем только последний элемент ===
-            last.dof_x, last.dof_y = dof_x, dof_y
-            last.symmetry_dist = sym_dist
-            last.symm_beam_size_x, last.symm_beam_size_y = sym_size_x, sym_size_y
-
-        return results, state
\ No newline at end of file
+import math
+from dataclasses import dataclass, make_dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+# --- 1. Классы данных (Data Structures) ---
+# Они заменят разрозненные переменные и словари
+
+LENS_RESULT_FIELDS = [
+    # Служебные поля (можно не показывать в GUI)
+    ("tf_name", str,"TF", str),           # None в заголовке = не отображать
+    ("block_index", int, None, None),
+    ("is_last_in_block", bool, None, None),
+    ("is_last_in_tf", bool, None, None),
+    # (имя, тип, заголовок для GUI, форматтер)
+    ("tf_id", str, None, None),
+    ("index", int,  None, None),
+    ("lens_index_in_tf", int, 'Lens in TF', str),
+    ("lens_index_in_block", int, 'Lens number', str), #вставить колонку с R
+    ("position", float, "Pos (m)", lambda x: f"{x:.4f}"),
+    ("L1", float, "L1, m", lambda x: f"{x:.4f}"),
+    ("L2", float, "L2, m", lambda x: "Inf" if x == float('inf') else f"{x:.4f}"),
+    ("F", float, "F, m", lambda x: f"{x:.4f}"),
+    ("sx_fwhm", float, "source (x), um", lambda x: f"{x * 1e6:.2f}"),
+    ("sy_fwhm", float, "source (y), um", lambda x: f"{x * 1e6:.2f}"),
+    ("sfpx", float, "Sfp (x), um", lambda x: f"{x * 1e6:.2f}"),
+    ("sfpy", float, "Sfp (y), um", lambda x: f"{x * 1e6:.2f}"),
+    ("alx", float, "Al (x), um", lambda x: f"{x * 1e6:.2f}"),
+    ("aly", float, "Al (y), um", lambda x: f"{x * 1e6:.2f}"),
+    ("slx", float, None, lambda x: f"{x * 1e6:.2f}"),
+    ("sly", float, None, lambda x: f"{x * 1e6:.2f}"),
+    ("sfx", float, "Focus Size (x), um", lambda x: f"{x * 1e6:.2f}"),
+    ("sfy", float, "Focus Size (y), um", lambda x: f"{x * 1e6:.2f}"),
+    ("T", float, "Trans., %", lambda x: f"{x * 100:.1f}"),
+    ("T_block", float, "T block, %", lambda x: f"{x * 100:.1f}"),
+    #("T_total", float, "T total (%)", lambda x: f"{x * 100:.1f}"),
+    ("M", float, "M", lambda x: f"{x:.3e}"),
+    ("M_total", float, "M total", lambda x: f"{x:.3e}"),
+    ("G", float, "G", lambda x: f"{x:.3e}"),
+    ("G_total", float, "G total", lambda x: f"{x:.3e}"),
+    ("NA", float, "NA", lambda x: f"{x:.3e}"),
+    ("NA_block", float, "NA block", lambda x: f"{x:.3e}"),
+    ("Aeff", float, "Effective Aperture, um", lambda x: f"{x * 1e6:.2f}"),  # в мкм
+    ("Aeff_total", float, "Aeff total", lambda x: f"{x * 1e6:.2f}"),  # в мкм
+    ("Aeff_block", float, "Aeff block", lambda x: f"{x * 1e6:.2f}"),  # в мкм
+    ("dof_x", float, None, lambda x: f'{x:.3e}'),
+    ("dof_y", float, None, lambda x: f'{x:.3e}'),
+    ("symmetry_dist", float, None, lambda x: f"{x:.4f}"),
+    ("symm_beam_size_x", float, None, lambda x: f"{x * 1e6:.2f}"),
+    ("symm_beam_size_y", float, None, lambda x: f"{x * 1e6:.2f}"),
+    #("G_block", float, "G block", lambda x: f"{x:.3e}"),
+    #("num_aper_block", float, "N.A. TF, umrad", lambda x: f"{x * 1e6:.2f}"),
+    # Можно добавить G, dof и т.д. — всё автоматически появится в GUI!
+]
+
+# Поля, не вошедшие в проекцию (параметр fields у propagate), остаются None
+LensResult = make_dataclass("LensResult", [(name, typ, field(default=None)) for name, typ, _, _ in LENS_RESULT_FIELDS])
+LensResult.__module__ = __name__  # иначе объекты не передаются между процессами (pickle)
+
+# Граф зависимостей полей LensResult: поле -> поля, без которых его не посчитать.
+# Поля вне OPTIONAL_FIELDS (служебные, геометрия, размеры пучка, alx/aly)
+# нужны для перехода к следующей линзе и считаются всегда.
+FIELD_DEPENDENCIES = {
+    'T_block': ('T',),
+    'G': ('T',),
+    'G_total': ('G',),
+    'NA_block': ('NA',),
+    'Aeff_block': ('Aeff_total',),
+    'dof_x': ('NA', 'slx'),
+    'dof_y': ('NA', 'sly'),
+    'symm_beam_size_x': ('symmetry_dist',),
+    'symm_beam_size_y': ('symmetry_dist',),
+}
+ALL_FIELDS = frozenset(name for name, _, _, _ in LENS_RESULT_FIELDS)
+OPTIONAL_FIELDS = frozenset(FIELD_DEPENDENCIES) | {'T', 'NA', 'Aeff_total', 'slx', 'sly', 'symmetry_dist'}
+
+
+def dependency_closure(fields, dependencies, known):
+    """Запрошенные поля вместе со всеми зависимостями (по графу dependencies)."""
+    need = set()
+    pending = list(fields)
+    while pending:
+        name = pending.pop()
+        if name in need:
+            continue
+        if name not in known:
+            raise ValueError(f"Unknown result field: {name}")
+        need.add(name)
+        pending.extend(dependencies.get(name, ()))
+    return need
+
+
+def resolve_fields(fields=None, stop=()):
+    """
+    Поля LensResult, которые нужно посчитать для проекции fields
+    (None — все поля). Добавляются зависимости и поля, нужные условиям
+    остановки (атрибут fields у условия, см. stop_if_*).
+    """
+    if fields is None:
+        return ALL_FIELDS
+    requested = list(fields)
+    for condition in stop:
+        requested.extend(getattr(condition, 'fields', ()))
+    need = dependency_closure(requested, FIELD_DEPENDENCIES, ALL_FIELDS)
+    return frozenset(need | (ALL_FIELDS - OPTIONAL_FIELDS))
+
+
+FWHM_TO_SIGMA = 2.35482
+ERF_CONST = math.sqrt(math.log(2))   # множитель аргумента erf в transmission (соглашение FWHM)
+
+
+@dataclass(frozen=True)
+class CalcMode:
+    """
+    Соглашение о размерах пучка для одного расчёта: FWHM или sigma.
+
+    Неизменяемый объект передаётся в каждый расчёт явно, поэтому расчёты в
+    разных режимах можно вести параллельно.
+
+    Режим пересчитывает только размеры источника (SourceManager); Aeff,
+    пропускание и дифракционный предел всегда считаются в соглашении FWHM.
+    """
+    use_fwhm: bool
+    from_fwhm: float     # FWHM -> размер в этом режиме (для параметров источника)
+
+    @staticmethod
+    def of(use_fwhm):
+        return FWHM if use_fwhm else SIGMA
+
+
+FWHM = CalcMode(use_fwhm=True, from_fwhm=1.0)
+SIGMA = CalcMode(use_fwhm=False, from_fwhm=1 / FWHM_TO_SIGMA)
+
+
+@dataclass
+class BeamState:
+    """Хранит состояние пучка в конкретной точке оптической оси"""
+
+    #focus_pos: float
+    z: float                  # Текущая координата на оси
+    wx: float                 # Размер источника/пучка X (расходимость или размер)
+    wy: float                 # Размер источника/пучка Y
+    sx: float                 # Размер пятна X
+    sy: float                 # Размер пятна Y
+    M_total: float = 1.0      # Общее увеличение
+    T_current_block: float = 1.0
+    G_current_block: float = 1.0
+    T_total: float = 1.0      # Общее пропускание
+    G_total: float = 1.0      # Общий gain
+
+    NA_current_block: float = 0.0
+    Aeff_current_block: float = float('inf')
+    Aeff_current_tf: float = float('inf')
+
+    T_blocks: List[float] = field(default_factory=list)
+    G_blocks: List[float] = field(default_factory=list)
+    NA_blocks: List[float] = field(default_factory=list)
+    Aeff_blocks: List[float] = field(default_factory=list)
+
+    # Параметры предыдущей линзы (для расчета следующей)
+    L2_prev: float = 0.0
+    Alx_prev: float = 0.0
+    Aly_prev: float = 0.0
+    Aeff_prev_total: float = float('inf')
+
+
+
+# --- 2. Физическое ядро (Physics Engine) ---
+
+class Formulas:
+    """Сборник формул. Чистые функции, не хранят состояния"""
+
+    @staticmethod
+    def F_single_lens(R: float, delta: float, p: float) -> float: #убрать float
+        #print(R)
+        #print(delta)
+        #print('p calc',p)
+        return R / (2 * delta) + p / 6
+
+
+    @staticmethod
+    def L2(F, L1):
+        if L1 == F:
+            return float('inf')
+        try:
+            return 1/(1/F - 1/L1)
+        except ZeroDivisionError:
+            return float('inf')
+        
+    @staticmethod
+    def magnification(L1, L2):
+        return abs(L2 / L1)
+    
+    @staticmethod
+    def magnification_total(M1, M2):
+        return M1 * M2
+    
+    @staticmethod
+    def Aeff_single_lens(F, delta, mu):
+        sigma_aeff = math.sqrt(F * delta / mu)
+        return FWHM_TO_SIGMA * sigma_aeff
+
+    @staticmethod
+    def Aeff_system(Aeff_prev, Aeff_curr):
+        if Aeff_prev == float('inf'):
+            return Aeff_curr
+        return math.sqrt(1/(1/Aeff_prev**2 + 1/Aeff_curr**2))
+
+    @staticmethod
+    def diff_lim(L2, A, Aeff, lamda): #diff_lim_total
+        sigma = Aeff / 2.35482 #сделать свитч на sigma
+        n_pow = 6
+        A0 = 6 * sigma
+
+        w = 1 / (1 + (A / A0)**n_pow)
+        a = Aeff / A
+
+        k = (a + 1/6 * math.exp(-a) * w + 0.442 * (1 - w))
+        res = abs(k * lamda * L2 / Aeff)
+        return res
+    
+    @staticmethod
+    def sigma(Aeff):
+        return Aeff / 2.35482
+
+    @staticmethod
+    def get_k_param(A, Aeff):
+        sigma = Aeff / 2.35482 #FWHM / 2.35482
+        n_pow = 6
+        A0 = 6 * sigma
+
+        w = 1 / (1 + (A / A0)**n_pow)
+        a = Aeff / A
+
+        k = (a + 1/6 * math.exp(-a) * w + 0.442 * (1 - w))
+        return k
+    
+    @staticmethod
+    def sf(M, s, diff_lim):
+        """Размер пучка в фокусе"""
+        sl = M * s
+        return math.sqrt(sl**2 + diff_lim**2)
+    
+    @staticmethod
+    def sl(M, s):
+        """Размер пучка в фокусе"""
+        sl = M * s
+        return sl
+
+    @staticmethod
+    def sfp(L2_prev, L1, Al_prev, s_divergence, s, l, first_on_way: bool):
+        """Размер пучка на входе в линзу"""
+        if first_on_way: #if n == 1 and self.first_on_way == True:
+            sfpn = math.sqrt((L1 * s_divergence)**2 + s**2)
+        else:
+            sfpn = Al_prev * abs(L2_prev - l) / L2_prev
+        return sfpn
+    
+    @staticmethod
+    def sfp_first_lens(L1: float, divergence: float, source_size: float) -> float:
+        """Размер пучка на входе в первую линзу."""
+        return math.sqrt((L1 * divergence)**2 + source_size**2)
+    
+    @staticmethod
+    def sfp_next_lens(L2_prev: float, Al_prev: float, dist_from_prev: float) -> float:
+        """Размер пучка на входе в последующую линзу (после фокуса)."""
+        if L2_prev == 0:
+            return float('inf')  # или 0, или бросить исключение
+        return Al_prev * abs(dist_from_prev - L2_prev) / L2_prev #не lens_position
+    
+    @staticmethod
+    def Al(A, sfp_val, Aeff):
+        if A > sfp_val:
+           return math.sqrt(1/(1/sfp_val**2 + 1/Aeff**2))
+        else:
+            return A
+        #return math.sqrt(1/(1/sfp_val**2 + 1/self.Aeff_single_lens(F)**2))
+
+    @staticmethod
+    def transmission(A, Alx, Aly, sfpx, sfpy, mu, d):
+        const = ERF_CONST
+
+        erf_alx = math.erf(A * const / Alx)
+        erf_aly = math.erf(A * const / Aly)
+        erf_sfpx = math.erf(A * const / sfpx)
+        erf_sfpy = math.erf(A * const / sfpy)
+        return math.exp(-mu * d) * (Alx * Aly) / (sfpx * sfpy) * (erf_alx * erf_aly) / (erf_sfpx * erf_sfpy)
+    
+    @staticmethod
+    def transmission_total(T1, T2):
+        return T1 * T2
+
+    @staticmethod
+    def straight_beam(L, s, s_divergence):
+        return math.sqrt((L * s_divergence)**2 + s**2)
+    
+    @staticmethod
+    def gain(T, straight_beam_x, straight_beam_y, sfx, sfy,):
+        G = T * straight_beam_x * straight_beam_y / (sfx * sfy)
+        return G
+    
+    @staticmethod
+    def gain_total(G1, G2):
+        return G1*G2#math.sqrt(G1**2 + G2**2)
+    
+    @staticmethod
+    def numerical_aperture(Aeff, F):
+        return Aeff / (2 * F)
+    
+    @staticmethod
+    def num_aper_total():
+        return
+    
+    @staticmethod
+    def symmetry_dist(l2, sfy, sfx, alx, aly, k):
+        """Calculate distance from last lens for symmetry beam"""
+        try:
+            return l2*math.sqrt((math.pow((1 + k) * sfy, 2) - math.pow(sfx, 2)) / (math.pow(alx, 2) - math.pow((1 + k) * aly, 2)))
+        except ZeroDivisionError:
+            return 0 #min(dofx, dofy)
+        except ValueError:
+            return 0#'Корень из отрицательного числа' #min(dofx, dofy)
+    
+    @staticmethod
+    def symm_beam_size(Al, L2, L, sf):
+        """Calculate size of symmetry beam"""
+        sg = Al * L / L2
+        return math.sqrt(sf**2 + sg**2)
+
+    @staticmethod
+    def dof(L2, sl, Al, lamda, num_ap):
+        """depth of field"""
+        dof_diff = lamda / (num_ap**2)
+        dof_g = 2 * L2 * sl / Al
+        dof_total = math.sqrt(math.pow(dof_g, 2))        
+        #return 0.88*lamda*l2**2/Aeff**2; либо как в диссере зверева
+        #из диссера поликарпова дополнительно рассмотреть хроматические абберации
+        #N.A. = arctg(Aeff/(2*L1)) = Aeff/(2*L1); либо Aeff/(2*f)
+        #взять картинку для пучка в фокусе как у зверева в диссертации
+        return dof_total
+
+
+# --- 3. Логика расчета (Logic) ---
+
+class Calculator:
+    """Класс, управляющий процессом расчета по цепочке линз."""
+
+    @staticmethod
+    def initial_state(source_params: Dict) -> BeamState:
+        """Состояние пучка перед первой линзой (от источника)."""
+        return BeamState(
+            z = 0,
+            wx = source_params['wx_fwhm'],
+            wy = source_params['wy_fwhm'],
+            sx = source_params['sx_fwhm'],
+            sy = source_params['sy_fwhm'],
+            L2_prev = 0,
+            Alx_prev = 0,
+            Aly_prev = 0,
+            M_total = 1,
+            T_total = 1,
+            G_total = 1,
+            Aeff_prev_total = float('inf')
+        )
+
+    @staticmethod
+    def propagate(lens_config: List[Dict], source_params: Dict, initial_state: BeamState = None, fields=None):
+        """
+        Основной цикл расчета.
+        
+        Args:
+            lens_configs: Список словарей параметров линз (R, A, p, u, N...)
+            source_params: Параметры источника (E, lamda, sx, sy...)
+            initial_state: Состояние пучка ПЕРЕД первой линзой в списке.
+            fields: нужные поля LensResult (None — все); остальные не считаются и равны None
+        """
+        state = initial_state if initial_state is not None else Calculator.initial_state(source_params)
+        need = resolve_fields(fields)
+
+        results = list(Calculator.iter_propagate(lens_config, source_params, state, fields=fields))
+        if results:
+            Calculator._finish_last(results[-1], lens_config[results[-1].index - 1], source_params['lamda'], need)
+        return results, state
+
+    @staticmethod
+    def propagate_final(lens_config: List[Dict], source_params: Dict, initial_state: BeamState = None,
+                        stop=(), fields=None):
+        """
+        Расчёт без списка результатов: хранится только последняя линза.
+        fields — проекция, как у propagate (поля условий stop добавляются сами).
+
+        Returns:
+            (last, state, stopped_by): результат последней посчитанной линзы (None
+            для пустой цепочки), состояние после неё и сработавшее условие
+            остановки (None, если цепочка досчитана до конца)
+        """
+        state = initial_state if initial_state is not None else Calculator.initial_state(source_params)
+
+        need = resolve_fields(fields, stop)
+
+        last = None
+        steps = Calculator.iter_propagate(lens_config, source_params, state, stop, fields)
+        while True:
+            try:
+                last = next(steps)
+            except StopIteration as finished:
+                stopped_by = finished.value
+                break
+        if last is not None and stopped_by is None:
+            Calculator._finish_last(last, lens_config[last.index - 1], source_params['lamda'], need)
+        return last, state, stopped_by
+
+    @staticmethod
+    def iter_propagate(lens_config: List[Dict], source_params: Dict, state: BeamState = None,
+                       stop=(), fields=None):
+        """
+        Генератор: тот же цикл, что propagate, по одной линзе (LensResult).
+
+        state изменяется на месте и после каждой выдачи соответствует
+        посчитанной линзе. stop — условия остановки, функции
+        (lens_conf, result, state) -> bool (см. stop_if_*): после линзы, на которой
+        сработало условие, генератор завершается и возвращает это условие
+        (StopIteration.value). dof и symmetry последней линзы не считаются —
+        их добавляет propagate. fields — проекция, как у propagate.
+        """
+        if state is None:
+            state = Calculator.initial_state(source_params)
+        need = resolve_fields(fields, stop)
+        want_T = 'T' in need
+        want_G = 'G' in need
+        want_NA = 'NA' in need
+        want_aeff_sys = 'Aeff_total' in need
+        want_sl = 'slx' in need or 'sly' in need
+        want_dof = 'dof_x' in need or 'dof_y' in need
+        want_symmetry = 'symmetry_dist' in need
+
+        lamda = source_params['lamda']
+
+        for i, lens_conf in enumerate(lens_config):
+            if lens_conf.get('is_first_in_tf', False):
+                state.T_current_block = 1.0
+                state.G_current_block = 1.0
+                state.NA_current_block = 0.0
+                state.Aeff_current_block = float('inf')
+
+            abs_pos = lens_conf.get('abs_pos', None)
+            if abs_pos is not None:
+                if i == 0:
+                    distance_from_prev = abs_pos  # ← от источника
+                else:
+                    prev_abs_pos = lens_config[i - 1].get('abs_pos', state.z)
+                    distance_from_prev = abs_pos - prev_abs_pos
+            else:
+                # fallback: использовать distance_from_prev, если abs_pos не задан
+                distance_from_prev = lens_conf.get('distance_from_prev', 0)
+
+            # 1. Извлекаем параметры линзы
+            # Если передана группа (N > 1), нужно решить, как считать. 
+            # Твой код считал линзы по одной внутри группы? Или группу как одну линзу?
+            # В твоем parameters N=1..5, но в computations цикл шел по lens_set.
+            # Будем считать, что lens_configs - это уже развернутый список одиночных элементов, 
+            # либо мы обрабатываем "группу" как одну эффективную линзу (что обычно делается для CRL).
+            # НО, твой старый код итерировал `for n in lens_set`.
+            
+            # Для простоты считаем, что lens_conf - это ОДНА физическая единица расчета.
+            R = lens_conf['R']
+            A_phys = lens_conf['A']
+            p = lens_conf['p']
+            delta = lens_conf['delta']
+            mu = lens_conf['mu']
+            d = lens_conf['d']
+
+            # Расстояние от предыдущего элемента
+            t = distance_from_prev
+
+            #Определяем L1 (расстояние от источника / предыдущего фокуса до линзы)
+            if state.L2_prev == 0 and state.Alx_prev == 0:
+                L1 = t
+                is_first = True
+            else:
+                L1 = t - state.L2_prev #lens['position'] - prev_pos - L2_prev
+                is_first = False
+
+            #2. РАсчёт оптики
+            F = Formulas.F_single_lens(R, delta, p)
+            L2 = Formulas.L2(F, L1)
+            M = Formulas.magnification(L1, L2)
+            #M_total = Formulas.magnification_total(M_total, M)
+
+            Aeff = Formulas.Aeff_single_lens(F, delta, mu)
+
+            l_position = state.z + t
+
+            if is_first:
+                sfpx = Formulas.sfp_first_lens(L1=L1, divergence=state.wx, source_size=state.sx) if state.wx else A_phys
+                sfpy = Formulas.sfp_first_lens(L1=L1, divergence=state.wy, source_size=state.sy) if state.wy else A_phys
+            else:
+                sfpx = Formulas.sfp_next_lens(L2_prev = state.L2_prev, Al_prev = state.Alx_prev, dist_from_prev = t)
+                sfpy = Formulas.sfp_next_lens(L2_prev = state.L2_prev, Al_prev = state.Aly_prev, dist_from_prev = t)
+
+            alx = Formulas.Al(A_phys, sfpx, Aeff)
+            aly = Formulas.Al(A_phys, sfpy, Aeff)
+
+            diff_lim = Formulas.diff_lim(L2, A_phys, Aeff, lamda)
+            sfx = Formulas.sf(M, state.sx, diff_lim)
+            sfy = Formulas.sf(M, state.sy, diff_lim)
+
+            #Обновление состояния для следующей итерации
+            new_wx = state.wx - alx/F #под вопросом правильность
+            new_wy = state.wy - aly/F
+
+            new_M_total = state.M_total * M
+
+            #Сохранение результатов (только поля проекции)
+            result_data = {
+                'tf_name': lens_conf.get('tf_name', 'Unknown'),
+                'block_index': lens_conf.get('block_index', 1),
+                'is_last_in_block': lens_conf.get('is_last_in_block', False),
+                'is_last_in_tf': lens_conf.get('is_last_in_tf', False),
+                'tf_id': lens_conf.get('tf_id', 'Unknown'),
+                'lens_index_in_tf': lens_conf.get('lens_index_in_tf', i + 1),
+                'lens_index_in_block': lens_conf.get('lens_index_in_block', 1),
+                'index': i + 1,
+                'position': l_position,
+                'L1': L1,
+                'L2': L2,
+                'F': F,
+                'sx_fwhm': state.sx,
+                'sy_fwhm': state.sy,
+                'sfpx': sfpx,
+                'sfpy': sfpy,
+                'alx': alx,
+                'aly': aly,
+                'sfx': sfx,
+                'sfy': sfy,
+                'M': M,
+                'M_total': new_M_total,
+                'Aeff': Aeff,
+            }
+            # calculated only for last lens
+            if want_dof:
+                result_data['dof_x'] = 0.0
+                result_data['dof_y'] = 0.0
+            if want_symmetry:
+                result_data['symmetry_dist'] = 0.0
+                result_data['symm_beam_size_x'] = 0.0
+                result_data['symm_beam_size_y'] = 0.0
+
+            if want_sl:
+                result_data['slx'] = Formulas.sl(M, state.sx)
+                result_data['sly'] = Formulas.sl(M, state.sy)
+
+            if want_T:
+                T = Formulas.transmission(A_phys, alx, aly, sfpx, sfpy, mu, d)
+                state.T_current_block *= T
+                state.T_total *= T
+                result_data['T'] = T
+                if 'T_block' in need:
+                    result_data['T_block'] = state.T_current_block
+
+            if want_G:
+                L_total_dist = L1 + L2
+                sb_x = math.sqrt((L_total_dist * state.wx)**2 + state.sx**2)
+                sb_y = math.sqrt((L_total_dist * state.wy)**2 + state.sy**2)
+                G = Formulas.gain(T, sb_x, sb_y, sfx, sfy)
+                state.G_current_block *= G #= math.sqrt(state.G_current_block**2 + G**2)
+                state.G_total *= G#new_G_total #подумать над правильностью Formulas.gain_total(current_G_total, G)
+                result_data['G'] = G
+                if 'G_total' in need:
+                    result_data['G_total'] = state.G_current_block
+
+            if want_NA:
+                NA = Formulas.numerical_aperture(Aeff, F)
+                state.NA_current_block = NA  # можно сделать накопление, если нужно
+                result_data['NA'] = NA
+                if 'NA_block' in need:
+                    result_data['NA_block'] = state.NA_current_block
+
+            if want_aeff_sys:
+                Aeff_sys = Formulas.Aeff_system(state.Aeff_prev_total, Aeff)
+                state.Aeff_current_block = Aeff_sys
+                state.Aeff_prev_total = Aeff_sys
+                result_data['Aeff_total'] = Aeff_sys
+                if 'Aeff_block' in need:
+                    result_data['Aeff_block'] = state.Aeff_current_block
+
+            if lens_conf.get('is_last_in_tf', False):
+                if want_T:
+                    state.T_blocks.append(state.T_current_block)
+                if want_G:
+                    state.G_blocks.append(state.G_current_block)
+                if want_NA:
+                    state.NA_blocks.append(state.NA_current_block)
+                if want_aeff_sys:
+                    state.Aeff_blocks.append(state.Aeff_current_block)
+                if want_dof:
+                    result_data['dof_x'] = Formulas.dof(L2, sfx, alx, lamda, NA)
+                    result_data['dof_y'] = Formulas.dof(L2, sfy, aly, lamda, NA)
+            #result_data.setdefault('dof_x', 0.0)
+            #result_data.setdefault('dof_y', 0.0)
+            #result_data.setdefault('symmetry_dist', 0.0)
+            #result_data.setdefault('symm_beam_size_x', 0.0)
+            #result_data.setdefault('symm_beam_size_y', 0.0)
+
+            # Создаём объект
+            res = LensResult(**result_data)
+
+            #Обновление state
+            state.z += t
+            state.wx = new_wx
+            state.wy = new_wy
+            state.sx = sfx
+            state.sy = sfy
+            state.M_total *= M
+            
+            state.L2_prev = L2
+            state.Alx_prev = alx
+            state.Aly_prev = aly
+
+            yield res
+            for condition in stop:
+                if condition(lens_conf, res, state):
+                    return condition
+        return None
+
+    @staticmethod
+    def _finish_last(last, last_conf, lamda, need=ALL_FIELDS):
+        """dof и symmetry для последней линзы цепочки (дописываются в last, если входят в need)."""
+        k = 0.01 #cltkfnm 
+
+        # === DoF ===
+        if 'dof_x' in need or 'dof_y' in need:
+            # === NA для последней линзы ===
+            Aeff_last = Formulas.Aeff_single_lens(last.F, last_conf['delta'], last_conf['mu'])  # нужно передать актуальные delta, mu
+            num_ap = Formulas.numerical_aperture(Aeff_last, last.F)
+            if num_ap != 0:
+                dof_x = Formulas.dof(last.L2, last.slx, last.alx, lamda, num_ap)
+                dof_y = Formulas.dof(last.L2, last.sly, last.aly, lamda, num_ap)
+            else:
+                dof_x = 0.0
+                dof_y = 0.0
+            last.dof_x, last.dof_y = dof_x, dof_y
+
+        # === Symmetry ===
+        if 'symmetry_dist' in need:
+            try:
+                sym_dist = Formulas.symmetry_dist(last.L2, last.sfy, last.sfx, last.alx, last.aly, k)
+            except:
+                sym_dist = 0.0
+
+            try:
+                sym_size_x = Formulas.symm_beam_size(last.alx, last.L2, sym_dist, last.sfx)
+                sym_size_y = Formulas.symm_beam_size(last.aly, last.L2, sym_dist, last.sfy)
+            except:
+                sym_size_x, sym_size_y = 0.0, 0.0
+
+            last.symmetry_dist = sym_dist
+            last.symm_beam_size_x, last.symm_beam_size_y = sym_size_x, sym_size_y
+
+
+# --- 4. Условия остановки для Calculator.iter_propagate ---
+
+def stop_if_transmission_below(t_min: float):
+    """Общее пропускание T_total упало ниже t_min."""
+    def condition(lens_conf, result, state):
+        return state.T_total < t_min
+    condition.fields = ('T',)
+    return condition
+
+
+def stop_if_beam_exceeds_aperture(factor: float = 1.0):
+    """Пучок на входе линзы (sfp по x или y) больше factor * A."""
+    def condition(lens_conf, result, state):
+        limit = factor * lens_conf['A']
+        return result.sfpx > limit or result.sfpy > limit
+    return condition
+
+
+def stop_if_focus_outside(z_min: float, z_max: float, tf_name: Optional[str] = None):
+    """
+    Фокус после последней линзы TF (tf_name или любого) вне [z_min, z_max].
+    Для промежуточных TF это фокус, который видит следующий TF.
+    """
+    def condition(lens_conf, result, state):
+        if not lens_conf.get('is_last_in_tf', False):
+            return False
+        if tf_name is not None and lens_conf.get('tf_name') != tf_name:
+            return False
+        focus = result.position + result.L2
+        return not z_min <= focus <= z_max
+    return condition
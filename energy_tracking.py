@@ -0,0 +1,412 @@
+import json
+import os
+from bisect import bisect_left
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+import numpy as np
+
+from batch_computations import ChainArrays, BatchCalculator
+from fidelity import screen_then_confirm
+from lens_mask import LensMask
+
+
+# Строка таблицы: candidate — индекс конфигурации линз, positions — {TF: позиция, м}
+TrackingRow = namedtuple('TrackingRow', 'energy candidate positions focus_pos size_x size_y transmission')
+
+
+# --- Конфигурации линз (кандидаты) ---
+
+def default_candidates(structure_config):
+    """
+    Кандидаты по умолчанию: в одном из Air-TF в пучок вводятся первые k линз
+    (k = 1..N), остальные TF остаются как в structure_config. TF меняются по
+    одному, а не всеми сочетаниями: два Air-TF по 100 линз дают 200
+    кандидатов, а не 10 000.
+    """
+    candidates = []
+    for block in structure_config:
+        if block.get('type') != 'air' or not block.get('lenses'):
+            continue
+        n = len(block['lenses'])
+        candidates += [{block['tf_name']: {'active_mask': LensMask.from_ranges([(0, k - 1)], n)}}
+                       for k in range(1, n + 1)]
+    return candidates or [{}]
+
+
+def apply_candidate(structure_config, candidate):
+    """Копия structure_config с подставленными из кандидата active_mask/groups."""
+    return [dict(block, **candidate.get(block.get('tf_name'), {})) for block in structure_config]
+
+
+def lens_states(structure_config):
+    """
+    Состояния линз TF: {имя TF: LensMask} — линзы Air или блоки Vacuum в пучке.
+    Блок Vacuum с заданными по отдельности линзами в пучке, если в пучке хоть одна из них.
+    """
+    states = {}
+    for block in structure_config:
+        name = block.get('tf_name')
+        if block.get('type') == 'air':
+            lenses = block.get('lenses', [])
+            mask = block.get('active_mask')
+            states[name] = mask if mask is not None else \
+                LensMask.from_flags(lens.get('active', True) for lens in lenses)
+        elif block.get('type') == 'vacuum':
+            groups = block.get('groups', [])
+            states[name] = LensMask.from_flags(
+                any(lens.get('active', True) for lens in group['lenses'])
+                if group.get('lenses') is not None and len(group['lenses']) == group['N']
+                else group.get('active', True)
+                for group in groups)
+    return states
+
+
+def apply_lens_states(structure_config, states):
+    """
+    Копия structure_config с состояниями линз {имя TF: LensMask} (как у lens_states).
+    Выведенный блок Vacuum — все его линзы вне пучка; введённый — линзы как в конфигурации.
+    """
+    candidate = {}
+    for block in structure_config:
+        name = block.get('tf_name')
+        if name not in states:
+            continue
+        mask = states[name]
+        if block.get('type') == 'air':
+            candidate[name] = {'active_mask': mask}
+            continue
+        groups = []
+        for i, group in enumerate(block.get('groups', [])):
+            group = dict(group, active=bool(mask.bits >> i & 1))
+            if not group['active'] and group.get('lenses') is not None:
+                group['lenses'] = [dict(lens, active=False) for lens in group['lenses']]
+            groups.append(group)
+        candidate[name] = {'groups': groups}
+    return apply_candidate(structure_config, candidate)
+
+
+def apply_positions(structure_config, positions):
+    """Копия structure_config с другими позициями TF (сдвигается absolute_start)."""
+    result = []
+    for block in structure_config:
+        block = dict(block)
+        name = block.get('tf_name')
+        if name in positions:
+            base = block.get('position', block['absolute_start'])
+            block['absolute_start'] += positions[name] - base
+            block['position'] = positions[name]
+        result.append(block)
+    return result
+
+
+def describe_candidate(candidate):
+    """Короткое текстовое описание конфигурации линз для GUI."""
+    parts = []
+    for name, conf in candidate.items():
+        if 'active_mask' in conf:
+            ranges = conf['active_mask'].to_ranges()
+            parts.append(f"{name}: " + ", ".join(f"{a + 1}-{b + 1}" if a != b else f"{a + 1}" for a, b in ranges))
+        elif 'groups' in conf:
+            active = [str(i + 1) for i, g in enumerate(conf['groups']) if g.get('active', True)]
+            parts.append(f"{name}: blocks " + ",".join(active))
+    return "; ".join(parts) or "as configured"
+
+
+def _candidate_to_json(candidate):
+    out = {}
+    for name, conf in candidate.items():
+        conf = dict(conf)
+        if 'active_mask' in conf:
+            mask = conf.pop('active_mask')
+            conf['active_ranges'] = mask.to_ranges()
+            conf['total_lenses'] = mask.size
+        out[name] = conf
+    return out
+
+
+def _candidate_from_json(data):
+    out = {}
+    for name, conf in data.items():
+        conf = dict(conf)
+        if 'active_ranges' in conf:
+            conf['active_mask'] = LensMask.from_ranges(conf.pop('active_ranges'), conf.pop('total_lenses'))
+        out[name] = conf
+    return out
+
+
+# --- Поиск позиций для одной энергии ---
+
+# Величины, которые нужны стоимости и метрикам найденной точки (G не считается)
+TRACKING_FIELDS = ('focus_pos', 'size_x', 'size_y', 'T')
+
+@dataclass
+class TrackingTarget:
+    """Цель: положение фокуса (м) и, при необходимости, размер пятна (м)."""
+
+    focus_pos: float
+    size: float = None
+    focus_tol: float = 1e-3
+    size_tol: float = 0.1e-6
+
+    def cost(self, result):
+        """
+        Стоимость точки: ошибка фокуса в допусках + размер + (1 - T) как tie-breaker
+        (если T в результате; на уровне fidelity.SCREEN его нет).
+        """
+        cost = ((result['focus_pos'] - self.focus_pos) / self.focus_tol)**2
+        if self.size is not None:
+            cost = cost + (((result['size_x'] - self.size)**2 + (result['size_y'] - self.size)**2)
+                           / self.size_tol**2)
+        if 'T' in result:
+            cost = cost + (1 - result['T'])
+        return cost
+
+
+def _position_grid(bounds, steps):
+    axes = [np.linspace(lo, hi, steps) for lo, hi in bounds.values()]
+    grids = np.meshgrid(*axes, indexing='ij')
+    return {name: grid.ravel() for name, grid in zip(bounds, grids)}
+
+
+def optimize_positions(controller, energy, structure_config, source_params, target, bounds,
+                       steps=41, refinements=2, confirm=16):
+    """
+    Лучшие позиции TF для одной конфигурации линз: сетка по bounds, затем
+    уточнение сеткой вокруг лучшей точки (refinements раз, каждый раз в 4 раза уже).
+
+    Сетка считается дешёвым уровнем fidelity.SCREEN, confirm лучших точек
+    перепроверяются полным расчётом; confirm=None — вся сетка полным расчётом.
+
+    Returns:
+        (cost, positions, metrics) или None, если нет допустимых точек
+    """
+    source, lens_chain = controller.build_chain(energy, structure_config, source_params)
+    if not lens_chain:
+        return None
+    chain = ChainArrays.from_chain(lens_chain)
+
+    best = None
+    for _ in range(refinements + 1):
+        grid = _position_grid(bounds, steps)
+        abs_pos = chain.positions_for(structure_config, grid)
+        if confirm is None:
+            result = BatchCalculator.propagate(chain, source, abs_pos=abs_pos, fields=TRACKING_FIELDS)
+            cost = np.where(ChainArrays.ordered(abs_pos), target.cost(result), np.nan)
+            if np.all(np.isnan(cost)):
+                break
+            k = int(np.nanargmin(cost))
+            found = (float(cost[k]), k, {key: float(result[key][k]) for key in TRACKING_FIELDS})
+        else:
+            indices, costs, result = screen_then_confirm(chain, source, abs_pos, target.cost, keep=confirm,
+                                                         fields=TRACKING_FIELDS)
+            if not len(indices) or not np.isfinite(costs[0]):
+                break
+            found = (float(costs[0]), int(indices[0]),
+                     {key: float(result[key][0]) for key in TRACKING_FIELDS})
+        if best is None or found[0] < best[0]:
+            k = found[1]
+            best = (found[0], {name: float(values[k]) for name, values in grid.items()}, found[2])
+        # Сужаем область вокруг лучшей точки, не выходя за исходные границы
+        new_bounds = {}
+        for name, (lo, hi) in bounds.items():
+            half = (hi - lo) / 8
+            center = best[1][name]
+            new_bounds[name] = (max(lo, center - half), min(hi, center + half))
+        bounds = new_bounds
+    return best
+
+
+def _solve_energy(args):
+    controller, energy, structure_config, source_params, candidates, target, bounds, steps = args
+    if source_params is not None:
+        source_params = dict(source_params, energy=energy)
+    best = None
+    for index, candidate in enumerate(candidates):
+        config = apply_candidate(structure_config, candidate)
+        found = optimize_positions(controller, energy, config, source_params, target, bounds, steps)
+        if found is not None and (best is None or found[0] < best[0]):
+            best = (found[0], index, found[1], found[2])
+    return energy, best
+
+
+# --- Таблица ---
+
+class EnergyTrackingTable:
+    """
+    Таблица энергия -> лучшая конфигурация линз и позиции TF.
+
+    Энергии отсортированы; nearest()/interpolate() ищут делением пополам по
+    списку Python float и не трогают numpy, поэтому запрос занимает микросекунды.
+    """
+
+    def __init__(self, energies, candidates, candidate_index, positions, tf_names,
+                 focus_pos, size_x, size_y, transmission, target=None):
+        order = np.argsort(energies)
+        self.energies = np.asarray(energies, dtype=float)[order]
+        self.candidates = list(candidates)
+        self.candidate_index = np.asarray(candidate_index, dtype=int)[order]
+        self.positions = np.asarray(positions, dtype=float).reshape(len(order), len(tf_names))[order]
+        self.tf_names = tuple(tf_names)
+        self.focus_pos = np.asarray(focus_pos, dtype=float)[order]
+        self.size_x = np.asarray(size_x, dtype=float)[order]
+        self.size_y = np.asarray(size_y, dtype=float)[order]
+        self.transmission = np.asarray(transmission, dtype=float)[order]
+        self.target = target
+
+        # Предвычисленные строки для быстрых запросов
+        self._keys = self.energies.tolist()
+        self._rows = [
+            TrackingRow(e, int(c), dict(zip(self.tf_names, pos)), f, sx, sy, t)
+            for e, c, pos, f, sx, sy, t in zip(
+                self._keys, self.candidate_index.tolist(), self.positions.tolist(),
+                self.focus_pos.tolist(), self.size_x.tolist(), self.size_y.tolist(),
+                self.transmission.tolist())
+        ]
+
+    @classmethod
+    def from_rows(cls, rows, candidates, tf_names, target=None):
+        """Таблица из строк TrackingRow (например, накопленных по partial при построении)."""
+        return cls(
+            energies = [row.energy for row in rows],
+            candidates = candidates,
+            candidate_index = [row.candidate for row in rows],
+            positions = [[row.positions[name] for name in tf_names] for row in rows],
+            tf_names = tf_names,
+            focus_pos = [row.focus_pos for row in rows],
+            size_x = [row.size_x for row in rows],
+            size_y = [row.size_y for row in rows],
+            transmission = [row.transmission for row in rows],
+            target = target,
+        )
+
+    def __len__(self):
+        return len(self._rows)
+
+    def rows(self):
+        return list(self._rows)
+
+    def nearest(self, energy) -> TrackingRow:
+        """Строка с ближайшей энергией."""
+        keys = self._keys
+        i = bisect_left(keys, energy)
+        if i == len(keys):
+            i -= 1
+        elif i > 0 and energy - keys[i - 1] <= keys[i] - energy:
+            i -= 1
+        return self._rows[i]
+
+    def interpolate(self, energy) -> TrackingRow:
+        """
+        Линейная интерполяция позиций и метрик между соседними энергиями.
+        Если у соседей разные конфигурации линз, возвращается ближайшая строка.
+        """
+        keys = self._keys
+        i = bisect_left(keys, energy)
+        if i == 0 or i == len(keys):
+            return self._rows[min(i, len(keys) - 1)]
+        lo, hi = self._rows[i - 1], self._rows[i]
+        if lo.candidate != hi.candidate:
+            return self.nearest(energy)
+        w = (energy - lo.energy) / (hi.energy - lo.energy)
+        return TrackingRow(
+            energy, lo.candidate,
+            {name: lo.positions[name] + w * (hi.positions[name] - lo.positions[name]) for name in self.tf_names},
+            lo.focus_pos + w * (hi.focus_pos - lo.focus_pos),
+            lo.size_x + w * (hi.size_x - lo.size_x),
+            lo.size_y + w * (hi.size_y - lo.size_y),
+            lo.transmission + w * (hi.transmission - lo.transmission),
+        )
+
+    def candidate(self, row):
+        return self.candidates[row.candidate]
+
+    def save(self, path):
+        """Сохраняет таблицу в .npz (кандидаты — JSON внутри архива)."""
+        np.savez(
+            path,
+            energies = self.energies,
+            candidate_index = self.candidate_index,
+            positions = self.positions,
+            tf_names = np.array(self.tf_names),
+            focus_pos = self.focus_pos,
+            size_x = self.size_x,
+            size_y = self.size_y,
+            transmission = self.transmission,
+            candidates_json = np.array(json.dumps([_candidate_to_json(c) for c in self.candidates])),
+            target_json = np.array(json.dumps(vars(self.target) if self.target else None)),
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            target = json.loads(str(data['target_json']))
+            return cls(
+                energies = data['energies'],
+                candidates = [_candidate_from_json(c) for c in json.loads(str(data['candidates_json']))],
+                candidate_index = data['candidate_index'],
+                positions = data['positions'],
+                tf_names = [str(name) for name in data['tf_names']],
+                focus_pos = data['focus_pos'],
+                size_x = data['size_x'],
+                size_y = data['size_y'],
+                transmission = data['transmission'],
+                target = TrackingTarget(**target) if target else None,
+            )
+
+
+def build_tracking_table(controller, structure_config, energies, target: TrackingTarget,
+                         source_params=None, candidates=None, bounds=None, steps=41,
+                         workers=None, progress=None, partial=None) -> EnergyTrackingTable:
+    """
+    Строит таблицу слежения за фокусом по энергиям, параллельно по всем ядрам.
+
+    Args:
+        controller: AdvancedController
+        structure_config: текущая конфигурация (с 'position' у блоков)
+        energies: энергии, эВ
+        target: TrackingTarget
+        candidates: конфигурации линз; по умолчанию default_candidates()
+        bounds: {имя TF: (min, max)} — ход TF по рельсу; по умолчанию ±1 м от текущей позиции
+        workers: число процессов (None — все ядра)
+        progress: callback(done, total), вызывается по мере готовности энергий;
+            исключение из него (отмена задачи) снимает ещё не начатые энергии
+        partial: callback(TrackingRow) для каждой решённой энергии (в порядке energies)
+    """
+    if candidates is None:
+        candidates = default_candidates(structure_config)
+    if bounds is None:
+        bounds = {}
+        for block in structure_config:
+            pos = block.get('position', block['absolute_start'])
+            bounds[block['tf_name']] = (pos - 1.0, pos + 1.0)
+    tf_names = list(bounds)
+
+    jobs = [(controller, float(e), structure_config, source_params, candidates, target, bounds, steps)
+            for e in energies]
+    rows = []
+    pool = ProcessPoolExecutor(max_workers=workers or os.cpu_count())
+    futures = [pool.submit(_solve_energy, job) for job in jobs]
+    try:
+        for done, future in enumerate(futures, start=1):
+            energy, best = future.result()
+            if best is not None:
+                _, index, positions, metrics = best
+                row = TrackingRow(energy, index, {name: positions[name] for name in tf_names},
+                                  metrics['focus_pos'], metrics['size_x'], metrics['size_y'], metrics['T'])
+                rows.append(row)
+                if partial is not None:
+                    partial(row)
+            if progress is not None:
+                progress(done, len(jobs))
+    except BaseException:
+        # Не ждём уже начатых энергий: процессы досчитают их и завершатся сами
+        pool.shutdown(wait=False, cancel_futures=True)
+        raise
+    pool.shutdown()
+
+    if not rows:
+        raise ValueError("No valid configuration found for any energy")
+
+    return EnergyTrackingTable.from_rows(rows, candidates, tf_names, target)
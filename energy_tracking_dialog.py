@@ -0,0 +1,230 @@
+import numpy as np
+from PyQt5.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QFormLayout, QGroupBox,
+                             QDoubleSpinBox, QPushButton, QTableWidget, QTableWidgetItem,
+                             QHeaderView, QCheckBox, QMessageBox, QFileDialog, QProgressBar)
+
+from energy_tracking import (EnergyTrackingTable, TrackingTarget, build_tracking_table,
+                             default_candidates, describe_candidate)
+
+
+class EnergyTrackingDialog(QDialog):
+    """Построение/загрузка таблицы слежения за фокусом при смене энергии."""
+
+    def __init__(self, parent, controller, structure_config, source_params, jobs, focus_pos=None,
+                 table=None, tracking_enabled=False):
+        super().__init__(parent)
+        self.setWindowTitle("Energy Tracking Table")
+        self.resize(800, 600)
+        self.controller = controller
+        self.structure_config = structure_config
+        self.source_params = source_params
+        self.table = table
+        self.jobs = jobs   # JobsPanel: таблица строится фоновой задачей
+        self.job = None
+        self._partial = None   # (кандидаты, имена TF, цель, решённые строки) идущего построения
+
+        self.setup_ui(focus_pos, tracking_enabled)
+        self.show_table()
+
+    def setup_ui(self, focus_pos, tracking_enabled):
+        layout = QVBoxLayout(self)
+        top = QHBoxLayout()
+
+        gb_energy = QGroupBox("Energy Range")
+        form = QFormLayout()
+        energy = self.source_params['energy']
+        self.spin_e_from, self.spin_e_to, self.spin_e_step = QDoubleSpinBox(), QDoubleSpinBox(), QDoubleSpinBox()
+        for spin, value in ((self.spin_e_from, energy * 0.8), (self.spin_e_to, energy * 1.2), (self.spin_e_step, 100)):
+            spin.setRange(1, 100000)
+            spin.setDecimals(0)
+            spin.setSuffix(" eV")
+            spin.setValue(value)
+        form.addRow("From:", self.spin_e_from)
+        form.addRow("To:", self.spin_e_to)
+        form.addRow("Step:", self.spin_e_step)
+        gb_energy.setLayout(form)
+        top.addWidget(gb_energy)
+
+        gb_target = QGroupBox("Target")
+        form = QFormLayout()
+        self.spin_focus = QDoubleSpinBox()
+        self.spin_focus.setRange(0, 500)
+        self.spin_focus.setDecimals(4)
+        self.spin_focus.setSuffix(" m")
+        self.spin_focus.setValue(focus_pos if focus_pos is not None else 0.0)
+        self.spin_focus_tol = QDoubleSpinBox()
+        self.spin_focus_tol.setRange(0.001, 1000)
+        self.spin_focus_tol.setDecimals(3)
+        self.spin_focus_tol.setSuffix(" mm")
+        self.spin_focus_tol.setValue(1.0)
+        self.spin_size = QDoubleSpinBox()
+        self.spin_size.setRange(0, 10000)
+        self.spin_size.setDecimals(2)
+        self.spin_size.setSuffix(" um")
+        self.spin_size.setSpecialValueText("any")
+        form.addRow("Focus position:", self.spin_focus)
+        form.addRow("Focus tolerance:", self.spin_focus_tol)
+        form.addRow("Spot size:", self.spin_size)
+        gb_target.setLayout(form)
+        top.addWidget(gb_target)
+        layout.addLayout(top)
+
+        btns_top = QHBoxLayout()
+        self.btn_build = QPushButton("Build Table")
+        self.btn_load = QPushButton("Load...")
+        self.btn_save = QPushButton("Save...")
+        self.btn_stop = QPushButton("Stop")
+        self.btn_stop.setEnabled(False)
+        self.progress = QProgressBar()
+        self.btn_build.clicked.connect(self.build)
+        self.btn_stop.clicked.connect(self.stop)
+        self.btn_load.clicked.connect(self.load)
+        self.btn_save.clicked.connect(self.save)
+        btns_top.addWidget(self.btn_build)
+        btns_top.addWidget(self.btn_stop)
+        btns_top.addWidget(self.progress)
+        btns_top.addStretch()
+        btns_top.addWidget(self.btn_load)
+        btns_top.addWidget(self.btn_save)
+        layout.addLayout(btns_top)
+
+        self.table_view = QTableWidget(0, 0)
+        self.table_view.verticalHeader().setVisible(False)
+        layout.addWidget(self.table_view)
+
+        self.chk_track = QCheckBox("Track focus when energy changes")
+        self.chk_track.setChecked(tracking_enabled)
+        layout.addWidget(self.chk_track)
+
+        btns = QHBoxLayout()
+        btn_ok = QPushButton("OK")
+        btn_cancel = QPushButton("Cancel")
+        btn_ok.clicked.connect(self.accept)
+        btn_cancel.clicked.connect(self.reject)
+        btns.addStretch()
+        btns.addWidget(btn_ok)
+        btns.addWidget(btn_cancel)
+        layout.addLayout(btns)
+
+    def build(self):
+        e_from, e_to, e_step = self.spin_e_from.value(), self.spin_e_to.value(), self.spin_e_step.value()
+        if e_to < e_from:
+            QMessageBox.warning(self, "Energy Tracking", "Energy range is empty.")
+            return
+        energies = np.arange(e_from, e_to + e_step / 2, e_step)
+        target = TrackingTarget(
+            focus_pos = self.spin_focus.value(),
+            size = self.spin_size.value() * 1e-6 or None,
+            focus_tol = self.spin_focus_tol.value() * 1e-3,
+        )
+
+        controller, structure_config, source_params = self.controller, self.structure_config, self.source_params
+        candidates = default_candidates(structure_config)
+        tf_names = [block['tf_name'] for block in structure_config]
+
+        def run(job):
+            return build_tracking_table(controller, structure_config, energies, target,
+                                        source_params = source_params, candidates = candidates,
+                                        progress = job.progress, partial = job.partial)
+
+        # Решённые энергии приходят по одной строке и дописываются в таблицу
+        self._partial = (candidates, tf_names, target, [])
+        self._set_headers(tf_names)
+        self.table_view.setRowCount(0)
+
+        self.progress.setRange(0, len(energies))
+        self.progress.setValue(0)
+        self.btn_build.setEnabled(False)
+        self.btn_stop.setEnabled(True)
+        self.job = self.jobs.submit(
+            f"Energy tracking {e_from:.0f}-{e_to:.0f} eV", run,
+            on_progress = lambda done, total: self.progress.setValue(done),
+            on_partial = self.show_partial,
+            on_done = self.on_built,
+            on_error = self.on_error,
+        )
+
+    def show_partial(self, row):
+        """Строка очередной решённой энергии."""
+        candidates, tf_names, _, rows = self._partial
+        rows.append(row)
+        self._add_row(row, candidates[row.candidate], tf_names)
+
+    def on_built(self, table):
+        self._finished()
+        self.table = table
+        self.show_table()
+
+    def on_error(self, message):
+        self._finished()
+        QMessageBox.critical(self, "Energy Tracking Error", message)
+
+    def stop(self):
+        self.jobs.cancel(self.job)
+        self._finished()
+        candidates, tf_names, target, rows = self._partial
+        if rows:
+            self.table = EnergyTrackingTable.from_rows(rows, candidates, tf_names, target)
+            self.show_table()
+
+    def _finished(self):
+        self.job = None
+        self.btn_build.setEnabled(True)
+        self.btn_stop.setEnabled(False)
+
+    def done(self, result):
+        # Закрытие окна отменяет незавершённое построение; готовые строки остаются в таблице
+        if self.job is not None:
+            self.stop()
+        super().done(result)
+
+    def show_table(self):
+        table = self.table
+        if table is None:
+            return
+        self._set_headers(table.tf_names)
+        self.table_view.setRowCount(0)
+        for row in table.rows():
+            self._add_row(row, table.candidate(row), table.tf_names)
+
+    def _set_headers(self, tf_names):
+        headers = ["Energy, eV", "Lenses"] + [f"{name}, m" for name in tf_names] + \
+                  ["Focus, m", "Size X, um", "Size Y, um", "T, %"]
+        self.table_view.setColumnCount(len(headers))
+        self.table_view.setHorizontalHeaderLabels(headers)
+        self.table_view.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+
+    def _add_row(self, row, candidate, tf_names):
+        values = [f"{row.energy:.0f}", describe_candidate(candidate)]
+        values += [f"{row.positions[name]:.4f}" for name in tf_names]
+        values += [f"{row.focus_pos:.4f}", f"{row.size_x * 1e6:.2f}", f"{row.size_y * 1e6:.2f}",
+                   f"{row.transmission * 100:.1f}"]
+        r = self.table_view.rowCount()
+        self.table_view.insertRow(r)
+        for c, text in enumerate(values):
+            self.table_view.setItem(r, c, QTableWidgetItem(text))
+
+    def load(self):
+        path, _ = QFileDialog.getOpenFileName(self, "Load Tracking Table", "", "Tracking table (*.npz)")
+        if not path:
+            return
+        try:
+            self.table = EnergyTrackingTable.load(path)
+        except Exception as e:
+            QMessageBox.critical(self, "Load Error", str(e))
+            return
+        self.show_table()
+
+    def save(self):
+        if self.table is None:
+            QMessageBox.warning(self, "Save", "Build or load a table first.")
+            return
+        path, _ = QFileDialog.getSaveFileName(self, "Save Tracking Table", "tracking.npz", "Tracking table (*.npz)")
+        if path:
+            self.table.save(path)
+
+    def get_table(self):
+        return self.table
+
+    def tracking_enabled(self):
+        return self.chk_track.isChecked() and self.table is not None
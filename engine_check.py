@@ -0,0 +1,353 @@
+"""
+Проверка эквивалентности расчётных движков и регрессии физики.
+
+Генерирует случайные корректные схемы (TF, линзы, источник), считает их
+эталонным Calculator.propagate и каждым доступным движком и сравнивает все
+колонки LENS_RESULT_FIELDS с заданными допусками. Эталонные результаты можно
+сохранить в golden-файл и потом проверять, что физика не поменялась.
+
+    python engine_check.py --schemes 20000                 # все движки против эталона
+    python engine_check.py --schemes 2000 --write-golden golden.npz
+    python engine_check.py --check-golden golden.npz
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from computations import LENS_RESULT_FIELDS, CalcMode
+from calc_service import structure_from_json
+from main_controller import AdvancedController
+
+# Допуски (rtol, atol) по колонкам; остальные числовые колонки — DEFAULT_TOLERANCE
+DEFAULT_TOLERANCE = (1e-9, 0.0)
+TOLERANCES = {
+    # Около нуля относительная ошибка не имеет смысла
+    'symmetry_dist': (1e-9, 1e-15),
+    'dof_x': (1e-9, 1e-15),
+    'dof_y': (1e-9, 1e-15),
+}
+
+NUMERIC_FIELDS = [name for name, typ, _, _ in LENS_RESULT_FIELDS if typ in (float, int)]
+EXACT_FIELDS = [name for name, typ, _, _ in LENS_RESULT_FIELDS if typ in (str, bool)]
+SUMMARY_KEYS = ('final_pos', 'L2', 'M_total', 'T', 'G', 'size_x', 'size_y')
+
+
+# --- Случайные схемы ---
+
+def random_scheme(rng, presets):
+    """
+    Случайная корректная схема в JSON-формате calc_service:
+    {'energy', 'source', 'use_fwhm', 'structure': [...]}.
+    TF идут по оси друг за другом и не перекрываются.
+    """
+    n_tf = int(rng.integers(1, 4))
+    position = float(rng.uniform(10, 40))
+    structure = []
+    for k in range(n_tf):
+        name = f"TF{k + 1}"
+        if rng.random() < 0.5:
+            n = int(rng.integers(1, 101))
+            lenses = [{'preset': str(rng.choice(presets))} for _ in range(n)] if rng.random() < 0.3 else None
+            preset = str(rng.choice(presets))
+            n_ranges = int(rng.integers(1, 4))
+            starts = np.sort(rng.choice(n, size=min(n_ranges, n), replace=False))
+            ranges = [[int(a), int(min(a + rng.integers(0, 10), n - 1))] for a in starts]
+            block = {'tf_name': name, 'type': 'air', 'preset': preset, 'total_lenses': n, 'active_ranges': ranges}
+            if lenses is not None:
+                block['lenses'] = lenses
+        else:
+            groups = [{'N': int(rng.integers(1, 6)), 'preset': str(rng.choice(presets)),
+                       'active': bool(rng.random() < 0.6)} for _ in range(int(rng.integers(1, 15)))]
+            groups[int(rng.integers(len(groups)))]['active'] = True
+            block = {'tf_name': name, 'type': 'vacuum', 'groups': groups}
+        block['position'] = position
+        block['measure_to_center'] = bool(rng.random() < 0.5)
+        structure.append(block)
+        position += float(rng.uniform(0.5, 40))
+
+    energy = float(rng.uniform(5000, 40000))
+    source = {
+        'energy': energy,
+        'sx_fwhm': float(rng.uniform(1, 200)), 'sy_fwhm': float(rng.uniform(1, 50)),
+        'wx_fwhm': float(rng.uniform(0, 50)), 'wy_fwhm': float(rng.uniform(0, 50)),
+    }
+    return {'energy': energy, 'source': source, 'use_fwhm': bool(rng.random() < 0.8), 'structure': structure}
+
+
+def scheme_rng(seed, index):
+    """Генератор схемы index: воспроизводим независимо от числа процессов."""
+    return np.random.default_rng([seed, index])
+
+
+# --- Движки ---
+
+def _history_columns(history):
+    return {name: [getattr(item, name) for item in history] for name in NUMERIC_FIELDS + EXACT_FIELDS}
+
+
+def _run_controller(controller, scheme):
+    structure = structure_from_json(scheme['structure'], controller)
+    mode = CalcMode.of(scheme['use_fwhm'])
+    report = controller.run_calculations(scheme['energy'], structure, source_params=scheme['source'], mode=mode)
+    if 'error' in report:
+        return None
+    return {'columns': _history_columns(report['full_history']),
+            'summary': {key: report[key] for key in SUMMARY_KEYS}}
+
+
+def _backend_python(scheme):
+    return _run_controller(_controllers('python'), scheme)
+
+
+def _backend_numba(scheme):
+    return _run_controller(_controllers('numba'), scheme)
+
+
+def _backend_batch(scheme):
+    """BatchCalculator: только итоговые величины (без истории по линзам)."""
+    from batch_computations import ChainArrays, BatchCalculator
+
+    controller = _controllers('python')
+    structure = structure_from_json(scheme['structure'], controller)
+    source, chain = controller.build_chain(scheme['energy'], structure, scheme['source'],
+                                           CalcMode.of(scheme['use_fwhm']))
+    if not chain:
+        return None
+    result = BatchCalculator.propagate(ChainArrays.from_chain(chain), source)
+    summary = {key: float(result[key][0]) for key in ('final_pos', 'L2', 'M_total', 'T', 'G', 'size_x', 'size_y')}
+    return {'columns': {}, 'summary': summary}
+
+
+def _backend_abcd(scheme):
+    """ABCDEngine: геометрия и размеры в фокусе (T, G считает эталон)."""
+    from abcd_engine import ABCDEngine
+
+    controller = _controllers('python')
+    structure = structure_from_json(scheme['structure'], controller)
+    engine = ABCDEngine.from_structure(controller, scheme['energy'], structure, scheme['source'],
+                                       CalcMode.of(scheme['use_fwhm']))
+    focus = engine.focus()
+    if 'error' in focus:
+        return None
+    return {'columns': {}, 'summary': {key: focus[key] for key in ('final_pos', 'L2', 'M_total', 'size_x', 'size_y')}}
+
+
+def _numba_available():
+    from numba_engine import NUMBA_AVAILABLE
+    return NUMBA_AVAILABLE
+
+
+# Реестр: имя -> (функция схема -> результат, проверка доступности)
+BACKENDS = {
+    'numba': (_backend_numba, _numba_available),
+    'batch': (_backend_batch, lambda: True),
+    'abcd': (_backend_abcd, lambda: True),
+}
+
+
+def register_backend(name, func, available=lambda: True):
+    """
+    Добавляет движок в проверку. func(scheme) -> {'columns': {поле: список},
+    'summary': {ключ: значение}} или None; сравниваются только те колонки, что он вернул.
+    Функция должна быть доступна по импорту (её вызывают рабочие процессы).
+    """
+    BACKENDS[name] = (func, available)
+
+
+def available_backends():
+    return [name for name, (_, available) in BACKENDS.items() if available()]
+
+
+_CONTROLLERS = {}
+
+
+def _controllers(backend):
+    if backend not in _CONTROLLERS:
+        _CONTROLLERS[backend] = AdvancedController(backend=backend)
+    return _CONTROLLERS[backend]
+
+
+# --- Сравнение ---
+
+def _close(a, b, rtol, atol):
+    a = np.asarray(a, dtype=float)
+    b = np.asarray(b, dtype=float)
+    same = (a == b) | (np.isnan(a) & np.isnan(b))
+    with np.errstate(invalid='ignore', over='ignore'):
+        return same | (np.abs(a - b) <= atol + rtol * np.abs(a))
+
+
+def compare(reference, result, tolerances=None):
+    """
+    Список расхождений [(колонка, индекс линзы или None, эталон, значение)].
+    None-результат (ошибка) совпадает только с None.
+    """
+    tolerances = tolerances or TOLERANCES
+    if reference is None or result is None:
+        return [] if reference is result else [('error', None, reference is None, result is None)]
+
+    mismatches = []
+    for name, values in result['columns'].items():
+        ref = reference['columns'][name]
+        if len(ref) != len(values):
+            mismatches.append((name, None, len(ref), len(values)))
+            continue
+        if name in EXACT_FIELDS:
+            mismatches += [(name, i, a, b) for i, (a, b) in enumerate(zip(ref, values)) if a != b]
+            continue
+        ok = _close(ref, values, *tolerances.get(name, DEFAULT_TOLERANCE))
+        mismatches += [(name, int(i), ref[i], values[i]) for i in np.flatnonzero(~ok)]
+    for key, value in result['summary'].items():
+        if not _close(reference['summary'][key], value, *tolerances.get(key, DEFAULT_TOLERANCE)):
+            mismatches.append((key, None, reference['summary'][key], value))
+    return mismatches
+
+
+def _check_chunk(args):
+    """Рабочий процесс: схемы [start, stop) против эталона для всех движков."""
+    seed, start, stop, backends = args
+    np.seterr(over='ignore', invalid='ignore')  # переполнения в случайных схемах ожидаемы
+    from lens_catalog import get_catalog
+    presets = get_catalog().ids()
+    failures = {name: [] for name in backends}
+    skipped = 0
+    for index in range(start, stop):
+        scheme = random_scheme(scheme_rng(seed, index), presets)
+        try:
+            reference = _backend_python(scheme)
+        except (ArithmeticError, ValueError):
+            skipped += 1  # эталон не считает такую схему — сравнивать не с чем
+            continue
+        for name in backends:
+            try:
+                result = BACKENDS[name][0](scheme)
+            except Exception as e:
+                failures[name].append((index, [('exception', None, None, repr(e))]))
+                continue
+            mismatches = compare(reference, result)
+            if mismatches:
+                failures[name].append((index, mismatches[:5]))
+    return stop - start, skipped, failures
+
+
+def run_check(n_schemes, seed=0, backends=None, workers=None, chunk=200, progress=None):
+    """
+    Проверяет n_schemes случайных схем параллельно.
+
+    Returns:
+        (checked, skipped, failures): failures[движок] — список (номер схемы, расхождения);
+        схему можно воспроизвести через random_scheme(scheme_rng(seed, номер), ...)
+    """
+    backends = list(backends or available_backends())
+    jobs = [(seed, start, min(start + chunk, n_schemes), backends) for start in range(0, n_schemes, chunk)]
+    checked, skipped = 0, 0
+    failures = {name: [] for name in backends}
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        for n, s, f in pool.map(_check_chunk, jobs):
+            checked += n
+            skipped += s
+            for name, items in f.items():
+                failures[name].extend(items)
+            if progress is not None:
+                progress(checked, n_schemes)
+    return checked, skipped, failures
+
+
+# --- Golden-файлы ---
+
+def write_golden(path, n_schemes, seed=0):
+    """Сохраняет схемы и эталонные колонки (через Calculator.propagate) в .npz."""
+    np.seterr(over='ignore', invalid='ignore')
+    from lens_catalog import get_catalog
+    presets = get_catalog().ids()
+    schemes, results = [], []
+    for index in range(n_schemes):
+        scheme = random_scheme(scheme_rng(seed, index), presets)
+        try:
+            result = _backend_python(scheme)
+        except (ArithmeticError, ValueError):
+            continue
+        if result is not None:
+            schemes.append(scheme)
+            results.append(result)
+
+    lengths = [len(r['columns']['index']) for r in results]
+    arrays = {'offsets': np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64),
+              'schemes_json': np.array(json.dumps(schemes))}
+    for name in NUMERIC_FIELDS + EXACT_FIELDS:
+        values = [v for r in results for v in r['columns'][name]]
+        arrays[f'col_{name}'] = np.array(values, dtype=str if name in EXACT_FIELDS and isinstance(values[0], str) else None)
+    for key in SUMMARY_KEYS:
+        arrays[f'sum_{key}'] = np.array([r['summary'][key] for r in results], dtype=float)
+    np.savez_compressed(path, **arrays)
+    return len(schemes)
+
+
+def check_golden(path, backends=('python',)):
+    """Пересчитывает схемы golden-файла и сравнивает с сохранёнными результатами."""
+    runners = {'python': _backend_python}
+    runners.update({name: func for name, (func, _) in BACKENDS.items()})
+    failures = {name: [] for name in backends}
+    np.seterr(over='ignore', invalid='ignore')
+    with np.load(path) as data:
+        schemes = json.loads(str(data['schemes_json']))
+        offsets = data['offsets']
+        columns = {name: data[f'col_{name}'] for name in NUMERIC_FIELDS + EXACT_FIELDS}
+        summaries = {key: data[f'sum_{key}'] for key in SUMMARY_KEYS}
+    for index, scheme in enumerate(schemes):
+        a, b = offsets[index], offsets[index + 1]
+        golden = {'columns': {name: col[a:b].tolist() for name, col in columns.items()},
+                  'summary': {key: float(s[index]) for key, s in summaries.items()}}
+        for name in backends:
+            mismatches = compare(golden, runners[name](scheme))
+            if mismatches:
+                failures[name].append((index, mismatches[:5]))
+    return len(schemes), failures
+
+
+def _print_failures(failures, limit=10):
+    ok = True
+    for name, items in failures.items():
+        status = "OK" if not items else f"{len(items)} schemes differ"
+        print(f"  {name}: {status}")
+        for index, mismatches in items[:limit]:
+            ok = False
+            print(f"    scheme {index}: " + "; ".join(
+                f"{col}[{i}] {ref!r} != {val!r}" if i is not None else f"{col} {ref!r} != {val!r}"
+                for col, i, ref, val in mismatches))
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check optimized engines against Calculator.propagate")
+    parser.add_argument('--schemes', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--backends', nargs='*', default=None, help="default: all available")
+    parser.add_argument('--write-golden', metavar='PATH')
+    parser.add_argument('--check-golden', metavar='PATH')
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    if args.write_golden:
+        n = write_golden(args.write_golden, args.schemes, args.seed)
+        print(f"Wrote {n} reference schemes to {args.write_golden} ({time.perf_counter() - t0:.1f} s)")
+        return 0
+    if args.check_golden:
+        n, failures = check_golden(args.check_golden, args.backends or ('python',))
+        print(f"Golden check, {n} schemes ({time.perf_counter() - t0:.1f} s):")
+        return 0 if _print_failures(failures) else 1
+
+    checked, skipped, failures = run_check(args.schemes, args.seed, args.backends, args.workers)
+    print(f"Checked {checked} schemes, {skipped} skipped (reference failed), "
+          f"{time.perf_counter() - t0:.1f} s:")
+    return 0 if _print_failures(failures) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,138 @@
+"""
+Уровни точности расчёта для поиска и скрининга.
+
+Все уровни считают итоговые величины (focus_pos, size_x, size_y, T, ...) для
+B вариантов позиций одной цепочки линз (ChainArrays) и различаются ценой:
+
+    SCREEN — геометрия и размеры в фокусе матричным методом (abcd_engine,
+             точно); T и G не считаются; на линзу — несколько векторных
+             операций.
+    FULL   — BatchCalculator.propagate (совпадает с Calculator.propagate).
+
+Другие уровни (трассировка лучей, волновая оптика) подключаются через
+register_fidelity(). screen_then_confirm() считает все варианты дешёвым уровнем
+и перепроверяет точным только лучшие; величины, которых дешёвый уровень не
+считает (T), в отборе не участвуют и учитываются только точным.
+"""
+from typing import Dict
+
+import numpy as np
+
+from abcd_engine import diffraction_coefficients
+from batch_computations import ChainArrays, BatchCalculator
+
+SCREEN = 'screen'
+FULL = 'full'
+
+
+class ScreenEvaluator:
+    """
+    Дешёвый уровень: точная геометрия и размеры в фокусе, без T и G.
+
+    Цепочка проходится одним циклом по линзам над векторами (b, d) — вторым
+    столбцом матрицы системы в координатах abcd_engine (L2 = b / d,
+    M_total = 1 / |d|). Вклад дифракции в размер — сумма c_i^2 b_i^2.
+    Пропускание здесь не считается: без erf и ограничения апертурой A оно
+    завышает точное T на порядки, а с ними требует полной рекурсии по Al, sfp.
+    """
+
+    fields = ('final_pos', 'L2', 'focus_pos', 'M_total', 'size_x', 'size_y')
+
+    def evaluate(self, chain: ChainArrays, source_params: Dict, abs_pos=None, fields=None) -> Dict:
+        if fields is None:
+            fields = self.fields
+        missing = set(fields) - set(self.fields)
+        if missing:
+            raise ValueError(f"Screen level does not compute: {', '.join(sorted(missing))}")
+        abs_pos = np.atleast_2d(chain.abs_pos if abs_pos is None else np.asarray(abs_pos, dtype=float))
+        F = chain.R / (2 * chain.delta) + chain.p / 6
+        c2 = diffraction_coefficients(chain.A, F, chain.delta, chain.mu, source_params['lamda'])**2
+
+        B = abs_pos.shape[0]
+        b = np.zeros(B)
+        d = np.ones(B)
+        S = np.zeros(B)
+        prev = 0.0
+        for i in range(abs_pos.shape[1]):
+            pos = abs_pos[:, i]
+            b = b - (pos - prev) * d
+            d = d + b / F[i]
+            S += c2[i] * b * b
+            prev = pos
+
+        sx, sy = source_params['sx_fwhm'], source_params['sy_fwhm']
+        with np.errstate(divide='ignore', invalid='ignore'):
+            L2 = b / d
+            result = {
+                'final_pos': abs_pos[:, -1],
+                'L2': L2,
+                'focus_pos': abs_pos[:, -1] + L2,
+                'M_total': 1.0 / np.abs(d),
+                'size_x': np.sqrt(sx * sx + S) / np.abs(d),
+                'size_y': np.sqrt(sy * sy + S) / np.abs(d),
+            }
+        return {name: result[name] for name in fields}
+
+
+class FullEvaluator:
+    """Полный расчёт: все члены Formulas, как в Calculator.propagate."""
+
+    fields = ('final_pos', 'L2', 'focus_pos', 'M_total', 'T', 'G', 'size_x', 'size_y', 'alx', 'aly')
+
+    def evaluate(self, chain: ChainArrays, source_params: Dict, abs_pos=None, fields=None) -> Dict:
+        return BatchCalculator.propagate(chain, source_params, abs_pos=abs_pos, fields=fields)
+
+
+FIDELITY_LEVELS = {
+    SCREEN: ScreenEvaluator(),
+    FULL: FullEvaluator(),
+}
+
+
+def register_fidelity(name, evaluator):
+    """
+    Добавляет уровень точности. evaluator.fields — ключи, которые уровень умеет
+    считать; evaluator.evaluate(chain, source_params, abs_pos, fields) возвращает
+    словарь массивов (B,) с ключами как у BatchCalculator.propagate (только
+    fields; None — все evaluator.fields).
+    """
+    FIDELITY_LEVELS[name] = evaluator
+
+
+def get_evaluator(level):
+    try:
+        return FIDELITY_LEVELS[level]
+    except KeyError:
+        raise ValueError(f"Unknown fidelity level: {level}") from None
+
+
+def screen_then_confirm(chain, source_params, abs_pos, cost, keep=8, screen=SCREEN, confirm=FULL, fields=None):
+    """
+    Отбор лучших вариантов позиций: все — дешёвым уровнем, keep лучших — точным.
+
+    Args:
+        abs_pos: (B, n) позиции линз вариантов; варианты, где TF заходят друг
+            на друга (ChainArrays.ordered), не рассматриваются
+        cost: функция (результат evaluate) -> массив (B,) стоимостей; NaN — недопустимые.
+            На дешёвом уровне получает только те из fields, что он считает
+        fields: ключи, которые нужны cost и вызывающему (None — все)
+    Returns:
+        (indices, confirmed_cost, confirmed): номера отобранных вариантов в abs_pos
+        (по возрастанию точной стоимости), их точная стоимость и результаты точного уровня
+    """
+    abs_pos = np.atleast_2d(abs_pos)
+    screener = get_evaluator(screen)
+    screen_fields = None if fields is None else [name for name in fields if name in screener.fields]
+    screened = cost(screener.evaluate(chain, source_params, abs_pos, screen_fields))
+    screened = np.where(np.isfinite(screened) & ChainArrays.ordered(abs_pos), screened, np.inf)
+    keep = min(keep, len(screened))
+    candidates = np.argpartition(screened, keep - 1)[:keep] if keep < len(screened) else np.arange(len(screened))
+    candidates = candidates[np.isfinite(screened[candidates])]
+    if not len(candidates):
+        return candidates, np.array([]), {}
+
+    confirmed = get_evaluator(confirm).evaluate(chain, source_params, abs_pos[candidates], fields)
+    confirmed_cost = cost(confirmed)
+    confirmed_cost = np.where(np.isfinite(confirmed_cost), confirmed_cost, np.inf)
+    order = np.argsort(confirmed_cost, kind='stable')
+    return candidates[order], confirmed_cost[order], {key: value[order] for key, value in confirmed.items()}
@@ -0,0 +1,261 @@
+"""
+Атлас фокуса: заранее посчитанная сетка энергия × позиции TF для одной
+конфигурации линз и быстрые запросы к ней интерполяцией.
+
+Каталог атласа:
+    atlas.json      — оси, поля, отпечаток конфигурации, посчитанные срезы по энергии
+    values.npy      — значения, форма (n_energy, n_tf1, ..., n_fields)
+    curvature.npy   — |вторые разности| по каждой оси, форма (..., n_axes, n_fields)
+
+Файлы открываются через memmap, так что в память читаются только затронутые
+ячейки. Запрос — полилинейная интерполяция по 2^d узлам ячейки с оценкой
+ошибки sum_d w_d (1 - w_d) / 2 * |D2_d f| (остаточный член линейной
+интерполяции через вторые разности соседних узлов).
+
+Расчёт ведётся срезами по энергии параллельно (в каждом срезе все позиции
+считаются одним вызовом BatchCalculator). При повторной сборке в тот же
+каталог срезы с той же энергией, конфигурацией и осями позиций берутся из
+старого атласа; invalidate() помечает срезы для пересчёта.
+"""
+import hashlib
+import json
+import os
+from bisect import bisect_right
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from batch_computations import ChainArrays, BatchCalculator
+
+ENERGY = 'energy'
+ATLAS_FIELDS = ('focus_pos', 'size_x', 'size_y', 'T', 'G')
+
+AtlasResult = namedtuple('AtlasResult', 'values errors')
+
+
+def config_fingerprint(structure_config, source_params):
+    """Отпечаток конфигурации линз и источника (без энергии и позиций TF)."""
+    blocks = []
+    for block in structure_config:
+        block = {k: v for k, v in block.items() if k not in ('position', 'absolute_start')}
+        blocks.append(sorted((k, repr(v)) for k, v in block.items()))
+    source = sorted((k, repr(v)) for k, v in (source_params or {}).items() if k != 'energy')
+    return hashlib.sha1(repr((blocks, source)).encode()).hexdigest()
+
+
+def _energy_slice(args):
+    """Рабочий процесс: все точки сетки позиций при одной энергии, (n_tf1, ..., n_fields)."""
+    controller, energy, structure_config, source_params, position_axes, fields = args
+    if source_params is not None:
+        source_params = dict(source_params, energy=energy)
+    shape = tuple(len(v) for v in position_axes.values())
+    source, lens_chain = controller.build_chain(energy, structure_config, source_params)
+    if not lens_chain:
+        return np.full(shape + (len(fields),), np.nan)
+    chain = ChainArrays.from_chain(lens_chain)
+    if position_axes:
+        grids = np.meshgrid(*position_axes.values(), indexing='ij')
+        abs_pos = chain.positions_for(structure_config, {name: g.ravel() for name, g in zip(position_axes, grids)})
+    else:
+        abs_pos = chain.abs_pos[None, :]
+    result = BatchCalculator.propagate(chain, source, abs_pos=abs_pos, fields=fields)
+    valid = ChainArrays.ordered(abs_pos)
+    values = np.stack([np.where(valid, result[name], np.nan) for name in fields], axis=-1)
+    return values.reshape(shape + (len(fields),))
+
+
+def _curvature(values):
+    """|f[i-1] - 2 f[i] + f[i+1]| по каждой оси сетки (на краях — от соседнего узла)."""
+    grid_ndim = values.ndim - 1
+    out = np.zeros(values.shape[:-1] + (grid_ndim,) + values.shape[-1:])
+    for axis in range(grid_ndim):
+        n = values.shape[axis]
+        if n < 3:
+            continue
+        lo = np.take(values, range(0, n - 2), axis=axis)
+        mid = np.take(values, range(1, n - 1), axis=axis)
+        hi = np.take(values, range(2, n), axis=axis)
+        d2 = np.abs(lo - 2 * mid + hi)
+        d2 = np.concatenate([np.take(d2, [0], axis=axis), d2, np.take(d2, [-1], axis=axis)], axis=axis)
+        out[..., axis, :] = d2
+    return out
+
+
+class FocusAtlas:
+    """Атлас, открытый для запросов (файлы — только чтение через memmap)."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'atlas.json')) as f:
+            meta = json.load(f)
+        self.meta = meta
+        self.fields = tuple(meta['fields'])
+        self.has_energy = meta['has_energy']
+        self.fingerprint = meta['fingerprint']
+        self.axis_names = [ENERGY] + list(meta['position_axes'])
+        self.axes = [np.asarray(meta['energies'], dtype=float)] + \
+                    [np.asarray(v, dtype=float) for v in meta['position_axes'].values()]
+        self.done = np.asarray(meta['done'], dtype=bool)
+        self.values = np.load(os.path.join(path, 'values.npy'), mmap_mode='r')
+        self.curvature = np.load(os.path.join(path, 'curvature.npy'), mmap_mode='r')
+        # Списки Python для bisect: поиск ячейки без вызовов numpy
+        self._keys = [axis.tolist() for axis in self.axes]
+
+    @property
+    def position_axes(self):
+        return dict(zip(self.axis_names[1:], self.axes[1:]))
+
+    @property
+    def energies(self):
+        return self.axes[0]
+
+    def _cell(self, axis, value):
+        """(индекс нижнего узла, вес верхнего) по оси; ось из одного узла — константа."""
+        keys = self._keys[axis]
+        if len(keys) == 1:
+            return 0, 0.0
+        if not keys[0] <= value <= keys[-1]:
+            raise ValueError(f"{self.axis_names[axis]} = {value} is outside the atlas "
+                             f"[{keys[0]}, {keys[-1]}]")
+        i = min(bisect_right(keys, value) - 1, len(keys) - 2)
+        return i, (value - keys[i]) / (keys[i + 1] - keys[i])
+
+    def query(self, energy=None, **positions) -> AtlasResult:
+        """
+        Значения и оценки ошибки в точке: {поле: значение}, {поле: ошибка}.
+        Позиции TF, не заданные в запросе, — центр оси (как при сборке).
+        """
+        point = [energy if energy is not None else self._keys[0][0]]
+        for name, keys in zip(self.axis_names[1:], self._keys[1:]):
+            point.append(positions.get(name, keys[len(keys) // 2]))
+
+        cells = [self._cell(axis, value) for axis, value in enumerate(point)]
+        if not self.done[cells[0][0]] or (cells[0][1] and not self.done[cells[0][0] + 1]):
+            raise ValueError("Atlas slice for this energy is not computed")
+        index = tuple(slice(i, i + 2) if len(keys) > 1 else slice(0, 1)
+                      for (i, _), keys in zip(cells, self._keys))
+        cube = np.asarray(self.values[index])
+        curv = np.asarray(self.curvature[index])
+
+        # Свёртка куба 2^d по осям с весами (1 - w, w)
+        values = cube
+        for (i, w), keys in zip(cells, self._keys):
+            values = values[0] * (1 - w) + values[1] * w if len(keys) > 1 else values[0]
+        bound = curv.reshape(-1, curv.shape[-2], curv.shape[-1]).max(axis=0)
+        weights = np.array([w * (1 - w) / 2 for _, w in cells])
+        errors = weights @ bound
+        return AtlasResult(dict(zip(self.fields, values.tolist())), dict(zip(self.fields, errors.tolist())))
+
+    def close(self):
+        """Отпускает memmap (на Windows иначе файлы нельзя заменить новой сборкой)."""
+        self.values = self.curvature = None
+
+    def invalidate(self, energy_min=-np.inf, energy_max=np.inf):
+        """Помечает срезы с энергией в [energy_min, energy_max] для пересчёта при следующей сборке."""
+        meta = dict(self.meta)
+        mask = (self.energies >= energy_min) & (self.energies <= energy_max)
+        meta['done'] = (self.done & ~mask).tolist()
+        _write_meta(self.path, meta)
+        self.meta = meta
+        self.done = np.asarray(meta['done'], dtype=bool)
+
+
+def _write_meta(path, meta):
+    tmp_path = os.path.join(path, 'atlas.json.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, os.path.join(path, 'atlas.json'))
+
+
+def _open_existing(path):
+    try:
+        return FocusAtlas(path)
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def build_atlas(path, controller, structure_config, axes, source_params=None, fields=ATLAS_FIELDS,
+                workers=None, progress=None) -> FocusAtlas:
+    """
+    Строит (или дополняет) атлас в каталоге path.
+
+    Args:
+        controller: AdvancedController
+        structure_config: конфигурация линз (с 'position' у блоков)
+        axes: {ENERGY: энергии, имя TF: позиции, ...}; без ENERGY — энергия из source_params
+        workers: число процессов (None — все ядра)
+        progress: callback(done, total) по срезам энергии
+
+    Срезы, уже посчитанные в существующем атласе с тем же отпечатком
+    конфигурации, теми же осями позиций и полями, не пересчитываются.
+    """
+    axes = dict(axes)
+    has_energy = ENERGY in axes
+    energies = np.unique(np.asarray(axes.pop(ENERGY), dtype=float)) if has_energy else \
+        np.array([float((source_params or {}).get('energy', 10300.0))])
+    position_axes = {name: np.asarray(values, dtype=float) for name, values in axes.items()}
+    known = {block.get('tf_name') for block in structure_config}
+    missing = [name for name in position_axes if name not in known]
+    if missing:
+        raise ValueError(f"TF not found in configuration: {', '.join(missing)}")
+    for name, values in position_axes.items():
+        if len(values) > 1 and np.any(np.diff(values) <= 0):
+            raise ValueError(f"Axis {name} must be strictly increasing")
+
+    fingerprint = config_fingerprint(structure_config, source_params)
+    grid_shape = tuple(len(v) for v in position_axes.values())
+    shape = (len(energies),) + grid_shape + (len(fields),)
+
+    # Срезы из старого атласа
+    os.makedirs(path, exist_ok=True)
+    old = _open_existing(path)
+    reuse = {}
+    if (old is not None and old.fingerprint == fingerprint and old.fields == tuple(fields)
+            and list(old.position_axes) == list(position_axes)
+            and all(np.array_equal(old.position_axes[n], v) for n, v in position_axes.items())):
+        old_index = {e: i for i, e in enumerate(old.energies.tolist())}
+        for k, e in enumerate(energies.tolist()):
+            i = old_index.get(e)
+            if i is not None and old.done[i]:
+                reuse[k] = i
+
+    tmp_values = os.path.join(path, 'values.npy.tmp')
+    values = np.lib.format.open_memmap(tmp_values, mode='w+', dtype='<f8', shape=shape)
+    for k, i in reuse.items():
+        values[k] = old.values[i]
+
+    todo = [k for k in range(len(energies)) if k not in reuse]
+    jobs = [(controller, float(energies[k]), structure_config, source_params, position_axes, tuple(fields))
+            for k in todo]
+    done = np.zeros(len(energies), dtype=bool)
+    done[list(reuse)] = True
+    if progress is not None:
+        progress(len(reuse), len(energies))
+    if jobs:
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+            for k, result in zip(todo, pool.map(_energy_slice, jobs)):
+                values[k] = result
+                done[k] = True
+                if progress is not None:
+                    progress(int(done.sum()), len(energies))
+    values.flush()
+
+    tmp_curv = os.path.join(path, 'curvature.npy.tmp')
+    curvature = np.lib.format.open_memmap(tmp_curv, mode='w+', dtype='<f8',
+                                          shape=shape[:-1] + (len(shape) - 1, len(fields)))
+    curvature[...] = _curvature(np.asarray(values))
+    curvature.flush()
+    del values, curvature, old
+
+    os.replace(tmp_values, os.path.join(path, 'values.npy'))
+    os.replace(tmp_curv, os.path.join(path, 'curvature.npy'))
+    _write_meta(path, {
+        'fields': list(fields),
+        'has_energy': has_energy,
+        'fingerprint': fingerprint,
+        'energies': energies.tolist(),
+        'position_axes': {name: v.tolist() for name, v in position_axes.items()},
+        'done': done.tolist(),
+    })
+    return FocusAtlas(path)
@@ -0,0 +1,193 @@
+from collections import OrderedDict
+from collections.abc import Mapping
+from dataclasses import dataclass
+from typing import Tuple
+
+from lens_mask import LensMask
+
+
+class FrozenDict(Mapping):
+    """Неизменяемый словарь (хэшируемый; хэш считается один раз)."""
+
+    __slots__ = ('_data', '_hash')
+
+    def __init__(self, items=()):
+        self._data = dict(items)
+        self._hash = None
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __eq__(self, other):
+        if isinstance(other, FrozenDict):
+            return self is other or self._data == other._data
+        return Mapping.__eq__(self, other)
+
+    def __hash__(self):
+        if self._hash is None:
+            self._hash = hash(frozenset(self._data.items()))
+        return self._hash
+
+    def __repr__(self):
+        return f"FrozenDict({self._data!r})"
+
+
+def freeze(value):
+    """dict -> FrozenDict, list/tuple -> tuple (рекурсивно)."""
+    if isinstance(value, dict):
+        return FrozenDict((key, freeze(v)) for key, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(v) for v in value)
+    return value
+
+
+def thaw(value):
+    """Обратно к изменяемым dict/list (для Transfocator и диалогов)."""
+    if isinstance(value, FrozenDict):
+        return {key: thaw(v) for key, v in value.items()}
+    if isinstance(value, tuple):
+        return [thaw(v) for v in value]
+    return value
+
+
+@dataclass(frozen=True)
+class TFSnapshot:
+    name: str
+    tf_type: str
+    preset: str
+    total_lenses: int
+    active_mask: LensMask
+    lenses: Tuple[FrozenDict, ...]
+    groups: Tuple[FrozenDict, ...]
+    position: float
+    measure_to_center: bool
+    enabled: bool
+
+
+@dataclass(frozen=True)
+class SchemeSnapshot:
+    """Состояние схемы целиком: источник, режим FWHM/sigma и все TF."""
+
+    source: FrozenDict
+    use_fwhm: bool
+    tfs: Tuple[TFSnapshot, ...]
+
+
+class EditHistory:
+    """
+    История правок схемы с undo/redo.
+
+    Снимки неизменяемы и разделяют общие части: одинаковые словари линз/групп
+    хранятся в одном экземпляре, а неизменённые TF и списки линз берутся из
+    предыдущего снимка. Правка одного TF стоит одного нового TFSnapshot, поэтому
+    тысячи правок занимают немного памяти.
+
+    К снимку привязывается отчёт расчёта (LRU на results_limit отчётов), так что
+    при переходе по истории результат показывается без пересчёта.
+    """
+
+    def __init__(self, limit=10000, results_limit=256):
+        self.limit = limit
+        self.results_limit = results_limit
+        self.current = None
+        self._undo = []
+        self._redo = []
+        self._records = {}   # общий пул словарей линз/групп
+        self._results = OrderedDict()
+
+    # --- Снимки ---
+
+    def _intern(self, record):
+        return self._records.setdefault(record, record)
+
+    def _freeze_records(self, records, previous):
+        frozen = tuple(self._intern(freeze(record)) for record in records)
+        return previous if previous == frozen else frozen
+
+    def capture(self, source, use_fwhm, tfs):
+        """
+        Снимок текущего состояния.
+
+        Args:
+            source: словарь параметров источника
+            tfs: список (Transfocator, enabled)
+        """
+        previous = {tf.name: tf for tf in self.current.tfs} if self.current else {}
+        snapshots = []
+        for tf, enabled in tfs:
+            prev = previous.get(tf.name)
+            snapshot = TFSnapshot(
+                name = tf.name,
+                tf_type = tf.tf_type,
+                preset = tf.preset,
+                total_lenses = tf.total_lenses,
+                active_mask = tf.active_mask,
+                lenses = self._freeze_records(tf.lenses, prev.lenses if prev else None),
+                groups = self._freeze_records(tf.groups, prev.groups if prev else None),
+                position = tf.position,
+                measure_to_center = tf.measure_to_center,
+                enabled = enabled,
+            )
+            snapshots.append(prev if prev == snapshot else snapshot)
+
+        source = freeze(source)
+        if self.current is not None and self.current.source == source:
+            source = self.current.source
+        return SchemeSnapshot(source=source, use_fwhm=use_fwhm, tfs=tuple(snapshots))
+
+    def record(self, snapshot):
+        """Добавляет снимок, если он отличается от текущего. Возвращает True, если добавлен."""
+        if snapshot == self.current:
+            return False
+        if self.current is not None:
+            self._undo.append(self.current)
+            if len(self._undo) > self.limit:
+                del self._undo[0]
+        self._redo.clear()
+        self.current = snapshot
+        return True
+
+    def can_undo(self):
+        return bool(self._undo)
+
+    def can_redo(self):
+        return bool(self._redo)
+
+    def undo(self):
+        """Шаг назад; возвращает снимок, который нужно восстановить, или None."""
+        if not self._undo:
+            return None
+        self._redo.append(self.current)
+        self.current = self._undo.pop()
+        return self.current
+
+    def redo(self):
+        if not self._redo:
+            return None
+        self._undo.append(self.current)
+        self.current = self._redo.pop()
+        return self.current
+
+    def __len__(self):
+        return len(self._undo) + len(self._redo) + (self.current is not None)
+
+    # --- Результаты ---
+
+    def attach_result(self, snapshot, report):
+        self._results[snapshot] = report
+        self._results.move_to_end(snapshot)
+        if len(self._results) > self.results_limit:
+            self._results.popitem(last=False)
+
+    def result(self, snapshot):
+        """Отчёт, посчитанный для такого же состояния схемы, или None."""
+        report = self._results.get(snapshot)
+        if report is not None:
+            self._results.move_to_end(snapshot)
+        return report
@@ -0,0 +1,308 @@
+"""
+Обратная задача: позиции TF и/или энергия для заданного положения фокуса
+(и, при необходимости, размера пятна) при фиксированной конфигурации линз.
+
+Модель — матричный расчёт abcd_engine.focus_batch (совпадает с
+Calculator.propagate по фокусу и размерам). Производные — центральные разности,
+все точки шаблона считаются одним векторным вызовом. Шаг — Гаусс-Ньютон с
+демпфированием (Левенберг-Марквардт) и проекцией на границы хода. Для одной
+переменной без цели по размеру, если итерации не сошлись, корень ищется
+в скобке (сетка по всему ходу, затем метод Иллинойса).
+
+    solver = InverseSolver(controller, energy, structure_config, source_params,
+                           variables=['TF2'], bounds={'TF2': (60.0, 70.0)})
+    solution = solver.solve(InverseTarget(focus_pos=75.0))
+    solution.positions, solution.report['size_x']
+"""
+from dataclasses import dataclass, field
+from typing import Dict
+
+import numpy as np
+
+from abcd_engine import focus_batch, diffraction_coefficients
+from batch_computations import ChainArrays
+from computations import CalcMode
+from energy_tracking import apply_positions
+
+ENERGY = 'energy'   # имя переменной энергии (остальные переменные — имена TF)
+
+# Шаг численной производной: позиции, м; энергия, эВ
+_STEP_POSITION = 1e-5
+_STEP_ENERGY = 1e-2
+
+
+@dataclass
+class InverseTarget:
+    """Цель: положение фокуса (м) и, при необходимости, размеры пятна по x и/или y (м)."""
+
+    focus_pos: float
+    size_x: float = None
+    size_y: float = None
+    focus_tol: float = 1e-6
+    size_tol: float = 0.01e-6
+
+    def has_size(self):
+        return self.size_x is not None or self.size_y is not None
+
+
+@dataclass
+class InverseSolution:
+    positions: Dict[str, float]
+    energy: float
+    converged: bool
+    iterations: int
+    evaluations: int             # число векторных вызовов модели
+    message: str = ""
+    report: Dict = field(default=None, repr=False)   # точный отчёт контроллера в найденной точке
+
+
+class _OpticalTable:
+    """delta(E), mu(E) по материалам: таблица на диапазоне энергий и интерполяция в log-log."""
+
+    def __init__(self, materials, lo, hi, points=512):
+        from parameters_micro1 import optical_constants_table
+
+        self.log_e = np.linspace(np.log(lo), np.log(hi), points)
+        self.tables = {}
+        for material in materials:
+            delta, _, mu = optical_constants_table(material, np.exp(self.log_e))
+            self.tables[material] = (np.log(delta), np.log(mu))
+
+    def __call__(self, material, energies):
+        log_e = np.log(energies)
+        log_delta, log_mu = self.tables[material]
+        return np.exp(np.interp(log_e, self.log_e, log_delta)), np.exp(np.interp(log_e, self.log_e, log_mu))
+
+
+class InverseSolver:
+    """
+    Решатель для одной схемы. Цепочка собирается один раз в конструкторе,
+    solve() можно вызывать много раз с разными целями.
+    """
+
+    def __init__(self, controller, energy, structure_config, source_params=None, mode=None,
+                 variables=None, bounds=None):
+        """
+        Args:
+            controller: AdvancedController
+            structure_config: конфигурация (с 'position' у блоков); линзы фиксированы
+            variables: имена TF и/или ENERGY; по умолчанию — позиции всех TF
+            bounds: {переменная: (min, max)} — ход TF по рельсу и диапазон энергии;
+                по умолчанию ±1 м от текущей позиции TF и ±10 % по энергии
+        """
+        self.controller = controller
+        self.energy = float(energy)
+        self.structure_config = structure_config
+        self.source_params = source_params
+        if mode is None:
+            mode = CalcMode.of(source_params.get('use_fwhm', True)) if source_params else None
+        self.mode = mode
+
+        self.source, lens_chain = controller.build_chain(energy, structure_config, source_params, mode)
+        if not lens_chain:
+            raise ValueError("No active lenses in the selected configuration")
+        self.chain = ChainArrays.from_chain(lens_chain)
+        self.materials = [lens['material'] for lens in lens_chain]
+
+        current = {block['tf_name']: block.get('position', block['absolute_start']) for block in structure_config}
+        current[ENERGY] = self.energy
+        self.variables = list(variables or [block['tf_name'] for block in structure_config])
+        unknown = [name for name in self.variables if name not in current]
+        if unknown:
+            raise ValueError(f"Unknown variables: {', '.join(unknown)}")
+        if not self.variables:
+            raise ValueError("Nothing to solve for")
+
+        bounds = dict(bounds or {})
+        for name in self.variables:
+            if name not in bounds:
+                value = current[name]
+                bounds[name] = (value * 0.9, value * 1.1) if name == ENERGY else (value - 1.0, value + 1.0)
+        self.x0 = np.array([current[name] for name in self.variables], dtype=float)
+        self.lower = np.array([bounds[name][0] for name in self.variables], dtype=float)
+        self.upper = np.array([bounds[name][1] for name in self.variables], dtype=float)
+        if np.any(self.lower >= self.upper):
+            raise ValueError("Empty bounds")
+        self.steps = np.array([_STEP_ENERGY if name == ENERGY else _STEP_POSITION for name in self.variables])
+
+        if ENERGY in self.variables:
+            lo, hi = bounds[ENERGY]
+            self.optics = _OpticalTable(set(self.materials), lo, hi)
+        else:
+            self.optics = None
+            self.F = self.chain.R / (2 * self.chain.delta) + self.chain.p / 6
+            self.c = diffraction_coefficients(self.chain.A, self.F, self.chain.delta, self.chain.mu,
+                                              self.source['lamda'])
+        self.evaluations = 0
+
+    # --- Модель ---
+
+    def evaluate(self, X):
+        """
+        Фокус для точек X (B, k) в пространстве переменных.
+        Точки, где TF заходят друг на друга, дают NaN.
+        """
+        X = np.atleast_2d(np.asarray(X, dtype=float))
+        self.evaluations += 1
+        positions = {name: X[:, j] for j, name in enumerate(self.variables) if name != ENERGY}
+        if positions:
+            abs_pos = self.chain.positions_for(self.structure_config, positions)
+        else:
+            abs_pos = np.broadcast_to(self.chain.abs_pos, (len(X), len(self.chain)))
+
+        if self.optics is None:
+            F, c = self.F, self.c
+        else:
+            energies = X[:, self.variables.index(ENERGY)]
+            delta = np.empty((len(X), len(self.chain)))
+            mu = np.empty_like(delta)
+            for material in set(self.materials):
+                cols = [i for i, m in enumerate(self.materials) if m == material]
+                d, m = self.optics(material, energies)
+                delta[:, cols] = d[:, None]
+                mu[:, cols] = m[:, None]
+            lamda = (12398.4 / energies * 1e-10)[:, None]   # как в SourceManager.set_energy
+            F = self.chain.R / (2 * delta) + self.chain.p / 6
+            c = diffraction_coefficients(self.chain.A, F, delta, mu, lamda)
+
+        result = focus_batch(abs_pos, F, c, self.source['sx_fwhm'], self.source['sy_fwhm'])
+        valid = ChainArrays.ordered(abs_pos)
+        return {key: np.where(valid, value, np.nan) for key, value in result.items()}
+
+    def _residuals(self, result, target):
+        """Невязки в единицах допусков, (B, m)."""
+        r = [(result['focus_pos'] - target.focus_pos) / target.focus_tol]
+        for key in ('size_x', 'size_y'):
+            if getattr(target, key) is not None:
+                r.append((result[key] - getattr(target, key)) / target.size_tol)
+        return np.stack(r, axis=1)
+
+    def _stencil(self, x):
+        """x и точки центральных разностей вокруг него (с учётом границ)."""
+        k = len(x)
+        points = np.repeat(x[None, :], 2 * k + 1, axis=0)
+        for j in range(k):
+            points[1 + 2 * j, j] = min(x[j] + self.steps[j], self.upper[j])
+            points[2 + 2 * j, j] = max(x[j] - self.steps[j], self.lower[j])
+        return points
+
+    def _linearize(self, x, target):
+        """(r, J) в точке x за один вызов модели."""
+        points = self._stencil(x)
+        r_all = self._residuals(self.evaluate(points), target)
+        J = np.empty((r_all.shape[1], len(x)))
+        for j in range(len(x)):
+            h = points[1 + 2 * j, j] - points[2 + 2 * j, j]
+            J[:, j] = (r_all[1 + 2 * j] - r_all[2 + 2 * j]) / h
+        return r_all[0], J
+
+    # --- Решение ---
+
+    def solve(self, target: InverseTarget, x0=None, max_iter=50, progress=None) -> InverseSolution:
+        """progress: callback(iteration, max_iter) на каждой итерации (исключение из него прерывает решение)."""
+        self.evaluations = 0
+        x = np.clip(self.x0 if x0 is None else np.asarray(x0, dtype=float), self.lower, self.upper)
+        x, iterations, converged = self._levenberg_marquardt(x, target, max_iter, progress)
+
+        message = "converged" if converged else "tolerances not reached"
+        if not converged and len(x) == 1 and not target.has_size():
+            found = self._bracketed(x, target, max_iter, progress=progress)
+            if found is not None:
+                x, extra = found
+                iterations += extra
+                converged = True
+                message = "converged (bracketed)"
+        return self._solution(x, converged, iterations, message)
+
+    def _levenberg_marquardt(self, x, target, max_iter, progress=None):
+        """
+        Демпфированный Гаусс-Ньютон в переменных, отнесённых к ширине границ.
+        При малом демпфировании шаг для недоопределённой задачи (две TF, одна
+        цель) — шаг минимальной нормы: переменные сдвигаются поровну, а не одна.
+        """
+        scale = self.upper - self.lower
+        r, J = self._linearize(x, target)
+        if not np.all(np.isfinite(r)):
+            return x, 0, False
+        cost = float(r @ r)
+        lam = 1e-9
+        iteration = 0
+        for iteration in range(1, max_iter + 1):
+            if progress is not None:
+                progress(iteration, max_iter)
+            if np.all(np.abs(r) <= 1.0):
+                return x, iteration - 1, True
+            if not np.all(np.isfinite(J)):
+                return x, iteration, False
+            Js = J * scale
+            # (Jsᵀ Js + λ I)⁻¹ Jsᵀ = Jsᵀ (Js Jsᵀ + λ I)⁻¹ — берём меньшую из двух систем
+            mu = lam * max(float(np.sum(Js * Js)), 1e-300)
+            if Js.shape[0] < Js.shape[1]:
+                step = -Js.T @ np.linalg.solve(Js @ Js.T + mu * np.eye(Js.shape[0]), r)
+            else:
+                step = -np.linalg.solve(Js.T @ Js + mu * np.eye(Js.shape[1]), Js.T @ r)
+            x_new = np.clip(x + step * scale, self.lower, self.upper)
+            if np.all(x_new == x):
+                break   # шаг целиком упирается в границы хода
+            r_new, J_new = self._linearize(x_new, target)
+            cost_new = float(r_new @ r_new) if np.all(np.isfinite(r_new)) else np.inf
+            if cost_new < cost:
+                small_step = np.all(np.abs(x_new - x) <= 1e-12 * (1 + np.abs(x)))
+                x, r, J, cost = x_new, r_new, J_new, cost_new
+                lam = max(lam / 10, 1e-12)
+                if small_step:
+                    break
+            else:
+                lam *= 10
+                if lam > 1e6:
+                    break
+        return x, iteration, bool(np.all(np.abs(r) <= 1.0))
+
+    def _bracketed(self, x, target, max_iter, points=129, progress=None):
+        """Одна переменная: смена знака невязки фокуса на сетке хода, затем метод Иллинойса."""
+        grid = np.linspace(self.lower[0], self.upper[0], points)
+        f = self.evaluate(grid[:, None])['focus_pos'] - target.focus_pos
+        brackets = [
+            (grid[i], grid[i + 1], f[i], f[i + 1]) for i in range(points - 1)
+            if np.isfinite(f[i]) and np.isfinite(f[i + 1]) and f[i] * f[i + 1] <= 0
+        ]
+        brackets.sort(key=lambda b: abs(0.5 * (b[0] + b[1]) - x[0]))
+
+        def f_at(value):
+            return float(self.evaluate([[value]])['focus_pos'][0] - target.focus_pos)
+
+        for a, b, fa, fb in brackets:
+            for iteration in range(1, max_iter + 1):
+                if progress is not None:
+                    progress(iteration, max_iter)
+                c = b - fb * (b - a) / (fb - fa) if fb != fa else 0.5 * (a + b)
+                fc = f_at(c)
+                if abs(fc) <= target.focus_tol:
+                    return np.array([c]), iteration
+                if not np.isfinite(fc):
+                    break
+                if fc * fb < 0:
+                    a, fa = b, fb
+                else:
+                    fa /= 2   # Иллинойс: неподвижный конец не тормозит сходимость
+                b, fb = c, fc
+            # Смена знака через полюс (L1 = F): фокус уходит в бесконечность, корня нет
+        return None
+
+    def _solution(self, x, converged, iterations, message):
+        positions = {name: float(v) for name, v in zip(self.variables, x) if name != ENERGY}
+        energy = float(x[self.variables.index(ENERGY)]) if ENERGY in self.variables else self.energy
+        source_params = dict(self.source_params, energy=energy) if self.source_params else None
+        report = self.controller.run_calculations(energy, apply_positions(self.structure_config, positions),
+                                                  source_params=source_params, mode=self.mode)
+        return InverseSolution(positions=positions, energy=energy, converged=converged,
+                               iterations=iterations, evaluations=self.evaluations,
+                               message=message, report=report)
+
+
+def solve_focus(controller, energy, structure_config, focus_pos, source_params=None, variables=None,
+                bounds=None, **target) -> InverseSolution:
+    """Короткий вызов для макросов: InverseSolver(...).solve(InverseTarget(focus_pos, **target))."""
+    solver = InverseSolver(controller, energy, structure_config, source_params,
+                           variables=variables, bounds=bounds)
+    return solver.solve(InverseTarget(focus_pos=focus_pos, **target))
@@ -0,0 +1,151 @@
+from PyQt5.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QFormLayout, QGroupBox, QGridLayout,
+                             QDoubleSpinBox, QPushButton, QCheckBox, QLabel, QMessageBox)
+
+from inverse_solver import InverseSolver, InverseTarget, ENERGY
+
+
+class InverseSolverDialog(QDialog):
+    """Подбор позиций TF и/или энергии под заданный фокус (линзы не меняются)."""
+
+    def __init__(self, parent, controller, structure_config, source_params, jobs, focus_pos=None):
+        super().__init__(parent)
+        self.setWindowTitle("Solve for Focus")
+        self.controller = controller
+        self.structure_config = structure_config
+        self.source_params = source_params
+        self.solution = None
+        self.jobs = jobs   # JobsPanel: решение идёт фоновой задачей
+        self.job = None
+
+        self.setup_ui(focus_pos)
+
+    def _spin(self, lo, hi, value, decimals, suffix):
+        spin = QDoubleSpinBox()
+        spin.setRange(lo, hi)
+        spin.setDecimals(decimals)
+        spin.setSuffix(suffix)
+        spin.setValue(value)
+        return spin
+
+    def setup_ui(self, focus_pos):
+        layout = QVBoxLayout(self)
+
+        gb_target = QGroupBox("Target")
+        form = QFormLayout()
+        self.spin_focus = self._spin(0, 500, focus_pos if focus_pos is not None else 0.0, 4, " m")
+        self.spin_focus_tol = self._spin(0.001, 1000, 1.0, 3, " um")
+        form.addRow("Focus position:", self.spin_focus)
+        form.addRow("Focus tolerance:", self.spin_focus_tol)
+        self.spin_size_x = self._spin(0, 10000, 0, 2, " um")
+        self.spin_size_y = self._spin(0, 10000, 0, 2, " um")
+        for spin in (self.spin_size_x, self.spin_size_y):
+            spin.setSpecialValueText("any")
+        form.addRow("Spot size X:", self.spin_size_x)
+        form.addRow("Spot size Y:", self.spin_size_y)
+        gb_target.setLayout(form)
+        layout.addWidget(gb_target)
+
+        # Переменные: флажок + ход (min, max)
+        gb_vars = QGroupBox("Solve for")
+        grid = QGridLayout()
+        grid.addWidget(QLabel("From"), 0, 1)
+        grid.addWidget(QLabel("To"), 0, 2)
+        self.var_widgets = {}
+        rows = [(block['tf_name'], block.get('position', block['absolute_start']), 4, " m", 1.0)
+                for block in self.structure_config]
+        rows.append((ENERGY, self.source_params['energy'], 0, " eV", 0.1 * self.source_params['energy']))
+        for row, (name, value, decimals, suffix, half) in enumerate(rows, start=1):
+            chk = QCheckBox("Energy" if name == ENERGY else f"{name} position")
+            chk.setChecked(name != ENERGY and row == len(rows) - 1)   # по умолчанию — последний TF
+            spin_from = self._spin(0, 100000, max(value - half, 0), decimals, suffix)
+            spin_to = self._spin(0, 100000, value + half, decimals, suffix)
+            grid.addWidget(chk, row, 0)
+            grid.addWidget(spin_from, row, 1)
+            grid.addWidget(spin_to, row, 2)
+            self.var_widgets[name] = (chk, spin_from, spin_to)
+        gb_vars.setLayout(grid)
+        layout.addWidget(gb_vars)
+
+        self.btn_solve = QPushButton("Solve")
+        self.btn_solve.clicked.connect(self.solve)
+        layout.addWidget(self.btn_solve)
+
+        self.lbl_result = QLabel("")
+        self.lbl_result.setWordWrap(True)
+        self.lbl_result.setStyleSheet("font-family: monospace;")
+        layout.addWidget(self.lbl_result)
+
+        btns = QHBoxLayout()
+        self.btn_apply = QPushButton("Apply")
+        self.btn_apply.setEnabled(False)
+        btn_cancel = QPushButton("Cancel")
+        self.btn_apply.clicked.connect(self.accept)
+        btn_cancel.clicked.connect(self.reject)
+        btns.addStretch()
+        btns.addWidget(self.btn_apply)
+        btns.addWidget(btn_cancel)
+        layout.addLayout(btns)
+
+    def solve(self):
+        variables = [name for name, (chk, _, _) in self.var_widgets.items() if chk.isChecked()]
+        if not variables:
+            QMessageBox.warning(self, "Solve for Focus", "Select at least one variable.")
+            return
+        bounds = {name: (self.var_widgets[name][1].value(), self.var_widgets[name][2].value())
+                  for name in variables}
+        target = InverseTarget(
+            focus_pos = self.spin_focus.value(),
+            size_x = self.spin_size_x.value() * 1e-6 or None,
+            size_y = self.spin_size_y.value() * 1e-6 or None,
+            focus_tol = self.spin_focus_tol.value() * 1e-6,
+        )
+        controller, structure_config, source_params = self.controller, self.structure_config, self.source_params
+
+        def run(job):
+            solver = InverseSolver(controller, source_params['energy'], structure_config, source_params,
+                                   variables=variables, bounds=bounds)
+            return solver.solve(target, progress=job.progress)
+
+        self.btn_solve.setEnabled(False)
+        self.btn_apply.setEnabled(False)
+        self.lbl_result.setText("Solving...")
+        self.job = self.jobs.submit(
+            "Solve for focus", run,
+            on_progress = lambda done, total: self.lbl_result.setText(f"Solving... iteration {done}"),
+            on_done = lambda solution: self.on_solved(solution, variables),
+            on_error = self.on_error,
+        )
+
+    def on_solved(self, solution, variables):
+        self._finished()
+        self.solution = sol = solution
+        report = sol.report
+        lines = [f"Status: {sol.message} ({sol.iterations} iterations)"]
+        lines += [f"{name}: {pos:.4f} m" for name, pos in sol.positions.items()]
+        if ENERGY in variables:
+            lines.append(f"Energy: {sol.energy:.1f} eV")
+        if 'error' not in report:
+            lines.append(f"Focus: {report['final_pos'] + report['L2']:.4f} m, "
+                         f"size {report['size_x'] * 1e6:.2f} x {report['size_y'] * 1e6:.2f} um, "
+                         f"T = {report['T'] * 100:.1f} %")
+        self.lbl_result.setText("\n".join(lines))
+        self.btn_apply.setEnabled('error' not in report)
+
+    def on_error(self, message):
+        self._finished()
+        self.lbl_result.setText("")
+        QMessageBox.critical(self, "Solve for Focus", message)
+
+    def _finished(self):
+        self.job = None
+        self.btn_solve.setEnabled(True)
+
+    def done(self, result):
+        # Закрытие окна отменяет незавершённое решение
+        if self.job is not None:
+            self.jobs.cancel(self.job)
+            self._finished()
+        super().done(result)
+
+    def get_solution(self):
+        return self.solution
@@ -0,0 +1,209 @@
+"""
+Очередь фоновых задач: прогресс, отмена и частичные результаты.
+
+Задача — функция fn(job, *args, **kwargs), которая выполняется в пуле потоков
+JobManager; одновременно идёт до workers задач, остальные ждут в очереди.
+Пул из потоков, а не процессов: задачи делят кэши одного процесса —
+оптические константы материалов, цепочки TF контроллера, общий пул
+пакетных расчётов. Внутри задачи:
+
+    job.progress(done, total)  — прогресс; при отмене поднимает JobCancelled,
+                                 поэтому годится как callback progress
+                                 (build_tracking_table, build_atlas, replay_log)
+    job.partial(value)         — частичный результат (строки таблицы, часть карты)
+    job.check()                — поднимает JobCancelled, если задачу отменили
+
+poll() не блокирует и вызывается из потока GUI (по таймеру, как
+ComparisonRun.poll); callbacks задачи — on_progress(done, total),
+on_partial(value), on_done(result), on_error(message) — вызываются только из
+poll(), то есть в потоке GUI. После отмены callbacks задачи не вызываются.
+Исключение в callback печатается и не прерывает poll(); если задача уже
+завершилась, она помечается FAILED с текстом ошибки callback.
+"""
+import itertools
+import os
+import queue
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+_PARTIAL = 'partial'
+
+
+class JobCancelled(Exception):
+    """Отмена задачи; поднимается внутри задачи из job.progress() и job.check()."""
+
+
+class Job:
+    """Одна фоновая задача. Поля state, result, error меняются только в JobManager.poll()."""
+
+    def __init__(self, job_id, title, events, on_progress=None, on_partial=None, on_done=None, on_error=None):
+        self.id = job_id
+        self.title = title
+        self.state = QUEUED
+        self.done = 0
+        self.total = 0
+        self.result = None
+        self.error = None
+        self.on_progress = on_progress
+        self.on_partial = on_partial
+        self.on_done = on_done
+        self.on_error = on_error
+        self._events = events
+        self._cancel = threading.Event()
+        self._running = False
+        self._reported = (0, 0)
+        self._future = None
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    @property
+    def finished(self):
+        return self.state in (DONE, FAILED, CANCELLED)
+
+    @property
+    def fraction(self):
+        """Доля выполненного 0..1 (None, если задача не сообщала прогресс)."""
+        return self.done / self.total if self.total else None
+
+    # --- Вызываются из задачи (поток пула) ---
+
+    def check(self):
+        if self._cancel.is_set():
+            raise JobCancelled()
+
+    def progress(self, done, total):
+        self.done, self.total = done, total
+        self.check()
+
+    def partial(self, value):
+        self.check()
+        self._events.put((self, _PARTIAL, value))
+
+    def __repr__(self):
+        return f"Job({self.id}, {self.title!r}, {self.state})"
+
+
+class JobManager:
+    """Очередь задач на общем пуле потоков (workers — число одновременно идущих задач)."""
+
+    def __init__(self, workers=None):
+        self.workers = workers or os.cpu_count()
+        self.pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='job')
+        self.jobs = {}   # id -> Job в порядке постановки, вместе с завершёнными
+        self._events = queue.SimpleQueue()
+        self._ids = itertools.count(1)
+
+    def submit(self, title, fn, *args, on_progress=None, on_partial=None, on_done=None, on_error=None,
+               **kwargs) -> Job:
+        """Ставит fn(job, *args, **kwargs) в очередь; возвращает Job."""
+        job = Job(next(self._ids), title, self._events, on_progress=on_progress, on_partial=on_partial,
+                  on_done=on_done, on_error=on_error)
+        self.jobs[job.id] = job
+        job._future = self.pool.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def _run(self, job, fn, args, kwargs):
+        if job.cancelled:
+            # Отменена, когда поток уже взял её из очереди
+            self._events.put((job, CANCELLED, None))
+            return
+        job._running = True
+        try:
+            result = fn(job, *args, **kwargs)
+        except JobCancelled:
+            self._events.put((job, CANCELLED, None))
+        except Exception as e:
+            self._events.put((job, FAILED, str(e) or type(e).__name__))
+        else:
+            self._events.put((job, CANCELLED if job.cancelled else DONE, result))
+
+    def poll(self):
+        """Доставляет события задач в вызывающем потоке; список задач, у которых что-то изменилось."""
+        changed = {}
+        while True:
+            try:
+                job, kind, payload = self._events.get_nowait()
+            except queue.Empty:
+                break
+            changed[job.id] = job
+            if kind == _PARTIAL:
+                if not job.cancelled:
+                    self._call(job, job.on_partial, payload)
+                continue
+            self._report_progress(job)
+            if job.cancelled:
+                # Задача успела завершиться до отмены: результат и ошибка не доставляются
+                kind = CANCELLED
+            job.state = kind
+            if kind == DONE:
+                job.result = payload
+                self._call(job, job.on_done, payload)
+            elif kind == FAILED:
+                job.error = payload
+                self._call(job, job.on_error, payload)
+
+        for job in self.jobs.values():
+            if job.state == QUEUED and job._running:
+                job.state = RUNNING
+                changed[job.id] = job
+            if job.state == RUNNING and self._report_progress(job):
+                changed[job.id] = job
+        return list(changed.values())
+
+    @staticmethod
+    def _report_progress(job):
+        """Вызывает on_progress, если прогресс изменился с прошлого раза."""
+        current = (job.done, job.total)
+        if current == job._reported or job.cancelled:
+            return False
+        job._reported = current
+        JobManager._call(job, job.on_progress, *current)
+        return True
+
+    @staticmethod
+    def _call(job, callback, *args):
+        """Вызывает callback задачи; исключение печатается и не мешает доставке остальных событий."""
+        if callback is None:
+            return
+        try:
+            callback(*args)
+        except Exception as e:
+            traceback.print_exc()
+            job.error = f"Callback failed: {e}" if job.error is None else f"{job.error}; callback failed: {e}"
+            if job.finished:
+                job.state = FAILED
+
+    def cancel(self, job):
+        """Отменяет задачу: ждущая снимается с очереди, идущая остановится на ближайшем progress/check."""
+        if isinstance(job, int):
+            job = self.jobs[job]
+        if job.finished or job.cancelled:
+            return
+        job._cancel.set()
+        if job._future.cancel():
+            self._events.put((job, CANCELLED, None))
+
+    def cancel_all(self):
+        for job in list(self.jobs.values()):
+            self.cancel(job)
+
+    def active(self):
+        """Задачи в очереди и выполняющиеся."""
+        return [job for job in self.jobs.values() if not job.finished]
+
+    def clear_finished(self):
+        for job_id in [job.id for job in self.jobs.values() if job.finished]:
+            del self.jobs[job_id]
+
+    def shutdown(self):
+        self.cancel_all()
+        self.pool.shutdown(wait=False, cancel_futures=True)
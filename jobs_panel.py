@@ -0,0 +1,99 @@
+from PyQt5.QtWidgets import (QGroupBox, QVBoxLayout, QHBoxLayout, QTableWidget, QTableWidgetItem,
+                             QHeaderView, QProgressBar, QPushButton, QAbstractItemView)
+from PyQt5.QtCore import Qt, QTimer
+
+from job_manager import JobManager, RUNNING, DONE, FAILED
+
+
+class JobsPanel(QGroupBox):
+    """
+    Список фоновых задач JobManager с прогрессом и отменой.
+
+    Через панель задачи и ставятся (submit): она опрашивает менеджер по таймеру,
+    пока есть незавершённые задачи, и callbacks задач вызываются в потоке GUI.
+    """
+
+    def __init__(self, jobs=None, parent=None):
+        super().__init__("Background Jobs", parent)
+        self.jobs = jobs or JobManager()
+
+        self.timer = QTimer(self)
+        self.timer.setInterval(50)
+        self.timer.timeout.connect(self.poll)
+
+        layout = QVBoxLayout(self)
+        self.table = QTableWidget(0, 3)
+        self.table.setHorizontalHeaderLabels(["Job", "Progress", "Status"])
+        self.table.verticalHeader().setVisible(False)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        self.table.setMaximumHeight(120)
+        layout.addWidget(self.table)
+
+        btns = QHBoxLayout()
+        self.btn_cancel = QPushButton("Cancel Job")
+        self.btn_clear = QPushButton("Clear Finished")
+        self.btn_cancel.clicked.connect(self.cancel_selected)
+        self.btn_clear.clicked.connect(self.clear_finished)
+        btns.addStretch()
+        btns.addWidget(self.btn_cancel)
+        btns.addWidget(self.btn_clear)
+        layout.addLayout(btns)
+
+    def submit(self, title, fn, *args, **kwargs):
+        """Как JobManager.submit; запускает опрос."""
+        job = self.jobs.submit(title, fn, *args, **kwargs)
+        self.refresh()
+        self.timer.start()
+        return job
+
+    def cancel(self, job):
+        if job is not None:
+            self.jobs.cancel(job)
+            self.refresh()
+
+    def poll(self):
+        if self.jobs.poll():
+            self.refresh()
+        if not self.jobs.active():
+            self.timer.stop()
+
+    def refresh(self):
+        jobs = list(self.jobs.jobs.values())
+        self.table.setRowCount(len(jobs))
+        for row, job in enumerate(jobs):
+            item = QTableWidgetItem(job.title)
+            item.setData(Qt.UserRole, job.id)
+            self.table.setItem(row, 0, item)
+
+            bar = self.table.cellWidget(row, 1)
+            if bar is None:
+                bar = QProgressBar()
+                bar.setTextVisible(True)
+                self.table.setCellWidget(row, 1, bar)
+            if job.state == RUNNING and job.fraction is None:
+                bar.setRange(0, 0)   # задача не сообщает прогресс
+            else:
+                bar.setRange(0, 100)
+                bar.setValue(100 if job.state == DONE else int(100 * (job.fraction or 0.0)))
+
+            status = job.state if job.state != FAILED else f"failed: {job.error}"
+            if job.cancelled and not job.finished:
+                status = "cancelling"
+            self.table.setItem(row, 2, QTableWidgetItem(status))
+
+    def cancel_selected(self):
+        for index in self.table.selectionModel().selectedRows():
+            job_id = self.table.item(index.row(), 0).data(Qt.UserRole)
+            if job_id in self.jobs.jobs:
+                self.jobs.cancel(job_id)
+        self.refresh()
+
+    def clear_finished(self):
+        self.jobs.clear_finished()
+        self.refresh()
+
+    def shutdown(self):
+        self.timer.stop()
+        self.jobs.shutdown()
@@ -0,0 +1,160 @@
+import csv
+import os
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+from collections.abc import Mapping
+
+# Файл каталога по умолчанию; свой каталог можно задать переменной окружения
+DEFAULT_CATALOG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lens_catalog.csv')
+CATALOG_ENV = 'LENS_CATALOG'
+
+# Тип линзы; R, A, d в метрах
+LensType = namedtuple('LensType', 'id vendor material R A d description')
+
+
+class LensCatalog:
+    """
+    Каталог типов линз из CSV (id, vendor, material, R_um, A_um, d_um, description).
+
+    Поиск по id — словарь; индексы по материалу и производителю — словари
+    списков id; по радиусу и апертуре — отсортированные списки для поиска
+    диапазонов делением пополам.
+    """
+
+    def __init__(self, entries):
+        self.by_id = {}
+        self.by_material = {}
+        self.by_vendor = {}
+        for entry in entries:
+            if entry.id in self.by_id:
+                raise ValueError(f"Duplicate lens id in catalog: {entry.id}")
+            self.by_id[entry.id] = entry
+            self.by_material.setdefault(entry.material, []).append(entry.id)
+            self.by_vendor.setdefault(entry.vendor, []).append(entry.id)
+
+        by_R = sorted(self.by_id.values(), key=lambda e: e.R)
+        by_A = sorted(self.by_id.values(), key=lambda e: e.A)
+        self._R_keys, self._R_ids = [e.R for e in by_R], [e.id for e in by_R]
+        self._A_keys, self._A_ids = [e.A for e in by_A], [e.id for e in by_A]
+
+    @classmethod
+    def load(cls, path):
+        entries = []
+        with open(path, newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                entries.append(LensType(
+                    id = row['id'].strip(),
+                    vendor = row.get('vendor', '').strip(),
+                    material = row['material'].strip(),
+                    R = float(row['R_um']) * 1e-6,
+                    A = float(row['A_um']) * 1e-6,
+                    d = float(row.get('d_um') or 30) * 1e-6,
+                    description = row.get('description', '').strip(),
+                ))
+        return cls(entries)
+
+    def __len__(self):
+        return len(self.by_id)
+
+    def __contains__(self, lens_id):
+        return lens_id in self.by_id
+
+    def get(self, lens_id, default=None):
+        return self.by_id.get(lens_id, default)
+
+    def ids(self):
+        """id в порядке файла."""
+        return list(self.by_id)
+
+    def materials(self):
+        return sorted(self.by_material)
+
+    def vendors(self):
+        return sorted(self.by_vendor)
+
+    @staticmethod
+    def _range(keys, ids, lo, hi):
+        lo = keys[0] if lo is None else lo
+        hi = keys[-1] if hi is None else hi
+        return ids[bisect_left(keys, lo):bisect_right(keys, hi)]
+
+    def find(self, material=None, vendor=None, R_range=None, A_range=None):
+        """
+        id линз, подходящих под все заданные условия (порядок как в файле).
+        R_range/A_range — (min, max) в метрах, любая граница может быть None.
+        """
+        selected = None
+        if material is not None:
+            selected = set(self.by_material.get(material, ()))
+        if vendor is not None:
+            ids = set(self.by_vendor.get(vendor, ()))
+            selected = ids if selected is None else selected & ids
+        if self.by_id:
+            for rng, keys, ids in ((R_range, self._R_keys, self._R_ids), (A_range, self._A_keys, self._A_ids)):
+                if rng is not None:
+                    ids = set(self._range(keys, ids, *rng))
+                    selected = ids if selected is None else selected & ids
+        if selected is None:
+            return self.ids()
+        return [lens_id for lens_id in self.by_id if lens_id in selected]
+
+    def preset(self, lens_id):
+        """Словарь в формате старых LENS_PRESETS."""
+        entry = self.by_id[lens_id]
+        return {'R': entry.R, 'A': entry.A, 'material': entry.material, 'd': entry.d}
+
+    def prefetch_optical_constants(self, energies, materials=None):
+        """
+        Заполняет кэш optical_constants для материалов каталога на энергиях energies,
+        чтобы редакторы и расчёты не обращались к xraydb при работе.
+        """
+        from parameters_micro1 import optical_constants
+
+        if isinstance(energies, (int, float)):
+            energies = [energies]
+        for material in materials or self.materials():
+            for energy in energies:
+                try:
+                    optical_constants(material, float(energy))
+                except Exception:
+                    pass  # неизвестный xraydb материал — ошибку покажет расчёт
+
+
+_CATALOG = None
+_CATALOG_VERSION = 0   # растёт при каждой подмене каталога (ключ кэшей, зависящих от каталога)
+
+
+def get_catalog():
+    """Каталог, загружаемый при первом обращении (не при импорте)."""
+    global _CATALOG
+    if _CATALOG is None:
+        _CATALOG = LensCatalog.load(os.environ.get(CATALOG_ENV) or DEFAULT_CATALOG_PATH)
+    return _CATALOG
+
+
+def set_catalog(catalog):
+    """Подменяет каталог (например, загруженный из другого файла)."""
+    global _CATALOG, _CATALOG_VERSION
+    _CATALOG = catalog
+    _CATALOG_VERSION += 1
+
+
+def catalog_version():
+    """Номер текущего каталога: меняется при set_catalog."""
+    return _CATALOG_VERSION
+
+
+class PresetView(Mapping):
+    """Ленивое представление каталога в виде словаря LENS_PRESETS {id: {R, A, material, d}}."""
+
+    def __getitem__(self, lens_id):
+        catalog = get_catalog()
+        if lens_id not in catalog:
+            raise KeyError(lens_id)
+        return catalog.preset(lens_id)
+
+    def __iter__(self):
+        return iter(get_catalog().ids())
+
+    def __len__(self):
+        return len(get_catalog())
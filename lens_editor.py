@@ -1,450 +1,442 @@
-from PyQt5.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QTableWidget, 
-                             QTableWidgetItem, QPushButton, QComboBox, QCheckBox, 
-                             QLabel, QHeaderView, QMessageBox, QWidget, QSpinBox)
-from PyQt5.QtCore import Qt
-from xraydb import xray_delta_beta, get_material
-from parameters_micro1 import LENS_PRESETS
-
-MATERIALS = ['Be', 'Al', 'Si', "Ni"]
-
-class TFEditorDialog(QDialog):
-    def __init__(self, parent=None, tf_type='air', config=None, title="Edit TF", energy = 10300):
-        super().__init__(parent)
-        self.tf_type = tf_type
-        self.setWindowTitle(title)
-        self.resize(600, 400)
-        
-        self.config = config or self._default_config()
-        self.energy = energy
-        self.setup_ui()
-        self.load_data()
-
-
-
-    def _default_config(self):
-        if self.tf_type == 'air':
-            return [{'preset': 'R50', 'active': True} for _ in range(10)]
-        else:  # vacuum
-            return [{'preset': 'R500', 'N': 1, 'active': True} for _ in range(3)]
-
-    def setup_ui(self):
-        layout = QVBoxLayout(self)
-
-        # Таблица
-        self.table = QTableWidget()
-        layout.addWidget(self.table)
-
-        # Кнопки
-        btn_layout = QHBoxLayout()
-        self.btn_ok = QPushButton("OK")
-        self.btn_cancel = QPushButton("Cancel")
-        self.btn_details = QPushButton("Edit Lens Details...")  # Только для vacuum
-        self.btn_details.setVisible(self.tf_type == 'vacuum')
-
-        # Кнопки Add/Remove Group (только для Vacuum)
-        self.btn_add_group = QPushButton("Add Group")
-        self.btn_remove_group = QPushButton("Remove Last")
-        if self.tf_type == 'vacuum':
-            btn_layout.addWidget(self.btn_add_group)
-            btn_layout.addWidget(self.btn_remove_group)
-
-        btn_layout.addWidget(self.btn_details)
-        btn_layout.addStretch()
-        btn_layout.addWidget(self.btn_ok)
-        btn_layout.addWidget(self.btn_cancel)
-        layout.addLayout(btn_layout)
-
-        self.btn_ok.clicked.connect(self.accept)
-        self.btn_cancel.clicked.connect(self.reject)
-        self.btn_details.clicked.connect(self.open_lens_details)
-        if self.tf_type == 'vacuum':
-            self.btn_add_group.clicked.connect(self.add_vacuum_group)
-            self.btn_remove_group.clicked.connect(self.remove_vacuum_group)
-
-        self.setup_table_headers()
-
-    def setup_table_headers(self):
-        if self.tf_type == 'air':
-            self.table.setColumnCount(4)
-            self.table.setHorizontalHeaderLabels(["Preset", "In Beam", "Position", "Material"])
-        else:  # vacuum
-            self.table.setColumnCount(4)
-            self.table.setHorizontalHeaderLabels(["N Lenses", "Preset", "In Beam", "Block Length (mm)"])
-        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
-
-    def load_data(self):
-        self.table.setRowCount(len(self.config))
-        for row, item in enumerate(self.config):
-            if self.tf_type == 'air':
-                self._load_air_row(row, item)
-            else:
-                self._load_vacuum_row(row, item)
-    
-    def update_optical_constants_for_row(self, row, material, energy):
-
-        mat_obj = get_material(material)
-        if mat_obj is not None and hasattr(mat_obj, 'density'):
-            density = mat_obj.density
-        else:
-            fallback = {"Be": 1.848, "Al": 2.7, "Si": 2.33, "Ni": 8.9}
-            density = fallback.get(material, 1.848)
-
-        try:
-            delta, betta, atlen = xray_delta_beta(material, density, energy)
-            mu = 1.0 / (atlen * 1e-2)
-        except:
-            delta, betta, mu = 0, 0, 0
-
-        # Найдём QLabel в строке и обновим
-        delta_lbl = self.table.cellWidget(row, 4)
-        betta_lbl = self.table.cellWidget(row, 5)
-        mu_lbl = self.table.cellWidget(row, 6)
-
-        if delta_lbl:
-            delta_lbl.setText(f"{delta:.2e}")
-        if betta_lbl:
-            betta_lbl.setText(f"{betta:.2e}")
-        if mu_lbl:
-            mu_lbl.setText(f"{mu:.2e}")
-
-    def _load_air_row(self, row, lens):
-        # Preset
-        cb = QComboBox()
-        cb.addItems(LENS_PRESETS.keys())
-        cb.setCurrentText(lens['preset'])
-        self.table.setCellWidget(row, 0, cb)
-
-        # Active
-        chk = QCheckBox()
-        chk.setChecked(lens['active'])
-        container = QWidget()
-        lay = QHBoxLayout(container)
-        lay.addWidget(chk)
-        lay.setAlignment(Qt.AlignCenter)
-        lay.setContentsMargins(0,0,0,0)
-        container.chk = chk
-        self.table.setCellWidget(row, 1, container)
-
-        # Position (read-only)
-        pos_item = QTableWidgetItem(f"{row * 1.4:.1f} mm")
-        pos_item.setFlags(pos_item.flags() & ~Qt.ItemIsEditable)
-        self.table.setItem(row, 2, pos_item)
-
-        # Material
-        mat_combo = QComboBox()
-        mat_combo.addItems(MATERIALS)
-        mat_combo.setCurrentText(lens.get('material', LENS_PRESETS[lens['preset']]['material']))  # по умолчанию из пресета
-        self.table.setCellWidget(row, 3, mat_combo)
-
-        # Добавим метки для оптических констант
-        delta_lbl = QLabel("-")
-        betta_lbl = QLabel("-")
-        mu_lbl = QLabel("-")
-        self.update_optical_constants_for_row(row, mat_combo.currentText(), self.energy)
-        #self.table.setCellWidget(row, 4, delta_lbl)
-        #self.table.setCellWidget(row, 5, betta_lbl)
-        #self.table.setCellWidget(row, 6, mu_lbl)
-
-        # Подключим обновление при смене материала
-        mat_combo.currentTextChanged.connect(lambda mat, r=row: self.update_optical_constants_for_row(r, mat, self.energy))
-
-    def _load_vacuum_row(self, row, block):
-        # N lenses
-        sb = QSpinBox()
-        sb.setRange(1, 10)
-        sb.setValue(block['N'])
-        sb.valueChanged.connect(lambda n, r=row: self.on_block_n_changed(r, n))
-        self.table.setCellWidget(row, 0, sb)
-
-        # Preset
-        cb = QComboBox()
-        cb.addItems(LENS_PRESETS.keys())
-        cb.setCurrentText(block['preset'])
-        self.table.setCellWidget(row, 1, cb)
-
-        # Active
-        chk = QCheckBox()
-        chk.setChecked(block['active'])
-        container = QWidget()
-        lay = QHBoxLayout(container)
-        lay.addWidget(chk)
-        lay.setAlignment(Qt.AlignCenter)
-        lay.setContentsMargins(0,0,0,0)
-        container.chk = chk
-        self.table.setCellWidget(row, 2, container)
-
-        # Block length = 10 mm (fixed)
-        len_item = QTableWidgetItem("10.0")
-        len_item.setFlags(len_item.flags() & ~Qt.ItemIsEditable)
-        self.table.setItem(row, 3, len_item)
-
-    def add_vacuum_group(self):
-        row = self.table.rowCount()
-        self.table.insertRow(row)
-
-        # N lenses
-        sb = QSpinBox()
-        sb.setRange(1, 10)
-        sb.setValue(1)
-        sb.valueChanged.connect(lambda n, r=row: self.on_block_n_changed(r, n))
-        self.table.setCellWidget(row, 0, sb)
-
-        # Preset
-        cb = QComboBox()
-        cb.addItems(LENS_PRESETS.keys())
-        cb.setCurrentText('R500')
-        self.table.setCellWidget(row, 1, cb)
-
-        # Active
-        chk = QCheckBox()
-        chk.setChecked(True)
-        container = QWidget()
-        lay = QHBoxLayout(container)
-        lay.addWidget(chk)
-        lay.setAlignment(Qt.AlignCenter)
-        lay.setContentsMargins(0,0,0,0)
-        container.chk = chk
-        self.table.setCellWidget(row, 2, container)
-
-        # Block length = 10 mm (fixed)
-        len_item = QTableWidgetItem("10.0")
-        len_item.setFlags(len_item.flags() & ~Qt.ItemIsEditable)
-        self.table.setItem(row, 3, len_item)
-
-        # Добавляем в config
-        self.config.append({
-            'N': 1,
-            'preset': 'R500',
-            'active': True,
-            'lenses': [{'preset': 'R500', 'active': True, 'material': LENS_PRESETS['R500']['material']} for _ in range(1)]
-        })
-
-    def remove_vacuum_group(self):
-        row = self.table.rowCount()
-        if row > 0:
-            self.table.removeRow(row - 1)
-            if len(self.config) >= row:
-                self.config.pop(row - 1)  # удаляем последний элемент
-            #self.config.pop()  # удаляем последний элемент
-
-    def on_block_n_changed(self, row, n):
-        # Обновляем внутреннюю структуру block['lenses']
-        block = self.config[row]
-        
-        if 'lenses' not in block or block['lenses'] is None:
-            # Инициализируем lenses, если его нет
-            preset = block['preset']
-            active = block.get('active', True)
-            material = block.get('material', LENS_PRESETS[preset]['material'])
-            block['lenses'] = [
-                {'preset': preset, 'active': active, 'material': material}
-                for _ in range(n)
-            ]
-        else:
-            current = block['lenses']
-            if n > len(current):
-                # Добавляем новые линзы с теми же параметрами, что и у блока
-                preset = block['preset']
-                active = block.get('active', True)
-                material = block.get('material', LENS_PRESETS[preset]['material'])
-                current.extend([
-                    {'preset': preset, 'active': active, 'material': material}
-                    for _ in range(n - len(current))
-                ])
-            elif n < len(current):
-                current = current[:n]
-                block['lenses'] = current
-
-    def open_lens_details(self):
-        row = self.table.currentRow()
-        if row < 0:
-            QMessageBox.warning(self, "Select Block", "Please select a block first.")
-            return
-
-        block = self.config[row]
-        if 'lenses' not in block or block['lenses'] is None:
-            # Инициализируем, если ещё не было
-            block['lenses'] = [
-                {'preset': block['preset'], 
-                 'active': block.get('active', True), 
-                 'material': block.get('material', LENS_PRESETS[block['preset']]['material'])}
-
-                for _ in range(block['N'])
-            ]
-
-        dialog = LensDetailDialog(self, block['lenses'], block_length_mm=10.0, energy = self.energy)
-        if dialog.exec_() == QDialog.Accepted:
-            self.config[row]['lenses'] = dialog.get_lenses()
-
-    def get_config(self):
-        """Возвращает обновлённую конфигурацию"""
-        result = []
-        for row in range(self.table.rowCount()):
-            if self.tf_type == 'air':
-                cb = self.table.cellWidget(row, 0)
-                chk_container = self.table.cellWidget(row, 1)
-                mat_combo = self.table.cellWidget(row, 3)
-
-                result.append({
-                    'preset': cb.currentText(),
-                    'material': mat_combo.currentText(),
-                    'active': chk_container.chk.isChecked()
-                })
-            else:
-                sb = self.table.cellWidget(row, 0)
-                cb = self.table.cellWidget(row, 1)
-                chk_container = self.table.cellWidget(row, 2)
-                #mat_combo = self.table.cellWidget(row, 3)
-
-                # Обновляем config[row] напрямую
-                n = sb.value()
-                preset = cb.currentText()
-                active = chk_container.chk.isChecked()
-                #material = mat_combo.currentText() if mat_combo else 'Be'
-
-                # Обновляем внутреннюю структуру
-                if row < len(self.config):
-                    self.config[row]['N'] = n
-                    self.config[row]['preset'] = preset
-                    self.config[row]['active'] = active
-                    #self.config[row]['material'] = material
-                else:
-                    self.config.append({'N': n, 'preset': preset, 'active': active})
-
-                lenses = self.config[row].get('lenses', None)
-
-                result.append({
-                    'N': sb.value(),
-                    'preset': cb.currentText(),
-                    #'material': material,
-                    'active': chk_container.chk.isChecked(),
-                    'lenses': lenses
-                })
-        return result
-
-class LensDetailDialog(QDialog):
-    def __init__(self, parent=None, lenses=None, block_length_mm=10.0, material = 'Be', energy = 10300.0):
-        super().__init__(parent)
-        self.lenses = lenses or []
-        self.energy = energy
-        self.block_length = block_length_mm
-        self.setWindowTitle("Edit Lenses in Block")
-        self.resize(700, 300)
-        self.setup_ui()
-        self.load_lenses()
-
-    def setup_ui(self):
-        layout = QVBoxLayout(self)
-        self.table = QTableWidget()
-        layout.addWidget(self.table)
-
-        btns = QHBoxLayout()
-        btns.addStretch()
-        btn_ok = QPushButton("OK")
-        btn_cancel = QPushButton("Cancel")
-        btn_ok.clicked.connect(self.accept)
-        btn_cancel.clicked.connect(self.reject)
-        btns.addWidget(btn_ok)
-        btns.addWidget(btn_cancel)
-        layout.addLayout(btns)
-
-        self.table.setColumnCount(4)
-        self.table.setHorizontalHeaderLabels(["Preset", "In Beam", "Material", "Wall thickness from Left/Right (mm)"])
-        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
-
-    def load_lenses(self):
-        n = len(self.lenses)
-        if n == 0:
-            return
-
-        block_length = self.block_length  # 10.0 мм
-        p = 1.0  # 1 мм на линзу (должно браться из defaults, но для GUI в мм)
-
-        if n * p > block_length:
-            return
-        
-        free_space = block_length - n * p
-        offset_left = free_space / 2.0
-
-        spacing = self.block_length / (n + 1)  # 10mm / (N+1)
-        self.table.setRowCount(n)
-
-        for i, lens in enumerate(self.lenses):
-            # Preset
-            cb = QComboBox()
-            cb.addItems(LENS_PRESETS.keys())
-            cb.setCurrentText(lens['preset'])
-            self.table.setCellWidget(i, 0, cb)
-
-            # Active
-            chk = QCheckBox()
-            chk.setChecked(lens['active'])
-            container = QWidget()
-            lay = QHBoxLayout(container)
-            lay.addWidget(chk)
-            lay.setAlignment(Qt.AlignCenter)
-            lay.setContentsMargins(0,0,0,0)
-            container.chk = chk
-            self.table.setCellWidget(i, 1, container)
-
-            # Material
-            mat_combo = QComboBox()
-            mat_combo.addItems(MATERIALS)
-            mat_combo.setCurrentText(lens.get('material', 'Be'))
-            self.table.setCellWidget(i, 2, mat_combo)  # колонка 2
-            #self.update_optical_constants_for_row(i, mat_combo.currentText(), self.energy)
-
-            # Position from left
-            from_left = spacing * (i + 1)
-            from_right = self.block_length - from_left
-            pos_item = QTableWidgetItem(f"{from_left:.2f} / {from_right:.2f}")
-            pos_item.setFlags(pos_item.flags() & ~Qt.ItemIsEditable)
-            self.table.setItem(i, 3, pos_item)
-
-            mat_combo.currentTextChanged.connect(
-                lambda mat, row = i: self.update_optical_constants_for_row(row, mat, self.energy)
-            )
-
-            # Make position read-only
-            #for col in [3, 4]:
-            #    item = self.table.item(i, col)
-            #    item.setFlags(item.flags() & ~Qt.ItemIsEditable)
-
-    def update_optical_constants_for_row(self, row, material, energy):
-        mat_obj = get_material(material)
-        if mat_obj is not None and hasattr(mat_obj, 'density'):
-            density = mat_obj.density
-        else:
-            fallback = {"Be": 1.848, "Al": 2.7, "Si": 2.33, "Ni": 8.9}
-            density = fallback.get(material, 1.848)
-
-        try:
-            delta, betta, atlen = xray_delta_beta(material, density, energy)
-            mu = 1.0 / (atlen * 1e-2)
-        except:
-            delta, betta, mu = 0, 0, 0
-
-        # Найдём QLabel в строке и обновим
-        delta_lbl = self.table.cellWidget(row, 3)
-        betta_lbl = self.table.cellWidget(row, 4)
-        mu_lbl = self.table.cellWidget(row, 5)
-
-        if delta_lbl:
-            delta_lbl.setText(f"{delta:.2e}")
-        if betta_lbl:
-            betta_lbl.setText(f"{betta:.2e}")
-        if mu_lbl:
-            mu_lbl.setText(f"{mu:.2e}")
-
-    def get_lenses(self):
-        result = []
-        for i in range(self.table.rowCount()):
-            cb = self.table.cellWidget(i, 0)
-            chk_container = self.table.cellWidget(i, 1)
-            mat_combo = self.table.cellWidget(i, 2)
-            result.append({
-                'preset': cb.currentText(),
-                'active': chk_container.chk.isChecked(),
-                'material': mat_combo.currentText() if mat_combo else 'Be'
-            })
-        return result
\ No newline at end of file
+from collections import namedtuple
+
+from PyQt5.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QTableView, QPushButton, QComboBox,
+                             QHeaderView, QMessageBox, QSpinBox, QApplication, QStyledItemDelegate,
+                             QAbstractItemView)
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex
+from PyQt5.QtGui import QStandardItemModel, QStandardItem
+from parameters_micro1 import LENS_PRESETS, optical_constants
+from lens_catalog import get_catalog
+from lens_mask import LensMask
+from tf_hardware import DEFAULT_HARDWARE, get_hardware
+
+_PRESET_MODEL = None
+
+
+def preset_combo(current=None):
+    """
+    Комбобокс типа линзы. Модель со всеми id каталога одна на все комбобоксы,
+    поэтому таблица из сотен строк не копирует каталог в каждую ячейку.
+    """
+    global _PRESET_MODEL
+    if _PRESET_MODEL is None:
+        _PRESET_MODEL = QStandardItemModel(QApplication.instance())
+        for entry in get_catalog().by_id.values():
+            item = QStandardItem(entry.id)
+            item.setToolTip(f"{entry.description} ({entry.vendor}, {entry.material}, "
+                            f"R={entry.R * 1e6:g} um, A={entry.A * 1e6:g} um, d={entry.d * 1e6:g} um)")
+            _PRESET_MODEL.appendRow(item)
+    cb = QComboBox()
+    # Без этого QComboBox перебирает все элементы модели для расчёта ширины
+    cb.setSizeAdjustPolicy(QComboBox.AdjustToMinimumContentsLengthWithIcon)
+    cb.setMinimumContentsLength(8)
+    cb.setModel(_PRESET_MODEL)
+    if current is not None:
+        cb.setCurrentText(current)
+    return cb
+
+
+def catalog_materials():
+    return get_catalog().materials()
+
+# Виды колонок таблиц редакторов
+PRESET, MATERIAL, CHECK, SPIN, TEXT = 'preset', 'material', 'check', 'spin', 'text'
+
+# key — ключ словаря строки; для TEXT — функция (номер строки, строка) -> текст
+Column = namedtuple('Column', 'key title kind')
+
+
+class LensTableModel(QAbstractTableModel):
+    """
+    Строки редактора (список словарей) для QTableView.
+
+    Виджеты в ячейках не создаются: флажки рисует сам вид, комбобоксы и
+    счётчики — делегаты только на время редактирования ячейки. Оптические
+    константы считаются один раз на материал и показываются в подсказке.
+    """
+
+    def __init__(self, columns, rows, energy, parent=None):
+        super().__init__(parent)
+        self.columns = columns
+        self.rows = rows
+        self.energy = energy
+        self._constants = {}
+        for material in {row['material'] for row in rows if 'material' in row}:
+            self._material_constants(material)
+
+    def column(self, key):
+        return next(i for i, col in enumerate(self.columns) if col.key == key)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.columns)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return self.columns[section].title
+        return super().headerData(section, orientation, role)
+
+    def flags(self, index):
+        kind = self.columns[index.column()].kind
+        flags = Qt.ItemIsEnabled | Qt.ItemIsSelectable
+        if kind == CHECK:
+            flags |= Qt.ItemIsUserCheckable
+        elif kind != TEXT:
+            flags |= Qt.ItemIsEditable
+        return flags
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row = self.rows[index.row()]
+        col = self.columns[index.column()]
+        if col.kind == TEXT:
+            return col.key(index.row(), row) if role == Qt.DisplayRole else None
+        if col.kind == CHECK:
+            if role == Qt.CheckStateRole:
+                return Qt.Checked if row[col.key] else Qt.Unchecked
+            return None
+        if role in (Qt.DisplayRole, Qt.EditRole):
+            return row[col.key]
+        if role == Qt.ToolTipRole:
+            if col.kind == PRESET:
+                entry = get_catalog().get(row[col.key])
+                return entry and f"{entry.description} ({entry.vendor}, {entry.material})"
+            if col.kind == MATERIAL:
+                constants = self._material_constants(row[col.key])
+                if constants is not None:
+                    delta, betta, mu = constants
+                    return f"delta = {delta:.2e}, beta = {betta:.2e}, mu = {mu:.2e} 1/m"
+        return None
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if not index.isValid():
+            return False
+        col = self.columns[index.column()]
+        if col.kind == CHECK and role == Qt.CheckStateRole:
+            value = value == Qt.Checked
+        elif col.kind == TEXT or role != Qt.EditRole:
+            return False
+        self.rows[index.row()][col.key] = value
+        self.dataChanged.emit(index, index, [role])
+        return True
+
+    def append_row(self, row):
+        n = len(self.rows)
+        self.beginInsertRows(QModelIndex(), n, n)
+        self.rows.append(row)
+        self.endInsertRows()
+
+    def remove_last(self):
+        n = len(self.rows)
+        if n:
+            self.beginRemoveRows(QModelIndex(), n - 1, n - 1)
+            self.rows.pop()
+            self.endRemoveRows()
+
+    def _material_constants(self, material):
+        """(delta, betta, mu) материала при self.energy; None — xraydb его не знает."""
+        if material not in self._constants:
+            try:
+                self._constants[material] = optical_constants(material, self.energy)
+            except Exception:
+                self._constants[material] = None
+        return self._constants[material]
+
+
+def material_combo():
+    cb = QComboBox()
+    cb.addItems(catalog_materials())
+    return cb
+
+
+class ComboDelegate(QStyledItemDelegate):
+    """Комбобокс (make_combo()) только на время редактирования ячейки."""
+
+    def __init__(self, make_combo, parent=None):
+        super().__init__(parent)
+        self.make_combo = make_combo
+
+    def createEditor(self, parent, option, index):
+        combo = self.make_combo()
+        combo.setParent(parent)
+        # Выбор сразу записывается в модель, без ухода из ячейки
+        combo.activated.connect(lambda _: self.commitData.emit(combo))
+        return combo
+
+    def setEditorData(self, editor, index):
+        editor.setCurrentText(index.data(Qt.EditRole))
+
+    def setModelData(self, editor, model, index):
+        model.setData(index, editor.currentText(), Qt.EditRole)
+
+
+class SpinDelegate(QStyledItemDelegate):
+    """Целое число в диапазоне [lo, hi]."""
+
+    def __init__(self, lo, hi, parent=None):
+        super().__init__(parent)
+        self.lo, self.hi = lo, hi
+
+    def createEditor(self, parent, option, index):
+        spin = QSpinBox(parent)
+        spin.setRange(self.lo, self.hi)
+        return spin
+
+    def setEditorData(self, editor, index):
+        editor.setValue(index.data(Qt.EditRole))
+
+    def setModelData(self, editor, model, index):
+        editor.interpretText()
+        model.setData(index, editor.value(), Qt.EditRole)
+
+
+def lens_table_view(model, spin_max=10):
+    """QTableView для LensTableModel с делегатами по видам колонок."""
+    view = QTableView()
+    view.setModel(model)
+    view.setEditTriggers(QAbstractItemView.AllEditTriggers)
+    view.setSelectionBehavior(QAbstractItemView.SelectRows)
+    view.setSelectionMode(QAbstractItemView.SingleSelection)
+    view.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+    # Высота строк фиксированная: вид не измеряет содержимое каждой строки
+    view.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+    delegates = {PRESET: ComboDelegate(preset_combo, view), MATERIAL: ComboDelegate(material_combo, view)}
+    for i, col in enumerate(model.columns):
+        if col.kind in delegates:
+            view.setItemDelegateForColumn(i, delegates[col.kind])
+        elif col.kind == SPIN:
+            view.setItemDelegateForColumn(i, SpinDelegate(1, spin_max, view))
+    return view
+
+
+class TFEditorDialog(QDialog):
+    def __init__(self, parent=None, tf_type='air', config=None, title="Edit TF", energy = 10300, active_mask = None,
+                 hardware = None):
+        super().__init__(parent)
+        self.tf_type = tf_type
+        # Геометрия и число слотов/блоков — из описания железа TF
+        self.hardware = hardware or get_hardware(DEFAULT_HARDWARE[tf_type])
+        self.setWindowTitle(title)
+        self.resize(600, 400)
+        
+        self.energy = energy
+        # Для Air: активность линз задаётся маской; без неё берётся lens['active']
+        self.active_mask = active_mask
+        # Строки редактора — копии: конфигурация TF меняется только через get_config()
+        self.config = self._load_rows(config or self._default_config())
+        self.setup_ui()
+
+
+
+    def _default_config(self):
+        if self.tf_type == 'air':
+            return [{'preset': 'R50', 'active': True} for _ in range(10)]
+        else:  # vacuum
+            return [{'preset': 'R500', 'N': 1, 'active': True} for _ in range(3)]
+
+    def _load_rows(self, config):
+        rows = []
+        for row, item in enumerate(config):
+            if self.tf_type == 'air':
+                active = row in self.active_mask if self.active_mask is not None else item.get('active', True)
+                rows.append({
+                    'preset': item['preset'],
+                    'active': active,
+                    'material': item.get('material', LENS_PRESETS[item['preset']]['material']),  # по умолчанию из пресета
+                })
+            else:
+                block = dict(item)
+                if block.get('lenses') is not None:
+                    block['lenses'] = [dict(lens) for lens in block['lenses']]
+                rows.append(block)
+        return rows
+
+    def setup_ui(self):
+        layout = QVBoxLayout(self)
+
+        # Таблица
+        if self.tf_type == 'air':
+            columns = [
+                Column('preset', "Preset", PRESET),
+                Column('active', "In Beam", CHECK),
+                Column(self._slot_position, "Position", TEXT),
+                Column('material', "Material", MATERIAL),
+            ]
+        else:  # vacuum
+            columns = [
+                Column('N', "N Lenses", SPIN),
+                Column('preset', "Preset", PRESET),
+                Column('active', "In Beam", CHECK),
+                Column(lambda row, block: f"{self.hardware.block_length * 1e3:.1f}", "Block Length (mm)", TEXT),
+            ]
+        self.model = LensTableModel(columns, self.config, self.energy, self)
+        self.model.dataChanged.connect(self.on_data_changed)
+        self.table = lens_table_view(self.model, getattr(self.hardware, 'max_lenses', 10))
+        layout.addWidget(self.table)
+
+        # Кнопки
+        btn_layout = QHBoxLayout()
+        self.btn_ok = QPushButton("OK")
+        self.btn_cancel = QPushButton("Cancel")
+        self.btn_details = QPushButton("Edit Lens Details...")  # Только для vacuum
+        self.btn_details.setVisible(self.tf_type == 'vacuum')
+
+        # Кнопки Add/Remove Group (только для Vacuum)
+        self.btn_add_group = QPushButton("Add Group")
+        self.btn_remove_group = QPushButton("Remove Last")
+        if self.tf_type == 'vacuum':
+            btn_layout.addWidget(self.btn_add_group)
+            btn_layout.addWidget(self.btn_remove_group)
+
+        btn_layout.addWidget(self.btn_details)
+        btn_layout.addStretch()
+        btn_layout.addWidget(self.btn_ok)
+        btn_layout.addWidget(self.btn_cancel)
+        layout.addLayout(btn_layout)
+
+        self.btn_ok.clicked.connect(self.accept)
+        self.btn_cancel.clicked.connect(self.reject)
+        self.btn_details.clicked.connect(self.open_lens_details)
+        if self.tf_type == 'vacuum':
+            self.btn_add_group.clicked.connect(self.add_vacuum_group)
+            self.btn_remove_group.clicked.connect(self.remove_vacuum_group)
+
+    def on_data_changed(self, top_left, bottom_right, roles=()):
+        if self.tf_type == 'vacuum' and top_left.column() == self.model.column('N'):
+            for row in range(top_left.row(), bottom_right.row() + 1):
+                self.on_block_n_changed(row, self.config[row]['N'])
+
+    def _slot_position(self, row, lens):
+        offsets = self.hardware.slot_offsets
+        return f"{offsets[row] * 1e3:.1f} mm" if row < len(offsets) else "no slot"
+
+    def add_vacuum_group(self):
+        if len(self.config) >= self.hardware.capacity:
+            return   # все блоки железа заняты
+        self.model.append_row({
+            'N': 1,
+            'preset': 'R500',
+            'active': True,
+            'lenses': [{'preset': 'R500', 'active': True, 'material': LENS_PRESETS['R500']['material']} for _ in range(1)]
+        })
+
+    def remove_vacuum_group(self):
+        self.model.remove_last()
+
+    def on_block_n_changed(self, row, n):
+        # Обновляем внутреннюю структуру block['lenses']
+        block = self.config[row]
+        
+        if 'lenses' not in block or block['lenses'] is None:
+            # Инициализируем lenses, если его нет
+            preset = block['preset']
+            active = block.get('active', True)
+            material = block.get('material', LENS_PRESETS[preset]['material'])
+            block['lenses'] = [
+                {'preset': preset, 'active': active, 'material': material}
+                for _ in range(n)
+            ]
+        else:
+            current = block['lenses']
+            if n > len(current):
+                # Добавляем новые линзы с теми же параметрами, что и у блока
+                preset = block['preset']
+                active = block.get('active', True)
+                material = block.get('material', LENS_PRESETS[preset]['material'])
+                current.extend([
+                    {'preset': preset, 'active': active, 'material': material}
+                    for _ in range(n - len(current))
+                ])
+            elif n < len(current):
+                current = current[:n]
+                block['lenses'] = current
+
+    def open_lens_details(self):
+        row = self.table.currentIndex().row()
+        if row < 0:
+            QMessageBox.warning(self, "Select Block", "Please select a block first.")
+            return
+
+        block = self.config[row]
+        if 'lenses' not in block or block['lenses'] is None:
+            # Инициализируем, если ещё не было
+            block['lenses'] = [
+                {'preset': block['preset'], 
+                 'active': block.get('active', True), 
+                 'material': block.get('material', LENS_PRESETS[block['preset']]['material'])}
+
+                for _ in range(block['N'])
+            ]
+
+        dialog = LensDetailDialog(self, block['lenses'], block_length_mm=self.hardware.block_length * 1e3,
+                                  lens_thickness_mm=self.hardware.p * 1e3, energy = self.energy)
+        if dialog.exec_() == QDialog.Accepted:
+            self.config[row]['lenses'] = dialog.get_lenses()
+
+    def get_config(self):
+        """Возвращает обновлённую конфигурацию"""
+        self.table.setCurrentIndex(QModelIndex())   # закрывает открытый редактор ячейки
+        if self.tf_type == 'air':
+            return [{'preset': lens['preset'], 'material': lens['material']} for lens in self.config]
+        return [{
+            'N': block['N'],
+            'preset': block['preset'],
+            'active': block['active'],
+            'lenses': block.get('lenses', None),
+        } for block in self.config]
+
+    def get_active_mask(self):
+        """Активные линзы Air-массива в виде LensMask."""
+        return LensMask.from_flags(lens['active'] for lens in self.config)
+
+class LensDetailDialog(QDialog):
+    def __init__(self, parent=None, lenses=None, block_length_mm=10.0, material = 'Be', energy = 10300.0,
+                 lens_thickness_mm=1.0):
+        super().__init__(parent)
+        self.lenses = [dict(lens, material=lens.get('material', 'Be')) for lens in lenses or []]
+        self.energy = energy
+        self.block_length = block_length_mm
+        self.lens_thickness = lens_thickness_mm
+        self.setWindowTitle("Edit Lenses in Block")
+        self.resize(700, 300)
+        self.setup_ui()
+
+    def setup_ui(self):
+        layout = QVBoxLayout(self)
+
+        n = len(self.lenses)
+        p = self.lens_thickness  # мм
+        if n * p > self.block_length:
+            self.lenses = []   # линзы не помещаются в блок
+        spacing = self.block_length / (n + 1)  # 10mm / (N+1)
+
+        def position(row, lens):
+            from_left = spacing * (row + 1)
+            return f"{from_left:.2f} / {self.block_length - from_left:.2f}"
+
+        self.model = LensTableModel([
+            Column('preset', "Preset", PRESET),
+            Column('active', "In Beam", CHECK),
+            Column('material', "Material", MATERIAL),
+            Column(position, "Wall thickness from Left/Right (mm)", TEXT),
+        ], self.lenses, self.energy, self)
+        self.table = lens_table_view(self.model)
+        layout.addWidget(self.table)
+
+        btns = QHBoxLayout()
+        btns.addStretch()
+        btn_ok = QPushButton("OK")
+        btn_cancel = QPushButton("Cancel")
+        btn_ok.clicked.connect(self.accept)
+        btn_cancel.clicked.connect(self.reject)
+        btns.addWidget(btn_ok)
+        btns.addWidget(btn_cancel)
+        layout.addLayout(btns)
+
+    def get_lenses(self):
+        self.table.setCurrentIndex(QModelIndex())   # закрывает открытый редактор ячейки
+        return [{'preset': lens['preset'], 'active': lens['active'], 'material': lens['material']}
+                for lens in self.lenses]
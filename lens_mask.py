@@ -0,0 +1,139 @@
+class LensMask:
+    """
+    Неизменяемый набор активных линз TF (битовая маска на int).
+
+    Бит i = 1 означает, что линза i в пучке. Операции над множествами,
+    сравнение и хэш работают с одним int, без списков словарей,
+    поэтому маски удобно перебирать в оптимизаторах и использовать как ключи кэшей.
+    """
+
+    __slots__ = ('bits', 'size')
+
+    def __init__(self, bits=0, size=0):
+        mask = (1 << size) - 1
+        object.__setattr__(self, 'bits', bits & mask)
+        object.__setattr__(self, 'size', size)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("LensMask is immutable")
+
+    def __reduce__(self):
+        return (LensMask, (self.bits, self.size))
+
+    # --- Конструкторы ---
+
+    @classmethod
+    def from_ranges(cls, ranges, size):
+        """Из списка включительных интервалов [(start, end), ...] (как active_ranges)."""
+        bits = 0
+        for start, end in ranges:
+            start = max(start, 0)
+            end = min(end, size - 1)
+            if end >= start:
+                bits |= ((1 << (end - start + 1)) - 1) << start
+        return cls(bits, size)
+
+    @classmethod
+    def from_flags(cls, flags):
+        """Из последовательности bool (например, чекбоксов 'In Beam')."""
+        bits = 0
+        size = 0
+        for i, flag in enumerate(flags):
+            if flag:
+                bits |= 1 << i
+            size = i + 1
+        return cls(bits, size)
+
+    @classmethod
+    def from_indices(cls, indices, size):
+        bits = 0
+        for i in indices:
+            if 0 <= i < size:
+                bits |= 1 << i
+        return cls(bits, size)
+
+    # --- Представления ---
+
+    def to_ranges(self):
+        """Сжатое представление в виде включительных интервалов."""
+        ranges = []
+        bits = self.bits
+        offset = 0
+        while bits:
+            skip = (bits & -bits).bit_length() - 1  # нули до следующего интервала
+            bits >>= skip
+            offset += skip
+            run = (~bits & (bits + 1)).bit_length() - 1  # длина серии единиц
+            ranges.append((offset, offset + run - 1))
+            bits >>= run
+            offset += run
+        return ranges
+
+    def to_flags(self):
+        return [bool(self.bits >> i & 1) for i in range(self.size)]
+
+    def resized(self, size):
+        """Маска другой длины (лишние линзы отбрасываются, новые — неактивны)."""
+        return LensMask(self.bits, size)
+
+    def toggled(self, i):
+        return LensMask(self.bits ^ (1 << i), self.size)
+
+    def with_lens(self, i, active):
+        bits = self.bits | (1 << i) if active else self.bits & ~(1 << i)
+        return LensMask(bits, self.size)
+
+    def count(self):
+        return bin(self.bits).count('1')
+
+    def diff(self, other):
+        """Возвращает (включённые, выключенные) линзы при переходе self -> other."""
+        size = max(self.size, other.size)
+        return (LensMask(other.bits & ~self.bits, size),
+                LensMask(self.bits & ~other.bits, size))
+
+    def distance(self, other):
+        """Число переключений актуаторов между двумя конфигурациями."""
+        return bin(self.bits ^ other.bits).count('1')
+
+    # --- Протоколы ---
+
+    def __contains__(self, i):
+        return 0 <= i < self.size and bool(self.bits >> i & 1)
+
+    def __iter__(self):
+        """Индексы активных линз по возрастанию."""
+        bits = self.bits
+        while bits:
+            low = bits & -bits
+            yield low.bit_length() - 1
+            bits ^= low
+
+    def __len__(self):
+        return self.size
+
+    def __bool__(self):
+        return self.bits != 0
+
+    def __eq__(self, other):
+        if not isinstance(other, LensMask):
+            return NotImplemented
+        return self.bits == other.bits and self.size == other.size
+
+    def __hash__(self):
+        return hash((self.bits, self.size))
+
+    def __or__(self, other):
+        return LensMask(self.bits | other.bits, max(self.size, other.size))
+
+    def __and__(self, other):
+        return LensMask(self.bits & other.bits, max(self.size, other.size))
+
+    def __xor__(self, other):
+        return LensMask(self.bits ^ other.bits, max(self.size, other.size))
+
+    def __sub__(self, other):
+        return LensMask(self.bits & ~other.bits, max(self.size, other.size))
+
+    def __repr__(self):
+        return f"LensMask({self.to_ranges()}, size={self.size})"
@@ -0,0 +1,340 @@
+"""
+Воспроизведение журналов станции (энергия, позиции TF, состояния линз) через
+калькулятор: ожидаемые фокус, размер и пропускание для каждой записи.
+
+Журнал читается порциями по chunk записей (CSV/TSV, в том числе .gz), так что
+память не зависит от длины журнала. В порции записи группируются по
+состоянию линз; цепочка для каждого состояния собирается один раз и хранится
+в LRU-кэше, а все записи группы считаются одним вызовом BatchCalculator с
+позициями TF и оптическими константами по записям (xraydb — один вызов на
+материал и порцию). Результаты сразу дописываются в выходной CSV.
+
+Состояние линз TF в журнале:
+    "1-5, 8"  — номера линз (Air) или блоков (Vacuum) в пучке, с 1, интервалы включительно
+    "0x1f"    — битовая маска (бит i — линза/блок i + 1)
+    ""        — все выведены из пучка
+
+Запуск:
+    python log_replay.py run.csv.gz focus.csv --scheme scheme.json \\
+        --energy energy --position TF1=tf1_z --position TF2=tf2_z --lenses TF2=tf2_in --keep time
+scheme.json — {"structure": [...], "source": {...}, "use_fwhm": true} в формате calc_service.
+"""
+import argparse
+import csv
+import gzip
+import io
+import json
+import os
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+import numpy as np
+
+from batch_computations import ChainArrays, BatchCalculator
+from computations import CalcMode
+from energy_tracking import apply_lens_states
+from lens_mask import LensMask
+
+OUTPUT_FIELDS = ('final_pos', 'focus_pos', 'size_x', 'size_y', 'T', 'G')
+
+
+@dataclass
+class LogColumns:
+    """Какие колонки журнала что означают."""
+
+    energy: str = 'energy'
+    positions: Dict[str, str] = field(default_factory=dict)   # {имя TF: колонка позиции, м}
+    lenses: Dict[str, str] = field(default_factory=dict)      # {имя TF: колонка состояния линз}
+    keep: List[str] = field(default_factory=list)             # колонки, переносимые в вывод (время и т.п.)
+
+    def required(self):
+        return [self.energy] + list(self.positions.values()) + list(self.lenses.values()) + list(self.keep)
+
+
+# --- Чтение журналов ---
+
+def _open_text(path):
+    if path.endswith('.gz'):
+        return io.TextIOWrapper(gzip.open(path, 'rb'), newline='')
+    return open(path, newline='')
+
+
+def read_delimited(path, chunk, delimiter=','):
+    """Порции {колонка: список строк} по chunk записей."""
+    with _open_text(path) as f:
+        reader = csv.reader(f, delimiter=delimiter)
+        header = [name.strip() for name in next(reader)]
+        rows = []
+        for row in reader:
+            if not row:
+                continue
+            rows.append(row)
+            if len(rows) == chunk:
+                yield _columns(header, rows)
+                rows = []
+        if rows:
+            yield _columns(header, rows)
+
+
+def _columns(header, rows):
+    width = len(header)
+    rows = [row + [''] * (width - len(row)) if len(row) < width else row for row in rows]
+    return {name: list(values) for name, values in zip(header, zip(*rows))}
+
+
+LOG_READERS = {
+    '.csv': read_delimited,
+    '.tsv': lambda path, chunk: read_delimited(path, chunk, '\t'),
+    '.txt': lambda path, chunk: read_delimited(path, chunk, '\t'),
+}
+
+
+def register_reader(suffix, reader):
+    """Формат журнала: reader(path, chunk) выдаёт порции {колонка: последовательность значений}."""
+    LOG_READERS[suffix] = reader
+
+
+def read_log(path, chunk=100_000):
+    name = path[:-3] if path.endswith('.gz') else path
+    suffix = os.path.splitext(name)[1].lower()
+    try:
+        reader = LOG_READERS[suffix]
+    except KeyError:
+        raise ValueError(f"Unknown log format: {suffix or path}") from None
+    return reader(path, chunk)
+
+
+def _floats(values):
+    """Числа из колонки журнала; пустые и нечисловые значения — NaN."""
+    try:
+        return np.asarray(values, dtype=float)
+    except ValueError:
+        out = np.empty(len(values))
+        for i, value in enumerate(values):
+            try:
+                out[i] = float(value)
+            except ValueError:
+                out[i] = np.nan
+        return out
+
+
+def parse_lens_state(text, size):
+    """LensMask из записи журнала ("1-5, 8", "0x1f" или пусто)."""
+    text = str(text).strip()
+    if not text:
+        return LensMask(0, size)
+    if text.lower().startswith('0x'):
+        return LensMask(int(text, 16), size)
+    ranges = []
+    for part in text.replace(';', ',').split(','):
+        part = part.strip()
+        if not part:
+            continue
+        start, _, end = part.partition('-')
+        ranges.append((int(start) - 1, int(end or start) - 1))
+    return LensMask.from_ranges(ranges, size)
+
+
+# --- Расчёт ---
+
+def _optical_constants(material, energies):
+    """(delta, mu) на массиве энергий; энергии вне таблиц xraydb — NaN."""
+    from parameters_micro1 import optical_constants, optical_constants_table
+
+    try:
+        delta, _, mu = optical_constants_table(material, energies)
+        return delta, mu
+    except (ValueError, IndexError):
+        delta = np.full(len(energies), np.nan)
+        mu = np.full(len(energies), np.nan)
+        for k, energy in enumerate(energies.tolist()):
+            try:
+                delta[k], _, mu[k] = optical_constants(material, energy)
+            except (ValueError, IndexError):
+                pass
+        return delta, mu
+
+
+class LogReplay:
+    """
+    Расчёт записей журнала для одной схемы (structure_config) и источника.
+    Колонки positions/lenses переопределяют позиции и состояния линз своих TF,
+    остальное берётся из structure_config.
+    """
+
+    def __init__(self, controller, structure_config, columns: LogColumns, source_params=None, mode=None,
+                 cache_size=64):
+        self.controller = controller
+        self.structure_config = structure_config
+        self.columns = columns
+        self.source_params = source_params
+        if mode is None:
+            mode = CalcMode.of(source_params.get('use_fwhm', True)) if source_params else None
+        self.mode = mode
+        self.cache_size = cache_size
+        self._chains = OrderedDict()    # состояние линз -> (source, structure_config, ChainArrays, материалы)
+        self._states = {}               # (TF, запись журнала) -> LensMask
+        self.hits = self.misses = 0
+
+        blocks = {block['tf_name']: block for block in structure_config}
+        unknown = [name for name in list(columns.positions) + list(columns.lenses) if name not in blocks]
+        if unknown:
+            raise ValueError(f"TF not found in configuration: {', '.join(unknown)}")
+        # Число переключаемых элементов TF: линзы Air или блоки Vacuum
+        self._sizes = {name: len(blocks[name]['lenses']) if blocks[name].get('type') == 'air'
+                       else len(blocks[name].get('groups', []))
+                       for name in columns.lenses}
+
+    def _mask(self, tf_name, text):
+        key = (tf_name, text)
+        mask = self._states.get(key)
+        if mask is None:
+            if len(self._states) > 65536:
+                self._states.clear()
+            mask = self._states[key] = parse_lens_state(text, self._sizes[tf_name])
+        return mask
+
+    def _chain(self, state):
+        entry = self._chains.get(state)
+        if entry is not None:
+            self._chains.move_to_end(state)
+            self.hits += 1
+            return entry
+        self.misses += 1
+        structure = apply_lens_states(self.structure_config, dict(state))
+        energy = (self.source_params or {}).get('energy', 10300.0)
+        source, lens_chain = self.controller.build_chain(energy, structure, self.source_params, self.mode)
+        entry = (source, structure, ChainArrays.from_chain(lens_chain) if lens_chain else None,
+                 [lens['material'] for lens in lens_chain])
+        self._chains[state] = entry
+        if len(self._chains) > self.cache_size:
+            self._chains.popitem(last=False)
+        return entry
+
+    def evaluate(self, chunk) -> Dict[str, np.ndarray]:
+        """Результаты для порции журнала: {поле OUTPUT_FIELDS: массив по записям} (NaN — не посчитано)."""
+        cols = self.columns
+        energy = _floats(chunk[cols.energy])
+        n = len(energy)
+        positions = {name: _floats(chunk[column]) for name, column in cols.positions.items()}
+        out = {name: np.full(n, np.nan) for name in OUTPUT_FIELDS}
+
+        # Группы записей с одинаковым состоянием линз
+        lens_columns = [(name, chunk[column]) for name, column in cols.lenses.items()]
+        groups = {}
+        for i, key in enumerate(zip(*(values for _, values in lens_columns)) if lens_columns else [()] * n):
+            groups.setdefault(key, []).append(i)
+
+        valid_energy = np.isfinite(energy) & (energy > 0)
+        if not valid_energy.any():
+            return out   # в порции нет ни одной допустимой энергии
+        energies, energy_index = np.unique(np.where(valid_energy, energy, energy[valid_energy][:1]),
+                                           return_inverse=True)
+        tables = {}   # материал -> (delta, mu) на energies
+
+        for key, rows in groups.items():
+            try:
+                state = tuple((name, self._mask(name, text)) for (name, _), text in zip(lens_columns, key))
+            except ValueError:
+                continue   # нечитаемое состояние линз — записи остаются NaN
+            source, structure, chain, materials = self._chain(state)
+            rows = np.asarray(rows)
+            rows = rows[valid_energy[rows] & np.all([np.isfinite(p[rows]) for p in positions.values()], axis=0)]
+            if chain is None or not len(rows):
+                continue
+
+            for material in set(materials) - set(tables):
+                tables[material] = _optical_constants(material, energies)
+            e_index = energy_index[rows]
+            delta = np.stack([tables[m][0][e_index] for m in materials], axis=1)
+            mu = np.stack([tables[m][1][e_index] for m in materials], axis=1)
+
+            abs_pos = chain.positions_for(structure, {name: p[rows] for name, p in positions.items()})
+            result = BatchCalculator.propagate(chain, source, abs_pos=abs_pos, delta=delta, mu=mu,
+                                               lamda=12398.4 / energy[rows] * 1e-10,
+                                               fields=OUTPUT_FIELDS)
+            ordered = ChainArrays.ordered(abs_pos)
+            for name in OUTPUT_FIELDS:
+                out[name][rows] = np.where(ordered, result[name], np.nan)
+        return out
+
+
+def replay_log(log_path, out_path, controller, structure_config, columns: LogColumns, source_params=None,
+               mode=None, chunk=100_000, progress=None):
+    """
+    Считает все записи журнала и пишет CSV: колонки keep, энергия, позиции TF и OUTPUT_FIELDS.
+
+    Args:
+        progress: callback(записей обработано)
+    Returns:
+        число записей
+    """
+    replay = LogReplay(controller, structure_config, columns, source_params, mode)
+    header = list(columns.keep) + ['energy'] + [f'{name}_position' for name in columns.positions] + \
+        list(OUTPUT_FIELDS)
+    total = 0
+    tmp_path = out_path + '.tmp'
+    try:
+        with open(tmp_path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(header)
+            for chunk in read_log(log_path, chunk):
+                missing = [name for name in columns.required() if name not in chunk]
+                if missing:
+                    raise ValueError(f"Columns not found in log: {', '.join(missing)}")
+                result = replay.evaluate(chunk)
+                cols = [chunk[name] for name in columns.keep] + [_floats(chunk[columns.energy]).tolist()]
+                cols += [_floats(chunk[column]).tolist() for column in columns.positions.values()]
+                cols += [result[name].tolist() for name in OUTPUT_FIELDS]
+                writer.writerows(zip(*cols))
+                total += len(cols[-1])
+                if progress is not None:
+                    progress(total)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, out_path)
+    return total
+
+
+def _pairs(items):
+    out = {}
+    for item in items or []:
+        name, sep, column = item.partition('=')
+        if not sep:
+            raise argparse.ArgumentTypeError(f"Expected TF=column, got '{item}'")
+        out[name] = column
+    return out
+
+
+def main(argv=None):
+    from calc_service import structure_from_json
+    from main_controller import AdvancedController
+
+    parser = argparse.ArgumentParser(description="Replay a beamline log through the focus calculator")
+    parser.add_argument('log', help="log file (.csv, .tsv, optionally .gz)")
+    parser.add_argument('output', help="output CSV")
+    parser.add_argument('--scheme', required=True, help="JSON with structure/source as for calc_service")
+    parser.add_argument('--energy', default='energy', help="energy column (eV)")
+    parser.add_argument('--position', action='append', metavar='TF=COLUMN', help="TF position column (m)")
+    parser.add_argument('--lenses', action='append', metavar='TF=COLUMN', help="TF lens state column")
+    parser.add_argument('--keep', action='append', default=[], metavar='COLUMN', help="column copied to output")
+    parser.add_argument('--chunk', type=int, default=100_000, help="records per batch")
+    args = parser.parse_args(argv)
+
+    with open(args.scheme) as f:
+        scheme = json.load(f)
+    controller = AdvancedController()
+    structure = structure_from_json(scheme['structure'], controller)
+    source = scheme.get('source')
+    mode = CalcMode.of(bool(scheme.get('use_fwhm', (source or {}).get('use_fwhm', True))))
+    columns = LogColumns(energy=args.energy, positions=_pairs(args.position), lenses=_pairs(args.lenses),
+                         keep=args.keep)
+    total = replay_log(args.log, args.output, controller, structure, columns, source, mode, args.chunk,
+                       progress=lambda done: print(f"{done} records", end='\r', flush=True))
+    print(f"{total} records -> {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,699 +1,1059 @@
-import sys
-import os
-import pandas as pd
-from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
-                             QGroupBox, QLabel, QLineEdit, QComboBox, QCheckBox, 
-                             QPushButton, QTableWidget, QTableWidgetItem, QHeaderView, 
-                             QSpinBox, QDoubleSpinBox, QTabWidget, QSplitter, QTextEdit, QMessageBox, QDialog, QSizePolicy, QPushButton, QFileDialog)
-from PyQt5.QtCore import Qt
-
-from main_controller import AdvancedController
-from parameters_micro1 import LENS_PRESETS, LensGenerator
-from lens_editor import TFEditorDialog, LensDetailDialog
-from computations import LENS_RESULT_FIELDS
-from column_settings import ColumnSettingsDialog
-from source_editor import SourceEditorDialog
-
-# --- Универсальный класс трансфокатора ---
-class Transfocator:
-    def __init__(self, name, tf_type="Air (Array)", preset="R50", total_lenses=100, active_ranges=None, measure_to_center=True):
-        self.name = name
-        self.tf_type = tf_type
-        self.preset = preset
-        self.total_lenses = total_lenses
-        self.active_ranges = active_ranges or [(0, 8)]
-        self.measure_to_center = measure_to_center
-        
-        # Конфигурация
-        self.lenses = self._build_air_lenses() if tf_type == "Air (Array)" else []
-        # Теперь groups — это список словарей с N, preset, active
-        self.groups = [{"N": 1, "preset": preset, "active": True}, {"N": 2, "preset": preset, "active": True}, 
-                       {"N": 1, "preset": preset, "active": True}, {"N": 4, "preset": preset, "active": False},
-                       {"N": 5, "preset": preset, "active": False}, {"N": 5, "preset": preset, "active": False},
-                       {"N": 5, "preset": preset, "active": False}, {"N": 5, "preset": preset, "active": False},
-                       {"N": 5, "preset": preset, "active": False}, {"N": 5, "preset": preset, "active": False},
-                       {"N": 5, "preset": preset, "active": False}, {"N": 5, "preset": preset, "active": False},
-                       {"N": 5, "preset": preset, "active": False}, {"N": 5, "preset": preset, "active": False},] if tf_type == "Vacuum (Groups)" else []
-
-        # UI виджеты (инициализируются при создании UI)
-        self.ui_widgets = {}
-
-    def _build_air_lenses(self):
-        active_set = set()
-        for start, end in self.active_ranges:
-            active_set.update(range(start, end + 1))
-        return [
-            {"preset": self.preset, "active": (i in active_set)}
-            for i in range(self.total_lenses)
-        ]
-
-    def update_active_ranges(self, ranges):
-        self.active_ranges = ranges
-        self.lenses = self._build_air_lenses()
-
-    def update_preset(self, preset):
-        self.preset = preset
-        if self.tf_type == "Air (Array)":
-            for lens in self.lenses:
-                lens["preset"] = preset
-        else:
-            for group in self.groups:
-                group["preset"] = preset
-
-    def get_config(self):
-        if self.tf_type == "Air (Array)":
-            return {"type": "air", "lenses": self.lenses}
-        else:
-            return {"type": "vacuum", "groups": self.groups}
-
-
-# --- Менеджер трансфокаторов ---
-class TransfocatorManager:
-    def __init__(self):
-        self.tfs = []
-
-    def add_tf(self, name, tf_type="Air (Array)", preset="R50", total_lenses=100, active_ranges=None):
-        tf = Transfocator(name, tf_type, preset, total_lenses, active_ranges)
-        self.tfs.append(tf)
-        return tf
-
-    def remove_tf(self, name):
-        self.tfs = [tf for tf in self.tfs if tf.name != name]
-
-    def get_tf_by_name(self, name):
-        for tf in self.tfs:
-            if tf.name == name:
-                return tf
-        return None
-
-    def get_all_configs(self):
-        return [tf.get_config() for tf in self.tfs]
-
-
-# --- Основное окно ---
-class XRayCalcApp(QMainWindow):
-    def __init__(self):
-        super().__init__()
-        self.setWindowTitle("X-Ray Transfocator Calculator (PyQt5)")
-        self.resize(1200, 800)
-
-        default_display_fields = {'lens_index_in_block','position', 'L1', 'L2', 'sfx', 'sfy', 'T', 'M'}
-        self.current_display_fields = [
-            field for field in LENS_RESULT_FIELDS
-            if field[0] in default_display_fields and field[2] is not None
-        ]
-
-        # Инициализация
-        self.controller = AdvancedController()
-        self.tf_manager = TransfocatorManager()
-
-        # Создаём TF1 и TF2 по умолчанию
-        self.tf_manager.add_tf("TF1", "Vacuum (Groups)", "R500", total_lenses=100, active_ranges=[(0, 8)])  # Vacuum по умолчанию
-        self.tf_manager.add_tf("TF2", "Air (Array)", "R50", total_lenses=100, active_ranges=[(0, 8)])
-
-        self.source_params = {
-            'energy': 10300.0,
-            'sx_fwhm': 32.9 * 2.35482,
-            'sy_fwhm': 5.9 * 2.35482,
-            'wx_fwhm': 9.4 * 2.35482,
-            'wy_fwhm': 11.0 * 2.35482,
-            'material': 'Be'
-        }
-
-        self.use_fwhm = True
-        self.lbl_source_info = QLabel("")
-        self.lbl_source_info.setWordWrap(True)
-        self.lbl_source_info.setStyleSheet("font-family: monospace; font-size: 9pt;")
-
-        self.init_ui()
-        self.update_energy_input()
-        self.update_source_info_label()
-
-    def init_ui(self):
-        central_widget = QWidget()
-        self.setCentralWidget(central_widget)
-        
-        main_layout = QHBoxLayout(central_widget)
-        splitter = QSplitter(Qt.Horizontal)
-        main_layout.addWidget(splitter)
-
-        # --- ЛЕВАЯ ПАНЕЛЬ ---
-        left_panel = QWidget()
-        left_layout = QVBoxLayout(left_panel)
-
-        # Глобальные параметры
-        gb_global = QGroupBox("Source & Global Params")
-        gl_layout = QVBoxLayout()
-        hbox_energy = QHBoxLayout()
-        hbox_energy.addWidget(QLabel("Energy, eV:"))
-        self.inp_energy = QLineEdit("10300")
-        self.inp_energy.editingFinished.connect(self.on_energy_input_changed)
-        hbox_energy.addWidget(self.inp_energy)
-        gl_layout.addLayout(hbox_energy)
-
-        self.btn_edit_source = QPushButton("Edit Source")
-        self.btn_edit_source.clicked.connect(self.open_source_editor)
-        gl_layout.addWidget(self.btn_edit_source)
-        gl_layout.addWidget(self.lbl_source_info)
-        gb_global.setLayout(gl_layout)
-        left_layout.addWidget(gb_global)
-
-        # Добавить TF
-        btn_add_tf = QPushButton("Add TF")
-        btn_add_tf.clicked.connect(self.add_new_tf)
-        left_layout.addWidget(btn_add_tf)
-
-        # Динамические TF
-        self.tf_widgets_layout = QVBoxLayout()
-        left_layout.addLayout(self.tf_widgets_layout)
-
-        # Кнопка расчета
-        self.btn_calc = QPushButton("CALCULATE")
-        self.btn_calc.setStyleSheet("background-color: #4CAF50; color: white; font-weight: bold; padding: 10px;")
-        self.btn_calc.clicked.connect(self.run_calculation)
-        left_layout.addWidget(self.btn_calc)
-
-        left_layout.addStretch()
-
-        # Создаём UI для каждого TF
-        for tf in self.tf_manager.tfs:
-            self.create_tf_ui(tf)
-
-        # --- ПРАВАЯ ПАНЕЛЬ ---
-        right_panel = QWidget()
-        right_layout = QVBoxLayout(right_panel)
-
-        self.txt_summary = QTextEdit()
-        self.txt_summary.setMaximumHeight(150)
-        self.txt_summary.setReadOnly(True)
-        right_layout.addWidget(QLabel("Summary Report:"))
-        right_layout.addWidget(self.txt_summary)
-
-        self.tab_widget = QTabWidget()
-        self.tab_widget.setStyleSheet("QTabWidget::item { padding: 4px; }")
-
-        self.btn_column_settings = QPushButton("Columns...")
-        self.btn_column_settings.clicked.connect(self.open_column_settings)
-
-        right_layout.addWidget(QLabel("Beam Propagation History:"))
-        right_layout.addWidget(self.btn_column_settings)
-        right_layout.addWidget(self.tab_widget)
-        self._update_results_table_columns()
-
-        self.btn_export_csv = QPushButton("Export to CSV")
-        self.btn_export_csv.clicked.connect(self.export_to_csv)
-        right_layout.addWidget(self.btn_export_csv)
-
-        splitter.addWidget(left_panel)
-        splitter.addWidget(right_panel)
-        splitter.setSizes([400, 800])
-
-    def create_tf_ui(self, tf):
-        gb_tf = QGroupBox(f"{tf.name}")
-        gb_tf.setCheckable(True)
-        gb_tf.setChecked(True)
-
-        tf_layout = QVBoxLayout()
-
-        # Тип TF
-        hbox_type = QHBoxLayout()
-        hbox_type.addWidget(QLabel("Type:"))
-        combo_type = QComboBox()
-        combo_type.addItems(["Vacuum (Groups)", "Air (Array)"])
-        combo_type.setCurrentText(tf.tf_type)
-        hbox_type.addWidget(combo_type)
-
-        btn_edit = QPushButton("Edit TF")
-        hbox_type.addWidget(btn_edit)
-
-        btn_remove = QPushButton("Remove TF")
-        btn_remove.clicked.connect(lambda: self.remove_tf(tf.name))
-        hbox_type.addWidget(btn_remove)
-
-        tf_layout.addLayout(hbox_type)
-
-        # Позиция
-        hbox_pos = QHBoxLayout()
-        hbox_pos.addWidget(QLabel("Position (m):"))
-        spin_pos = QDoubleSpinBox()
-        spin_pos.setRange(0, 100)
-        spin_pos.setValue(27.1 if tf.name == "TF1" else 64)
-        spin_pos.setDecimals(4)
-        hbox_pos.addWidget(spin_pos)
-        tf_layout.addLayout(hbox_pos)
-
-        # Чекбокс Measure to center
-        chk_center = QCheckBox("Measure to center of TF")
-        chk_center.setChecked(tf.measure_to_center)
-        tf_layout.addWidget(chk_center)
-
-        # Виджеты для Air
-        wdg_air = QWidget()
-        air_layout = QVBoxLayout(wdg_air)
-        spin_n = QSpinBox()
-        spin_n.setRange(1, 200)
-        spin_n.setValue(tf.total_lenses)
-        combo_preset = QComboBox()
-        combo_preset.addItems(LENS_PRESETS.keys())
-        combo_preset.setCurrentText(tf.preset)
-        #air_layout.addWidget(QLabel("Count (N):"))
-        #air_layout.addWidget(spin_n)
-        air_layout.addWidget(QLabel("Preset:"))
-        air_layout.addWidget(combo_preset)
-        air_layout.addStretch()
-        tf_layout.addWidget(wdg_air)
-
-        # Виджеты для Vacuum (скрыты по умолчанию)
-        wdg_vac = QWidget()
-        vac_layout = QVBoxLayout(wdg_vac)
-        combo_vac_preset = QComboBox()
-        combo_vac_preset.addItems(LENS_PRESETS.keys())
-        combo_vac_preset.setCurrentText(tf.preset)
-        vac_layout.addWidget(QLabel("Preset:"))
-        vac_layout.addWidget(combo_vac_preset)
-        vac_layout.addStretch()
-        tf_layout.addWidget(wdg_vac)
-
-        # Синхронизация
-        spin_n.valueChanged.connect(lambda v: self.on_air_n_changed(v, tf.name, spin_n, combo_preset, tf))
-        combo_preset.currentTextChanged.connect(lambda p: self.on_air_preset_changed(p, tf.name, combo_preset, tf))
-        combo_vac_preset.currentTextChanged.connect(lambda p: self.on_vac_preset_changed(p, tf.name, combo_vac_preset, tf))
-        combo_type.currentTextChanged.connect(lambda t: self.on_tf_type_changed(t, tf, wdg_air, wdg_vac))
-
-        # Скрыть/показать виджеты в зависимости от типа
-        if tf.tf_type == "Air (Array)":
-            wdg_air.setVisible(True)
-            wdg_vac.setVisible(False)
-        else:
-            wdg_air.setVisible(False)
-            wdg_vac.setVisible(True)
-
-        gb_tf.setLayout(tf_layout)
-        self.tf_widgets_layout.addWidget(gb_tf)
-
-        # Сохраняем виджеты в tf.ui_widgets
-        tf.ui_widgets = {
-            'gb': gb_tf,
-            'combo_type': combo_type,
-            'btn_edit': btn_edit,
-            'btn_remove': btn_remove,
-            'spin_pos': spin_pos,
-            'chk_center': chk_center,  # ← добавлено
-            'wdg_air': wdg_air,
-            'wdg_vac': wdg_vac,
-            'spin_n': spin_n,
-            'combo_preset': combo_preset,
-            'combo_vac_preset': combo_vac_preset
-        }
-
-        # Подключаем кнопку Edit
-        btn_edit.clicked.connect(lambda: self.open_tf_editor(tf.name, combo_type.currentText(), tf))
-
-    def on_air_n_changed(self, value, tf_name, n_spin, preset_combo, tf_obj):
-        tf_obj.total_lenses = value
-        tf_obj.update_active_ranges(tf_obj.active_ranges)
-
-    def on_air_preset_changed(self, preset, tf_name, preset_combo, tf_obj):
-        tf_obj.update_preset(preset)
-
-    def on_vac_preset_changed(self, preset, tf_name, preset_combo, tf_obj):
-        tf_obj.update_preset(preset)
-
-    def on_tf_type_changed(self, tf_type, tf_obj, air_widget, vac_widget):
-        # Обновляем tf_obj.tf_type
-        tf_obj.tf_type = tf_type
-        
-        # Скрываем/показываем виджеты
-        air_widget.setVisible(tf_type == "Air (Array)")
-        vac_widget.setVisible(tf_type == "Vacuum (Groups)")
-        
-        # Если переключаемся в Air, инициализируем lenses
-        if tf_type == "Air (Array)" and not tf_obj.lenses:
-            tf_obj.lenses = tf_obj._build_air_lenses()
-        
-        # Если переключаемся в Vacuum, инициализируем groups
-        if tf_type == "Vacuum (Groups)" and not tf_obj.groups:
-            tf_obj.groups = [{"N": 1, "preset": tf_obj.preset, "active": True}]
-
-    def add_new_tf(self):
-        name = f"TF{len(self.tf_manager.tfs) + 1}"
-        new_tf = self.tf_manager.add_tf(name, "Air (Array)", "R50", total_lenses=100, active_ranges=[(0, 8)])
-        self.create_tf_ui(new_tf)
-
-    def remove_tf(self, name):
-        tf = self.tf_manager.get_tf_by_name(name)
-        if tf:
-            # Удаляем UI
-            gb = tf.ui_widgets['gb']
-            self.tf_widgets_layout.removeWidget(gb)
-            gb.deleteLater()
-            # Удаляем из менеджера
-            self.tf_manager.remove_tf(name)
-
-    def update_source_info_label(self):
-        energy = self.source_params['energy']
-        if self.use_fwhm:
-            sx = self.source_params['sx_fwhm']
-            sy = self.source_params['sy_fwhm']
-            wx = self.source_params['wx_fwhm']
-            wy = self.source_params['wy_fwhm']
-            size_label_x = "Source size X, um (FWHM):"
-            size_label_y = "Source size Y, um (FWHM):"
-            div_label_x = "Divergence X, mrad (FWHM):"
-            div_label_y = "Divergence Y, mrad (FWHM):"
-        else:
-            sx = self.source_params['sx_fwhm'] / 2.35482
-            sy = self.source_params['sy_fwhm'] / 2.35482
-            wx = self.source_params['wx_fwhm'] / 2.35482
-            wy = self.source_params['wy_fwhm'] / 2.35482
-            size_label_x = "Source size X, um (Sigma):"
-            size_label_y = "Source size y, um (Sigma):"
-            div_label_x = "Divergence X, mrad (Sigma):"
-            div_label_y = "Divergence Y, mrad (Sigma):"
-
-        text = (
-            f"Energy: {energy:.0f} eV\n"
-            f"{size_label_x} {sx:.2f}\n"
-            f"{size_label_y} {sy:.2f}\n"
-            f"{div_label_x} {wx:.2f}\n"
-            f"{div_label_y} {wy:.2f}"
-        )
-
-        self.lbl_source_info.setText(text)
-
-    def open_source_editor(self):
-        dialog = SourceEditorDialog(
-            self,
-            source_params = self.source_params.copy(),
-            use_fwhm = self.use_fwhm 
-        )
-        if dialog.exec_() == QDialog.Accepted:
-            new_params = dialog.get_params()
-            self.use_fwhm = dialog.get_use_fwhm()
-            self.source_params.update(new_params)
-            self.update_energy_input()
-            self.update_source_info_label()
-
-    def open_tf_editor(self, name, tf_type, tf_obj):
-        # Выбираем, какую конфигурацию передавать
-        config = tf_obj.lenses if tf_type == "Air (Array)" else tf_obj.groups
-
-        dialog = TFEditorDialog(
-            self, 
-            tf_type='air' if tf_type == "Air (Array)" else 'vacuum',
-            config=config,
-            title=f"Edit {name}",
-            energy = self.source_params['energy']
-        )
-        if dialog.exec_() == QDialog.Accepted:
-            new_config = dialog.get_config()
-            if tf_type == "Air (Array)":
-                tf_obj.lenses = new_config
-                # Обновляем total_lenses и active_ranges
-                tf_obj.total_lenses = len(new_config)
-                tf_obj.active_ranges = [(i, i) for i in range(len(new_config)) if new_config[i]['active']]
-            else:
-                tf_obj.groups = new_config  # <-- Сохраняем обновлённые группы
-
-    def on_energy_input_changed(self):
-        try:
-            energy = float(self.inp_energy.text())
-            self.source_params['energy'] = energy
-            self.update_source_info_label()
-        except ValueError:
-            self.update_energy_input()
-
-    def update_energy_input(self):
-        self.inp_energy.setText(f"{self.source_params['energy']:.0f}")
-
-    def run_calculation(self):
-        calc_params = self.source_params.copy()
-        if not self.use_fwhm:
-            calc_params['sx_fwhm'] = self.source_params['sx_fwhm'] / 2.35482
-            calc_params['sy_fwhm'] = self.source_params['sy_fwhm'] / 2.35482
-            calc_params['wx_fwhm'] = self.source_params['wx_fwhm'] / 2.35482
-            calc_params['wy_fwhm'] = self.source_params['wy_fwhm'] / 2.35482
-
-        structure_config = []
-        for tf in self.tf_manager.tfs:
-            if not tf.ui_widgets['gb'].isChecked():
-                continue
-
-            config = tf.get_config()
-            config['tf_name'] = tf.name
-
-            pos = tf.ui_widgets['spin_pos'].value()
-            measure_to_center = tf.ui_widgets['chk_center'].isChecked()
-
-            # === ВЫБОР ДЛИНЫ TF (фиксированная) ===
-            if tf.tf_type == "Air (Array)":
-                length = 0.1396  # фиксированная длина для Air
-            else:  # Vacuum
-                length = 0.153  # фиксированная длина для Vacuum
-
-            # === ВЫЧИСЛЕНИЕ absolute_start ===
-            if measure_to_center:
-                absolute_start = pos - length / 2.0  # начало TF = центр - половина длины
-            else:
-                absolute_start = pos  # начало TF = позиция
-
-            config['absolute_start'] = absolute_start
-            structure_config.append(config)
-
-        try:
-            report = self.controller.run_calculations(
-                calc_params['energy'],
-                structure_config,
-                source_params=calc_params
-            )
-        except Exception as e:
-            QMessageBox.critical(self, "Calculation Error", str(e))
-            import traceback
-            traceback.print_exc()
-            return
-
-        self.display_results(report)
-
-    def display_results(self, report):
-        self._last_report = report
-        if not report or "Error" in report:
-            self.txt_summary.setText("No results or error occurred.")
-            return
-        
-        history = report.get('full_history', [])
-        if not history:
-            self.txt_summary.setText("No results computed.")
-            return
-
-        last = history[-1]
-        focus_pos = report['final_pos'] + report['L2']
-        summary = (
-            f"<b>Energy:</b> {report['energy']} eV<br>"
-            #f"<b>Final Position:</b> {report['final_pos']:.4f} m<br>"
-            f"<b>Focal Distance (L2) from last lens:</b> {report['L2']:.4f} m<br>"
-            f"<b>Focus position:</b> {focus_pos:.4f} m<br>"
-            f"<b>Transmission:</b> {report['T']*100:.2f} %<br>"
-            f"<b>Focus Size X:</b> {report['size_x']*1e6:.2f} um<br>"
-            f"<b>Focus Size Y:</b> {report['size_y']*1e6:.2f} um<br>"
-            f"<b>Depth of Field X:</b> {last.dof_x:.3f} m<br>"
-            f"<b>Depth of Field Y:</b> {last.dof_y:.3f} m<br>"
-            f"<b>Symmetry Distance (from focus position):</b> {last.symmetry_dist:.4f} m<br>"
-            f"<b>Symmetry Distance (from last lens position):</b> {(focus_pos - last.symmetry_dist):.4f}m,  {(focus_pos + last.symmetry_dist):.4f}m<br>"
-            f"<b>Symmetry Beam Size X:</b> {last.symm_beam_size_x * 1e6:.2f} um<br>"
-            f"<b>Symmetry Beam Size Y:</b> {last.symm_beam_size_y * 1e6:.2f} um<br>"
-        )
-        self.txt_summary.setHtml(summary)
-
-
-        tf_histories = {}
-        for item in history:
-            tf_name = item.tf_name
-            if tf_name not in tf_histories:
-                tf_histories[tf_name] = []
-            tf_histories[tf_name].append(item)
-
-        self.tab_widget.clear()
-
-        for tf_name, tf_history in tf_histories.items():
-            table = QTableWidget(0, 0)
-            table.verticalHeader().setVisible(False)
-            table.setStyleSheet("QTableWidget::item {padding: 2px 4px; }")
-            table.setHorizontalScrollBarPolicy(Qt.ScrollBarAsNeeded)
-
-            # Headers setup
-            headers = [field[2] for field in self.current_display_fields]
-            table.setColumnCount(len(headers))
-            table.setHorizontalHeaderLabels(headers)
-            table.horizontalHeader().setSectionResizeMode(QHeaderView.Fixed)
-            for col, field in enumerate(self.current_display_fields):
-                width = 100
-                table.setColumnWidth(col, width)
-
-            # Table content
-            display_rows = []
-            for i, item in enumerate(tf_history):
-                display_rows.append(item)
-                is_last_in_block = getattr(item, 'is_last_in_block', False)
-                is_last_in_tf = getattr(item, 'is_last_in_tf', False)
-
-                if is_last_in_block and not is_last_in_tf and i + 1 < len(tf_history):
-                    next_block_index = getattr(tf_history[i + 1], 'block_index', None)
-                    if next_block_index is not None:
-                        display_rows.append(f"Block {next_block_index}")
-                
-            table.setRowCount(len(display_rows))
-            for row, item in enumerate(display_rows):
-                if isinstance(item, str):
-                    table.setItem(row, 0, QTableWidgetItem(item))
-                    for col in range(1, table.columnCount()):
-                        table.setItem(row, col, QTableWidgetItem(""))
-                    font = table.item(row, 0).font()
-                    font.setBold(True)
-                    table.item(row, 0).setFont(font)
-                else:
-                    for col, field in enumerate(self.current_display_fields):
-                        field_name = field[0]
-                        formatter = field[3]
-                        value = getattr(item, field_name)
-                        text = formatter(value) if formatter else str(value)
-                        table.setItem(row, col, QTableWidgetItem(text))
-
-            self.tab_widget.addTab(table, tf_name) 
-
-    def open_column_settings(self):
-        all_fields_info = [
-            (field[0], field[2], field[3])
-            for field in LENS_RESULT_FIELDS
-            if field[2] is not None
-        ]
-        current_names = [field[0] for field in self.current_display_fields] if self.current_display_fields else None
-        dialog = ColumnSettingsDialog(self, current_names, all_fields_info)
-        if dialog.exec_() == QDialog.Accepted:
-            selected_names = set(dialog.get_selected_fields())
-            self.current_display_fields = [
-                field for field in LENS_RESULT_FIELDS
-                if field[0] in selected_names and field[2] is not None
-            ]
-            self._update_results_table_columns()
-
-    def _update_results_table_columns(self):
-        if not self.current_display_fields:
-            self.current_display_fields = [
-                field for field in LENS_RESULT_FIELDS
-                if field[2] is not None
-            ]
-        headers = [field[2] for field in self.current_display_fields]
-
-        for i in range(self.tab_widget.count()):
-            table = self.tab_widget.widget(i)
-            if isinstance(table, QTableWidget):
-                table.setColumnCount(len(headers))
-                table.setHorizontalHeaderLabels(headers)
-                table.setStyleSheet("QTableWidget::item { padding: 2px 4px; }")
-
-                header = table.horizontalHeader()
-                for col, field in enumerate(self.current_display_fields):
-                    width = 100
-                    table.setColumnWidth(col, width)
-                    header.setSectionResizeMode(col, QHeaderView.Fixed)
-
-        if hasattr(self, '_last_report'):
-            self.display_results(self._last_report)
-
-
-    def export_to_csv(self):
-        if not hasattr(self, '_last_report') or not self._last_report:
-            QMessageBox.warning(self, "Export Error", "No results to export. Please run calculation first.")
-            return
-
-        # Диалог выбора директории
-        directory = QFileDialog.getExistingDirectory(self, "Select Directory to Save CSV Files")
-        if not directory:
-            return
-
-        history = self._last_report.get('full_history', [])
-        if not history:
-            QMessageBox.information(self, "Export", "No history data to export.")
-            return
-
-        try:
-            # 1. Экспорт Summary Report
-            focus_pos = self._last_report['final_pos'] + self._last_report['L2']
-            last = history[-1]
-            summary_data = {
-                "Field": [
-                    "Energy",
-                    "Final Position",
-                    "Focal Distance (L2)",
-                    "Focus Position",
-                    "Transmission",
-                    "Focus Size X",
-                    "Focus Size Y",
-                    "Depth of Field X",
-                    "Depth of Field Y",
-                    "Symmetry Distance",
-                    "Symmetry Distance (from lens)",
-                    "Symmetry Distance (from lens)",
-                    "Symmetry Beam Size X",
-                    "Symmetry Beam Size Y"
-                ],
-                "Value": [
-                    self._last_report['energy'],
-                    self._last_report['final_pos'],
-                    self._last_report['L2'],
-                    focus_pos,  # focus_pos
-                    self._last_report['T'] * 100,
-                    self._last_report['size_x'] * 1e6,
-                    self._last_report['size_y'] * 1e6,
-                    last.dof_x,  # если есть
-                    last.dof_y,  # если есть
-                    last.symmetry_dist,
-                    focus_pos - last.symmetry_dist,
-                    focus_pos + last.symmetry_dist,
-                    last.symm_beam_size_x * 1e6,
-                    last.symm_beam_size_y * 1e6
-                ]
-            }
-            df_summary = pd.DataFrame(summary_data)
-            summary_path = os.path.join(directory, "summary_report.csv")
-            df_summary.to_csv(summary_path, index=False)
-
-            # 2. Экспорт истории каждого TF
-
-
-            tf_histories = {}
-            for item in history:
-                tf_name = item.tf_name
-                if tf_name not in tf_histories:
-                    tf_histories[tf_name] = []
-                tf_histories[tf_name].append(item)
-
-            for tf_name, tf_history in tf_histories.items():
-                # Подготовим данные для DataFrame
-                rows = []
-                for item in tf_history:
-                    if isinstance(item, str):
-                        # Пропускаем заголовки блоков, если не нужно их сохранять
-                        continue
-                    row = {}
-                    for field in self.current_display_fields:
-                        field_name = field[0]
-                        value = getattr(item, field_name)
-                        row[field_name] = value
-                    rows.append(row)
-
-                df_tf = pd.DataFrame(rows)
-                tf_path = os.path.join(directory, f"{tf_name}_history.csv")
-                df_tf.to_csv(tf_path, index=False)
-
-            QMessageBox.information(self, "Export", f"Data exported successfully to:\n{directory}")
-
-        except Exception as e:
-            QMessageBox.critical(self, "Export Error", f"Failed to export data:\n{str(e)}")
-
-
-if __name__ == '__main__':
-    app = QApplication(sys.argv)
-    window = XRayCalcApp()
-    window.show()
+import time
+_T_START = time.perf_counter()  # для замера времени старта (--startup-timing)
+
+import sys
+import os
+import copy
+from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
+                             QGroupBox, QLabel, QLineEdit, QComboBox, QCheckBox, 
+                             QPushButton, QTableWidget, QTableWidgetItem, QHeaderView, 
+                             QSpinBox, QDoubleSpinBox, QTabWidget, QSplitter, QTextEdit, QMessageBox, QDialog, QSizePolicy, QPushButton, QFileDialog,
+                             QShortcut)
+from PyQt5.QtGui import QKeySequence
+from PyQt5.QtCore import Qt, QTimer
+
+# Тяжёлые модули (pandas, xraydb) и диалоги импортируются при первом использовании
+from main_controller import AdvancedController
+from computations import LENS_RESULT_FIELDS, ALL_FIELDS
+from lens_mask import LensMask
+from history import EditHistory, thaw
+from tf_hardware import DEFAULT_HARDWARE, get_hardware
+from jobs_panel import JobsPanel
+
+_T_IMPORTED = time.perf_counter()
+
+# Поля LensResult, которые нужны сводке и экспорту независимо от выбранных колонок
+# (T_block и G_total — для T и G отчёта)
+SUMMARY_FIELDS = ('T_block', 'G_total', 'dof_x', 'dof_y', 'symmetry_dist', 'symm_beam_size_x', 'symm_beam_size_y')
+
+# --- Универсальный класс трансфокатора ---
+class Transfocator:
+    def __init__(self, name, tf_type="Air (Array)", preset="R50", total_lenses=100, active_ranges=None, measure_to_center=True, position=64.0):
+        self.name = name
+        self.tf_type = tf_type
+        self.preset = preset
+        self.total_lenses = total_lenses
+        # Какие линзы Air-массива в пучке: единственный источник правды (битовая маска)
+        self.active_mask = LensMask.from_ranges(active_ranges or [(0, 8)], total_lenses)
+        self.measure_to_center = measure_to_center
+        self.position = position  # м; расчёт берёт позицию отсюда, а не из spin_pos
+        
+        # Конфигурация
+        self.lenses = self._build_air_lenses() if tf_type == "Air (Array)" else []
+        # Теперь groups — это список словарей с N, preset, active
+        self.groups = [{"N": 1, "preset": preset, "active": True}, {"N": 2, "preset": preset, "active": True}, 
+                       {"N": 1, "preset": preset, "active": True}, {"N": 4, "preset": preset, "active": False},
+                       {"N": 5, "preset": preset, "active": False}, {"N": 5, "preset": preset, "active": False},
+                       {"N": 5, "preset": preset, "active": False}, {"N": 5, "preset": preset, "active": False},
+                       {"N": 5, "preset": preset, "active": False}, {"N": 5, "preset": preset, "active": False},
+                       {"N": 5, "preset": preset, "active": False}, {"N": 5, "preset": preset, "active": False},
+                       {"N": 5, "preset": preset, "active": False}, {"N": 5, "preset": preset, "active": False},] if tf_type == "Vacuum (Groups)" else []
+
+        # UI виджеты (инициализируются при создании UI)
+        self.ui_widgets = {}
+
+    @property
+    def active_ranges(self):
+        return self.active_mask.to_ranges()
+
+    def _build_air_lenses(self):
+        """Свойства линз массива (preset/material); активность хранится в active_mask."""
+        return [{"preset": self.preset} for _ in range(self.total_lenses)]
+
+    def update_active_ranges(self, ranges):
+        self.active_mask = LensMask.from_ranges(ranges, self.total_lenses)
+
+    def resize(self, total_lenses):
+        """Меняет число линз массива, сохраняя их свойства и активность."""
+        self.total_lenses = total_lenses
+        self.active_mask = self.active_mask.resized(total_lenses)
+        if len(self.lenses) > total_lenses:
+            del self.lenses[total_lenses:]
+        else:
+            self.lenses.extend({"preset": self.preset} for _ in range(total_lenses - len(self.lenses)))
+
+    def update_preset(self, preset):
+        self.preset = preset
+        if self.tf_type == "Air (Array)":
+            for lens in self.lenses:
+                lens["preset"] = preset
+        else:
+            for group in self.groups:
+                group["preset"] = preset
+
+    def get_config(self):
+        if self.tf_type == "Air (Array)":
+            return {"type": "air", "lenses": self.lenses, "active_mask": self.active_mask}
+        else:
+            return {"type": "vacuum", "groups": self.groups}
+
+
+# --- Менеджер трансфокаторов ---
+class TransfocatorManager:
+    def __init__(self):
+        self.tfs = []
+
+    def add_tf(self, name, tf_type="Air (Array)", preset="R50", total_lenses=100, active_ranges=None, position=64.0):
+        tf = Transfocator(name, tf_type, preset, total_lenses, active_ranges, position=position)
+        self.tfs.append(tf)
+        return tf
+
+    def remove_tf(self, name):
+        self.tfs = [tf for tf in self.tfs if tf.name != name]
+
+    def get_tf_by_name(self, name):
+        for tf in self.tfs:
+            if tf.name == name:
+                return tf
+        return None
+
+    def get_all_configs(self):
+        return [tf.get_config() for tf in self.tfs]
+
+
+# --- Основное окно ---
+class XRayCalcApp(QMainWindow):
+    def __init__(self):
+        super().__init__()
+        self.setWindowTitle("X-Ray Transfocator Calculator (PyQt5)")
+        self.resize(1200, 800)
+
+        default_display_fields = {'lens_index_in_block','position', 'L1', 'L2', 'sfx', 'sfy', 'T', 'M'}
+        self.current_display_fields = [
+            field for field in LENS_RESULT_FIELDS
+            if field[0] in default_display_fields and field[2] is not None
+        ]
+
+        # Инициализация
+        self.controller = AdvancedController()
+        self.tf_manager = TransfocatorManager()
+
+        # Создаём TF1 и TF2 по умолчанию
+        self.tf_manager.add_tf("TF1", "Vacuum (Groups)", "R500", total_lenses=100, active_ranges=[(0, 8)], position=27.1)  # Vacuum по умолчанию
+        self.tf_manager.add_tf("TF2", "Air (Array)", "R50", total_lenses=100, active_ranges=[(0, 8)])
+
+        self.source_params = {
+            'energy': 10300.0,
+            'sx_fwhm': 32.9 * 2.35482,
+            'sy_fwhm': 5.9 * 2.35482,
+            'wx_fwhm': 9.4 * 2.35482,
+            'wy_fwhm': 11.0 * 2.35482,
+            'material': 'Be'
+        }
+
+        self.use_fwhm = True
+        self.tracking_table = None   # EnergyTrackingTable
+        self.track_energy = False    # подстраивать линзы/позиции при смене энергии
+        self.result_store = None     # ResultStore: если открыт, каждый расчёт дописывается туда
+        self.comparison_dialog = None  # немодальное окно сравнения конфигураций
+        self.history = EditHistory()  # undo/redo правок схемы со ссылками на посчитанные отчёты
+        self._restoring = False       # идёт восстановление снимка: правки не записываются
+        self.lbl_source_info = QLabel("")
+        self.lbl_source_info.setWordWrap(True)
+        self.lbl_source_info.setStyleSheet("font-family: monospace; font-size: 9pt;")
+
+        self.init_ui()
+        self.update_energy_input()
+        self.update_source_info_label()
+        self._record_history()
+
+    def init_ui(self):
+        central_widget = QWidget()
+        self.setCentralWidget(central_widget)
+        
+        main_layout = QHBoxLayout(central_widget)
+        splitter = QSplitter(Qt.Horizontal)
+        main_layout.addWidget(splitter)
+
+        # --- ЛЕВАЯ ПАНЕЛЬ ---
+        left_panel = QWidget()
+        left_layout = QVBoxLayout(left_panel)
+
+        # Глобальные параметры
+        gb_global = QGroupBox("Source & Global Params")
+        gl_layout = QVBoxLayout()
+        hbox_energy = QHBoxLayout()
+        hbox_energy.addWidget(QLabel("Energy, eV:"))
+        self.inp_energy = QLineEdit("10300")
+        self.inp_energy.editingFinished.connect(self.on_energy_input_changed)
+        hbox_energy.addWidget(self.inp_energy)
+        gl_layout.addLayout(hbox_energy)
+
+        self.btn_edit_source = QPushButton("Edit Source")
+        self.btn_edit_source.clicked.connect(self.open_source_editor)
+        gl_layout.addWidget(self.btn_edit_source)
+        gl_layout.addWidget(self.lbl_source_info)
+        gb_global.setLayout(gl_layout)
+        left_layout.addWidget(gb_global)
+
+        # Добавить TF, Undo/Redo
+        hbox_edit = QHBoxLayout()
+        btn_add_tf = QPushButton("Add TF")
+        btn_add_tf.clicked.connect(self.add_new_tf)
+        hbox_edit.addWidget(btn_add_tf)
+        self.btn_undo = QPushButton("Undo")
+        self.btn_redo = QPushButton("Redo")
+        self.btn_undo.clicked.connect(self.undo)
+        self.btn_redo.clicked.connect(self.redo)
+        self.btn_undo.setEnabled(False)
+        self.btn_redo.setEnabled(False)
+        hbox_edit.addWidget(self.btn_undo)
+        hbox_edit.addWidget(self.btn_redo)
+        left_layout.addLayout(hbox_edit)
+        QShortcut(QKeySequence.Undo, self, self.undo)
+        QShortcut(QKeySequence.Redo, self, self.redo)
+
+        # Динамические TF
+        self.tf_widgets_layout = QVBoxLayout()
+        left_layout.addLayout(self.tf_widgets_layout)
+
+        # Кнопка расчета
+        self.btn_calc = QPushButton("CALCULATE")
+        self.btn_calc.setStyleSheet("background-color: #4CAF50; color: white; font-weight: bold; padding: 10px;")
+        self.btn_calc.clicked.connect(self.run_calculation)
+        left_layout.addWidget(self.btn_calc)
+
+        self.btn_position_map = QPushButton("Position Map...")
+        self.btn_position_map.clicked.connect(self.open_position_map)
+        left_layout.addWidget(self.btn_position_map)
+
+        self.btn_solve_focus = QPushButton("Solve for Focus...")
+        self.btn_solve_focus.clicked.connect(self.open_inverse_solver)
+        left_layout.addWidget(self.btn_solve_focus)
+
+        self.btn_energy_tracking = QPushButton("Energy Tracking...")
+        self.btn_energy_tracking.clicked.connect(self.open_energy_tracking)
+        left_layout.addWidget(self.btn_energy_tracking)
+
+        self.btn_compare = QPushButton("Compare Configurations...")
+        self.btn_compare.clicked.connect(self.open_comparison)
+        left_layout.addWidget(self.btn_compare)
+
+        left_layout.addStretch()
+
+        # Создаём UI для каждого TF
+        for tf in self.tf_manager.tfs:
+            self.create_tf_ui(tf)
+
+        # --- ПРАВАЯ ПАНЕЛЬ ---
+        right_panel = QWidget()
+        right_layout = QVBoxLayout(right_panel)
+
+        self.txt_summary = QTextEdit()
+        self.txt_summary.setMaximumHeight(150)
+        self.txt_summary.setReadOnly(True)
+        right_layout.addWidget(QLabel("Summary Report:"))
+        right_layout.addWidget(self.txt_summary)
+
+        self.tab_widget = QTabWidget()
+        self.tab_widget.setStyleSheet("QTabWidget::item { padding: 4px; }")
+
+        self.btn_column_settings = QPushButton("Columns...")
+        self.btn_column_settings.clicked.connect(self.open_column_settings)
+
+        right_layout.addWidget(QLabel("Beam Propagation History:"))
+        right_layout.addWidget(self.btn_column_settings)
+        right_layout.addWidget(self.tab_widget)
+        self._update_results_table_columns()
+
+        self.btn_export_csv = QPushButton("Export to CSV")
+        self.btn_export_csv.clicked.connect(self.export_to_csv)
+
+        self.btn_result_store = QPushButton("Result Store...")
+        self.btn_result_store.clicked.connect(self.open_result_store)
+        hbox_export = QHBoxLayout()
+        hbox_export.addWidget(self.btn_export_csv)
+        hbox_export.addWidget(self.btn_result_store)
+        right_layout.addLayout(hbox_export)
+
+        # Долгие расчёты (карты, таблицы слежения, подбор) идут фоновыми задачами
+        self.jobs_panel = JobsPanel()
+        right_layout.addWidget(self.jobs_panel)
+
+        splitter.addWidget(left_panel)
+        splitter.addWidget(right_panel)
+        splitter.setSizes([400, 800])
+
+    def create_tf_ui(self, tf):
+        """Создаёт рамку TF сразу, а её содержимое — после показа окна."""
+        gb_tf = QGroupBox(f"{tf.name}")
+        gb_tf.setCheckable(True)
+        gb_tf.setChecked(True)
+        gb_tf.setLayout(QVBoxLayout())
+        gb_tf.toggled.connect(lambda _: self._record_history())
+        self.tf_widgets_layout.addWidget(gb_tf)
+
+        tf.ui_widgets = {'gb': gb_tf}
+        QTimer.singleShot(0, lambda: self._populate_tf_ui(tf))
+
+    def _populate_tf_ui(self, tf):
+        if tf not in self.tf_manager.tfs or 'spin_pos' in tf.ui_widgets:
+            return  # TF успели удалить или виджеты уже созданы
+        from lens_editor import preset_combo  # каталог линз грузится здесь, а не при старте
+        gb_tf = tf.ui_widgets['gb']
+        tf_layout = gb_tf.layout()
+
+        # Тип TF
+        hbox_type = QHBoxLayout()
+        hbox_type.addWidget(QLabel("Type:"))
+        combo_type = QComboBox()
+        combo_type.addItems(["Vacuum (Groups)", "Air (Array)"])
+        combo_type.setCurrentText(tf.tf_type)
+        hbox_type.addWidget(combo_type)
+
+        btn_edit = QPushButton("Edit TF")
+        hbox_type.addWidget(btn_edit)
+
+        btn_remove = QPushButton("Remove TF")
+        btn_remove.clicked.connect(lambda: self.remove_tf(tf.name))
+        hbox_type.addWidget(btn_remove)
+
+        tf_layout.addLayout(hbox_type)
+
+        # Позиция
+        hbox_pos = QHBoxLayout()
+        hbox_pos.addWidget(QLabel("Position (m):"))
+        spin_pos = QDoubleSpinBox()
+        spin_pos.setRange(0, 100)
+        spin_pos.setDecimals(4)
+        spin_pos.setValue(tf.position)
+        spin_pos.valueChanged.connect(lambda v: setattr(tf, 'position', v))
+        spin_pos.editingFinished.connect(self._record_history)
+        hbox_pos.addWidget(spin_pos)
+        tf_layout.addLayout(hbox_pos)
+
+        # Чекбокс Measure to center
+        chk_center = QCheckBox("Measure to center of TF")
+        chk_center.setChecked(tf.measure_to_center)
+        chk_center.toggled.connect(lambda c: setattr(tf, 'measure_to_center', c))
+        chk_center.toggled.connect(lambda _: self._record_history())
+        tf_layout.addWidget(chk_center)
+
+        # Виджеты для Air
+        wdg_air = QWidget()
+        air_layout = QVBoxLayout(wdg_air)
+        spin_n = QSpinBox()
+        spin_n.setRange(1, get_hardware(DEFAULT_HARDWARE['air']).capacity)
+        spin_n.setValue(tf.total_lenses)
+        combo_preset = preset_combo(tf.preset)
+        #air_layout.addWidget(QLabel("Count (N):"))
+        #air_layout.addWidget(spin_n)
+        air_layout.addWidget(QLabel("Preset:"))
+        air_layout.addWidget(combo_preset)
+        air_layout.addStretch()
+        tf_layout.addWidget(wdg_air)
+
+        # Виджеты для Vacuum (скрыты по умолчанию)
+        wdg_vac = QWidget()
+        vac_layout = QVBoxLayout(wdg_vac)
+        combo_vac_preset = preset_combo(tf.preset)
+        vac_layout.addWidget(QLabel("Preset:"))
+        vac_layout.addWidget(combo_vac_preset)
+        vac_layout.addStretch()
+        tf_layout.addWidget(wdg_vac)
+
+        # Синхронизация
+        spin_n.valueChanged.connect(lambda v: self.on_air_n_changed(v, tf.name, spin_n, combo_preset, tf))
+        combo_preset.currentTextChanged.connect(lambda p: self.on_air_preset_changed(p, tf.name, combo_preset, tf))
+        combo_vac_preset.currentTextChanged.connect(lambda p: self.on_vac_preset_changed(p, tf.name, combo_vac_preset, tf))
+        combo_type.currentTextChanged.connect(lambda t: self.on_tf_type_changed(t, tf, wdg_air, wdg_vac))
+
+        # Скрыть/показать виджеты в зависимости от типа
+        if tf.tf_type == "Air (Array)":
+            wdg_air.setVisible(True)
+            wdg_vac.setVisible(False)
+        else:
+            wdg_air.setVisible(False)
+            wdg_vac.setVisible(True)
+
+        # Сохраняем виджеты в tf.ui_widgets
+        tf.ui_widgets.update({
+            'combo_type': combo_type,
+            'btn_edit': btn_edit,
+            'btn_remove': btn_remove,
+            'spin_pos': spin_pos,
+            'chk_center': chk_center,  # ← добавлено
+            'wdg_air': wdg_air,
+            'wdg_vac': wdg_vac,
+            'spin_n': spin_n,
+            'combo_preset': combo_preset,
+            'combo_vac_preset': combo_vac_preset
+        })
+
+        # Подключаем кнопку Edit
+        btn_edit.clicked.connect(lambda: self.open_tf_editor(tf.name, combo_type.currentText(), tf))
+
+    def on_air_n_changed(self, value, tf_name, n_spin, preset_combo, tf_obj):
+        tf_obj.resize(value)
+        self._record_history()
+
+    def on_air_preset_changed(self, preset, tf_name, preset_combo, tf_obj):
+        tf_obj.update_preset(preset)
+        self._record_history()
+
+    def on_vac_preset_changed(self, preset, tf_name, preset_combo, tf_obj):
+        tf_obj.update_preset(preset)
+        self._record_history()
+
+    def on_tf_type_changed(self, tf_type, tf_obj, air_widget, vac_widget):
+        # Обновляем tf_obj.tf_type
+        tf_obj.tf_type = tf_type
+        
+        # Скрываем/показываем виджеты
+        air_widget.setVisible(tf_type == "Air (Array)")
+        vac_widget.setVisible(tf_type == "Vacuum (Groups)")
+        
+        # Если переключаемся в Air, инициализируем lenses
+        if tf_type == "Air (Array)" and not tf_obj.lenses:
+            tf_obj.lenses = tf_obj._build_air_lenses()
+        
+        # Если переключаемся в Vacuum, инициализируем groups
+        if tf_type == "Vacuum (Groups)" and not tf_obj.groups:
+            tf_obj.groups = [{"N": 1, "preset": tf_obj.preset, "active": True}]
+        self._record_history()
+
+    def add_new_tf(self):
+        name = f"TF{len(self.tf_manager.tfs) + 1}"
+        new_tf = self.tf_manager.add_tf(name, "Air (Array)", "R50", total_lenses=100, active_ranges=[(0, 8)])
+        self.create_tf_ui(new_tf)
+        self._record_history()
+
+    def remove_tf(self, name):
+        tf = self.tf_manager.get_tf_by_name(name)
+        if tf:
+            # Удаляем UI
+            gb = tf.ui_widgets['gb']
+            self.tf_widgets_layout.removeWidget(gb)
+            gb.deleteLater()
+            # Удаляем из менеджера
+            self.tf_manager.remove_tf(name)
+            self._record_history()
+
+    def update_source_info_label(self):
+        energy = self.source_params['energy']
+        if self.use_fwhm:
+            sx = self.source_params['sx_fwhm']
+            sy = self.source_params['sy_fwhm']
+            wx = self.source_params['wx_fwhm']
+            wy = self.source_params['wy_fwhm']
+            size_label_x = "Source size X, um (FWHM):"
+            size_label_y = "Source size Y, um (FWHM):"
+            div_label_x = "Divergence X, mrad (FWHM):"
+            div_label_y = "Divergence Y, mrad (FWHM):"
+        else:
+            sx = self.source_params['sx_fwhm'] / 2.35482
+            sy = self.source_params['sy_fwhm'] / 2.35482
+            wx = self.source_params['wx_fwhm'] / 2.35482
+            wy = self.source_params['wy_fwhm'] / 2.35482
+            size_label_x = "Source size X, um (Sigma):"
+            size_label_y = "Source size y, um (Sigma):"
+            div_label_x = "Divergence X, mrad (Sigma):"
+            div_label_y = "Divergence Y, mrad (Sigma):"
+
+        text = (
+            f"Energy: {energy:.0f} eV\n"
+            f"{size_label_x} {sx:.2f}\n"
+            f"{size_label_y} {sy:.2f}\n"
+            f"{div_label_x} {wx:.2f}\n"
+            f"{div_label_y} {wy:.2f}"
+        )
+
+        self.lbl_source_info.setText(text)
+
+    def open_source_editor(self):
+        from source_editor import SourceEditorDialog
+        dialog = SourceEditorDialog(
+            self,
+            source_params = self.source_params.copy(),
+            use_fwhm = self.use_fwhm 
+        )
+        if dialog.exec_() == QDialog.Accepted:
+            new_params = dialog.get_params()
+            self.use_fwhm = dialog.get_use_fwhm()
+            self.source_params.update(new_params)
+            self.update_energy_input()
+            self.update_source_info_label()
+            self._record_history()
+
+    def open_tf_editor(self, name, tf_type, tf_obj):
+        from lens_editor import TFEditorDialog
+        # Выбираем, какую конфигурацию передавать
+        config = tf_obj.lenses if tf_type == "Air (Array)" else tf_obj.groups
+
+        dialog = TFEditorDialog(
+            self, 
+            tf_type='air' if tf_type == "Air (Array)" else 'vacuum',
+            config=config,
+            title=f"Edit {name}",
+            energy = self.source_params['energy'],
+            active_mask = tf_obj.active_mask if tf_type == "Air (Array)" else None
+        )
+        if dialog.exec_() == QDialog.Accepted:
+            new_config = dialog.get_config()
+            if tf_type == "Air (Array)":
+                tf_obj.lenses = new_config
+                tf_obj.total_lenses = len(new_config)
+                tf_obj.active_mask = dialog.get_active_mask()
+            else:
+                tf_obj.groups = new_config  # <-- Сохраняем обновлённые группы
+            self._record_history()
+
+    def on_energy_input_changed(self):
+        try:
+            energy = float(self.inp_energy.text())
+            self.source_params['energy'] = energy
+            self.update_source_info_label()
+        except ValueError:
+            self.update_energy_input()
+            return
+
+        if self.track_energy and self.tracking_table is not None:
+            self.apply_tracking(energy)
+        else:
+            self._record_history()
+
+    # --- Undo/Redo ---
+
+    def _record_history(self):
+        """Записывает текущее состояние схемы в историю; возвращает текущий снимок."""
+        if self._restoring:
+            return self.history.current
+        snapshot = self.history.capture(
+            self.source_params, self.use_fwhm,
+            [(tf, tf.ui_widgets['gb'].isChecked()) for tf in self.tf_manager.tfs],
+        )
+        self.history.record(snapshot)
+        self._update_undo_buttons()
+        return self.history.current
+
+    def _update_undo_buttons(self):
+        self.btn_undo.setEnabled(self.history.can_undo())
+        self.btn_redo.setEnabled(self.history.can_redo())
+
+    def undo(self):
+        self._step_history(self.history.undo())
+
+    def redo(self):
+        self._step_history(self.history.redo())
+
+    def _step_history(self, snapshot):
+        if snapshot is None:
+            return
+        self._restore_snapshot(snapshot)
+        self._update_undo_buttons()
+        report = self.history.result(snapshot)
+        if report is not None and self._covers(report):
+            self.display_results(report)
+        else:
+            self.txt_summary.setText("Configuration changed. Press CALCULATE to update results.")
+
+    def _restore_snapshot(self, snapshot):
+        """Возвращает схему (источник и все TF) к состоянию снимка."""
+        self._restoring = True
+        try:
+            self.source_params = thaw(snapshot.source)
+            self.use_fwhm = snapshot.use_fwhm
+            self.update_energy_input()
+            self.update_source_info_label()
+
+            if [tf.name for tf in self.tf_manager.tfs] != [s.name for s in snapshot.tfs]:
+                # Набор TF изменился: пересобираем их и их виджеты
+                for tf in self.tf_manager.tfs:
+                    gb = tf.ui_widgets['gb']
+                    self.tf_widgets_layout.removeWidget(gb)
+                    gb.deleteLater()
+                self.tf_manager.tfs = [Transfocator(s.name, s.tf_type, s.preset, s.total_lenses, position=s.position)
+                                       for s in snapshot.tfs]
+                for tf in self.tf_manager.tfs:
+                    self.create_tf_ui(tf)
+
+            for tf, s in zip(self.tf_manager.tfs, snapshot.tfs):
+                tf.tf_type = s.tf_type
+                tf.preset = s.preset
+                tf.total_lenses = s.total_lenses
+                tf.active_mask = s.active_mask
+                tf.lenses = thaw(s.lenses)
+                tf.groups = thaw(s.groups)
+                tf.position = s.position
+                tf.measure_to_center = s.measure_to_center
+                self._sync_tf_widgets(tf, s.enabled)
+        finally:
+            self._restoring = False
+
+    def _sync_tf_widgets(self, tf, enabled):
+        w = tf.ui_widgets
+        w['gb'].blockSignals(True)
+        w['gb'].setChecked(enabled)
+        w['gb'].blockSignals(False)
+        if 'spin_pos' not in w:
+            return  # виджеты ещё не созданы; _populate_tf_ui возьмёт значения из tf
+        for key, setter, value in (
+            ('combo_type', 'setCurrentText', tf.tf_type),
+            ('spin_pos', 'setValue', tf.position),
+            ('chk_center', 'setChecked', tf.measure_to_center),
+            ('spin_n', 'setValue', tf.total_lenses),
+            ('combo_preset', 'setCurrentText', tf.preset),
+            ('combo_vac_preset', 'setCurrentText', tf.preset),
+        ):
+            w[key].blockSignals(True)
+            getattr(w[key], setter)(value)
+            w[key].blockSignals(False)
+        w['wdg_air'].setVisible(tf.tf_type == "Air (Array)")
+        w['wdg_vac'].setVisible(tf.tf_type == "Vacuum (Groups)")
+
+    def apply_tracking(self, energy):
+        """Ставит конфигурацию линз и позиции TF из таблицы слежения для energy."""
+        row = self.tracking_table.interpolate(energy)
+        for name, conf in self.tracking_table.candidate(row).items():
+            tf = self.tf_manager.get_tf_by_name(name)
+            if tf is None:
+                continue
+            if 'active_mask' in conf:
+                tf.resize(conf['active_mask'].size)
+                tf.active_mask = conf['active_mask']
+            if 'groups' in conf:
+                tf.groups = copy.deepcopy(conf['groups'])
+        self._set_tf_positions(row.positions)
+        self.run_calculation()
+
+    def _set_tf_positions(self, positions):
+        for name, position in positions.items():
+            tf = self.tf_manager.get_tf_by_name(name)
+            if tf is None:
+                continue
+            tf.position = position
+            if 'spin_pos' in tf.ui_widgets:
+                tf.ui_widgets['spin_pos'].setValue(position)
+
+    def open_energy_tracking(self):
+        from energy_tracking_dialog import EnergyTrackingDialog
+
+        focus_pos = None
+        report = getattr(self, '_last_report', None)
+        if report and 'final_pos' in report:
+            focus_pos = report['final_pos'] + report['L2']
+
+        dialog = EnergyTrackingDialog(
+            self, self.controller, self._build_structure_config(), self._calc_source_params(), self.jobs_panel,
+            focus_pos = focus_pos, table = self.tracking_table, tracking_enabled = self.track_energy
+        )
+        if dialog.exec_() == QDialog.Accepted:
+            self.tracking_table = dialog.get_table()
+            self.track_energy = dialog.tracking_enabled()
+            if self.track_energy:
+                self.apply_tracking(self.source_params['energy'])
+
+    def update_energy_input(self):
+        self.inp_energy.setText(f"{self.source_params['energy']:.0f}")
+
+    def _calc_source_params(self):
+        # Размеры всегда в FWHM; режим расчёта передаётся явно, пересчёт делает SourceManager
+        calc_params = self.source_params.copy()
+        calc_params['use_fwhm'] = self.use_fwhm
+        return calc_params
+
+    def _build_structure_config(self):
+        """Конфигурация включённых TF для контроллера (с absolute_start)."""
+        structure_config = []
+        for tf in self.tf_manager.tfs:
+            if not tf.ui_widgets['gb'].isChecked():
+                continue
+
+            config = tf.get_config()
+            config['tf_name'] = tf.name
+
+            pos = tf.position
+            measure_to_center = tf.measure_to_center
+
+            # === ДЛИНА TF (из описания железа) ===
+            length = self.controller._calculate_block_length(config['type'], config)
+
+            # === ВЫЧИСЛЕНИЕ absolute_start ===
+            if measure_to_center:
+                absolute_start = pos - length / 2.0  # начало TF = центр - половина длины
+            else:
+                absolute_start = pos  # начало TF = позиция
+
+            config['absolute_start'] = absolute_start
+            config['position'] = pos
+            structure_config.append(config)
+
+        return structure_config
+
+    def run_calculation(self):
+        # Для уже посчитанного состояния схемы (например, после Undo) отчёт берётся из истории
+        snapshot = self._record_history()
+        cached = self.history.result(snapshot)
+        if cached is not None and self._covers(cached):
+            self.display_results(cached)
+            return
+
+        calc_params = self._calc_source_params()
+        structure_config = self._build_structure_config()
+
+        try:
+            report = self.controller.run_calculations(
+                calc_params['energy'],
+                structure_config,
+                source_params=calc_params,
+                fields=self._result_fields()
+            )
+        except Exception as e:
+            QMessageBox.critical(self, "Calculation Error", str(e))
+            import traceback
+            traceback.print_exc()
+            return
+
+        if self.result_store is not None and 'error' not in report:
+            self.result_store.append_report(report)
+            self.result_store.flush()
+
+        self.history.attach_result(snapshot, report)
+        self.display_results(report)
+
+    def _result_fields(self):
+        """Поля LensResult для расчёта: выбранные колонки и сводка (все — при открытом хранилище)."""
+        if self.result_store is not None:
+            return None
+        return [field[0] for field in self.current_display_fields] + list(SUMMARY_FIELDS)
+
+    def _covers(self, report):
+        """Есть ли в отчёте все поля, которые сейчас нужны таблицам и сводке."""
+        computed = report.get('fields')
+        if computed is None:
+            return True
+        needed = self._result_fields()
+        return computed >= (ALL_FIELDS if needed is None else set(needed))
+
+    def open_result_store(self):
+        """Открывает дисковое хранилище: новые расчёты дописываются в него, старые можно показать."""
+        from PyQt5.QtWidgets import QInputDialog
+        from result_store import ResultStore
+
+        directory = QFileDialog.getExistingDirectory(self, "Select Result Store Directory")
+        if not directory:
+            return
+        try:
+            store = ResultStore(directory, mode='a')
+        except Exception as e:
+            QMessageBox.critical(self, "Result Store Error", str(e))
+            return
+        if self.result_store is not None:
+            self.result_store.close()
+        self.result_store = store
+
+        if store.n_runs == 0:
+            QMessageBox.information(self, "Result Store", f"New calculations will be appended to:\n{directory}")
+            return
+
+        energies = store.runs('energy')
+        focus = store.runs('final_pos') + store.runs('L2')
+        # Список может быть длинным: показываем последние 1000 расчётов
+        first = max(store.n_runs - 1000, 0)
+        items = [f"#{i}: E = {energies[i]:.0f} eV, focus = {focus[i]:.4f} m" for i in range(store.n_runs - 1, first - 1, -1)]
+        item, ok = QInputDialog.getItem(self, "Result Store", "Show stored calculation:", items, 0, False)
+        if ok and item:
+            run_id = int(item.split(':')[0][1:])
+            self.display_results(store.report(run_id))
+
+    def open_position_map(self):
+        from position_map_dialog import PositionMapDialog
+
+        structure_config = self._build_structure_config()
+        if len(structure_config) < 2:
+            QMessageBox.warning(self, "Position Map", "At least two enabled TFs are needed.")
+            return
+
+        sample_z = None
+        report = getattr(self, '_last_report', None)
+        if report and 'final_pos' in report:
+            sample_z = report['final_pos'] + report['L2']
+
+        calc_params = self._calc_source_params()
+        dialog = PositionMapDialog(self, self.controller, calc_params['energy'], structure_config,
+                                   calc_params, self.jobs_panel, sample_z = sample_z)
+        if dialog.exec_() == QDialog.Accepted:
+            self._set_tf_positions(dialog.get_selected_positions())
+            self.run_calculation()
+
+    def open_inverse_solver(self):
+        from inverse_solver_dialog import InverseSolverDialog
+
+        structure_config = self._build_structure_config()
+        if not structure_config:
+            QMessageBox.warning(self, "Solve for Focus", "No enabled TFs.")
+            return
+
+        focus_pos = None
+        report = getattr(self, '_last_report', None)
+        if report and 'final_pos' in report:
+            focus_pos = report['final_pos'] + report['L2']
+
+        dialog = InverseSolverDialog(self, self.controller, structure_config, self._calc_source_params(),
+                                     self.jobs_panel, focus_pos = focus_pos)
+        if dialog.exec_() == QDialog.Accepted:
+            solution = dialog.get_solution()
+            self._set_tf_positions(solution.positions)
+            if solution.energy != self.source_params['energy']:
+                self.source_params['energy'] = solution.energy
+                self.update_energy_input()
+                self.update_source_info_label()
+            self.run_calculation()
+
+    def open_comparison(self):
+        from comparison_dialog import ComparisonDialog
+
+        if self.comparison_dialog is None:
+            # Копия: Transfocator меняет списки линз на месте
+            capture = lambda: (copy.deepcopy(self._build_structure_config()), self._calc_source_params())
+            self.comparison_dialog = ComparisonDialog(self, capture)
+        self.comparison_dialog.show()
+        self.comparison_dialog.raise_()
+
+    def closeEvent(self, event):
+        # Незавершённые фоновые задачи отменяются вместе с окном
+        self.jobs_panel.shutdown()
+        super().closeEvent(event)
+
+    def display_results(self, report):
+        self._last_report = report
+        if not report or "Error" in report:
+            self.txt_summary.setText("No results or error occurred.")
+            return
+        
+        history = report.get('full_history', [])
+        if not history:
+            self.txt_summary.setText("No results computed.")
+            return
+
+        last = history[-1]
+        focus_pos = report['final_pos'] + report['L2']
+        summary = (
+            f"<b>Energy:</b> {report['energy']} eV<br>"
+            #f"<b>Final Position:</b> {report['final_pos']:.4f} m<br>"
+            f"<b>Focal Distance (L2) from last lens:</b> {report['L2']:.4f} m<br>"
+            f"<b>Focus position:</b> {focus_pos:.4f} m<br>"
+            f"<b>Transmission:</b> {report['T']*100:.2f} %<br>"
+            f"<b>Focus Size X:</b> {report['size_x']*1e6:.2f} um<br>"
+            f"<b>Focus Size Y:</b> {report['size_y']*1e6:.2f} um<br>"
+            f"<b>Depth of Field X:</b> {last.dof_x:.3f} m<br>"
+            f"<b>Depth of Field Y:</b> {last.dof_y:.3f} m<br>"
+            f"<b>Symmetry Distance (from focus position):</b> {last.symmetry_dist:.4f} m<br>"
+            f"<b>Symmetry Distance (from last lens position):</b> {(focus_pos - last.symmetry_dist):.4f}m,  {(focus_pos + last.symmetry_dist):.4f}m<br>"
+            f"<b>Symmetry Beam Size X:</b> {last.symm_beam_size_x * 1e6:.2f} um<br>"
+            f"<b>Symmetry Beam Size Y:</b> {last.symm_beam_size_y * 1e6:.2f} um<br>"
+        )
+        self.txt_summary.setHtml(summary)
+
+
+        tf_histories = {}
+        for item in history:
+            tf_name = item.tf_name
+            if tf_name not in tf_histories:
+                tf_histories[tf_name] = []
+            tf_histories[tf_name].append(item)
+
+        self.tab_widget.clear()
+
+        for tf_name, tf_history in tf_histories.items():
+            table = QTableWidget(0, 0)
+            table.verticalHeader().setVisible(False)
+            table.setStyleSheet("QTableWidget::item {padding: 2px 4px; }")
+            table.setHorizontalScrollBarPolicy(Qt.ScrollBarAsNeeded)
+
+            # Headers setup
+            headers = [field[2] for field in self.current_display_fields]
+            table.setColumnCount(len(headers))
+            table.setHorizontalHeaderLabels(headers)
+            table.horizontalHeader().setSectionResizeMode(QHeaderView.Fixed)
+            for col, field in enumerate(self.current_display_fields):
+                width = 100
+                table.setColumnWidth(col, width)
+
+            # Table content
+            display_rows = []
+            for i, item in enumerate(tf_history):
+                display_rows.append(item)
+                is_last_in_block = getattr(item, 'is_last_in_block', False)
+                is_last_in_tf = getattr(item, 'is_last_in_tf', False)
+
+                if is_last_in_block and not is_last_in_tf and i + 1 < len(tf_history):
+                    next_block_index = getattr(tf_history[i + 1], 'block_index', None)
+                    if next_block_index is not None:
+                        display_rows.append(f"Block {next_block_index}")
+                
+            table.setRowCount(len(display_rows))
+            for row, item in enumerate(display_rows):
+                if isinstance(item, str):
+                    table.setItem(row, 0, QTableWidgetItem(item))
+                    for col in range(1, table.columnCount()):
+                        table.setItem(row, col, QTableWidgetItem(""))
+                    font = table.item(row, 0).font()
+                    font.setBold(True)
+                    table.item(row, 0).setFont(font)
+                else:
+                    for col, field in enumerate(self.current_display_fields):
+                        field_name = field[0]
+                        formatter = field[3]
+                        value = getattr(item, field_name)
+                        text = formatter(value) if formatter else str(value)
+                        table.setItem(row, col, QTableWidgetItem(text))
+
+            self.tab_widget.addTab(table, tf_name) 
+
+    def open_column_settings(self):
+        from column_settings import ColumnSettingsDialog
+        all_fields_info = [
+            (field[0], field[2], field[3])
+            for field in LENS_RESULT_FIELDS
+            if field[2] is not None
+        ]
+        current_names = [field[0] for field in self.current_display_fields] if self.current_display_fields else None
+        dialog = ColumnSettingsDialog(self, current_names, all_fields_info)
+        if dialog.exec_() == QDialog.Accepted:
+            selected_names = set(dialog.get_selected_fields())
+            self.current_display_fields = [
+                field for field in LENS_RESULT_FIELDS
+                if field[0] in selected_names and field[2] is not None
+            ]
+            self._update_results_table_columns()
+
+    def _update_results_table_columns(self):
+        if not self.current_display_fields:
+            self.current_display_fields = [
+                field for field in LENS_RESULT_FIELDS
+                if field[2] is not None
+            ]
+        headers = [field[2] for field in self.current_display_fields]
+
+        for i in range(self.tab_widget.count()):
+            table = self.tab_widget.widget(i)
+            if isinstance(table, QTableWidget):
+                table.setColumnCount(len(headers))
+                table.setHorizontalHeaderLabels(headers)
+                table.setStyleSheet("QTableWidget::item { padding: 2px 4px; }")
+
+                header = table.horizontalHeader()
+                for col, field in enumerate(self.current_display_fields):
+                    width = 100
+                    table.setColumnWidth(col, width)
+                    header.setSectionResizeMode(col, QHeaderView.Fixed)
+
+        if hasattr(self, '_last_report'):
+            if self._covers(self._last_report):
+                self.display_results(self._last_report)
+            else:
+                self.run_calculation()  # новых колонок в отчёте нет
+
+
+    def export_to_csv(self):
+        import pandas as pd
+        if not hasattr(self, '_last_report') or not self._last_report:
+            QMessageBox.warning(self, "Export Error", "No results to export. Please run calculation first.")
+            return
+
+        # Диалог выбора директории
+        directory = QFileDialog.getExistingDirectory(self, "Select Directory to Save CSV Files")
+        if not directory:
+            return
+
+        history = self._last_report.get('full_history', [])
+        if not history:
+            QMessageBox.information(self, "Export", "No history data to export.")
+            return
+
+        try:
+            # 1. Экспорт Summary Report
+            focus_pos = self._last_report['final_pos'] + self._last_report['L2']
+            last = history[-1]
+            summary_data = {
+                "Field": [
+                    "Energy",
+                    "Final Position",
+                    "Focal Distance (L2)",
+                    "Focus Position",
+                    "Transmission",
+                    "Focus Size X",
+                    "Focus Size Y",
+                    "Depth of Field X",
+                    "Depth of Field Y",
+                    "Symmetry Distance",
+                    "Symmetry Distance (from lens)",
+                    "Symmetry Distance (from lens)",
+                    "Symmetry Beam Size X",
+                    "Symmetry Beam Size Y"
+                ],
+                "Value": [
+                    self._last_report['energy'],
+                    self._last_report['final_pos'],
+                    self._last_report['L2'],
+                    focus_pos,  # focus_pos
+                    self._last_report['T'] * 100,
+                    self._last_report['size_x'] * 1e6,
+                    self._last_report['size_y'] * 1e6,
+                    last.dof_x,  # если есть
+                    last.dof_y,  # если есть
+                    last.symmetry_dist,
+                    focus_pos - last.symmetry_dist,
+                    focus_pos + last.symmetry_dist,
+                    last.symm_beam_size_x * 1e6,
+                    last.symm_beam_size_y * 1e6
+                ]
+            }
+            df_summary = pd.DataFrame(summary_data)
+            summary_path = os.path.join(directory, "summary_report.csv")
+            df_summary.to_csv(summary_path, index=False)
+
+            # 2. Экспорт истории каждого TF
+
+
+            tf_histories = {}
+            for item in history:
+                tf_name = item.tf_name
+                if tf_name not in tf_histories:
+                    tf_histories[tf_name] = []
+                tf_histories[tf_name].append(item)
+
+            for tf_name, tf_history in tf_histories.items():
+                # Подготовим данные для DataFrame
+                rows = []
+                for item in tf_history:
+                    if isinstance(item, str):
+                        # Пропускаем заголовки блоков, если не нужно их сохранять
+                        continue
+                    row = {}
+                    for field in self.current_display_fields:
+                        field_name = field[0]
+                        value = getattr(item, field_name)
+                        row[field_name] = value
+                    rows.append(row)
+
+                df_tf = pd.DataFrame(rows)
+                tf_path = os.path.join(directory, f"{tf_name}_history.csv")
+                df_tf.to_csv(tf_path, index=False)
+
+            QMessageBox.information(self, "Export", f"Data exported successfully to:\n{directory}")
+
+        except Exception as e:
+            QMessageBox.critical(self, "Export Error", f"Failed to export data:\n{str(e)}")
+
+
+def _report_startup_timing():
+    """Печатает время импорта и время до первого отрисованного окна."""
+    now = time.perf_counter()
+    print(f"Startup: imports {(_T_IMPORTED - _T_START) * 1e3:.0f} ms, "
+          f"first window {(now - _T_START) * 1e3:.0f} ms")
+
+
+if __name__ == '__main__':
+    # python main.py --startup-timing  (подробнее по модулям: python -X importtime main.py)
+    startup_timing = '--startup-timing' in sys.argv
+    if startup_timing:
+        sys.argv.remove('--startup-timing')
+
+    app = QApplication(sys.argv)
+    window = XRayCalcApp()
+    window.show()
+    if startup_timing:
+        QTimer.singleShot(0, _report_startup_timing)
     sys.exit(app.exec_())
\ No newline at end of file
@@ -1,372 +1,497 @@
-import math
-from computations import Calculator, Formulas
-from parameters_micro1 import SourceManager, LensGenerator, LENS_PRESETS
-#Destop (для компа на SL) и веб-версия калькулятора, tkinter/PyQt5/PyQt6
-
-
-class AdvancedController:
-    """
-    Расширенная версия контроллера, которая умеет читать 
-    детальные настройки групп (пресеты, in_beam) из GUI.
-    """
-
-    def __init__(self):#, source_params, initial_scheme_params):
-        """В PyQt5 эти значения будут приходить из полей ввода"""
-        self.defaults = {
-            'p': 1e-3,
-            'd': 30e-6,
-            'u_vac': 0,
-            'u_air': 400e-6,
-            #'gap_between_tfs': 36 #вынести в настройки ui
-            'inter_block_gap': 1e-3
-        }
-        #self.results = [] #Список вычисленных параметров по каждой линзе
-        #self.final_state = None #Конечное состояние пучка
-
-        self.input_L1 = 27.1
-
-    
-    def _build_vacuum_tf(self, source_mgr, groups_data, first_dist, tf_name="Vacuum"):
-        if not groups_data:
-            return []
-
-        p = self.defaults['p']  # 1e-3 = 1 мм
-        u_vac = self.defaults['u_vac']
-        block_length = 0.01  # 10 мм
-        inter_block_gap = self.defaults.get('inter_block_gap', 0.001)
-
-        # === 1. РАССТАНОВКА БЛОКОВ (все линзы, включая неактивные) ===
-        all_lenses = []
-
-        current_block_start = first_dist  # first_dist — это начало первого блока
-
-        for group_idx, group in enumerate(groups_data):
-            n_lenses = min(group['N'], 5)
-
-            # === Позиции линз внутри блока ===
-            if n_lenses * p > block_length:
-                raise ValueError(f"Block {group_idx+1}: {n_lenses} lenses don't fit in 10 mm block")
-
-            total_lens_width = n_lenses * p
-            free_space = block_length - total_lens_width
-            wall_thickness = free_space / 2.0
-
-            for lens_idx in range(n_lenses):
-                pos_in_block = wall_thickness + (lens_idx + 0.5) * p
-                abs_pos = current_block_start + pos_in_block
-
-                # Получаем preset и active
-                if 'lenses' in group and group['lenses'] is not None and len(group['lenses']) == n_lenses:
-                    lens_info = group['lenses'][lens_idx]
-                else:
-                    lens_info = {'preset': group['preset'], 'active': group.get('active', True)}
-
-                all_lenses.append({
-                    'preset': lens_info['preset'],
-                    'active': lens_info.get('active', True),
-                    'abs_pos': abs_pos,
-                    'block_index': group_idx + 1,
-                    'lens_index_in_block': lens_idx + 1,
-                    'material': lens_info.get('material', LENS_PRESETS[lens_info['preset']].get('material', 'Be'))
-                })
-
-            # Переход к следующему блоку
-            current_block_start += block_length + inter_block_gap
-
-        # === 2. СОЗДАНИЕ ЦЕПОЧКИ (только активные линзы) ===
-        chain = []
-        for i, lens_geom in enumerate(all_lenses):
-            if not lens_geom['active']:
-                continue
-
-            lens = LensGenerator.create_lens_group(
-                lens_geom['preset'],
-                N=1,
-                p=p,
-                u=u_vac,
-                source_manager=source_mgr,
-                material = lens_geom.get('material')
-            )
-
-            lens['abs_pos'] = lens_geom['abs_pos']  # ← передаём абсолютную позицию
-            lens['tf_name'] = tf_name
-            lens['block_index'] = lens_geom['block_index']
-            lens['lens_index_in_tf'] = len(chain) + 1
-            lens['lens_index_in_block'] = lens_geom['lens_index_in_block']
-            lens['is_first_in_tf'] = (len(chain) == 0)
-            lens['is_last_in_block'] = (lens_geom['lens_index_in_block'] == groups_data[lens_geom['block_index'] - 1]['N'])
-            lens['is_last_in_tf'] = False
-
-            chain.append(lens)
-
-        if chain:
-            chain[-1]['is_last_in_tf'] = True
-
-        return chain
-
-    def _build_air_tf(self, source_mgr, lenses, first_dist, tf_name="Air"):
-        if not lenses:
-            return []
-
-        p = self.defaults['p']
-        u = self.defaults['u_air']
-        
-        step = p + u
-
-        all_positions = []
-        for i in range(len(lenses)):
-            pos = first_dist + i * step  # ← теперь это absolute_start + offset
-            all_positions.append(pos)
-
-        chain = []
-        for i, (lens_info, abs_pos) in enumerate(zip(lenses, all_positions)):
-            if not lens_info.get('active', True):
-                continue
-
-            preset = lens_info.get('preset', 'R50')
-            material = lens_info.get('material')
-            lens = LensGenerator.create_lens_group(
-                preset,
-                N=1,
-                p=p,
-                u=u,
-                source_manager=source_mgr,
-                material = material
-            )
-
-            lens['abs_pos'] = abs_pos  # ← передаём абсолютную позицию
-            lens['tf_name'] = tf_name
-            lens['block_index'] = 1
-            lens['lens_index_in_tf'] = len(chain) + 1
-            lens['is_first_in_tf'] = (len(chain) == 0)
-            lens['lens_index_in_block'] = i + 1
-            lens['is_last_in_block'] = False
-            lens['is_last_in_tf'] = False
-
-            chain.append(lens)
-
-        if chain:
-            chain[-1]['is_last_in_tf'] = True
-
-        return chain
-    
-    def _calculate_block_length(self, block_type, block_conf):
-        """Вычисляет длину TF в метрах."""
-        if block_type == 'air':
-            #N = block_conf['lens_count']
-            return 0.1396  # 10 мм на линзу
-        else:  # vacuum
-            return 0.153
-            #groups = block_conf['groups']
-            #N_blocks = sum(1 for g in groups if g['active'])
-            #return N_blocks * 0.01  # 10 мм на блок
-    
-    def run_calculations(self, energy, structure_config, source_params = None):
-        # 1. Настройка источника
-        if source_params is not None:
-            source_mgr = SourceManager(
-                energy = source_params['energy'],
-                sx_fwhm = source_params['sx_fwhm'],
-                sy_fwhm = source_params['sy_fwhm'],
-                wx_fwhm = source_params['wx_fwhm'],
-                wy_fwhm = source_params['wy_fwhm'],
-            )
-        else:
-            source_mgr = SourceManager(energy = energy)
-            
-        source_params = source_mgr.get_params_dict()
-
-        # 2. Сборка конфигурации системы (геометрия)
-        lens_chain = []
-
-        for index, block_conf in enumerate(structure_config):
-            block_type = block_conf.get('type')
-            absolute_start = block_conf.get('absolute_start')  # ← теперь получаем готовый absolute_start
-
-            if block_type == 'vacuum':
-                groups = block_conf.get('groups', [])
-                tf_name = block_conf.get('tf_name', f'Vacuum {index}')
-                block_chain = self._build_vacuum_tf(
-                    source_mgr,
-                    groups_data = groups,
-                    first_dist = absolute_start,  # ← передаём абсолютную позицию начала TF
-                    tf_name = tf_name
-                )
-                lens_chain.extend(block_chain)
-
-            elif block_type == 'air':
-                lenses = block_conf.get('lenses', [])
-                tf_name = block_conf.get('tf_name', f'Air {index}')
-                block_chain = self._build_air_tf(
-                    source_mgr,
-                    lenses = lenses,
-                    first_dist = absolute_start,  # ← передаём абсолютную позицию начала TF
-                    tf_name = tf_name
-                )
-                lens_chain.extend(block_chain)
-
-        # 3. Расчёт
-        results, final_state = Calculator.propagate(
-            lens_config = lens_chain,
-            source_params = source_params
-        )
-
-        # 4. Отчёт
-        return self._generate_report(source_params, results, final_state)
-    
-    def _generate_report(self, source_params, results, final_state):
-        if not results:
-            return {"error": "No results computed"}
-        
-        last = results[-1]
-        T_total = 1.0
-        for t in final_state.T_blocks:
-            T_total *= t
-
-        G_total = 0.0
-        for g in final_state.G_blocks:
-            G_total = math.sqrt(G_total**2 + g**2)
-
-        return {
-            'energy': source_params['energy'], #'energy': source_params['E'],
-            'final_pos': last.position,
-            'L2': last.L2,
-            'M_total': last.M_total,
-            'T': T_total,
-            'G': G_total,
-            'size_x': last.sfx,
-            'size_y': last.sfy,
-            'full_history': results  # ← свежий, независимый список
-        }
-
-    """
-    def _generate_report(self, source_params):
-        if not self.results:
-            return {"error": "No results computed"}
-        
-        last = self.results[-1]
-        state = self.final_state
-
-        # Глубина резкости (опционально, можно упростить)
-        # Если не используете — уберите вызов Formulas.dof
-        # Но для совместимости оставим базовый отчёт:
-
-        T_total = 1.0
-        for t_block in state.T_blocks:
-            T_total *= t_block
-
-        G_total = 0.0
-        for g_block in state.G_blocks:
-            G_total = math.sqrt(G_total**2 + g_block**2)
-
-        return {
-            'energy': source_params['E'],
-            'final_pos': last.position,
-            #'F': last.F,
-            'L2': last.L2,
-            'M_total': last.M_total,
-            'T': T_total if state else 1.0,
-            'G': G_total,
-            'size_x': last.sfx,
-            'size_y': last.sfy,
-            'full_history': self.results
-        }
-    """
-
-#________________________
-''' 
-    def _build_vacuum_tf(self, source_mgr, groups_lens_counts, first_dist):
-        """
-        Собирает вакуумный трансфокатор.
-        Структура: [Группа 1] -> дрейф -> [Группа 2] -> дрейф ...
-        Args:
-            groups_lens_counts (list): Список кол-ва линз в группах, например [1, 2, 3]
-            first_dist (float): Расстояние до ПЕРВОЙ линзы этого TF.
-        """
-        chain = []
-        # Расстояния МЕЖДУ группами внутри вакуумного TF (из твоего кода)
-        # tf1_1 (N=1) -> tf1_2 (N=2) -> tf1_3 (N=3)
-        # В старом коде дельты были: 0.0185, 0.0175 и т.д.
-        # Для упрощения зададим стандартный межблочный дрейф, или передадим список.
-        inter_group_gaps = [0.0185, 0.0175, 0.0165, 0.0155] # Примерный список зазоров
-
-        for i, n_lenses in enumerate(groups_lens_counts):
-            #Создаём группу линз
-            #В вакууме обычно R500
-            group = LensGenerator.create_lens_group(
-                'R500', N = n_lenses, p = self.defaults['p'], u = self.defaults['u_vac'],
-                source_manager = source_mgr
-            )
-
-            #Расчёт дистанции
-            if i == 0:
-                #Самая первая группа в трансфокаторе
-                group['distance_from_prev'] = first_dist
-            else:
-                #Последующие группы
-                if i - 1 < len(inter_group_gaps): #переделать группу
-                    gap = inter_group_gaps[i - 1] + 0.001 #+1mm на корпус
-                else:
-                    gap = 0.02 #Дефолт, если список кончился (?)
-                group['distance_from_prev'] = gap
-
-            chain.append(group)
-
-        return chain
-    
-    def _build_air_tf(self, source_mgr, n_lenses, first_dist):
-        """
-        Собирает on_air TF (длинный массив линз).
-        """
-        chain = []
-        # R50 usuall
-        base_lens = LensGenerator.create_lens_group(
-            'R50', N = 1, p = self.defaults['p'], u = self.defaults['u_air'],
-            source_manager = source_mgr
-        )
-
-        for i in range(n_lenses):
-            lens = base_lens.copy()
-            if i == 0:
-                lens['distance_from_prev'] = first_dist
-            else:
-                lens['distance_from_prev'] = self.defaults['p'] + self.defaults['u_air']
-
-            chain.append(lens)
-
-        return chain
-'''
-'''
-block = {
-    'preset': 'R500',
-    'N': 3,
-    'active': True,
-    'lenses': [  # ← опционально, для детального редактора
-        {'preset': 'R500', 'active': True},
-        {'preset': 'R500', 'active': False},
-        {'preset': 'R100', 'active': True}
-    ]
-}
-
-
-Про вопрос с передачей use_fwhm в SourceManager; более элегантный вариант
-Используйте Вариант 2 — он надёжен и легко поддерживается:
-# В main_controller.py, в run_calculations
-SOURCE_MANAGER_KEYS = {'energy', 'sx_fwhm', 'sy_fwhm', 'wx_fwhm', 'wy_fwhm', 'material'}
-
-def run_calculations(self, energy, structure_config, source_params=None):
-    if source_params is not None:
-        # Фильтруем только нужные ключи
-        sm_params = {k: v for k, v in source_params.items() if k in SOURCE_MANAGER_KEYS}
-        source_mgr = SourceManager(**sm_params)
-    else:
-        source_mgr = SourceManager(energy=energy)
-    # ...
-
-✅ Это предотвратит ошибки при добавлении новых GUI-флагов (типа use_fwhm, database, density и т.д.).
-
-После этого ошибка исчезнет, и расчёты будут работать корректно.
-
-
-
+import math
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from computations import Calculator, Formulas, CalcMode, FWHM, ALL_FIELDS, resolve_fields
+from parameters_micro1 import SourceManager, LensGenerator, LENS_PRESETS
+from lens_mask import LensMask
+from lens_catalog import catalog_version
+from tf_hardware import DEFAULT_HARDWARE, get_hardware, hardware_for, hardware_version
+#Destop (для компа на SL) и веб-версия калькулятора, tkinter/PyQt5/PyQt6
+
+_SHARED_POOL = None
+
+
+def shared_pool():
+    """Общий пул потоков для пакетных расчётов (создаётся при первом обращении)."""
+    global _SHARED_POOL
+    if _SHARED_POOL is None:
+        _SHARED_POOL = ThreadPoolExecutor(max_workers=os.cpu_count())
+    return _SHARED_POOL
+
+
+class AdvancedController:
+    """
+    Расширенная версия контроллера, которая умеет читать 
+    детальные настройки групп (пресеты, in_beam) из GUI.
+    """
+
+    def __init__(self, backend = 'python'):#, source_params, initial_scheme_params):
+        """
+        В PyQt5 эти значения будут приходить из полей ввода.
+        backend: 'python' (Calculator) или 'numba' (JitCalculator, если Numba установлена)
+        """
+        if backend == 'numba':
+            from numba_engine import JitCalculator
+            self.calculator = JitCalculator
+        elif backend == 'python':
+            self.calculator = Calculator
+        else:
+            raise ValueError(f"Unknown backend: {backend}")
+        # Геометрия TF (p, зазоры, блоки) — в описаниях железа, см. tf_hardware
+        self.defaults = {
+            'd': 30e-6,
+            #'gap_between_tfs': 36 #вынести в настройки ui
+        }
+        #self.results = [] #Список вычисленных параметров по каждой линзе
+        #self.final_state = None #Конечное состояние пучка
+
+        self.input_L1 = 27.1
+
+        # Кэш цепочек TF, собранных от нуля: ключ — содержимое TF и энергия (см. _tf_chain)
+        self.chain_cache_size = 256
+        self._chain_cache = OrderedDict()
+        self._chain_cache_lock = threading.Lock()
+        self.chain_cache_stats = {'hits': 0, 'misses': 0}
+
+    def __getstate__(self):
+        # Контроллер передаётся в рабочие процессы: кэш и блокировка не переносятся
+        state = self.__dict__.copy()
+        state['_chain_cache'] = OrderedDict()
+        del state['_chain_cache_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._chain_cache_lock = threading.Lock()
+
+    
+    def _build_vacuum_tf(self, source_mgr, groups_data, first_dist, tf_name="Vacuum", hardware=None):
+        if not groups_data:
+            return []
+
+        hardware = hardware or get_hardware(DEFAULT_HARDWARE['vacuum'])
+        p = hardware.p  # 1e-3 = 1 мм
+        u_vac = hardware.u
+        if len(groups_data) > hardware.capacity:
+            raise ValueError(f"{tf_name}: {len(groups_data)} blocks, hardware '{hardware.id}' has {hardware.capacity}")
+
+        # === 1. РАССТАНОВКА БЛОКОВ (все линзы, включая неактивные) ===
+        # Смещения линз от начала TF берутся из таблицы железа
+        all_lenses = []
+
+        for group_idx, group in enumerate(groups_data):
+            n_lenses = min(group['N'], hardware.max_lenses)
+            if n_lenses < 1:
+                continue
+            offsets = hardware.block_offsets[group_idx][n_lenses - 1]
+
+            for lens_idx in range(n_lenses):
+                abs_pos = first_dist + offsets[lens_idx]
+
+                # Получаем preset и active
+                if 'lenses' in group and group['lenses'] is not None and len(group['lenses']) == n_lenses:
+                    lens_info = group['lenses'][lens_idx]
+                else:
+                    lens_info = {'preset': group['preset'], 'active': group.get('active', True)}
+
+                all_lenses.append({
+                    'preset': lens_info['preset'],
+                    'active': lens_info.get('active', True),
+                    'abs_pos': abs_pos,
+                    'block_index': group_idx + 1,
+                    'lens_index_in_block': lens_idx + 1,
+                    'material': lens_info.get('material', LENS_PRESETS[lens_info['preset']].get('material', 'Be'))
+                })
+
+        # === 2. СОЗДАНИЕ ЦЕПОЧКИ (только активные линзы) ===
+        chain = []
+        for i, lens_geom in enumerate(all_lenses):
+            if not lens_geom['active']:
+                continue
+            hardware.check_lens(lens_geom['preset'], tf_name)
+
+            lens = LensGenerator.create_lens_group(
+                lens_geom['preset'],
+                N=1,
+                p=p,
+                u=u_vac,
+                source_manager=source_mgr,
+                material = lens_geom.get('material')
+            )
+
+            lens['abs_pos'] = lens_geom['abs_pos']  # ← передаём абсолютную позицию
+            lens['tf_name'] = tf_name
+            lens['block_index'] = lens_geom['block_index']
+            lens['lens_index_in_tf'] = len(chain) + 1
+            lens['lens_index_in_block'] = lens_geom['lens_index_in_block']
+            lens['is_first_in_tf'] = (len(chain) == 0)
+            lens['is_last_in_block'] = (lens_geom['lens_index_in_block'] == groups_data[lens_geom['block_index'] - 1]['N'])
+            lens['is_last_in_tf'] = False
+
+            chain.append(lens)
+
+        if chain:
+            chain[-1]['is_last_in_tf'] = True
+
+        return chain
+
+    def _build_air_tf(self, source_mgr, lenses, first_dist, tf_name="Air", active_mask=None, hardware=None):
+        if not lenses:
+            return []
+
+        hardware = hardware or get_hardware(DEFAULT_HARDWARE['air'])
+        p = hardware.p
+        u = hardware.u
+        slot_offsets = hardware.slot_offsets
+        if len(lenses) > len(slot_offsets):
+            raise ValueError(f"{tf_name}: {len(lenses)} lenses, hardware '{hardware.id}' has {len(slot_offsets)} slots")
+
+        # Без маски активность берётся из самих словарей линз (старый формат)
+        if active_mask is None:
+            active_mask = LensMask.from_flags(lens.get('active', True) for lens in lenses)
+
+        chain = []
+        for i in active_mask:  # только активные линзы, по возрастанию
+            if i >= len(lenses):
+                break
+            lens_info = lenses[i]
+            abs_pos = first_dist + slot_offsets[i]  # ← absolute_start + offset
+
+            preset = lens_info.get('preset', 'R50')
+            hardware.check_lens(preset, tf_name)
+            material = lens_info.get('material')
+            lens = LensGenerator.create_lens_group(
+                preset,
+                N=1,
+                p=p,
+                u=u,
+                source_manager=source_mgr,
+                material = material
+            )
+
+            lens['abs_pos'] = abs_pos  # ← передаём абсолютную позицию
+            lens['tf_name'] = tf_name
+            lens['block_index'] = 1
+            lens['lens_index_in_tf'] = len(chain) + 1
+            lens['is_first_in_tf'] = (len(chain) == 0)
+            lens['lens_index_in_block'] = i + 1
+            lens['is_last_in_block'] = False
+            lens['is_last_in_tf'] = False
+
+            chain.append(lens)
+
+        if chain:
+            chain[-1]['is_last_in_tf'] = True
+
+        return chain
+    
+    def _calculate_block_length(self, block_type, block_conf):
+        """Вычисляет длину TF в метрах (длина корпуса из описания железа)."""
+        return hardware_for(dict(block_conf, type = block_type)).length
+    
+    def run_calculations(self, energy, structure_config, source_params = None, mode = None, fields = None):
+        """
+        mode: CalcMode (FWHM/SIGMA). Если не задан, берётся source_params['use_fwhm'],
+        иначе FWHM. Размеры в source_params всегда передаются в FWHM.
+        fields: нужные поля LensResult (None — все, см. Calculator.propagate);
+            T и G отчёта считаются, только если в проекцию входят T_block и G_total.
+        """
+        source_params, lens_chain = self.build_chain(energy, structure_config, source_params, mode)
+
+        # 3. Расчёт
+        results, final_state = self.calculator.propagate(
+            lens_config = lens_chain,
+            source_params = source_params,
+            fields = fields
+        )
+
+        # 4. Отчёт
+        return self._generate_report(source_params, results, final_state, resolve_fields(fields))
+
+    def run_final(self, energy, structure_config, source_params = None, mode = None, stop = (), fields = None):
+        """
+        Расчёт без таблицы по линзам, с условиями остановки (stop_if_* из computations)
+        для поиска: безнадёжные конфигурации не досчитываются.
+
+        Returns:
+            (last, state, stopped_by) — как Calculator.propagate_final
+        """
+        source_params, lens_chain = self.build_chain(energy, structure_config, source_params, mode)
+        return self.calculator.propagate_final(lens_chain, source_params, stop = stop, fields = fields)
+
+    def run_batch(self, jobs):
+        """
+        Параллельный расчёт набора заданий на общем пуле потоков.
+
+        Args:
+            jobs: список словарей с аргументами run_calculations
+                (energy, structure_config, source_params, mode); режимы можно смешивать
+        """
+        futures = [shared_pool().submit(self.run_calculations, **job) for job in jobs]
+        return [future.result() for future in futures]
+
+    def build_chain(self, energy, structure_config, source_params = None, mode = None):
+        """
+        Собирает источник и цепочку линз без расчёта.
+
+        Returns:
+            (source_params, lens_chain): словарь источника из SourceManager и
+            список словарей линз с абсолютными позициями
+        """
+        if mode is None:
+            mode = CalcMode.of(source_params.get('use_fwhm', True)) if source_params else FWHM
+
+        # 1. Настройка источника
+        if source_params is not None:
+            source_mgr = SourceManager(
+                energy = source_params['energy'],
+                sx_fwhm = source_params['sx_fwhm'],
+                sy_fwhm = source_params['sy_fwhm'],
+                wx_fwhm = source_params['wx_fwhm'],
+                wy_fwhm = source_params['wy_fwhm'],
+                mode = mode,
+            )
+        else:
+            source_mgr = SourceManager(energy = energy, mode = mode)
+            
+        source_params = source_mgr.get_params_dict()
+
+        # 2. Сборка конфигурации системы (геометрия)
+        lens_chain = []
+        for index, block_conf in enumerate(structure_config):
+            lens_chain.extend(self._tf_chain(source_mgr, block_conf, index))
+
+        return source_params, lens_chain
+
+    # --- Кэш цепочек TF ---
+
+    def _tf_key(self, source_mgr, block_conf, index):
+        """Ключ цепочки TF: всё, от чего она зависит, кроме absolute_start."""
+        block_type = block_conf.get('type')
+        if block_type == 'vacuum':
+            tf_name = block_conf.get('tf_name', f'Vacuum {index}')
+            content = tuple(
+                (group['N'], group.get('preset'), group.get('active', True),
+                 None if group.get('lenses') is None else
+                 tuple((lens.get('preset'), lens.get('active', True), lens.get('material')) for lens in group['lenses']))
+                for group in block_conf.get('groups', [])
+            )
+        elif block_type == 'air':
+            tf_name = block_conf.get('tf_name', f'Air {index}')
+            content = (tuple((lens.get('preset', 'R50'), lens.get('material'), lens.get('active', True))
+                             for lens in block_conf.get('lenses', [])),
+                       block_conf.get('active_mask'))
+        else:
+            return None
+        defaults = tuple(sorted(self.defaults.items()))
+        return (block_type, tf_name, content, source_mgr.E, defaults, catalog_version(),
+                hardware_for(block_conf).id, hardware_version())
+
+    def _build_tf(self, source_mgr, block_conf, key, first_dist):
+        block_type, tf_name = key[0], key[1]
+        if block_type == 'vacuum':
+            return self._build_vacuum_tf(
+                source_mgr,
+                groups_data = block_conf.get('groups', []),
+                first_dist = first_dist,
+                tf_name = tf_name,
+                hardware = hardware_for(block_conf)
+            )
+        return self._build_air_tf(
+            source_mgr,
+            lenses = block_conf.get('lenses', []),
+            first_dist = first_dist,
+            tf_name = tf_name,
+            active_mask = block_conf.get('active_mask'),
+            hardware = hardware_for(block_conf)
+        )
+
+    def _tf_chain(self, source_mgr, block_conf, index):
+        """
+        Цепочка одного TF. Цепочка, собранная от first_dist = 0, берётся из
+        LRU-кэша по содержимому TF и энергии и сдвигается на absolute_start:
+        смена позиции TF не пересобирает линзы. Возвращаются копии словарей.
+        """
+        key = self._tf_key(source_mgr, block_conf, index)
+        if key is None:
+            return []
+        with self._chain_cache_lock:
+            template = self._chain_cache.get(key)
+            if template is not None:
+                self._chain_cache.move_to_end(key)
+                self.chain_cache_stats['hits'] += 1
+        if template is None:
+            template = self._build_tf(source_mgr, block_conf, key, 0.0)
+            with self._chain_cache_lock:
+                self.chain_cache_stats['misses'] += 1
+                self._chain_cache[key] = template
+                if len(self._chain_cache) > self.chain_cache_size:
+                    self._chain_cache.popitem(last=False)
+
+        absolute_start = block_conf.get('absolute_start')  # ← готовый absolute_start из конфигурации
+        return [dict(lens, abs_pos = absolute_start + lens['abs_pos']) for lens in template]
+
+    def clear_chain_cache(self):
+        """Сбрасывает кэш цепочек TF (например, после правки каталога на месте)."""
+        with self._chain_cache_lock:
+            self._chain_cache.clear()
+    
+    def _generate_report(self, source_params, results, final_state, fields = ALL_FIELDS):
+        if not results:
+            return {"error": "No results computed"}
+        
+        last = results[-1]
+        T_total = 1.0 if 'T_block' in fields else math.nan
+        for t in final_state.T_blocks:
+            T_total *= t
+
+        G_total = 0.0 if 'G_total' in fields else math.nan
+        for g in final_state.G_blocks:
+            G_total = math.sqrt(G_total**2 + g**2)
+
+        return {
+            'energy': source_params['energy'], #'energy': source_params['E'],
+            'final_pos': last.position,
+            'L2': last.L2,
+            'M_total': last.M_total,
+            'T': T_total,
+            'G': G_total,
+            'size_x': last.sfx,
+            'size_y': last.sfy,
+            'full_history': results,  # ← свежий, независимый список
+            'fields': fields  # посчитанные поля LensResult
+        }
+
+    """
+    def _generate_report(self, source_params):
+        if not self.results:
+            return {"error": "No results computed"}
+        
+        last = self.results[-1]
+        state = self.final_state
+
+        # Глубина резкости (опционально, можно упростить)
+        # Если не используете — уберите вызов Formulas.dof
+        # Но для совместимости оставим базовый отчёт:
+
+        T_total = 1.0
+        for t_block in state.T_blocks:
+            T_total *= t_block
+
+        G_total = 0.0
+        for g_block in state.G_blocks:
+            G_total = math.sqrt(G_total**2 + g_block**2)
+
+        return {
+            'energy': source_params['E'],
+            'final_pos': last.position,
+            #'F': last.F,
+            'L2': last.L2,
+            'M_total': last.M_total,
+            'T': T_total if state else 1.0,
+            'G': G_total,
+            'size_x': last.sfx,
+            'size_y': last.sfy,
+            'full_history': self.results
+        }
+    """
+
+#________________________
+''' 
+    def _build_vacuum_tf(self, source_mgr, groups_lens_counts, first_dist):
+        """
+        Собирает вакуумный трансфокатор.
+        Структура: [Группа 1] -> дрейф -> [Группа 2] -> дрейф ...
+        Args:
+            groups_lens_counts (list): Список кол-ва линз в группах, например [1, 2, 3]
+            first_dist (float): Расстояние до ПЕРВОЙ линзы этого TF.
+        """
+        chain = []
+        # Расстояния МЕЖДУ группами внутри вакуумного TF (из твоего кода)
+        # tf1_1 (N=1) -> tf1_2 (N=2) -> tf1_3 (N=3)
+        # В старом коде дельты были: 0.0185, 0.0175 и т.д.
+        # Для упрощения зададим стандартный межблочный дрейф, или передадим список.
+        inter_group_gaps = [0.0185, 0.0175, 0.0165, 0.0155] # Примерный список зазоров
+
+        for i, n_lenses in enumerate(groups_lens_counts):
+            #Создаём группу линз
+            #В вакууме обычно R500
+            group = LensGenerator.create_lens_group(
+                'R500', N = n_lenses, p = self.defaults['p'], u = self.defaults['u_vac'],
+                source_manager = source_mgr
+            )
+
+            #Расчёт дистанции
+            if i == 0:
+                #Самая первая группа в трансфокаторе
+                group['distance_from_prev'] = first_dist
+            else:
+                #Последующие группы
+                if i - 1 < len(inter_group_gaps): #переделать группу
+                    gap = inter_group_gaps[i - 1] + 0.001 #+1mm на корпус
+                else:
+                    gap = 0.02 #Дефолт, если список кончился (?)
+                group['distance_from_prev'] = gap
+
+            chain.append(group)
+
+        return chain
+    
+    def _build_air_tf(self, source_mgr, n_lenses, first_dist):
+        """
+        Собирает on_air TF (длинный массив линз).
+        """
+        chain = []
+        # R50 usuall
+        base_lens = LensGenerator.create_lens_group(
+            'R50', N = 1, p = self.defaults['p'], u = self.defaults['u_air'],
+            source_manager = source_mgr
+        )
+
+        for i in range(n_lenses):
+            lens = base_lens.copy()
+            if i == 0:
+                lens['distance_from_prev'] = first_dist
+            else:
+                lens['distance_from_prev'] = self.defaults['p'] + self.defaults['u_air']
+
+            chain.append(lens)
+
+        return chain
+'''
+'''
+block = {
+    'preset': 'R500',
+    'N': 3,
+    'active': True,
+    'lenses': [  # ← опционально, для детального редактора
+        {'preset': 'R500', 'active': True},
+        {'preset': 'R500', 'active': False},
+        {'preset': 'R100', 'active': True}
+    ]
+}
+
+
+Про вопрос с передачей use_fwhm в SourceManager; более элегантный вариант
+Используйте Вариант 2 — он надёжен и легко поддерживается:
+# В main_controller.py, в run_calculations
+SOURCE_MANAGER_KEYS = {'energy', 'sx_fwhm', 'sy_fwhm', 'wx_fwhm', 'wy_fwhm', 'material'}
+
+def run_calculations(self, energy, structure_config, source_params=None):
+    if source_params is not None:
+        # Фильтруем только нужные ключи
+        sm_params = {k: v for k, v in source_params.items() if k in SOURCE_MANAGER_KEYS}
+        source_mgr = SourceManager(**sm_params)
+    else:
+        source_mgr = SourceManager(energy=energy)
+    # ...
+
+✅ Это предотвратит ошибки при добавлении новых GUI-флагов (типа use_fwhm, database, density и т.д.).
+
+После этого ошибка исчезнет, и расчёты будут работать корректно.
+
+
+
 '''
\ No newline at end of file
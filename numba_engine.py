@@ -0,0 +1,330 @@
+"""
+JIT-версия цикла Calculator.propagate (Numba, опционально).
+
+Рекуррентный расчёт по линзам не векторизуется (каждая линза зависит от
+BeamState после предыдущей), поэтому цикл компилируется целиком: на вход
+плоские массивы параметров линз, результат пишется в заранее выделенные
+массивы. Скомпилированный код кэшируется на диске (cache=True), так что
+повторный запуск не тратит время на компиляцию.
+
+Без Numba JitCalculator.propagate просто вызывает Calculator.propagate.
+"""
+import math
+
+import numpy as np
+
+from computations import Calculator, BeamState, LensResult, ERF_CONST, FWHM_TO_SIGMA
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+    def njit(*args, **kwargs):
+        """Заглушка: ядро остаётся обычной функцией Python."""
+        if args and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
+
+# Числовые поля LensResult в порядке колонок out (см. _propagate_kernel)
+KERNEL_FIELDS = (
+    'position', 'L1', 'L2', 'F', 'sx_fwhm', 'sy_fwhm', 'sfpx', 'sfpy', 'alx', 'aly',
+    'slx', 'sly', 'sfx', 'sfy', 'T', 'T_block', 'M', 'M_total', 'G', 'G_total',
+    'NA', 'NA_block', 'Aeff', 'Aeff_total', 'Aeff_block',
+    'dof_x', 'dof_y', 'symmetry_dist', 'symm_beam_size_x', 'symm_beam_size_y',
+)
+
+# Скалярные поля BeamState в порядке элементов вектора состояния
+STATE_FIELDS = (
+    'z', 'wx', 'wy', 'sx', 'sy', 'M_total', 'T_current_block', 'G_current_block',
+    'T_total', 'G_total', 'NA_current_block', 'Aeff_current_block',
+    'L2_prev', 'Alx_prev', 'Aly_prev', 'Aeff_prev_total',
+)
+
+# Колонки blocks: T, G, NA, Aeff каждого завершённого TF
+BLOCK_FIELDS = ('T_blocks', 'G_blocks', 'NA_blocks', 'Aeff_blocks')
+
+SYMMETRY_K = 0.01
+
+
+@njit(cache=True, error_model='numpy')
+def _propagate_kernel(t, R, A, p, delta, mu, d, is_first_in_tf, is_last_in_tf, lamda,
+                      state, out, blocks):
+    """
+    Цикл Calculator.propagate на массивах.
+
+    t — расстояние от предыдущей линзы (у первой — от источника); state —
+    вектор STATE_FIELDS, обновляется на месте; out (n, len(KERNEL_FIELDS)) и
+    blocks (n, 4) заполняются. Возвращает число записанных строк blocks.
+    """
+    inf = math.inf
+    z, wx, wy, sx, sy = state[0], state[1], state[2], state[3], state[4]
+    M_total, T_block, G_block, T_total, G_total = state[5], state[6], state[7], state[8], state[9]
+    NA_block, Aeff_block = state[10], state[11]
+    L2_prev, alx_prev, aly_prev, aeff_prev_total = state[12], state[13], state[14], state[15]
+    n_blocks = 0
+    n = t.shape[0]
+
+    for i in range(n):
+        if is_first_in_tf[i]:
+            T_block = 1.0
+            G_block = 1.0
+            NA_block = 0.0
+            Aeff_block = inf
+
+        ti = t[i]
+        A_phys = A[i]
+        delta_i = delta[i]
+        mu_i = mu[i]
+        is_first = L2_prev == 0 and alx_prev == 0
+        L1 = ti if is_first else ti - L2_prev
+
+        F = R[i] / (2 * delta_i) + p[i] / 6
+        if L1 == F or F == 0 or L1 == 0:
+            L2 = inf
+        else:
+            denom = 1 / F - 1 / L1
+            L2 = inf if denom == 0 else 1 / denom
+        M = abs(L2 / L1)
+
+        aeff = FWHM_TO_SIGMA * math.sqrt(F * delta_i / mu_i)
+        if aeff_prev_total == inf:
+            aeff_sys = aeff
+        else:
+            aeff_sys = math.sqrt(1 / (1 / aeff_prev_total**2 + 1 / aeff**2))
+
+        if is_first:
+            sfpx = math.sqrt((L1 * wx)**2 + sx**2) if wx != 0 else A_phys
+            sfpy = math.sqrt((L1 * wy)**2 + sy**2) if wy != 0 else A_phys
+        elif L2_prev == 0:
+            sfpx = inf
+            sfpy = inf
+        else:
+            sfpx = alx_prev * abs(ti - L2_prev) / L2_prev
+            sfpy = aly_prev * abs(ti - L2_prev) / L2_prev
+
+        alx = math.sqrt(1 / (1 / sfpx**2 + 1 / aeff**2)) if A_phys > sfpx else A_phys
+        aly = math.sqrt(1 / (1 / sfpy**2 + 1 / aeff**2)) if A_phys > sfpy else A_phys
+
+        # diff_lim
+        w = 1 / (1 + (A_phys / (6 * (aeff / FWHM_TO_SIGMA)))**6)
+        a = aeff / A_phys
+        k = a + 1 / 6 * math.exp(-a) * w + 0.442 * (1 - w)
+        diff_lim = abs(k * lamda * L2 / aeff)
+
+        slx = M * sx
+        sly = M * sy
+        sfx = math.sqrt(slx**2 + diff_lim**2)
+        sfy = math.sqrt(sly**2 + diff_lim**2)
+
+        c = A_phys * ERF_CONST
+        T = (math.exp(-mu_i * d[i]) * (alx * aly) / (sfpx * sfpy)
+             * (math.erf(c / alx) * math.erf(c / aly)) / (math.erf(c / sfpx) * math.erf(c / sfpy)))
+
+        L_total = L1 + L2
+        sb_x = math.sqrt((L_total * wx)**2 + sx**2)
+        sb_y = math.sqrt((L_total * wy)**2 + sy**2)
+        G = T * sb_x * sb_y / (sfx * sfy)
+
+        NA = aeff / (2 * F)
+        NA_block = NA
+        Aeff_block = aeff_sys
+        T_block *= T
+        G_block *= G
+
+        row = out[i]
+        row[0] = z + ti
+        row[1] = L1
+        row[2] = L2
+        row[3] = F
+        row[4] = sx
+        row[5] = sy
+        row[6] = sfpx
+        row[7] = sfpy
+        row[8] = alx
+        row[9] = aly
+        row[10] = slx
+        row[11] = sly
+        row[12] = sfx
+        row[13] = sfy
+        row[14] = T
+        row[15] = T_block
+        row[16] = M
+        row[17] = M_total * M
+        row[18] = G
+        row[19] = G_block
+        row[20] = NA
+        row[21] = NA_block
+        row[22] = aeff
+        row[23] = aeff_sys
+        row[24] = Aeff_block
+        row[25] = 0.0
+        row[26] = 0.0
+        row[27] = 0.0
+        row[28] = 0.0
+        row[29] = 0.0
+
+        if is_last_in_tf[i]:
+            blocks[n_blocks, 0] = T_block
+            blocks[n_blocks, 1] = G_block
+            blocks[n_blocks, 2] = NA_block
+            blocks[n_blocks, 3] = Aeff_block
+            n_blocks += 1
+            row[25] = math.sqrt(math.pow(2 * L2 * sfx / alx, 2))
+            row[26] = math.sqrt(math.pow(2 * L2 * sfy / aly, 2))
+
+        z += ti
+        wx = wx - alx / F
+        wy = wy - aly / F
+        sx = sfx
+        sy = sfy
+        M_total *= M
+        T_total *= T
+        G_total *= G
+        L2_prev = L2
+        alx_prev = alx
+        aly_prev = aly
+        aeff_prev_total = aeff_sys
+
+    if n > 0:
+        # Последняя линза: глубина резкости и симметричный пучок
+        last = out[n - 1]
+        L2, F = last[2], last[3]
+        slx, sly, sfx, sfy, alx, aly = last[10], last[11], last[12], last[13], last[8], last[9]
+        NA_last = FWHM_TO_SIGMA * math.sqrt(F * delta[n - 1] / mu[n - 1]) / (2 * F)
+        if NA_last != 0:
+            last[25] = math.sqrt(math.pow(2 * L2 * slx / alx, 2))
+            last[26] = math.sqrt(math.pow(2 * L2 * sly / aly, 2))
+        else:
+            last[25] = 0.0
+            last[26] = 0.0
+
+        kk = SYMMETRY_K
+        num = ((1 + kk) * sfy)**2 - sfx**2
+        den = alx**2 - ((1 + kk) * aly)**2
+        if den == 0 or num / den < 0:
+            sym_dist = 0.0
+        else:
+            sym_dist = L2 * math.sqrt(num / den)
+        last[27] = sym_dist
+        if L2 == 0:
+            last[28] = 0.0
+            last[29] = 0.0
+        else:
+            last[28] = math.sqrt(sfx**2 + (alx * sym_dist / L2)**2)
+            last[29] = math.sqrt(sfy**2 + (aly * sym_dist / L2)**2)
+
+    state[0], state[1], state[2], state[3], state[4] = z, wx, wy, sx, sy
+    state[5], state[6], state[7], state[8], state[9] = M_total, T_block, G_block, T_total, G_total
+    state[10], state[11] = NA_block, Aeff_block
+    state[12], state[13], state[14], state[15] = L2_prev, alx_prev, aly_prev, aeff_prev_total
+    return n_blocks
+
+
+def _distances(lens_config):
+    """Расстояния от предыдущей линзы по тем же правилам, что в Calculator.propagate."""
+    t = np.empty(len(lens_config))
+    z = 0.0
+    for i, lens_conf in enumerate(lens_config):
+        abs_pos = lens_conf.get('abs_pos', None)
+        if abs_pos is not None:
+            t[i] = abs_pos if i == 0 else abs_pos - lens_config[i - 1].get('abs_pos', z)
+        else:
+            t[i] = lens_conf.get('distance_from_prev', 0)
+        z += t[i]
+    return t
+
+
+def _initial_state(source_params, initial_state):
+    if initial_state is None:
+        initial_state = BeamState(
+            z = 0,
+            wx = source_params['wx_fwhm'],
+            wy = source_params['wy_fwhm'],
+            sx = source_params['sx_fwhm'],
+            sy = source_params['sy_fwhm'],
+        )
+    return initial_state, np.array([getattr(initial_state, name) for name in STATE_FIELDS], dtype=float)
+
+
+def propagate_arrays(t, R, A, p, delta, mu, d, is_first_in_tf, is_last_in_tf, source_params,
+                     state=None, out=None, blocks=None):
+    """
+    Расчёт цепочки на плоских массивах без создания LensResult.
+
+    Args:
+        t: (n,) расстояния от предыдущей линзы, м (у первой — от источника)
+        R, A, p, delta, mu, d: (n,) параметры линз
+        is_first_in_tf, is_last_in_tf: (n,) bool
+        state: вектор STATE_FIELDS (по умолчанию — из источника); обновляется на месте
+        out, blocks: заранее выделенные массивы (n, len(KERNEL_FIELDS)) и (n, 4),
+            чтобы не выделять память при повторных вызовах
+
+    Returns:
+        (out, blocks[:n_blocks], state)
+    """
+    n = len(t)
+    if state is None:
+        state = _initial_state(source_params, None)[1]
+    if out is None:
+        out = np.empty((n, len(KERNEL_FIELDS)))
+    if blocks is None:
+        blocks = np.empty((n, len(BLOCK_FIELDS)))
+    n_blocks = _propagate_kernel(
+        np.asarray(t, dtype=float), np.asarray(R, dtype=float), np.asarray(A, dtype=float),
+        np.asarray(p, dtype=float), np.asarray(delta, dtype=float), np.asarray(mu, dtype=float),
+        np.asarray(d, dtype=float), np.asarray(is_first_in_tf, dtype=np.bool_),
+        np.asarray(is_last_in_tf, dtype=np.bool_), float(source_params['lamda']),
+        state, out, blocks)
+    return out, blocks[:n_blocks], state
+
+
+class JitCalculator:
+    """Замена Calculator с тем же интерфейсом; считает через скомпилированное ядро."""
+
+    # Пошаговый расчёт с условиями остановки — эталонным циклом
+    iter_propagate = staticmethod(Calculator.iter_propagate)
+    propagate_final = staticmethod(Calculator.propagate_final)
+
+    @staticmethod
+    def propagate(lens_config, source_params, initial_state: BeamState = None, fields=None):
+        """
+        То же, что Calculator.propagate: возвращает (results, state).
+        Ядро считает все поля за один проход, поэтому fields ничего не отбрасывает.
+        """
+        if not NUMBA_AVAILABLE:
+            return Calculator.propagate(lens_config, source_params, initial_state, fields)
+
+        n = len(lens_config)
+        initial_state, state = _initial_state(source_params, initial_state)
+
+        def col(key, default=0.0):
+            return [lens.get(key, default) for lens in lens_config]
+
+        out, blocks, state = propagate_arrays(
+            _distances(lens_config), col('R'), col('A'), col('p'), col('delta'), col('mu'), col('d'),
+            col('is_first_in_tf', False), col('is_last_in_tf', False), source_params,
+            state = state,
+        )
+
+        results = []
+        for i, (lens_conf, row) in enumerate(zip(lens_config, out.tolist())):
+            values = dict(zip(KERNEL_FIELDS, row))
+            values.update(
+                tf_name = lens_conf.get('tf_name', 'Unknown'),
+                block_index = lens_conf.get('block_index', 1),
+                is_last_in_block = lens_conf.get('is_last_in_block', False),
+                is_last_in_tf = lens_conf.get('is_last_in_tf', False),
+                tf_id = lens_conf.get('tf_id', 'Unknown'),
+                lens_index_in_tf = lens_conf.get('lens_index_in_tf', i + 1),
+                lens_index_in_block = lens_conf.get('lens_index_in_block', 1),
+                index = i + 1,
+            )
+            results.append(LensResult(**values))
+
+        final_state = BeamState(**dict(zip(STATE_FIELDS, state.tolist())))
+        for name, column in zip(BLOCK_FIELDS, blocks.T.tolist()):
+            setattr(final_state, name, list(getattr(initial_state, name)) + column)
+        return results, final_state
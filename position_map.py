@@ -0,0 +1,94 @@
+from dataclasses import dataclass, replace
+from typing import Tuple
+
+import numpy as np
+
+from batch_computations import ChainArrays, BatchCalculator
+
+
+@dataclass
+class PositionMap:
+    """Карты фокуса по сетке позиций двух TF (ось 0 — первый TF, ось 1 — второй)."""
+
+    tf_names: Tuple[str, str]
+    axis_1: np.ndarray        # позиции первого TF, м
+    axis_2: np.ndarray        # позиции второго TF, м
+    sample_z: float           # плоскость образца (от источника), м
+    focus_pos: np.ndarray     # положение фокуса, м
+    size_x: np.ndarray        # размер в фокусе, м
+    size_y: np.ndarray
+    spot_x: np.ndarray        # размер пятна в плоскости образца, м
+    spot_y: np.ndarray
+    transmission: np.ndarray  # пропускание, доли
+
+    def best_index(self):
+        """Индекс (i, j) точки с минимальным пятном на образце; None, если допустимых точек нет."""
+        spot = np.hypot(self.spot_x, self.spot_y)
+        if not np.isfinite(spot).any():
+            return None
+        return np.unravel_index(np.nanargmin(spot), spot.shape)
+
+
+_MAP_KEYS = ('focus_pos', 'size_x', 'size_y', 'spot_x', 'spot_y', 'transmission')
+
+
+def compute_position_map(controller, energy, structure_config, tf_names, axis_1, axis_2,
+                         sample_z, source_params=None, rows=None, progress=None, partial=None):
+    """
+    Считает карты фокуса для всей сетки позиций двух TF векторным проходом.
+
+    Позиция TF понимается так же, как spin_pos в GUI: сдвиг относительно
+    block['position'] (или absolute_start, если позиции нет) переносит все
+    линзы этого TF. Точки, где TF заходят друг на друга, заполняются NaN.
+
+    rows — сколько позиций первого TF считать за проход (None — все сразу);
+    после каждого прохода вызываются progress(done, total) по позициям первого
+    TF и partial(PositionMap) — копия карты, где ещё не посчитанное — NaN.
+    """
+    axis_1 = np.asarray(axis_1, dtype=float)
+    axis_2 = np.asarray(axis_2, dtype=float)
+
+    source_params, lens_chain = controller.build_chain(energy, structure_config, source_params)
+    if not lens_chain:
+        raise ValueError("No active lenses in the selected configuration")
+    chain = ChainArrays.from_chain(lens_chain)
+
+    known = {block.get('tf_name') for block in structure_config}
+    missing = [name for name in tf_names if name not in known]
+    if missing:
+        raise ValueError(f"TF not found in configuration: {', '.join(missing)}")
+
+    grid_1, grid_2 = np.meshgrid(axis_1, axis_2, indexing='ij')
+    shape = grid_1.shape
+    position_map = PositionMap(
+        tf_names = tuple(tf_names),
+        axis_1 = axis_1,
+        axis_2 = axis_2,
+        sample_z = sample_z,
+        **{key: np.full(shape, np.nan) for key in _MAP_KEYS},
+    )
+
+    n1 = len(axis_1)
+    step = max(int(rows), 1) if rows else max(n1, 1)
+    for start in range(0, n1, step):
+        part = slice(start, start + step)
+        flat_pos = chain.positions_for(structure_config, {
+            tf_names[0]: grid_1[part].ravel(),
+            tf_names[1]: grid_2[part].ravel(),
+        })
+        result = BatchCalculator.propagate(chain, source_params, abs_pos=flat_pos,
+                                           fields=('L2', 'focus_pos', 'size_x', 'size_y', 'alx', 'aly', 'T'))
+        spot_x, spot_y = BatchCalculator.beam_size_at(result, sample_z)
+
+        valid = ChainArrays.ordered(flat_pos)
+        values = {'focus_pos': result['focus_pos'], 'size_x': result['size_x'], 'size_y': result['size_y'],
+                  'spot_x': spot_x, 'spot_y': spot_y, 'transmission': result['T']}
+        for key in _MAP_KEYS:
+            getattr(position_map, key)[part] = np.where(valid, values[key], np.nan).reshape(grid_1[part].shape)
+
+        if progress is not None:
+            progress(min(start + step, n1), n1)
+        if partial is not None:
+            partial(replace(position_map, **{key: getattr(position_map, key).copy() for key in _MAP_KEYS}))
+
+    return position_map
@@ -0,0 +1,272 @@
+import numpy as np
+from PyQt5.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QFormLayout, QGroupBox,
+                             QComboBox, QDoubleSpinBox, QSpinBox, QPushButton, QLabel,
+                             QTabWidget, QMessageBox, QSizePolicy, QToolTip, QProgressBar)
+from PyQt5.QtGui import QImage, QPixmap
+from PyQt5.QtCore import Qt, pyqtSignal
+
+from position_map import compute_position_map
+
+# Опорные точки палитры (близко к viridis), NaN рисуется серым
+_CMAP_STOPS = np.array([
+    [68, 1, 84], [59, 82, 139], [33, 145, 140], [94, 201, 98], [253, 231, 37]
+], dtype=float)
+_CMAP = np.stack([
+    np.interp(np.linspace(0, 1, 256), np.linspace(0, 1, len(_CMAP_STOPS)), _CMAP_STOPS[:, c])
+    for c in range(3)
+], axis=1).astype(np.uint8)
+_NAN_COLOR = np.array([160, 160, 160], dtype=np.uint8)
+
+
+class HeatmapView(QLabel):
+    """Простая тепловая карта: ось X — первый TF, ось Y — второй TF."""
+
+    pointSelected = pyqtSignal(int, int)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setMinimumSize(300, 300)
+        self.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
+        self.setAlignment(Qt.AlignCenter)
+        self.setMouseTracking(True)
+        self.values = None
+        self.fmt = str
+        self._image = None
+
+    def set_data(self, values, fmt):
+        self.values = values
+        self.fmt = fmt
+        finite = values[np.isfinite(values)]
+        lo, hi = (finite.min(), finite.max()) if finite.size else (0.0, 1.0)
+        scaled = np.zeros(values.shape) if hi == lo else (values - lo) / (hi - lo)
+        idx = np.clip(np.nan_to_num(scaled) * 255, 0, 255).astype(np.uint8)
+        rgb = _CMAP[idx]
+        rgb[~np.isfinite(values)] = _NAN_COLOR
+        # values[i, j]: i — первый TF (горизонталь), j — второй TF (вертикаль, вверх)
+        rgb = np.ascontiguousarray(rgb.transpose(1, 0, 2)[::-1])
+        h, w, _ = rgb.shape
+        self._image = QImage(rgb.data, w, h, 3 * w, QImage.Format_RGB888).copy()
+        self._update_pixmap()
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self._update_pixmap()
+
+    def _update_pixmap(self):
+        if self._image is not None:
+            self.setPixmap(QPixmap.fromImage(self._image).scaled(
+                self.size(), Qt.IgnoreAspectRatio, Qt.FastTransformation))
+
+    def _index_at(self, pos):
+        if self.values is None:
+            return None
+        n1, n2 = self.values.shape
+        i = int(pos.x() / max(self.width(), 1) * n1)
+        j = n2 - 1 - int(pos.y() / max(self.height(), 1) * n2)
+        if 0 <= i < n1 and 0 <= j < n2:
+            return i, j
+        return None
+
+    def mouseMoveEvent(self, event):
+        index = self._index_at(event.pos())
+        if index is not None:
+            QToolTip.showText(event.globalPos(), self.fmt(self.values[index]), self)
+
+    def mousePressEvent(self, event):
+        index = self._index_at(event.pos())
+        if index is not None:
+            self.pointSelected.emit(*index)
+
+
+class PositionMapDialog(QDialog):
+    """Скан позиций двух TF: карты фокуса, пятна на образце и пропускания."""
+
+    MAPS = [
+        ("Focus position, m", 'focus_pos', lambda x: f"{x:.4f} m"),
+        ("Spot X at sample, um", 'spot_x', lambda x: f"{x * 1e6:.2f} um"),
+        ("Spot Y at sample, um", 'spot_y', lambda x: f"{x * 1e6:.2f} um"),
+        ("Transmission, %", 'transmission', lambda x: f"{x * 100:.1f} %"),
+    ]
+
+    # Сколько раз за расчёт обновлять карты частичным результатом
+    PARTIAL_UPDATES = 20
+
+    def __init__(self, parent, controller, energy, structure_config, source_params, jobs, sample_z=None):
+        super().__init__(parent)
+        self.setWindowTitle("TF Position Map")
+        self.resize(900, 700)
+        self.controller = controller
+        self.energy = energy
+        self.structure_config = structure_config
+        self.source_params = source_params
+        self.position_map = None
+        self.selected = None
+        self.jobs = jobs   # JobsPanel: карта считается фоновой задачей
+        self.job = None
+
+        self.positions = {block['tf_name']: block.get('position', block['absolute_start'])
+                          for block in structure_config}
+        self.setup_ui(sample_z)
+
+    def setup_ui(self, sample_z):
+        layout = QVBoxLayout(self)
+        controls = QHBoxLayout()
+
+        names = list(self.positions)
+        self.axis_widgets = []
+        for k in range(2):
+            gb = QGroupBox(f"Axis {k + 1}")
+            form = QFormLayout()
+            combo = QComboBox()
+            combo.addItems(names)
+            combo.setCurrentIndex(min(k, len(names) - 1))
+            spin_from, spin_to = QDoubleSpinBox(), QDoubleSpinBox()
+            for spin in (spin_from, spin_to):
+                spin.setRange(0, 200)
+                spin.setDecimals(3)
+                spin.setSuffix(" m")
+            spin_steps = QSpinBox()
+            spin_steps.setRange(2, 1000)
+            spin_steps.setValue(101)
+            form.addRow("TF:", combo)
+            form.addRow("From:", spin_from)
+            form.addRow("To:", spin_to)
+            form.addRow("Steps:", spin_steps)
+            gb.setLayout(form)
+            controls.addWidget(gb)
+
+            widgets = (combo, spin_from, spin_to, spin_steps)
+            combo.currentTextChanged.connect(lambda name, w=widgets: self._reset_range(w))
+            self._reset_range(widgets)
+            self.axis_widgets.append(widgets)
+
+        gb_sample = QGroupBox("Sample")
+        form = QFormLayout()
+        self.spin_sample = QDoubleSpinBox()
+        self.spin_sample.setRange(0, 500)
+        self.spin_sample.setDecimals(4)
+        self.spin_sample.setSuffix(" m")
+        self.spin_sample.setValue(sample_z if sample_z is not None else max(self.positions.values()) + 1.0)
+        form.addRow("Distance from source:", self.spin_sample)
+        self.btn_compute = QPushButton("Compute")
+        self.btn_compute.clicked.connect(self.compute)
+        self.btn_stop = QPushButton("Stop")
+        self.btn_stop.setEnabled(False)
+        self.btn_stop.clicked.connect(self.stop)
+        self.progress = QProgressBar()
+        form.addRow(self.btn_compute, self.btn_stop)
+        form.addRow(self.progress)
+        gb_sample.setLayout(form)
+        controls.addWidget(gb_sample)
+        layout.addLayout(controls)
+
+        self.tabs = QTabWidget()
+        self.views = {}
+        for title, key, fmt in self.MAPS:
+            view = HeatmapView()
+            view.pointSelected.connect(self.on_point_selected)
+            self.views[key] = (view, fmt)
+            self.tabs.addTab(view, title)
+        layout.addWidget(self.tabs)
+
+        self.lbl_info = QLabel("Click a point on the map to select TF positions.")
+        self.lbl_info.setWordWrap(True)
+        layout.addWidget(self.lbl_info)
+
+        btns = QHBoxLayout()
+        self.btn_apply = QPushButton("Apply Selected Positions")
+        self.btn_apply.setEnabled(False)
+        btn_close = QPushButton("Close")
+        self.btn_apply.clicked.connect(self.accept)
+        btn_close.clicked.connect(self.reject)
+        btns.addStretch()
+        btns.addWidget(self.btn_apply)
+        btns.addWidget(btn_close)
+        layout.addLayout(btns)
+
+    def _reset_range(self, widgets):
+        combo, spin_from, spin_to, _ = widgets
+        center = self.positions.get(combo.currentText(), 0.0)
+        spin_from.setValue(max(center - 1.0, 0.0))
+        spin_to.setValue(center + 1.0)
+
+    def compute(self):
+        (c1, f1, t1, n1), (c2, f2, t2, n2) = self.axis_widgets
+        if c1.currentText() == c2.currentText():
+            QMessageBox.warning(self, "Position Map", "Choose two different TFs.")
+            return
+        tf_names = (c1.currentText(), c2.currentText())
+        axis_1 = np.linspace(f1.value(), t1.value(), n1.value())
+        axis_2 = np.linspace(f2.value(), t2.value(), n2.value())
+        sample_z = self.spin_sample.value()
+        controller, energy, structure_config, source_params = \
+            self.controller, self.energy, self.structure_config, self.source_params
+
+        def run(job):
+            return compute_position_map(controller, energy, structure_config, tf_names, axis_1, axis_2,
+                                        sample_z, source_params = source_params,
+                                        rows = max(len(axis_1) // self.PARTIAL_UPDATES, 1),
+                                        progress = job.progress, partial = job.partial)
+
+        self.progress.setRange(0, len(axis_1))
+        self.progress.setValue(0)
+        self.btn_compute.setEnabled(False)
+        self.btn_stop.setEnabled(True)
+        self.job = self.jobs.submit(
+            f"Position map {tf_names[0]} x {tf_names[1]}", run,
+            on_progress = lambda done, total: self.progress.setValue(done),
+            on_partial = self.show_maps,
+            on_done = self.on_computed,
+            on_error = self.on_error,
+        )
+
+    def show_maps(self, position_map):
+        """Карты (частичные: ещё не посчитанные точки — NaN)."""
+        self.position_map = position_map
+        for key, (view, fmt) in self.views.items():
+            view.set_data(getattr(position_map, key), fmt)
+
+    def on_computed(self, position_map):
+        self._finished()
+        self.show_maps(position_map)
+        best = position_map.best_index()
+        if best is None:
+            # TF заходят друг на друга во всех точках сетки
+            self.selected = None
+            self.btn_apply.setEnabled(False)
+            self.lbl_info.setText("No valid (non-overlapping) positions in this range.")
+            return
+        self.on_point_selected(*best)
+
+    def on_error(self, message):
+        self._finished()
+        QMessageBox.critical(self, "Position Map Error", message)
+
+    def stop(self):
+        self.jobs.cancel(self.job)
+        self._finished()
+
+    def _finished(self):
+        self.job = None
+        self.btn_compute.setEnabled(True)
+        self.btn_stop.setEnabled(False)
+
+    def done(self, result):
+        if self.job is not None:
+            self.stop()
+        super().done(result)
+
+    def on_point_selected(self, i, j):
+        pm = self.position_map
+        if pm is None:
+            return
+        self.selected = {pm.tf_names[0]: float(pm.axis_1[i]), pm.tf_names[1]: float(pm.axis_2[j])}
+        self.lbl_info.setText(
+            f"{pm.tf_names[0]} = {pm.axis_1[i]:.4f} m, {pm.tf_names[1]} = {pm.axis_2[j]:.4f} m: "
+            + ", ".join(f"{title.split(',')[0]} {fmt(getattr(pm, key)[i, j])}" for title, key, fmt in self.MAPS)
+        )
+        self.btn_apply.setEnabled(True)
+
+    def get_selected_positions(self):
+        """Словарь {имя TF: позиция, м} выбранной на карте точки."""
+        return self.selected or {}
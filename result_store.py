@@ -0,0 +1,289 @@
+import csv
+import json
+import os
+from collections.abc import Sequence
+
+import numpy as np
+
+from computations import LENS_RESULT_FIELDS, LensResult
+
+# Типы колонок на диске (строки хранятся кодами словаря)
+_DTYPES = {float: '<f8', int: '<i8', bool: '|b1', str: '<i4'}
+
+# Сводка по каждому расчёту (строка таблицы runs)
+RUN_FIELDS = [
+    ('start', '<i8'), ('stop', '<i8'), ('config_id', '<i8'), ('energy', '<f8'),
+    ('final_pos', '<f8'), ('L2', '<f8'), ('M_total', '<f8'), ('T', '<f8'), ('G', '<f8'),
+    ('size_x', '<f8'), ('size_y', '<f8'),
+]
+
+_INITIAL_CAPACITY = 1 << 16
+
+
+class _Column:
+    """Одна колонка: файл <name>.bin, открытый как memmap и растущий удвоением."""
+
+    def __init__(self, path, dtype, capacity, writable):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.writable = writable
+        self.capacity = capacity
+        self._map = None
+
+    def _mmap(self):
+        if self._map is None:
+            if self.writable and not os.path.exists(self.path):
+                with open(self.path, 'wb') as f:
+                    f.truncate(self.capacity * self.dtype.itemsize)
+            mode = 'r+' if self.writable else 'r'
+            self._map = np.memmap(self.path, dtype=self.dtype, mode=mode, shape=(self.capacity,))
+        return self._map
+
+    def ensure_capacity(self, needed):
+        if needed <= self.capacity:
+            return
+        capacity = self.capacity
+        while capacity < needed:
+            capacity *= 2
+        if self._map is not None:
+            self._map.flush()
+            self._map = None
+        with open(self.path, 'r+b' if os.path.exists(self.path) else 'wb') as f:
+            f.truncate(capacity * self.dtype.itemsize)
+        self.capacity = capacity
+
+    def write(self, start, values):
+        self.ensure_capacity(start + len(values))
+        self._mmap()[start:start + len(values)] = values
+
+    def view(self, length):
+        return self._mmap()[:length]
+
+    def flush(self):
+        if self._map is not None and self.writable:
+            self._map.flush()
+
+    def close(self):
+        self.flush()
+        self._map = None
+
+
+class StoredHistory(Sequence):
+    """
+    История одного расчёта из хранилища: ведёт себя как список LensResult,
+    но читает строки с диска только при обращении к ним.
+    """
+
+    def __init__(self, store, start, stop):
+        self.store = store
+        self.start = start
+        self.stop = stop
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return self.store.row(self.start + index)
+
+
+class ResultStore:
+    """
+    Дисковое колоночное хранилище истории расчётов (только дозапись).
+
+    Каталог содержит по файлу на каждую колонку LENS_RESULT_FIELDS (memmap),
+    колонки config_id/energy/run для строк, таблицу runs со сводкой каждого
+    расчёта и meta.json (длины, словари строк). Колонки читаются лениво,
+    поэтому в памяти процесса лежит только то, к чему обращались.
+    """
+
+    def __init__(self, path, mode='a'):
+        """mode: 'a' — открыть или создать для дозаписи, 'r' — только чтение."""
+        self.path = path
+        self.writable = mode != 'r'
+        meta_path = os.path.join(path, 'meta.json')
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+        elif self.writable:
+            os.makedirs(os.path.join(path, 'runs'), exist_ok=True)
+            meta = {'length': 0, 'runs': 0, 'capacity': {}, 'strings': {}}
+        else:
+            raise FileNotFoundError(f"No result store at {path}")
+
+        self.length = meta['length']
+        self.n_runs = meta['runs']
+        self.strings = {name: list(values) for name, values in meta['strings'].items()}
+        self._codes = {name: {v: i for i, v in enumerate(values)} for name, values in self.strings.items()}
+
+        capacity = meta['capacity']
+        self.fields = [(name, typ) for name, typ, _, _ in LENS_RESULT_FIELDS]
+        row_columns = [(name, _DTYPES[typ]) for name, typ in self.fields]
+        row_columns += [('config_id', '<i8'), ('energy', '<f8'), ('run', '<i8')]
+        self.columns = {
+            name: _Column(os.path.join(path, f'{name}.bin'), dtype,
+                          capacity.get(name, _INITIAL_CAPACITY), self.writable)
+            for name, dtype in row_columns
+        }
+        self.run_columns = {
+            name: _Column(os.path.join(path, 'runs', f'{name}.bin'), dtype,
+                          capacity.get(f'runs/{name}', 1024), self.writable)
+            for name, dtype in RUN_FIELDS
+        }
+
+    # --- Запись ---
+
+    def _encode(self, name, values):
+        codes = self._codes.setdefault(name, {})
+        table = self.strings.setdefault(name, [])
+        out = []
+        for value in values:
+            code = codes.get(value)
+            if code is None:
+                code = codes[value] = len(table)
+                table.append(value)
+            out.append(code)
+        return out
+
+    def append_report(self, report, config_id=0):
+        """Дописывает отчёт run_calculations; возвращает номер расчёта (run id)."""
+        if not self.writable:
+            raise PermissionError("Result store is opened read-only")
+        history = report.get('full_history') or []
+        start, stop = self.length, self.length + len(history)
+        run_id = self.n_runs
+
+        for name, typ in self.fields:
+            values = [getattr(item, name) for item in history]
+            if typ is str:
+                values = self._encode(name, values)
+            self.columns[name].write(start, np.asarray(values, dtype=self.columns[name].dtype))
+        self.columns['config_id'].write(start, np.full(len(history), config_id))
+        self.columns['energy'].write(start, np.full(len(history), report.get('energy', np.nan)))
+        self.columns['run'].write(start, np.full(len(history), run_id))
+
+        run = {'start': start, 'stop': stop, 'config_id': config_id}
+        for name, _ in RUN_FIELDS[3:]:
+            run[name] = report.get(name, np.nan)
+        for name, column in self.run_columns.items():
+            column.write(run_id, np.asarray([run[name]], dtype=column.dtype))
+
+        self.length = stop
+        self.n_runs += 1
+        return run_id
+
+    def flush(self):
+        """Сбрасывает данные на диск и обновляет meta.json."""
+        if not self.writable:
+            return
+        for column in list(self.columns.values()) + list(self.run_columns.values()):
+            column.flush()
+        capacity = {name: c.capacity for name, c in self.columns.items()}
+        capacity.update({f'runs/{name}': c.capacity for name, c in self.run_columns.items()})
+        meta = {'length': self.length, 'runs': self.n_runs, 'capacity': capacity, 'strings': self.strings}
+        tmp_path = os.path.join(self.path, 'meta.json.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, os.path.join(self.path, 'meta.json'))
+
+    def close(self):
+        self.flush()
+        for column in list(self.columns.values()) + list(self.run_columns.values()):
+            column.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # --- Чтение ---
+
+    def column(self, name, rows=None, decode=False):
+        """
+        Колонка как memmap (без копирования). rows — срез или массив индексов строк.
+        decode=True переводит коды строковых колонок обратно в строки.
+        """
+        data = self.columns[name].view(self.length)
+        if rows is not None:
+            data = data[rows]
+        if decode and name in self.strings:
+            table = np.array(self.strings[name], dtype=object)
+            return table[np.asarray(data)]
+        return data
+
+    def runs(self, name):
+        """Колонка таблицы расчётов (сводка по каждому run)."""
+        return self.run_columns[name].view(self.n_runs)
+
+    def select_runs(self, config_id=None, energy=None, energy_range=None):
+        """Номера расчётов по конфигурации и/или энергии (точной или диапазону)."""
+        mask = np.ones(self.n_runs, dtype=bool)
+        if config_id is not None:
+            mask &= self.runs('config_id') == config_id
+        if energy is not None:
+            mask &= self.runs('energy') == energy
+        if energy_range is not None:
+            e = self.runs('energy')
+            mask &= (e >= energy_range[0]) & (e <= energy_range[1])
+        return np.flatnonzero(mask)
+
+    def select_rows(self, config_id=None, energy=None, energy_range=None):
+        """Индексы строк (линз) выбранных расчётов."""
+        run_ids = self.select_runs(config_id, energy, energy_range)
+        starts, stops = self.runs('start')[run_ids], self.runs('stop')[run_ids]
+        if len(run_ids) == 0:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate([np.arange(a, b) for a, b in zip(starts, stops)])
+
+    def row(self, index):
+        values = {}
+        for name, typ in self.fields:
+            value = self.columns[name].view(self.length)[index]
+            if typ is str:
+                value = self.strings[name][int(value)]
+            values[name] = typ(value)
+        return LensResult(**values)
+
+    def history(self, run_id):
+        return StoredHistory(self, int(self.runs('start')[run_id]), int(self.runs('stop')[run_id]))
+
+    def report(self, run_id):
+        """Отчёт в формате _generate_report; full_history читается лениво."""
+        report = {name: float(self.runs(name)[run_id]) for name, _ in RUN_FIELDS[3:]}
+        report['config_id'] = int(self.runs('config_id')[run_id])
+        report['full_history'] = self.history(run_id)
+        return report
+
+    def to_csv(self, path, rows=None, fields=None, chunk=100_000):
+        """Выгружает строки (по умолчанию все) в CSV порциями, не загружая всё в память."""
+        fields = fields or [name for name, _ in self.fields] + ['config_id', 'energy', 'run']
+        # Без rows — непрерывные срезы memmap, без массива индексов на всё хранилище
+        if rows is None:
+            parts = (slice(begin, min(begin + chunk, self.length)) for begin in range(0, self.length, chunk))
+        else:
+            rows = np.asarray(rows)
+            parts = (rows[begin:begin + chunk] for begin in range(0, len(rows), chunk))
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(fields)
+            for part in parts:
+                cols = [self.column(name, part, decode=True) for name in fields]
+                writer.writerows(zip(*(c.tolist() for c in cols)))
+
+
+def record_scan(controller, store, energies, structure_config, source_params=None, config_id=0):
+    """Скан по энергиям с записью каждого расчёта в хранилище; возвращает run id."""
+    run_ids = []
+    for energy in energies:
+        source = dict(source_params, energy=energy) if source_params is not None else None
+        report = controller.run_calculations(energy, structure_config, source_params=source)
+        if 'error' not in report:
+            run_ids.append(store.append_report(report, config_id=config_id))
+    store.flush()
+    return run_ids
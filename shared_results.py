@@ -0,0 +1,241 @@
+"""
+Буферы результатов в shared memory для многопроцессных сканов.
+
+Рабочие процессы пишут строки LensResult прямо в колонки общего сегмента
+(multiprocessing.shared_memory), а родитель читает их как numpy-массивы
+поверх того же сегмента, без pickle и копирования. Раскладка колонок
+берётся из LENS_RESULT_FIELDS (типы — как в ResultStore: строки хранятся
+кодами словаря), сводка каждого расчёта — из RUN_FIELDS.
+
+    scan = parallel_scan(controller, [(energy, structure_config), ...], source_params)
+    scan.column('sfx')            # все линзы всех расчётов, без копирования
+    scan.runs('final_pos')        # по расчёту
+    scan.history(run_id)          # LensResult одного расчёта (материализуется)
+    scan.close()                  # массивы, полученные из column/runs, после этого недоступны
+
+Строки расчёта k — [start, stop) из runs; число строк каждого расчёта
+родитель знает заранее (длина цепочки линз), поэтому процессы пишут в
+непересекающиеся диапазоны без блокировок.
+"""
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from computations import LENS_RESULT_FIELDS, LensResult
+from result_store import RUN_FIELDS
+
+# Типы колонок (строки — коды словаря, как в ResultStore)
+_DTYPES = {float: '<f8', int: '<i8', bool: '|b1', str: '<i4'}
+_ALIGN = 64
+
+# Всё, что нужно рабочему процессу, чтобы подключиться к буферу (передаётся через pickle)
+BufferSpec = namedtuple('BufferSpec', 'name n_rows n_runs strings')
+
+ROW_COLUMNS = [(name, _DTYPES[typ]) for name, typ, _, _ in LENS_RESULT_FIELDS]
+RUN_COLUMNS = list(RUN_FIELDS) + [('ok', '|b1')]
+
+
+def _layout(n_rows, n_runs):
+    """{колонка: (dtype, длина, смещение)} и размер сегмента; колонки выровнены по 64 байта."""
+    layout = {}
+    offset = 0
+    for prefix, columns, length in (('', ROW_COLUMNS, n_rows), ('runs/', RUN_COLUMNS, n_runs)):
+        for name, dtype in columns:
+            dtype = np.dtype(dtype)
+            layout[prefix + name] = (dtype, length, offset)
+            offset += -(-length * dtype.itemsize // _ALIGN) * _ALIGN
+    return layout, max(offset, 1)
+
+
+class SharedResults:
+    """
+    Колонки LENS_RESULT_FIELDS (n_rows строк) и сводки расчётов (n_runs) в одном
+    сегменте shared memory. create() — в родителе (владелец, удаляет сегмент при
+    close), attach(spec) — в рабочем процессе.
+    """
+
+    def __init__(self, shm, spec, owner):
+        self.shm = shm
+        self.spec = spec
+        self.owner = owner
+        self.strings = {name: list(values) for name, values in spec.strings.items()}
+        self._codes = {name: {v: i for i, v in enumerate(values)} for name, values in self.strings.items()}
+        self._layout, _ = _layout(spec.n_rows, spec.n_runs)
+        self._views = {}
+
+    @classmethod
+    def create(cls, n_rows, n_runs, strings):
+        """strings: {строковое поле: допустимые значения} — словарь кодов, общий для всех процессов."""
+        _, size = _layout(n_rows, n_runs)
+        shm = shared_memory.SharedMemory(create=True, size=size)
+        spec = BufferSpec(shm.name, n_rows, n_runs, {name: list(values) for name, values in strings.items()})
+        buffer = cls(shm, spec, owner=True)
+        buffer._view('runs/ok')[:] = False
+        return buffer
+
+    @classmethod
+    def attach(cls, spec):
+        return cls(shared_memory.SharedMemory(name=spec.name), spec, owner=False)
+
+    def _view(self, key):
+        view = self._views.get(key)
+        if view is None:
+            dtype, length, offset = self._layout[key]
+            view = self._views[key] = np.ndarray((length,), dtype=dtype, buffer=self.shm.buf, offset=offset)
+        return view
+
+    # --- Запись (рабочий процесс) ---
+
+    def write_history(self, start, history):
+        """Пишет список LensResult в строки [start, start + len(history)); None -> NaN."""
+        stop = start + len(history)
+        for name, typ, _, _ in LENS_RESULT_FIELDS:
+            values = [getattr(item, name) for item in history]
+            if typ is str:
+                codes = self._codes[name]
+                try:
+                    values = [codes[value] for value in values]
+                except KeyError as e:
+                    raise ValueError(f"Value {e.args[0]!r} of {name} is not in the shared string table") from None
+            self._view(name)[start:stop] = values
+
+    def write_run(self, run_id, values):
+        """Сводка расчёта: значения RUN_COLUMNS по именам (недостающие — NaN/0)."""
+        for name, dtype in RUN_COLUMNS:
+            self._view('runs/' + name)[run_id] = values.get(name, np.nan if dtype == '<f8' else 0)
+
+    # --- Чтение (родитель) ---
+
+    def column(self, name, decode=False):
+        """Колонка всех строк — массив поверх shared memory (без копирования)."""
+        data = self._view(name)
+        if decode and name in self.strings:
+            return np.array(self.strings[name], dtype=object)[data]
+        return data
+
+    def runs(self, name):
+        return self._view('runs/' + name)
+
+    def row(self, index):
+        values = {}
+        for name, typ, _, _ in LENS_RESULT_FIELDS:
+            value = self._view(name)[index]
+            values[name] = self.strings[name][int(value)] if typ is str else typ(value)
+        return LensResult(**values)
+
+    def close(self):
+        """Отключается от сегмента (владелец его удаляет); внешние ссылки на колонки должны быть отпущены."""
+        if self.shm is None:
+            return
+        self._views.clear()
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+        self.shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class SharedScan(SharedResults):
+    """Результат parallel_scan: строки и сводки в shared memory плюс сообщения об ошибках."""
+
+    errors = None   # {run_id: текст ошибки}
+
+    def history(self, run_id):
+        start, stop = int(self.runs('start')[run_id]), int(self.runs('stop')[run_id])
+        return [self.row(i) for i in range(start, stop)]
+
+
+# --- Параллельный скан ---
+
+_WORKER = None   # (контроллер, буфер) рабочего процесса
+
+
+def _init_worker(controller, spec):
+    global _WORKER
+    _WORKER = (controller, SharedResults.attach(spec))
+
+
+def _scan_chunk(args):
+    """Рабочий процесс: расчёты части скана с записью в буфер; возвращает только ошибки."""
+    tasks, source_params, fields = args
+    controller, buffer = _WORKER
+    errors = {}
+    for run_id, energy, structure_config, config_id, start, n_rows in tasks:
+        source = dict(source_params, energy=energy) if source_params is not None else None
+        try:
+            report = controller.run_calculations(energy, structure_config, source_params=source, fields=fields)
+        except Exception as e:
+            report = {'error': str(e)}
+        run = {'start': start, 'stop': start + n_rows, 'config_id': config_id, 'energy': energy}
+        history = report.get('full_history') or []
+        if 'error' in report:
+            errors[run_id] = report['error']
+        elif len(history) != n_rows:
+            errors[run_id] = f"Expected {n_rows} lenses, got {len(history)}"
+        else:
+            buffer.write_history(start, history)
+            run.update({name: report.get(name, np.nan) for name, _ in RUN_FIELDS[4:]})
+            run['ok'] = True
+        buffer.write_run(run_id, run)
+    return len(tasks), errors
+
+
+def parallel_scan(controller, points, source_params=None, fields=None, workers=None, chunk=64,
+                  progress=None) -> SharedScan:
+    """
+    Считает точки скана параллельно; строки LensResult пишутся процессами в shared memory.
+
+    Args:
+        controller: AdvancedController (копируется в каждый процесс один раз)
+        points: список (энергия, structure_config); одинаковые конфигурации лучше
+            передавать одним объектом — цепочка для числа строк строится на объект
+        fields: проекция полей LensResult (см. Calculator.propagate); остальные — NaN
+        workers: число процессов (None — все ядра)
+        chunk: точек на задачу пула
+        progress: callback(done, total)
+    """
+    points = [(float(energy), config) for energy, config in points]
+
+    # Число строк каждого расчёта и словарь строк — по цепочкам линз (одна на конфигурацию)
+    config_ids, chains = {}, []
+    for energy, config in points:
+        if id(config) not in config_ids:
+            source = dict(source_params, energy=energy) if source_params is not None else None
+            config_ids[id(config)] = len(chains)
+            chains.append(controller.build_chain(energy, config, source)[1])
+    strings = {
+        name: sorted({lens.get(name, 'Unknown') for chain in chains for lens in chain} | {'Unknown'})
+        for name, typ, _, _ in LENS_RESULT_FIELDS if typ is str
+    }
+
+    tasks, start = [], 0
+    for run_id, (energy, config) in enumerate(points):
+        config_id = config_ids[id(config)]
+        n_rows = len(chains[config_id])
+        tasks.append((run_id, energy, config, config_id, start, n_rows))
+        start += n_rows
+
+    buffer = SharedScan.create(start, len(points), strings)
+    buffer.errors = {}
+    try:
+        jobs = [(tasks[i:i + chunk], source_params, fields) for i in range(0, len(tasks), chunk)]
+        done = 0
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count(), initializer=_init_worker,
+                                 initargs=(controller, buffer.spec)) as pool:
+            for n, errors in pool.map(_scan_chunk, jobs):
+                buffer.errors.update(errors)
+                done += n
+                if progress is not None:
+                    progress(done, len(tasks))
+    except BaseException:
+        buffer.close()
+        raise
+    return buffer
@@ -0,0 +1,174 @@
+"""
+Описания железа трансфокаторов (TF) из JSON-файлов.
+
+Файл описывает геометрию одного типа TF: толщину линзы, слоты (Air — ряд
+одиночных линз, Vacuum — блоки по несколько линз) и допустимые типы линз:
+
+    {"id": "air_array", "type": "air", "description": "...",
+     "lens_thickness_mm": 1.0, "lens_gap_mm": 0.4, "slots": 100,
+     "allowed_lenses": null}
+
+    {"id": "vacuum_groups", "type": "vacuum", "description": "...",
+     "lens_thickness_mm": 1.0, "lens_gap_mm": 0.0,
+     "blocks": {"count": 14, "length_mm": 10.0, "gap_mm": 1.0, "max_lenses": 5},
+     "allowed_lenses": null}
+
+length_mm (длина корпуса) можно не задавать — тогда это длина ряда слотов.
+allowed_lenses — список id из каталога линз или null (любые).
+
+При загрузке описание компилируется в таблицы смещений линз от начала TF,
+которые сборщики цепочки (AdvancedController) только индексируют.
+Файлы берутся из каталога hardware/ рядом с модулем и из каталогов в
+переменной окружения TF_HARDWARE_PATH (через os.pathsep; одинаковый id там
+заменяет встроенный).
+"""
+import glob
+import json
+import os
+
+DEFAULT_HARDWARE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'hardware')
+HARDWARE_ENV = 'TF_HARDWARE_PATH'
+
+# Железо по умолчанию для TF без ключа 'hardware' в structure_config
+DEFAULT_HARDWARE = {'air': 'air_array', 'vacuum': 'vacuum_groups'}
+
+MM = 1e-3
+
+
+class TFHardware:
+    """
+    Скомпилированное описание TF; длины в метрах.
+
+    Air: slot_offsets[i] — смещение линзы i от начала TF.
+    Vacuum: block_offsets[j][n - 1][k] — смещение линзы k блока j, если в
+    блоке n линз (линзы стоят по центру блока).
+    """
+
+    def __init__(self, hw_id, tf_type, p, u, length=None, slots=0, blocks=None, allowed_lenses=None,
+                 description=''):
+        self.id = hw_id
+        self.type = tf_type
+        self.description = description
+        self.p = p
+        self.u = u
+        self.allowed_lenses = frozenset(allowed_lenses) if allowed_lenses is not None else None
+
+        if tf_type == 'air':
+            if slots < 1:
+                raise ValueError(f"Hardware '{hw_id}': at least one slot is required")
+            step = p + u
+            self.slot_offsets = tuple(i * step for i in range(slots))
+            span = slots * p + (slots - 1) * u
+        elif tf_type == 'vacuum':
+            blocks = blocks or {}
+            count = int(blocks.get('count', 0))
+            self.block_length = blocks['length_mm'] * MM
+            self.block_gap = blocks.get('gap_mm', 0.0) * MM
+            self.max_lenses = int(blocks['max_lenses'])
+            if count < 1:
+                raise ValueError(f"Hardware '{hw_id}': at least one block is required")
+            if self.max_lenses * p > self.block_length:
+                raise ValueError(f"Hardware '{hw_id}': {self.max_lenses} lenses don't fit "
+                                 f"in {blocks['length_mm']} mm block")
+            # Позиции внутри блока для каждого числа линз
+            in_block = []
+            for n in range(1, self.max_lenses + 1):
+                wall_thickness = (self.block_length - n * p) / 2.0
+                in_block.append(tuple(wall_thickness + (k + 0.5) * p for k in range(n)))
+            # Начало блока накапливается сложением, как при расстановке от first_dist
+            table = []
+            block_start = 0.0
+            for _ in range(count):
+                table.append(tuple(tuple(block_start + pos for pos in layout) for layout in in_block))
+                block_start += self.block_length + self.block_gap
+            self.block_offsets = tuple(table)
+            span = count * self.block_length + (count - 1) * self.block_gap
+        else:
+            raise ValueError(f"Hardware '{hw_id}': unknown TF type: {tf_type}")
+
+        self.length = length if length is not None else span
+
+    @property
+    def capacity(self):
+        """Число слотов Air или блоков Vacuum."""
+        return len(self.slot_offsets) if self.type == 'air' else len(self.block_offsets)
+
+    def allows(self, lens_id):
+        return self.allowed_lenses is None or lens_id in self.allowed_lenses
+
+    def check_lens(self, lens_id, tf_name):
+        if not self.allows(lens_id):
+            raise ValueError(f"{tf_name}: lens '{lens_id}' is not allowed in hardware '{self.id}'")
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            hw_id = data['id'],
+            tf_type = data['type'],
+            p = data['lens_thickness_mm'] * MM,
+            u = data.get('lens_gap_mm', 0.0) * MM,
+            length = data['length_mm'] * MM if data.get('length_mm') is not None else None,
+            slots = int(data.get('slots', 0)),
+            blocks = data.get('blocks'),
+            allowed_lenses = data.get('allowed_lenses'),
+            description = data.get('description', ''),
+        )
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding='utf-8') as f:
+            return cls.from_dict(json.load(f))
+
+    def __repr__(self):
+        return f"TFHardware({self.id!r}, {self.type!r}, capacity={self.capacity}, length={self.length:.4f})"
+
+
+_HARDWARE = None
+_HARDWARE_VERSION = 0   # растёт при каждом register_hardware (ключ кэшей, зависящих от железа)
+
+
+def _load_all():
+    hardware = {}
+    dirs = [DEFAULT_HARDWARE_DIR] + [d for d in os.environ.get(HARDWARE_ENV, '').split(os.pathsep) if d]
+    for directory in dirs:
+        for path in sorted(glob.glob(os.path.join(directory, '*.json'))):
+            hw = TFHardware.load(path)
+            hardware[hw.id] = hw
+    return hardware
+
+
+def hardware_ids():
+    global _HARDWARE
+    if _HARDWARE is None:
+        _HARDWARE = _load_all()
+    return sorted(_HARDWARE)
+
+
+def get_hardware(hw_id):
+    """Описание по id; файлы читаются и компилируются один раз, при первом обращении."""
+    global _HARDWARE
+    if _HARDWARE is None:
+        _HARDWARE = _load_all()
+    try:
+        return _HARDWARE[hw_id]
+    except KeyError:
+        raise ValueError(f"Unknown TF hardware: {hw_id}") from None
+
+
+def hardware_for(block_conf):
+    """Железо блока structure_config: ключ 'hardware' или железо по умолчанию для типа."""
+    hw_id = block_conf.get('hardware') or DEFAULT_HARDWARE.get(block_conf.get('type'))
+    return get_hardware(hw_id)
+
+
+def register_hardware(hardware):
+    """Добавляет (или заменяет) описание, например созданное в коде через TFHardware.from_dict."""
+    global _HARDWARE_VERSION
+    hardware_ids()
+    _HARDWARE[hardware.id] = hardware
+    _HARDWARE_VERSION += 1
+
+
+def hardware_version():
+    """Номер набора описаний: меняется при register_hardware."""
+    return _HARDWARE_VERSION
@@ -0,0 +1,207 @@
+"""
+Планировщик перехода между настройками фокуса с минимальным числом
+перемещений актуаторов.
+
+Граф: вершины — состояния линз всех TF (какие линзы Air и блоки Vacuum в
+пучке), рёбра — одно перемещение актуатора (ввод или вывод одной линзы Air
+или одного блока Vacuum). Поиск A* с эвристикой «число актуаторов, которые
+ещё отличаются от цели» (допустима и согласована: каждое ребро меняет ровно
+один). Фокус состояний считается ABCDEngine — переход к соседнему состоянию
+пересчитывает O(log n) узлов дерева — и только для вершин, которые
+извлекаются из очереди.
+
+Промежуточные состояния допустимы, если фокус остаётся в коридоре
+[min(A, B) - excursion, max(A, B) + excursion] и (при max_step) меняется за
+одно перемещение не больше чем на max_step. Позиции TF не меняются.
+"""
+import heapq
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+import numpy as np
+
+from abcd_engine import ABCDEngine, slot_key
+from energy_tracking import lens_states, apply_lens_states
+from lens_mask import LensMask
+
+
+@dataclass
+class ZoomMove:
+    tf_name: str
+    element: int                 # номер линзы Air или блока Vacuum (с 0)
+    insert: bool                 # True — ввод в пучок, False — вывод
+    focus_pos: float             # фокус после перемещения, м
+    states: Dict[str, LensMask]  # состояния линз после перемещения
+
+
+@dataclass
+class ZoomPlan:
+    found: bool
+    start_focus: float
+    goal_focus: float
+    moves: List[ZoomMove] = field(default_factory=list)
+    expansions: int = 0
+    message: str = ""
+
+    @property
+    def max_excursion(self):
+        """Наибольший выход фокуса за отрезок между начальным и целевым, м."""
+        lo, hi = sorted((self.start_focus, self.goal_focus))
+        return max([max(lo - m.focus_pos, m.focus_pos - hi, 0.0) for m in self.moves], default=0.0)
+
+
+class ZoomPlanner:
+    """Планировщик для одной схемы (энергия, позиции TF, источник); исходное состояние — structure_config."""
+
+    def __init__(self, controller, energy, structure_config, source_params=None, mode=None):
+        self.structure_config = structure_config
+        self.engine = ABCDEngine.from_structure(controller, energy, structure_config, source_params, mode)
+
+        # Актуаторы: (TF, номер линзы/блока) -> слоты движка, которые он вводит
+        types = {block['tf_name']: block.get('type') for block in structure_config}
+        groups = {block['tf_name']: block.get('groups', []) for block in structure_config}
+        index = {}
+        self.actuators = []
+        self._slots = []
+        for i, slot in enumerate(self.engine.slots):
+            tf_name, block, lens = slot_key(slot)
+            element = (lens if types.get(tf_name) == 'air' else block) - 1
+            key = (tf_name, element)
+            if key not in index:
+                index[key] = len(self.actuators)
+                self.actuators.append(key)
+                self._slots.append([])
+            self._slots[index[key]].append(i)
+
+        # Введённый блок Vacuum вводит линзы, заданные в конфигурации (как apply_lens_states)
+        self._members = []
+        for (tf_name, element), slots in zip(self.actuators, self._slots):
+            members = slots
+            if types.get(tf_name) == 'vacuum':
+                group = groups[tf_name][element]
+                if group.get('lenses') is not None and len(group['lenses']) == group['N']:
+                    members = [s for s, lens in zip(slots, group['lenses']) if lens.get('active', True)]
+            self._members.append((slots, set(members)))
+
+        initial = lens_states(structure_config)
+        self._sizes = {name: mask.size for name, mask in initial.items()}
+        self.start = self._state_from(initial)
+        self._current = None
+        self._focus = {}
+
+    # --- Состояния ---
+
+    def _state_from(self, states):
+        bits = 0
+        for k, (tf_name, element) in enumerate(self.actuators):
+            mask = states.get(tf_name)
+            if mask is not None and mask.bits >> element & 1:
+                bits |= 1 << k
+        return bits
+
+    def states(self, state):
+        """{имя TF: LensMask} для состояния-битовой маски актуаторов."""
+        bits = {name: 0 for name in self._sizes}
+        for k, (tf_name, element) in enumerate(self.actuators):
+            if state >> k & 1:
+                bits[tf_name] |= 1 << element
+        return {name: LensMask(bits[name], size) for name, size in self._sizes.items()}
+
+    def structure(self, state):
+        """structure_config для состояния."""
+        return apply_lens_states(self.structure_config, self.states(state))
+
+    def _set_state(self, state):
+        changed = state ^ self._current if self._current is not None else (1 << len(self.actuators)) - 1
+        while changed:
+            k = (changed & -changed).bit_length() - 1
+            changed &= changed - 1
+            slots, members = self._members[k]
+            inserted = bool(state >> k & 1)
+            for i in slots:
+                self.engine.set_active(i, inserted and i in members)
+        self._current = state
+
+    def focus(self, state):
+        """Положение фокуса, м (NaN — нет линз в пучке или фокус не определён)."""
+        value = self._focus.get(state)
+        if value is None:
+            self._set_state(state)
+            result = self.engine.focus()
+            value = result.get('focus_pos', np.nan)
+            if not np.isfinite(value):
+                value = np.nan
+            self._focus[state] = value
+        return value
+
+    # --- Поиск ---
+
+    def plan(self, goal_states, excursion=0.0, max_step=None, max_expansions=2000) -> ZoomPlan:
+        """
+        Последовательность перемещений от текущего состояния к goal_states.
+
+        Args:
+            goal_states: {имя TF: LensMask}; TF, которых нет, остаются как есть
+            excursion: допустимый выход фокуса за отрезок [фокус A, фокус B], м
+            max_step: наибольшее изменение фокуса за одно перемещение, м (None — без ограничения)
+            max_expansions: предел числа раскрытых вершин (время ответа)
+        """
+        goal = self._state_from(dict(self.states(self.start), **goal_states))
+        start_focus = self.focus(self.start)
+        goal_focus = self.focus(goal)
+        if np.isnan(start_focus) or np.isnan(goal_focus):
+            return ZoomPlan(False, start_focus, goal_focus, message="Start or goal configuration has no focus")
+        lo = min(start_focus, goal_focus) - excursion
+        hi = max(start_focus, goal_focus) + excursion
+
+        n = len(self.actuators)
+        # Очередь: (g + h, -g, номер, состояние, родитель, актуатор); проверка допустимости — при извлечении
+        heap = [(bin(self.start ^ goal).count('1'), 0, 0, self.start, None, None)]
+        counter = 1
+        closed = {}
+        expansions = 0
+        while heap:
+            _, neg_g, _, state, parent, k = heapq.heappop(heap)
+            if state in closed:
+                continue
+            focus = self.focus(state)
+            if np.isnan(focus) or not lo <= focus <= hi:
+                closed[state] = None   # состояние вне коридора при любом пути
+                continue
+            if parent is not None and max_step is not None and abs(focus - self.focus(parent)) > max_step:
+                continue               # недопустимо только это ребро
+            closed[state] = (parent, k)
+            if state == goal:
+                return ZoomPlan(True, start_focus, goal_focus, self._moves(closed, goal), expansions,
+                                f"{-neg_g} moves")
+            expansions += 1
+            if expansions > max_expansions:
+                break
+            g = -neg_g + 1
+            for j in range(n):
+                nxt = state ^ (1 << j)
+                if nxt not in closed:
+                    heapq.heappush(heap, (g + bin(nxt ^ goal).count('1'), -g, counter, nxt, state, j))
+                    counter += 1
+        message = "Search limit reached" if heap else "No path within the focus limits"
+        return ZoomPlan(False, start_focus, goal_focus, expansions=expansions, message=message)
+
+    def _moves(self, closed, goal):
+        path = []
+        state = goal
+        while closed[state][0] is not None:
+            parent, k = closed[state]
+            path.append((state, k))
+            state = parent
+        moves = []
+        for state, k in reversed(path):
+            tf_name, element = self.actuators[k]
+            moves.append(ZoomMove(tf_name, element, bool(state >> k & 1), float(self.focus(state)),
+                                  self.states(state)))
+        return moves
+
+
+def plan_zoom(controller, energy, structure_config, goal_config, source_params=None, mode=None, **limits):
+    """План перехода от structure_config к состояниям линз goal_config (тоже structure_config)."""
+    planner = ZoomPlanner(controller, energy, structure_config, source_params, mode)
+    return planner.plan(lens_states(goal_config), **limits)